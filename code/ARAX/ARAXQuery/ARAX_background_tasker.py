@@ -10,6 +10,7 @@ import datetime
 import traceback
 import pkgutil
 from importlib.metadata import version
+from typing import Optional
 
 from ARAX_query_tracker import ARAXQueryTracker
 
@@ -23,8 +24,12 @@ FREQ_CHECK_ONGOING_SEC = 60
 class ARAXBackgroundTasker:
 
     def __init__(self, parent_pid: int,
-                 run_kp_info_cacher: bool = True):
+                 run_kp_info_cacher: bool = True,
+                 xdtd_data_path: Optional[str] = None):
         self.run_kp_info_cacher = run_kp_info_cacher
+        # Data path of the xDTD model whose embeddings to convert ahead of
+        # the first query, if any
+        self.xdtd_data_path = xdtd_data_path
         self.parent_pid = parent_pid
         timestamp = str(datetime.datetime.now().isoformat())
         eprint(f"{timestamp}: INFO: ARAXBackgroundTasker created")
@@ -115,6 +120,23 @@ class ARAXBackgroundTasker:
                     eprint(result.stdout.decode('utf-8'))
         eprint("INFO: End listing databases area contents")
 
+        # Convert the xDTD embeddings to their memory-mapped matrix ahead of
+        # time, so that the first query doesn't pay for it
+        if self.xdtd_data_path is not None:
+            timestamp = str(datetime.datetime.now().isoformat())
+            eprint(f"{timestamp}: INFO: ARAXBackgroundTasker: Converting "
+                   "the xDTD embeddings")
+            try:
+                sys.path.append(os.path.dirname(os.path.abspath(__file__)) +
+                                "/Infer/scripts")
+                from embedding_matrix import load_embedding_matrix
+                load_embedding_matrix(self.xdtd_data_path)
+                eprint(f"{timestamp}: INFO: ARAXBackgroundTasker: "
+                       "Completed converting the xDTD embeddings")
+            except Exception as error:
+                eprint(f"{timestamp}: INFO: ARAXBackgroundTasker: "
+                       f"converting the xDTD embeddings failed: {error}")
+
         # Loop forever doing various things
         my_pid = os.getpid()
         while True:
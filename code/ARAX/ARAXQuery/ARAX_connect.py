@@ -15,8 +15,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from Path_Finder.converter.paths_to_response_converter_factory import paths_to_response_converter_factory
 from Path_Finder.converter.Names import Names
 from Path_Finder.BidirectionalPathFinder import BidirectionalPathFinder
+from Path_Finder.constants import MAX_PATHS, MAX_PARTIAL_PATHS, PATH_FINDER_TIME_LIMIT
 from Path_Finder.repo.NGDSortedNeighborsRepo import NGDSortedNeighborsRepo
 from Path_Finder.repo.PloverDBRepo import PloverDBRepo
+from Path_Finder.repo.NodeDegreeRepo import NodeDegreeRepo
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.q_edge import QEdge
@@ -280,18 +282,29 @@ connect_nodes adds paths between two nodes specified in the query.
         if len(nodes) != 2:
             self.response.error(f"Need to have two nodes to find paths between them. Number of nodes: {len(nodes)}")
 
-        path_finder = BidirectionalPathFinder(
-            NGDSortedNeighborsRepo(
-                PloverDBRepo(plover_url=RTXConfiguration().plover_url)
-            )
-        )
-        qnode_1_id = self.parameters['qnode_keys'][0]
-        qnode_2_id = self.parameters['qnode_keys'][1]
-        synonymizer = NodeSynonymizer()
-        node_1_id = synonymizer.get_canonical_curies(curies=nodes[qnode_1_id].ids[0])[nodes[qnode_1_id].ids[0]]['preferred_curie']
-        node_2_id = synonymizer.get_canonical_curies(curies=nodes[qnode_2_id].ids[0])[nodes[qnode_2_id].ids[0]]['preferred_curie']
-
-        paths = path_finder.find_all_paths(node_1_id, node_2_id, hops_numbers=self.parameters['max_path_length'])
+        degree_repo = NodeDegreeRepo()
+        plover_repo = PloverDBRepo(plover_url=RTXConfiguration().plover_url, degree_repo=degree_repo)
+        path_finder_repo = NGDSortedNeighborsRepo(plover_repo, degree_repo=degree_repo)
+        try:
+            path_finder = BidirectionalPathFinder(path_finder_repo)
+            qnode_1_id = self.parameters['qnode_keys'][0]
+            qnode_2_id = self.parameters['qnode_keys'][1]
+            synonymizer = NodeSynonymizer()
+            node_1_id = synonymizer.get_canonical_curies(curies=nodes[qnode_1_id].ids[0])[nodes[qnode_1_id].ids[0]]['preferred_curie']
+            node_2_id = synonymizer.get_canonical_curies(curies=nodes[qnode_2_id].ids[0])[nodes[qnode_2_id].ids[0]]['preferred_curie']
+
+            paths = path_finder.find_all_paths(node_1_id, node_2_id, hops_numbers=self.parameters['max_path_length'],
+                                               max_paths=MAX_PATHS, max_partial_paths=MAX_PARTIAL_PATHS,
+                                               time_limit=PATH_FINDER_TIME_LIMIT)
+        finally:
+            path_finder_repo.close()
+            plover_repo.close()
+            degree_repo.close()
+        if path_finder.is_truncated:
+            self.response.warning(f"Path finding between {qnode_1_id} and {qnode_2_id} hit its limits (at most "
+                                  f"{MAX_PATHS} paths, {MAX_PARTIAL_PATHS} partial paths per side, and "
+                                  f"{PATH_FINDER_TIME_LIMIT} seconds); returning the {len(paths)} lowest-weight "
+                                  f"paths found.")
 
         if len(paths) == 0:
             self.response.warning(f"Could not connect the nodes {qnode_1_id} and {qnode_2_id} "
@@ -12,6 +12,7 @@ from typing import List, Dict, Tuple, Union, Set, Optional
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # ARAXQuery directory
 from ARAX_response import ARAXResponse
 from ARAX_decorator import ARAXDecorator
+from compact_kg import CompactKnowledgeGraph
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
 from RTXConfiguration import RTXConfiguration
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../BiolinkHelper/")
@@ -20,6 +21,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/Expand/")
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
 from kp_selector import KPSelector
+from Expand.kp_connection_pool import KPConnectionPool
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.knowledge_graph import KnowledgeGraph
 from openapi_server.models.query_graph import QueryGraph
@@ -29,6 +31,7 @@ from openapi_server.models.edge import Edge
 from openapi_server.models.attribute_constraint import AttributeConstraint
 from Expand.kg2_querier import KG2Querier
 from Expand.trapi_querier import TRAPIQuerier
+from Expand.kp_answer_cache import KPAnswerCache
 
 
 def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
@@ -48,6 +51,8 @@ def trim_to_size(input_list, length):
 
 class ARAXExpander:
 
+    pipeline_batch_size = 1000  # Max number of curies sent downstream per KP query in pipelined mode
+
     def __init__(self):
         self.bh = BiolinkHelper()
         self.rtxc = RTXConfiguration()
@@ -134,6 +139,17 @@ class ARAXExpander:
                 "type": "boolean",
                 "description": "Whether to omit supporting data on nodes/edges in the results (e.g., publications, "
                                "description, etc.)."
+            },
+            "pipelined": {
+                "is_required": False,
+                "examples": ["true", "false"],
+                "type": "boolean",
+                "default": "false",
+                "description": "Whether to expand multi-hop query graphs in a pipelined fashion, meaning curies "
+                               "returned by each KP are sent on (in batches) to KPs for the next qedge as soon as "
+                               "they arrive, rather than waiting for all KPs to answer the current qedge. Only "
+                               "applies to query graphs without optional/'exclude' qedges; instead of pre-pruning, no more "
+                               "curies are sent on to a qedge than its prune threshold allows."
             }
         }
         return parameter_info_dict
@@ -350,8 +366,28 @@ class ARAXExpander:
                     for edge in query_sub_graph.edges.keys():
                         query_sub_graph.edges[edge].knowledge_type = 'lookup'
 
+            # Expand the query graph in a pipelined fashion, if requested and the query graph allows for it
+            qedge_keys_to_expand_one_by_one = ordered_qedge_keys_to_expand
+            if parameters.get("pipelined") is True and self._can_expand_pipelined(ordered_qedge_keys_to_expand, query_graph,
+                                                                                   overarching_kg, inferred_qedge_keys,
+                                                                                   mode, log):
+                overarching_kg = self._expand_pipelined(ordered_qedge_keys_to_expand, query_graph, overarching_kg,
+                                                        message, parameters, kp_selector, user_specified_kp,
+                                                        kp_timeout, force_local, response)
+                if response.status != 'OK':
+                    return response
+                for qedge_key in ordered_qedge_keys_to_expand:
+                    overarching_kg = self._apply_post_expansion_filters(qedge_key, query_graph, overarching_kg, message,
+                                                                         inferred_qedge_keys, mode, response)
+                    if response.status != 'OK':
+                        return response
+                    response.update_query_plan(qedge_key, 'edge_properties', 'status', 'Done')
+                    if not self._qg_is_fulfilled_so_far(qedge_key, query_graph, overarching_kg, log):
+                        return response
+                qedge_keys_to_expand_one_by_one = []
+
             # Expand the query graph edge-by-edge
-            for qedge_key in ordered_qedge_keys_to_expand:
+            for qedge_key in qedge_keys_to_expand_one_by_one:
                 log.debug(f"Expanding qedge {qedge_key}")
                 response.update_query_plan(qedge_key, 'edge_properties', 'status', 'Expanding')
                 for kp in kp_selector.valid_kps:
@@ -393,28 +429,8 @@ class ARAXExpander:
                 qedge.filled = True  # Also mark as expanded in local QG #1848
 
                 # Figure out which KPs would be best to expand this edge with (if no KP was specified)
-                if not user_specified_kp:
-                    if mode == "RTXKG2":
-                        kps_to_query = {"infores:rtx-kg2"}
-                    else:
-                        queriable_kps = set(kp_selector.get_kps_for_single_hop_qg(one_hop_qg))
-                        # remove kps if this edge has kp constraints
-                        allowlist, denylist = eu.get_knowledge_source_constraints(qedge)
-                        kps_to_query = queriable_kps - denylist
-                        if allowlist:
-                            kps_to_query = {kp for kp in kps_to_query if kp in allowlist}
-
-                        for skipped_kp in queriable_kps.difference(kps_to_query):
-                            skipped_message = "This KP was constrained by this edge"
-                            response.update_query_plan(qedge_key, skipped_kp, "Skipped", skipped_message)
-
-                    log.info(f"Expand decided to use {len(kps_to_query)} KPs to answer {qedge_key}: {kps_to_query}")
-                else:
-                    kps_to_query = set(eu.convert_to_list(parameters["kp"]))
-                    for kp in kp_selector.valid_kps.difference(kps_to_query):
-                        skipped_message = f"Expand was told to use {', '.join(kps_to_query)}"
-                        response.update_query_plan(qedge_key, kp, "Skipped", skipped_message)
-                kps_to_query = list(kps_to_query)
+                kps_to_query = self._get_kps_to_query(qedge_key, one_hop_qg, user_specified_kp, parameters,
+                                                      kp_selector, mode, response)
 
                 # Use a non-concurrent method to expand with KG2 when bypassing the KG2 API
                 if kps_to_query == ["infores:rtx-kg2"] and mode == "RTXKG2":
@@ -423,8 +439,8 @@ class ARAXExpander:
                 elif kps_to_query:
                     kps_to_query = eu.sort_kps_for_asyncio(kps_to_query, log)
                     log.debug(f"Will use asyncio to run KP queries concurrently")
-                    loop = asyncio.new_event_loop()  # Need to create NEW event loop for threaded environments
-                    asyncio.set_event_loop(loop)
+                    # Run on the process-wide pool's event loop so KP connections are reused across qedges/queries
+                    kp_connection_pool = KPConnectionPool()
                     tasks = [self._expand_edge_async(one_hop_qg,
                                                      kp_to_use,
                                                      user_specified_kp,
@@ -435,9 +451,9 @@ class ARAXExpander:
                                                      multiple_kps=True,
                                                      alter_kg2_treats_edges=alter_kg2_treats_edges)
                              for kp_to_use in kps_to_query]
-                    task_group = asyncio.gather(*tasks)
-                    kp_answers = loop.run_until_complete(task_group)
-                    loop.close()
+                    kp_answers = kp_connection_pool.run_until_complete(tasks)
+                    log.debug(f"KP connection reuse so far: {kp_connection_pool.get_printable_stats()}")
+                    log.info(f"KP answer cache usage so far: {KPAnswerCache().get_printable_stats(kps_to_query)}")
                 else:
                     log.error("Expand could not find any KPs to answer "
                               f"{qedge_key} with.", error_code="NoResults")
@@ -458,82 +474,17 @@ class ARAXExpander:
                         return response
                 log.debug(f"After merging KPs' answers, total KG counts are: {eu.get_printable_counts_by_qg_id(overarching_kg)}")
 
-                # Handle any constraints for this qedge and/or its qnodes (that require post-filtering)
-                qnode_keys = {qedge.subject, qedge.object}
-                qnode_keys_with_answers = qnode_keys.intersection(set(overarching_kg.nodes_by_qg_id))
-                for qnode_key in qnode_keys_with_answers:
-                    qnode = query_graph.nodes[qnode_key]
-                    if qnode.constraints:
-                        for constraint in qnode.constraints:
-                            if constraint.id == "biolink:highest_FDA_approval_status" and constraint.operator == "==" and constraint.value == "regular approval":
-                                log.info(f"Applying qnode {qnode_key} constraint: {'NOT ' if constraint._not else ''}"
-                                         f"biolink:highest_FDA_approval_status == regular approval")
-                                fda_approved_drug_ids = self._load_fda_approved_drug_ids()
-                                answer_node_ids = set(overarching_kg.nodes_by_qg_id[qnode_key])
-                                if constraint._not:
-                                    nodes_to_remove = answer_node_ids.intersection(fda_approved_drug_ids)
-                                else:
-                                    nodes_to_remove = answer_node_ids.difference(fda_approved_drug_ids)
-                                log.debug(f"Removing {len(nodes_to_remove)} nodes fulfilling {qnode_key} for FDA "
-                                          f"approval constraint ({round((len(nodes_to_remove) / len(answer_node_ids)) * 100)}%)")
-                                overarching_kg.remove_nodes(nodes_to_remove, qnode_key, query_graph)
-
-                # Handle knowledge source constraints for this qedge
-                # Removing kedges that have any sources that are constrained
-                log.debug(f"Handling any knowledge source constraints")
-                allowlist, denylist = eu.get_knowledge_source_constraints(qedge)
-                log.debug(f"KP allowlist is {allowlist}, denylist is {denylist}")
-                if qedge_key in overarching_kg.edges_by_qg_id:
-                    kedges_to_remove = []
-                    for kedge_key, kedge in overarching_kg.edges_by_qg_id[qedge_key].items():
-                        edge_sources = {retrieval_source.resource_id for retrieval_source in kedge.sources} if kedge.sources else set()
-                        if edge_sources:
-                            # always accept arax as a source
-                            if edge_sources == {"infores:arax"}:
-                                continue
-                            # Don't keep edges that ONLY come from excluded sources
-                            if edge_sources.issubset(denylist):
-                                kedges_to_remove.append(kedge_key)
-                                break
-                            # Only keep edges that come from at least ONE allowed source
-                            elif allowlist and not edge_sources.intersection(allowlist):
-                                kedges_to_remove.append(kedge_key)
-                                break
-                    if kedges_to_remove:
-                        log.debug(f"Removing {len(kedges_to_remove)} edges because they do not fulfill knowledge source constraint")
-                        # remove kedges which have been determined to be constrained
-                        for kedge_key in kedges_to_remove:
-                            if kedge_key in overarching_kg.edges_by_qg_id[qedge_key]:
-                                del overarching_kg.edges_by_qg_id[qedge_key][kedge_key]
-
-                if mode != "RTXKG2":
-                    # Apply any kryptonite ("not") qedges
-                    self._apply_any_kryptonite_edges(overarching_kg, message.query_graph,
-                                                     message.encountered_kryptonite_edges_info, response)
-                    # Remove any paths that are now dead-ends
-                    if inferred_qedge_keys and len(inferred_qedge_keys) == 1:
-                        overarching_kg = self._remove_dead_end_paths(message.query_graph, overarching_kg, response)
-                    else:
-                        overarching_kg = self._remove_dead_end_paths(query_graph, overarching_kg, response)
-                    if response.status != 'OK':
-                        return response
+                overarching_kg = self._apply_post_expansion_filters(qedge_key, query_graph, overarching_kg, message,
+                                                                     inferred_qedge_keys, mode, response)
+                if response.status != 'OK':
+                    return response
 
                 # Declare that we are done expanding this qedge
                 response.update_query_plan(qedge_key, 'edge_properties', 'status', 'Done')
 
                 # Make sure we have at least SOME answers for all (regular) qedges expanded so far..
                 # TODO: Should this really just return response here? What about returning partial KG?
-                is_fulfilled, unfulfilled_qedge_keys = eu.qg_is_fulfilled(query_graph,
-                                                                          overarching_kg,
-                                                                          enforce_required_only=True,
-                                                                          enforce_expanded_only=True,
-                                                                          return_unfulfilled_qedges=True)
-                if not is_fulfilled:
-                    if qedge.exclude:
-                        log.warning(f"After processing 'exclude=True' edge {qedge_key}, "
-                                    f"no paths remain from any KPs that satisfy qedge(s) {unfulfilled_qedge_keys}.")
-                    else:
-                        log.warning(f"No paths were found in any KPs satisfying qedge {unfulfilled_qedge_keys}.")
+                if not self._qg_is_fulfilled_so_far(qedge_key, query_graph, overarching_kg, log):
                     return response
 
         # Expand any specified nodes
@@ -602,6 +553,278 @@ class ARAXExpander:
         
         return response
 
+    def _can_expand_pipelined(self, ordered_qedge_keys: List[str], query_graph: QueryGraph,
+                              overarching_kg: QGOrganizedKnowledgeGraph, inferred_qedge_keys: List[str], mode: str,
+                              log: ARAXResponse) -> bool:
+        """
+        Pipelined expansion is only used for 'plain' multi-hop query graphs: no optional or kryptonite qedges, no
+        inferred qedges, no cycles, and no answers already in the KG for the qnodes being expanded.
+        """
+        reason = None
+        if mode == "RTXKG2":
+            reason = "in RTXKG2 mode"
+        elif len(ordered_qedge_keys) < 2:
+            reason = "only one qedge is being expanded"
+        elif inferred_qedge_keys:
+            reason = "query graph has inferred qedges"
+        elif any(query_graph.edges[qedge_key].option_group_id or query_graph.edges[qedge_key].exclude
+                 for qedge_key in ordered_qedge_keys):
+            reason = "query graph has optional and/or 'exclude' qedges"
+        elif any(overarching_kg.edges_by_qg_id.get(qedge_key) for qedge_key in ordered_qedge_keys):
+            reason = "some qedges already have answers in the KG"
+        else:
+            input_qnode_keys = self._get_pipeline_input_qnode_keys(ordered_qedge_keys, query_graph)
+            if input_qnode_keys is None:
+                reason = "query graph has a cycle"
+        if reason:
+            log.info(f"Cannot use pipelined expansion ({reason}); will expand qedges one at a time instead")
+            return False
+        return True
+
+    @staticmethod
+    def _get_pipeline_input_qnode_keys(ordered_qedge_keys: List[str], query_graph: QueryGraph) -> Optional[Dict[str, str]]:
+        # Maps each qedge (besides the first) to the qnode whose curies are fed into it by upstream qedges
+        first_qedge = query_graph.edges[ordered_qedge_keys[0]]
+        qnode_keys_seen = {first_qedge.subject, first_qedge.object}
+        input_qnode_keys = dict()
+        for qedge_key in ordered_qedge_keys[1:]:
+            qedge = query_graph.edges[qedge_key]
+            connected_qnode_keys = {qedge.subject, qedge.object}.intersection(qnode_keys_seen)
+            if len(connected_qnode_keys) != 1:
+                return None
+            input_qnode_keys[qedge_key] = connected_qnode_keys.pop()
+            qnode_keys_seen.update({qedge.subject, qedge.object})
+        return input_qnode_keys
+
+    def _expand_pipelined(self, ordered_qedge_keys: List[str], query_graph: QueryGraph,
+                          overarching_kg: QGOrganizedKnowledgeGraph, message, parameters: Dict[str, any],
+                          kp_selector: KPSelector, user_specified_kp: bool, kp_timeout: Optional[int],
+                          force_local: bool, response: ARAXResponse) -> QGOrganizedKnowledgeGraph:
+        log = response
+        log.info(f"Expanding qedges {ordered_qedge_keys} in a pipelined fashion (batches of up to "
+                 f"{self.pipeline_batch_size} curies are sent downstream as soon as KPs answer)")
+        kp_connection_pool = KPConnectionPool()
+        kp_connection_pool.run_until_complete([self._expand_pipelined_async(ordered_qedge_keys, query_graph,
+                                                                            overarching_kg, message, parameters,
+                                                                            kp_selector, user_specified_kp,
+                                                                            kp_timeout, force_local, response)])
+        log.debug(f"KP connection reuse so far: {kp_connection_pool.get_printable_stats()}")
+        log.info(f"KP answer cache usage so far: {KPAnswerCache().get_printable_stats()}")
+        log.debug(f"After pipelined expansion, total KG counts are: {eu.get_printable_counts_by_qg_id(overarching_kg)}")
+        return overarching_kg
+
+    async def _expand_pipelined_async(self, ordered_qedge_keys: List[str], query_graph: QueryGraph,
+                                      overarching_kg: QGOrganizedKnowledgeGraph, message, parameters: Dict[str, any],
+                                      kp_selector: KPSelector, user_specified_kp: bool, kp_timeout: Optional[int],
+                                      force_local: bool, response: ARAXResponse):
+        log = response
+        input_qnode_keys = self._get_pipeline_input_qnode_keys(ordered_qedge_keys, query_graph)
+        kps_by_qedge_key = dict()
+        curies_sent = defaultdict(set)
+        prune_thresholds = dict()
+        batch_counts = defaultdict(lambda: defaultdict(lambda: {"sent": 0, "answered": 0, "edges": 0}))
+        pending_tasks = dict()  # Maps asyncio tasks to the (qedge_key, kp) they're expanding
+
+        # Mark all qedges as 'filled' up front; any without answers at the end should be reported as unfulfilled
+        for qedge_key in ordered_qedge_keys:
+            message.query_graph.edges[qedge_key].filled = True
+            query_graph.edges[qedge_key].filled = True
+
+        def send_batch(qedge_key: str, one_hop_qg: QueryGraph):
+            if qedge_key not in kps_by_qedge_key:
+                response.update_query_plan(qedge_key, 'edge_properties', 'status', 'Expanding')
+                kps_by_qedge_key[qedge_key] = self._get_kps_to_query(qedge_key, one_hop_qg, user_specified_kp,
+                                                                     parameters, kp_selector, "ARAX", response)
+                if not kps_by_qedge_key[qedge_key]:
+                    log.error(f"Expand could not find any KPs to answer {qedge_key} with.", error_code="NoResults")
+                    return
+            for kp_to_use in eu.sort_kps_for_asyncio(kps_by_qedge_key[qedge_key], log):
+                task = asyncio.ensure_future(self._expand_edge_async(one_hop_qg, kp_to_use, user_specified_kp,
+                                                                     kp_timeout, force_local, kp_selector, log,
+                                                                     multiple_kps=True))
+                pending_tasks[task] = (qedge_key, kp_to_use)
+                batch_counts[qedge_key][kp_to_use]["sent"] += 1
+
+        def get_prune_threshold(qedge_key: str) -> int:
+            if qedge_key not in prune_thresholds:
+                if parameters.get("prune_threshold"):
+                    prune_thresholds[qedge_key] = parameters["prune_threshold"]
+                else:
+                    one_hop_qg = self._get_query_graph_for_edge(qedge_key, query_graph, overarching_kg, log)
+                    prune_thresholds[qedge_key] = self._get_prune_threshold(one_hop_qg)
+                log.debug(f"For {qedge_key}, pre-prune threshold is {prune_thresholds[qedge_key]}")
+            return prune_thresholds[qedge_key]
+
+        def send_new_curies_downstream(answered_qedge_key: str):
+            answered_qedge = query_graph.edges[answered_qedge_key]
+            answered_qnode_keys = {answered_qedge.subject, answered_qedge.object}
+            answered_qedge_index = ordered_qedge_keys.index(answered_qedge_key)
+            for downstream_qedge_key in ordered_qedge_keys[answered_qedge_index + 1:]:
+                input_qnode_key = input_qnode_keys[downstream_qedge_key]
+                # Only curies for the answered qedge's 'output' qnode are fed downstream
+                if input_qnode_key in answered_qnode_keys and input_qnode_key != input_qnode_keys.get(answered_qedge_key):
+                    new_curies = sorted(set(overarching_kg.nodes_by_qg_id.get(input_qnode_key, dict()))
+                                        .difference(curies_sent[downstream_qedge_key]))
+                    # Stand in for the pre-prune step of edge-by-edge expansion: no more input curies are sent
+                    # downstream than its prune threshold allows (the rest end up as dead ends, which are removed)
+                    num_curies_allowed = max(0, get_prune_threshold(downstream_qedge_key) -
+                                             len(curies_sent[downstream_qedge_key]))
+                    if len(new_curies) > num_curies_allowed:
+                        log.info(f"Reached the pre-prune threshold for {downstream_qedge_key}; not sending "
+                                 f"{len(new_curies) - num_curies_allowed} more {input_qnode_key} curies downstream")
+                        new_curies = new_curies[:num_curies_allowed]
+                    for start_index in range(0, len(new_curies), self.pipeline_batch_size):
+                        batch = new_curies[start_index:start_index + self.pipeline_batch_size]
+                        curies_sent[downstream_qedge_key].update(batch)
+                        one_hop_qg = self._get_query_graph_for_edge(downstream_qedge_key, query_graph,
+                                                                    overarching_kg, log)
+                        one_hop_qg.nodes[input_qnode_key].ids = batch
+                        log.debug(f"Sending a batch of {len(batch)} {input_qnode_key} curies downstream to "
+                                  f"{downstream_qedge_key}")
+                        send_batch(downstream_qedge_key, one_hop_qg)
+
+        # Kick things off with the first qedge (which uses only curies specified in the QG)
+        first_qedge_key = ordered_qedge_keys[0]
+        send_batch(first_qedge_key, self._get_query_graph_for_edge(first_qedge_key, query_graph, overarching_kg, log))
+
+        while pending_tasks and log.status == 'OK':
+            done_tasks, _ = await asyncio.wait(set(pending_tasks), return_when=asyncio.FIRST_COMPLETED)
+            for task in done_tasks:
+                qedge_key, kp = pending_tasks.pop(task)
+                answer_kg, _ = task.result()
+                self._merge_answer_into_message_kg(answer_kg, overarching_kg, message.query_graph, query_graph,
+                                                   "ARAX", response)
+                if log.status != 'OK':
+                    break
+
+                # Show the progress of this KP's batches in the query plan
+                counts = batch_counts[qedge_key][kp]
+                counts["answered"] += 1
+                counts["edges"] += len(answer_kg.edges_by_qg_id.get(qedge_key, dict()))
+                latest_description = response.query_plan['qedge_keys'].get(qedge_key, dict()).get(kp, dict()).get('description')
+                status = "Done" if counts["answered"] == counts["sent"] else "Waiting"
+                response.update_query_plan(qedge_key, kp, status,
+                                           f"Answered {counts['answered']} of {counts['sent']} pipelined batches so far "
+                                           f"({counts['edges']} edges total); latest batch: {latest_description}")
+
+                send_new_curies_downstream(qedge_key)
+
+        # Clean up anything left over if we had to bail out early
+        for task in pending_tasks:
+            task.cancel()
+        await asyncio.gather(*pending_tasks, return_exceptions=True)
+
+    @staticmethod
+    def _get_kps_to_query(qedge_key: str, one_hop_qg: QueryGraph, user_specified_kp: bool, parameters: Dict[str, any],
+                          kp_selector: KPSelector, mode: str, response: ARAXResponse) -> List[str]:
+        # This function figures out which KPs would be best to expand this edge with (if no KP was specified)
+        log = response
+        qedge = one_hop_qg.edges[qedge_key]
+        if not user_specified_kp:
+            if mode == "RTXKG2":
+                kps_to_query = {"infores:rtx-kg2"}
+            else:
+                queriable_kps = set(kp_selector.get_kps_for_single_hop_qg(one_hop_qg))
+                # remove kps if this edge has kp constraints
+                allowlist, denylist = eu.get_knowledge_source_constraints(qedge)
+                kps_to_query = queriable_kps - denylist
+                if allowlist:
+                    kps_to_query = {kp for kp in kps_to_query if kp in allowlist}
+
+                for skipped_kp in queriable_kps.difference(kps_to_query):
+                    skipped_message = "This KP was constrained by this edge"
+                    response.update_query_plan(qedge_key, skipped_kp, "Skipped", skipped_message)
+
+            log.info(f"Expand decided to use {len(kps_to_query)} KPs to answer {qedge_key}: {kps_to_query}")
+        else:
+            kps_to_query = set(eu.convert_to_list(parameters["kp"]))
+            for kp in kp_selector.valid_kps.difference(kps_to_query):
+                skipped_message = f"Expand was told to use {', '.join(kps_to_query)}"
+                response.update_query_plan(qedge_key, kp, "Skipped", skipped_message)
+        kps_to_query = list(kps_to_query)
+        return kps_to_query
+
+    def _apply_post_expansion_filters(self, qedge_key: str, query_graph: QueryGraph,
+                                      overarching_kg: QGOrganizedKnowledgeGraph, message, inferred_qedge_keys: List[str],
+                                      mode: str, response: ARAXResponse) -> QGOrganizedKnowledgeGraph:
+        # This function applies any constraints/cleanup that need to happen after answers for a qedge have been merged
+        log = response
+        qedge = query_graph.edges[qedge_key]
+        # Handle any constraints for this qedge and/or its qnodes (that require post-filtering)
+        qnode_keys = {qedge.subject, qedge.object}
+        qnode_keys_with_answers = qnode_keys.intersection(set(overarching_kg.nodes_by_qg_id))
+        for qnode_key in qnode_keys_with_answers:
+            qnode = query_graph.nodes[qnode_key]
+            if qnode.constraints:
+                for constraint in qnode.constraints:
+                    if constraint.id == "biolink:highest_FDA_approval_status" and constraint.operator == "==" and constraint.value == "regular approval":
+                        log.info(f"Applying qnode {qnode_key} constraint: {'NOT ' if constraint._not else ''}"
+                                 f"biolink:highest_FDA_approval_status == regular approval")
+                        fda_approved_drug_ids = self._load_fda_approved_drug_ids()
+                        answer_node_ids = set(overarching_kg.nodes_by_qg_id[qnode_key])
+                        if constraint._not:
+                            nodes_to_remove = answer_node_ids.intersection(fda_approved_drug_ids)
+                        else:
+                            nodes_to_remove = answer_node_ids.difference(fda_approved_drug_ids)
+                        log.debug(f"Removing {len(nodes_to_remove)} nodes fulfilling {qnode_key} for FDA "
+                                  f"approval constraint ({round((len(nodes_to_remove) / len(answer_node_ids)) * 100)}%)")
+                        overarching_kg.remove_nodes(nodes_to_remove, qnode_key, query_graph)
+
+        # Handle knowledge source constraints for this qedge
+        # Removing kedges that have any sources that are constrained
+        log.debug(f"Handling any knowledge source constraints")
+        allowlist, denylist = eu.get_knowledge_source_constraints(qedge)
+        log.debug(f"KP allowlist is {allowlist}, denylist is {denylist}")
+        if qedge_key in overarching_kg.edges_by_qg_id:
+            kedges_to_remove = []
+            for kedge_key, kedge in overarching_kg.edges_by_qg_id[qedge_key].items():
+                edge_sources = {retrieval_source.resource_id for retrieval_source in kedge.sources} if kedge.sources else set()
+                if edge_sources:
+                    # always accept arax as a source
+                    if edge_sources == {"infores:arax"}:
+                        continue
+                    # Don't keep edges that ONLY come from excluded sources
+                    if edge_sources.issubset(denylist):
+                        kedges_to_remove.append(kedge_key)
+                        break
+                    # Only keep edges that come from at least ONE allowed source
+                    elif allowlist and not edge_sources.intersection(allowlist):
+                        kedges_to_remove.append(kedge_key)
+                        break
+            if kedges_to_remove:
+                log.debug(f"Removing {len(kedges_to_remove)} edges because they do not fulfill knowledge source constraint")
+                # remove kedges which have been determined to be constrained
+                for kedge_key in kedges_to_remove:
+                    if kedge_key in overarching_kg.edges_by_qg_id[qedge_key]:
+                        del overarching_kg.edges_by_qg_id[qedge_key][kedge_key]
+
+        if mode != "RTXKG2":
+            # Apply any kryptonite ("not") qedges
+            self._apply_any_kryptonite_edges(overarching_kg, message.query_graph,
+                                             message.encountered_kryptonite_edges_info, response)
+            # Remove any paths that are now dead-ends
+            if inferred_qedge_keys and len(inferred_qedge_keys) == 1:
+                overarching_kg = self._remove_dead_end_paths(message.query_graph, overarching_kg, response)
+            else:
+                overarching_kg = self._remove_dead_end_paths(query_graph, overarching_kg, response)
+        return overarching_kg
+
+    @staticmethod
+    def _qg_is_fulfilled_so_far(qedge_key: str, query_graph: QueryGraph, overarching_kg: QGOrganizedKnowledgeGraph,
+                                log: ARAXResponse) -> bool:
+        is_fulfilled, unfulfilled_qedge_keys = eu.qg_is_fulfilled(query_graph,
+                                                                  overarching_kg,
+                                                                  enforce_required_only=True,
+                                                                  enforce_expanded_only=True,
+                                                                  return_unfulfilled_qedges=True)
+        if not is_fulfilled:
+            if query_graph.edges[qedge_key].exclude:
+                log.warning(f"After processing 'exclude=True' edge {qedge_key}, "
+                            f"no paths remain from any KPs that satisfy qedge(s) {unfulfilled_qedge_keys}.")
+            else:
+                log.warning(f"No paths were found in any KPs satisfying qedge {unfulfilled_qedge_keys}.")
+        return is_fulfilled
+
     @staticmethod
     def get_inferred_answers(inferred_qedge_keys: List[str],
                              query_graph: QueryGraph,
@@ -784,14 +1007,21 @@ class ARAXExpander:
 
         log.info(f"{kp_to_use}: Query for edge {qedge_key} completed ({eu.get_printable_counts_by_qg_id(answer_kg)})")
 
-        # Do some post-processing (deduplicate nodes, remove self-edges..)
+        # Do some post-processing (deduplicate nodes, remove self-edges..); this blocks (e.g., on the synonymizer's
+        # database), so it's run in the loop's thread pool rather than holding up the KP queries sharing this loop
+        answer_kg = await asyncio.get_running_loop().run_in_executor(None, self._post_process_kp_answer, answer_kg,
+                                                                     kp_to_use, log)
+
+        return answer_kg, log
+
+    def _post_process_kp_answer(self, answer_kg: QGOrganizedKnowledgeGraph, kp_to_use: str,
+                                log: ARAXResponse) -> QGOrganizedKnowledgeGraph:
         if kp_to_use != 'infores:rtx-kg2':  # KG2c is already deduplicated and uses canonical predicates
             answer_kg = eu.check_for_canonical_predicates(answer_kg, kp_to_use, log)
             answer_kg = self._deduplicate_nodes(answer_kg, kp_to_use, log)
         if any(edges for edges in answer_kg.edges_by_qg_id.values()):  # Make sure the KP actually returned something
             answer_kg = self._remove_self_edges(answer_kg, kp_to_use, log)
-
-        return answer_kg, log
+        return answer_kg
 
     def _expand_edge_kg2_local(self, one_hop_qg: QueryGraph, log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, ARAXResponse]:
         qedge_key = next(qedge_key for qedge_key in one_hop_qg.edges)
@@ -1188,9 +1418,21 @@ class ARAXExpander:
         is_set_true_qg = copy.deepcopy(expands_qg)
         for qnode in is_set_true_qg.nodes.values():
             qnode.is_set = True  # This makes resultify run faster and doesn't hurt in this case
-        resultify_response = eu.create_results(is_set_true_qg, kg, log)
+        # Only the KG's structure matters here, so Resultify works off of a structure-only compact copy of the KG
+        # (rather than re-annotating all of its node/edge objects); we then keep whichever of them Resultify kept
+        compact_kg = CompactKnowledgeGraph.from_qg_organized_kg(kg, include_properties=False)
+        resultify_response = eu.create_results(is_set_true_qg, compact_kg, log)
         if resultify_response.status == "OK":
-            pruned_kg = eu.convert_standard_kg_to_qg_organized_kg(resultify_response.envelope.message.knowledge_graph)
+            resultify_kg = resultify_response.envelope.message.knowledge_graph
+            pruned_kg = QGOrganizedKnowledgeGraph()
+            for qnode_key, nodes in kg.nodes_by_qg_id.items():
+                for node_key, node in nodes.items():
+                    if node_key in resultify_kg.nodes:
+                        pruned_kg.add_node(node_key, node, qnode_key)
+            for qedge_key, edges in kg.edges_by_qg_id.items():
+                for edge_key, edge in edges.items():
+                    if edge_key in resultify_kg.edges:
+                        pruned_kg.add_edge(edge_key, edge, qedge_key)
         else:
             pruned_kg = QGOrganizedKnowledgeGraph()
             log.error(f"Ran into an issue trying to prune using Resultify: {resultify_response.show()}",
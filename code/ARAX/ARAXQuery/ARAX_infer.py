@@ -462,10 +462,15 @@ chemical_gene_regulation_graph_expansion predicts the regulation relationship be
             else:
                 self.response.warning(f"Could not get equivalent curies for Drug {self.parameters['drug_curie']}")
                 return self.response
+        try:
+            top_paths_by_disease = XDTD.get_top_paths_for_diseases(disease_ids=list(all_equivalent_curies),
+                                                                   top_m=self.parameters['n_paths'])
+        except:
+            top_paths_by_disease = None
         for preferred_curie in all_equivalent_curies:
             try:
                 top_drugs = XDTD.get_top_drugs_for_disease(disease_ids=preferred_curie)
-                top_paths = XDTD.get_top_paths_for_disease(disease_ids=preferred_curie)
+                top_paths = top_paths_by_disease[preferred_curie]
             except:
                 self.response.warning(f"Could not get top drugs and paths for disease {preferred_curie}")
                 continue
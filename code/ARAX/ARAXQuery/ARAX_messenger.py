@@ -16,6 +16,7 @@ from ARAX_response import ARAXResponse
 from ARAX_resultify import ARAXResultify
 from query_graph_info import QueryGraphInfo
 from knowledge_graph_info import KnowledgeGraphInfo
+from lazy_trapi_models import knowledge_graph_from_dict
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
 from RTXConfiguration import RTXConfiguration
@@ -749,7 +750,9 @@ class ARAXMessenger:
 
 
     #### Convert a Message as a dict to a Message as objects
-    def from_dict(self, message):
+    #### With lazy_knowledge_graph, the knowledge graph's nodes and edges are LazyNodes and LazyEdges, whose attributes
+    #### (and qualifiers and sources) are only converted to objects once something reads them
+    def from_dict(self, message, lazy_knowledge_graph=False):
 
         if str(message.__class__) == "<class 'openapi_server.models.message.Message'>":
             return message
@@ -788,7 +791,12 @@ class ARAXMessenger:
         #eprint(json.dumps(message,indent=2,sort_keys=True))
 
         #### Deserialize
-        message = Message().from_dict(message)
+        if lazy_knowledge_graph and message.get('knowledge_graph') is not None:
+            knowledge_graph = knowledge_graph_from_dict(message['knowledge_graph'])
+            message = Message().from_dict({key: value for key, value in message.items() if key != 'knowledge_graph'})
+            message.knowledge_graph = knowledge_graph
+        else:
+            message = Message().from_dict(message)
 
         #### Revert some things back temporarily
 
@@ -31,8 +31,9 @@ from ARAX_query_graph_interpreter import ARAXQueryGraphInterpreter
 from ARAX_messenger import ARAXMessenger
 from ARAX_ranker import ARAXRanker
 from operation_to_ARAXi import WorkflowToARAXi
-from ARAX_query_tracker import ARAXQueryTracker
+from ARAX_query_tracker import ARAXQueryTracker, get_cancel_token
 from result_transformer import ResultTransformer
+from trapi_json_encoder import iter_model_json
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response
@@ -59,16 +60,46 @@ from response_cache import ResponseCache
 ARAXResponse.output = 'STDERR'
 
 null_context_manager = contextlib.nullcontext()
+QUERY_PROGRESS_IDLE_SEC = 180.0  # query_return_stream() sends a 'still progressing' message after this long without news
 
 
 class response_locking(ARAXResponse):
-    def __init__(self, lock: threading.Lock):
+    """
+    An ARAXResponse that notifies a condition variable of its log, job_id, and query plan changes, so that
+    query_return_stream() can stream them as they happen
+    """
+    def __init__(self, lock: threading.Condition):
         self.lock = lock
         super().__init__()
 
-    def __add_message(self, message, level, code=None):
+    # Messages are only ever appended (which is atomic), so they're logged (and printed) without holding the lock;
+    # it's only taken to notify the streaming thread
+    def _add_message(self, message, level, code=None):
+        super()._add_message(message, level, code)
         with self.lock:
-            super()._add_message(message, level, code)
+            self.lock.notify_all()
+
+    def merge(self, response_to_merge):
+        super().merge(response_to_merge)
+        with self.lock:
+            self.lock.notify_all()
+
+    @property
+    def job_id(self):
+        return self._job_id
+
+    @job_id.setter
+    def job_id(self, job_id):
+        with self.lock:
+            self._job_id = job_id
+            self.lock.notify_all()
+
+    # The query plan is nested dicts that the streaming thread serializes while holding the lock, so it's changed
+    # under the lock
+    def update_query_plan(self, qedge_key, provider, status, description, query=None):
+        with self.lock:
+            super().update_query_plan(qedge_key, provider, status, description, query=query)
+            self.lock.notify_all()
 
 class ARAXQuery:
 
@@ -97,25 +128,20 @@ class ARAXQuery:
     def query_return_stream(self, query, mode='ARAX'):
 
         main_query_thread = threading.Thread(target=self.asynchronous_query, args=(query,mode,))
-        self.lock = threading.Lock()
+        # The query thread notifies this condition whenever it logs a message, updates the query plan, or finishes
+        # (it's reentrant since handle_memory_error() logs while holding it)
+        self.lock = threading.Condition(threading.RLock())
         main_query_thread.start()
 
         if self.response is None or "DONE" not in self.response.status:
 
-            # Sleep until a response object has been created
-            have_response = False
-            while not have_response:
-                with self.lock:
-                    have_response = (self.response is not None)
-                if not have_response:
-                    time.sleep(0.1)
+            # Wait until a response object has been created
+            with self.lock:
+                self.lock.wait_for(lambda: self.response is not None)
 
             try:
                 i_message = 0
-                with self.lock:
-                    n_messages = len(self.response.messages)
                 query_plan_counter = 0
-                idle_ticks = 0.0
                 pid = None
 
                 self.response.debug("In query_return_stream")
@@ -123,52 +149,50 @@ class ARAXQuery:
                 response_status_says_done = False
                 while not response_status_says_done:
                     with self.lock:
+                        self.lock.wait_for(lambda: "DONE" in self.response.status
+                                           or i_message < len(self.response.messages)
+                                           or query_plan_counter < self.response.query_plan['counter']
+                                           or (pid is None and hasattr(self.response, 'job_id')),
+                                           timeout=QUERY_PROGRESS_IDLE_SEC)
                         response_status_says_done = ("DONE" in self.response.status)
-                    if response_status_says_done:
-                        break
-                    with self.lock:
-                        n_messages = len(self.response.messages)
-                    while i_message < n_messages:
-                        with self.lock:
-                            i_message_obj = self.response.messages[i_message].copy()
+                        new_messages = self.response.messages[i_message:]
+                        # The query plan is nested dicts that the query thread keeps changing, so it's serialized
+                        # while the lock is held; if it changed several times since the last update, only the latest
+                        # version is sent
+                        query_plan_json = None
+                        if query_plan_counter < self.response.query_plan['counter']:
+                            query_plan_counter = self.response.query_plan['counter']
+                            query_plan_json = json.dumps(self.response.query_plan, allow_nan=False, sort_keys=True)
+
+                    # Logged messages are never changed once they're added, so they can be serialized without the lock
+                    for i_message_obj in new_messages:
                         yield(json.dumps(i_message_obj, allow_nan=False) + "\n")
-                        i_message += 1
-                        idle_ticks = 0.0
+                    i_message += len(new_messages)
 
-                    if pid is None:
+                    # The cancel token is only good for this query (tracked as job_id), since a pooled query worker
+                    # goes on to run other queries in the same pid. The job_id is set (and notified) right after the
+                    # query is received, so this is sent right away; if the query ends before it has a job_id at
+                    # all, the pid is still sent, but its authorization can't terminate anything.
+                    if pid is None and (hasattr(self.response, 'job_id') or response_status_says_done):
                         pid = os.getpid()
-                        authorization = str(hash('Pickles' + str(pid)))
+                        authorization = get_cancel_token(getattr(self.response, 'job_id', None), pid)
                         yield(json.dumps( { "pid": pid, "authorization": authorization } )+"\n")
 
                     #### Also emit any updates to the query_plan
-                    with self.lock:
-                        self_query_plan_counter = self.response.query_plan['counter']
-                    if query_plan_counter < self_query_plan_counter:
-                        query_plan_counter = self_query_plan_counter
-                        with self.lock:
-                            self_response_query_plan = self.response.query_plan.copy()
-                        yield(json.dumps(self_response_query_plan, allow_nan=False, sort_keys=True) + "\n")
-                        idle_ticks = 0.0
-                    time.sleep(0.2)
-                    idle_ticks += 0.2
-                    if idle_ticks > 180.0:
+                    if query_plan_json is not None:
+                        yield(query_plan_json + "\n")
+
+                    if not new_messages and query_plan_json is None and not response_status_says_done:
                         timestamp = str(datetime.now().isoformat())
                         yield json.dumps({ 'timestamp': timestamp, 'level': 'DEBUG', 'code': '', 'message': 'Query is still progressing...' }) + "\n"
-                        idle_ticks = 0.0
             except MemoryError as e:
                 self.handle_memory_error(e)
 
-                # #### If there are any more logging messages in the queue, send them first
-            n_messages = len(self.response.messages)
-            while i_message < n_messages:
-                yield(json.dumps(self.response.messages[i_message], allow_nan=False) + "\n")
-                i_message += 1
-
-            #### Also emit any updates to the query_plan
-            self_response_query_plan_counter = self.response.query_plan['counter']
-            if query_plan_counter < self_response_query_plan_counter:
-                query_plan_counter = self_response_query_plan_counter
-                yield(json.dumps(self.response.query_plan, allow_nan=False, sort_keys=True) + "\n")
+            # #### If there are any more logging messages in the queue, send them first
+            with self.lock:
+                new_messages = self.response.messages[i_message:]
+            for i_message_obj in new_messages:
+                yield(json.dumps(i_message_obj, allow_nan=False) + "\n")
 
             # Remove the little DONE flag the other thread used to signal this thread that it is done
             self.response.status = re.sub('DONE,', '', self.response.status)
@@ -177,22 +201,10 @@ class ARAXQuery:
             if self.response.envelope.status == 'OK':
                 self.response.envelope.status = 'Success'
 
-            # Stream the resulting message back to the client
-            try:
-                msg_str = json.dumps(self.response.envelope.to_dict(),
-                                     allow_nan=False,
-                                     sort_keys=True) + "\n"
-            except ValueError as v:
-                self.response.envelope.message.results = []
-                self.response.envelope.message.auxiliary_graphs = None
-                self.response.envelope.message.knowledge_graph = {'edges': dict(), 'nodes': dict()}
-                self.response.envelope.status = 'ERROR'
-                error_message_str = f"error dumping result to JSON: {str(v)}"
-                self.response.error(error_message_str)
-                eprint(error_message_str)
-                msg_str = json.dumps(self.response.envelope.to_dict(),
-                                     sort_keys=True) + "\n"
-            yield msg_str
+            # Stream the resulting message back to the client, a chunk at a time
+            for chunk in iter_model_json(self.response.envelope):
+                yield chunk
+            yield "\n"
 
         # Wait until both threads rejoin here and the return
         main_query_thread.join()
@@ -223,6 +235,7 @@ class ARAXQuery:
         # Insert a little flag into the response status to denote that this thread is done
         with self.lock:
             self.response.status = f"DONE,{self.response.status}"
+            self.lock.notify_all()
 
         return
 
@@ -363,7 +376,7 @@ class ARAXQuery:
             #### Convert the message from dicts to objects
             if 'message' in query:
                 response.debug(f"Deserializing message")
-                query['message'] = ARAXMessenger().from_dict(query['message'])
+                query['message'] = ARAXMessenger().from_dict(query['message'], lazy_knowledge_graph=True)
 
             # If there is a workflow, translate it to ARAXi and append it to the operations actions list
             if "have_workflow" in query_attributes:
@@ -773,6 +786,8 @@ class ARAXQuery:
                         self.inject_int_value_into_parameters('kp_timeout', response.envelope.query_options, action['parameters'], 'UserTimeoutNotInt')
                         self.inject_int_value_into_parameters('prune_threshold', response.envelope.query_options, action['parameters'], 'PruneThresholdNotInt')
                         self.inject_boolean_value_into_parameters('return_minimal_metadata', response.envelope.query_options, action['parameters'], 'InternalError')
+                        if 'pipelined' not in action['parameters']:
+                            self.inject_boolean_value_into_parameters('pipelined', response.envelope.query_options, action['parameters'], 'InternalError')
                         if response.status == 'ERROR':
                             if mode == 'asynchronous':
                                 self.send_to_callback(callback, response)
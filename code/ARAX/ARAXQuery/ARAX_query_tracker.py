@@ -8,6 +8,9 @@ import re
 import signal
 import socket
 import json
+import hmac
+import hashlib
+import secrets
 import psutil
 
 from datetime import datetime, timezone
@@ -21,6 +24,10 @@ from sqlalchemy import text
 
 DEBUG = False
 
+# Signs the per-query cancel tokens; it's made when the server imports this module, so the query workers and children
+# it forks all share it
+CANCEL_TOKEN_SECRET = secrets.token_bytes(32)
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
 from RTXConfiguration import RTXConfiguration
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
@@ -573,10 +580,22 @@ class ARAXQueryTracker:
         if self.session is None:
             return { 'status': 'ERROR', 'description': 'Internal error ETJ500' }
         eprint(f"INFO: Entering terminate_job: pid={terminate_pid}, authorization={authorization}")
-        reference_authorization = str(hash( 'Pickles' + str(terminate_pid)))
-        if authorization is None or str(authorization) != reference_authorization:
+        try:
+            terminate_pid = int(terminate_pid)
+            job_id = int(str(authorization).split('-')[0])
+        except ValueError:
+            return { 'status': 'ERROR', 'description': 'Invalid authorization provided' }
+        if not hmac.compare_digest(str(authorization), get_cancel_token(job_id, terminate_pid)):
             return { 'status': 'ERROR', 'description': 'Invalid authorization provided' }
 
+        #### Query workers run one query after another, so only terminate the pid if it's still running this job
+        self.session.commit()
+        ongoing_queries = self.session.query(ARAXOngoingQuery).filter(ARAXOngoingQuery.query_id == job_id).all()
+        self.session.commit()
+        if len(ongoing_queries) == 0 or ongoing_queries[0].pid != terminate_pid:
+            eprint(f"INFO: Not terminating pid={terminate_pid} since it is no longer running job {job_id}")
+            return { 'status': 'ERROR', 'description': f"Job {job_id} is no longer running in process {terminate_pid}" }
+
         try:
             os.kill(terminate_pid, signal.SIGTERM)
         except:
@@ -705,6 +724,15 @@ class ARAXQueryTracker:
         return instance_name
 
 
+##################################################################################################
+def get_cancel_token(job_id, pid):
+    """
+    Returns the token that lets a client terminate the query with this job_id (tracker query_id) running in pid
+    """
+    digest = hmac.new(CANCEL_TOKEN_SECRET, f"{job_id}-{pid}".encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"{job_id}-{digest}"
+
+
 ##################################################################################################
 def main():
 
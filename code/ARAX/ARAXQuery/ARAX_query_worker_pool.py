@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+The ARAX_query_worker_pool.py file defines a pool of pre-forked, warm worker processes that run queries for the
+query controller, instead of forking a brand-new child for every query. The pool imports the ARAXi modules (and
+runs any other warm-up) once, in the parent before it forks any workers, so every worker starts out warm and shares the
+imported modules' memory with the parent copy-on-write. Each worker runs queries one at a time until it has served
+max_queries_per_worker queries or its resident memory passes max_rss_bytes, at which point it exits and the pool forks
+a replacement.
+
+A query is handed to an idle worker along with the write end of a pipe (passed over a Unix socket), so the controller
+gets the same file object to stream from as it did with fork-per-query. Workers keep the behavior of the per-query
+children: they have the same virtual memory limit, and a worker whose client goes away (SIGPIPE) exits, and is
+replaced, just like a per-query child did.
+"""
+import json
+import os
+import queue
+import resource
+import signal
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, List, Optional
+
+import psutil
+import setproctitle
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+ARAXI_MODULES = ["ARAX_expander", "ARAX_overlay", "ARAX_filter_kg", "ARAX_resultify", "ARAX_filter_results",
+                 "ARAX_infer", "ARAX_connect"]
+JOB_HEADER_FORMAT = "<QH"  # length of the query JSON, length of the runner name
+REPLY_FORMAT = "<cd"  # reply kind, and (for READY replies) the seconds from fork until the worker was ready
+READY, DONE, RETIRING = b"W", b"D", b"R"
+
+
+class QueryWorkerPool:
+
+    def __init__(self, query_runners: Dict[str, Callable[[dict], Iterable[str]]], num_workers: int,
+                 rlimit_bytes: Optional[int] = None, max_queries_per_worker: int = 100,
+                 max_rss_bytes: Optional[int] = None, warm_up: Optional[Callable[[], None]] = None):
+        """
+        query_runners maps a runner name (given to run_query()) to a function that runs a query dict and returns the
+        JSON strings to stream back. warm_up() (by default, importing the ARAXi modules) is run once, by start(), before
+        any workers are forked.
+        """
+        self.query_runners = query_runners
+        self.num_workers = num_workers
+        self.rlimit_bytes = rlimit_bytes
+        self.max_queries_per_worker = max_queries_per_worker
+        self.max_rss_bytes = max_rss_bytes
+        self.warm_up = warm_up if warm_up is not None else import_araxi_modules
+        self.idle_workers = queue.Queue()
+        self.worker_sockets = dict()  # pid -> the pool's end of each worker's socket
+        self.lock = threading.Lock()  # Held while forking, so no worker inherits a socket or pipe half set up
+        self.is_closed = False
+        self.num_waiting_queries = 0
+        self.num_queries_dispatched = 0
+        self.num_workers_recycled = 0
+        self.num_workers_lost = 0
+        self.warm_start_latencies = []
+
+    def start(self):
+        try:
+            self.warm_up()
+        except Exception:
+            eprint(f"[query_worker_pool]: warm-up failed; workers will start cold: {traceback.format_exc()}")
+        for _ in range(self.num_workers):
+            self._start_worker()
+        return self
+
+    def run_query(self, query_dict: dict, runner_name: str, timeout: Optional[float] = None):
+        """
+        Runs the query in an idle worker and returns a file object to read its JSON output from, or None if no
+        worker became available within timeout seconds (in which case the caller should run the query some other way).
+        """
+        with self.lock:
+            self.num_waiting_queries += 1
+            queue_depth = self.num_waiting_queries
+        try:
+            if queue_depth > 1 or self.idle_workers.empty():
+                eprint(f"[query_worker_pool]: waiting for an idle worker; queue depth is {queue_depth}")
+            while True:
+                try:
+                    pid = self.idle_workers.get(timeout=timeout)
+                except queue.Empty:
+                    eprint(f"[query_worker_pool]: no worker became idle within {timeout} seconds")
+                    return None
+                with self.lock:
+                    worker_socket = self.worker_sockets.get(pid)
+                    if worker_socket is None:
+                        continue  # The worker went away while it was idle
+                    read_fd, write_fd = os.pipe()
+                try:
+                    query_json = json.dumps(query_dict).encode("utf-8")
+                    runner_name_bytes = runner_name.encode("utf-8")
+                    socket.send_fds(worker_socket, [struct.pack(JOB_HEADER_FORMAT, len(query_json),
+                                                                len(runner_name_bytes))], [write_fd],
+                                    socket.MSG_NOSIGNAL)
+                    worker_socket.sendall(runner_name_bytes + query_json, socket.MSG_NOSIGNAL)
+                except OSError:
+                    os.close(read_fd)
+                    continue  # The worker went away while it was idle; its monitor thread replaces it
+                finally:
+                    os.close(write_fd)  # Only the worker writes to the pipe
+                with self.lock:
+                    self.num_queries_dispatched += 1
+                eprint(f"[query_worker_pool]: query sent to worker pid={pid}")
+                return os.fdopen(read_fd, "r")
+        finally:
+            with self.lock:
+                self.num_waiting_queries -= 1
+
+    def get_status(self) -> dict:
+        with self.lock:
+            latencies = self.warm_start_latencies
+            return {"num_workers": len(self.worker_sockets),
+                    "num_idle_workers": self.idle_workers.qsize(),
+                    "queue_depth": self.num_waiting_queries,
+                    "num_queries_dispatched": self.num_queries_dispatched,
+                    "num_workers_recycled": self.num_workers_recycled,
+                    "num_workers_lost": self.num_workers_lost,
+                    "last_warm_start_latency_sec": latencies[-1] if latencies else None,
+                    "mean_warm_start_latency_sec": sum(latencies) / len(latencies) if latencies else None}
+
+    def close(self):
+        with self.lock:
+            self.is_closed = True
+            worker_sockets = dict(self.worker_sockets)
+        for worker_socket in worker_sockets.values():
+            # Idle workers exit once their socket is shut down, and busy ones once their query is done; either way,
+            # their monitor threads reap them
+            try:
+                worker_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _start_worker(self):
+        with self.lock:
+            if self.is_closed:
+                return
+            pool_socket, worker_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            sys.stderr.flush()
+            sys.stdout.flush()
+            fork_time = time.time()
+            pid = os.fork()
+            if pid == 0:  # I am the worker process
+                pool_socket.close()
+                try:
+                    self._run_worker(worker_socket, fork_time)
+                except BaseException:
+                    eprint(f"Exception in query_worker_pool worker: {traceback.format_exc()}")
+                    os._exit(1)
+                os._exit(0)
+            worker_socket.close()
+            self.worker_sockets[pid] = pool_socket
+        threading.Thread(target=self._monitor_worker, args=(pid, pool_socket), daemon=True).start()
+
+    def _monitor_worker(self, pid: int, pool_socket: socket.socket):
+        """
+        Marks the worker idle whenever it reports that it's ready for a query, and replaces it once it retires or
+        goes away (e.g. after a SIGPIPE, an exception, or being terminated via the query tracker).
+        """
+        reply_size = struct.calcsize(REPLY_FORMAT)
+        while True:
+            try:
+                reply = _receive_exactly(pool_socket, reply_size)
+            except OSError:
+                reply = None
+            if reply is None:
+                kind = None
+                break
+            kind, warm_start_latency = struct.unpack(REPLY_FORMAT, reply)
+            if kind == READY:
+                with self.lock:
+                    self.warm_start_latencies = (self.warm_start_latencies + [warm_start_latency])[-100:]
+                eprint(f"[query_worker_pool]: worker pid={pid} is warm after {warm_start_latency:.1f} seconds")
+            elif kind != DONE:
+                break
+            self.idle_workers.put(pid)
+
+        with self.lock:
+            self.worker_sockets.pop(pid, None)
+            if kind == RETIRING:
+                self.num_workers_recycled += 1
+            else:
+                self.num_workers_lost += 1
+            is_closed = self.is_closed
+        pool_socket.close()
+        _reap(pid)
+        if not is_closed:
+            eprint(f"[query_worker_pool]: worker pid={pid} {'retired' if kind == RETIRING else 'exited'}; "
+                   "starting a replacement")
+            self._start_worker()
+
+    def _run_worker(self, worker_socket: socket.socket, fork_time: float):
+        sys.stdout = open('/dev/null', 'w')  # parent and worker process should not share the same stdout stream object
+        sys.stdin = open('/dev/null', 'r')  # parent and worker process should not share the same stdin stream object
+        close_inherited_pipes_and_sockets(keep_fds=[worker_socket.fileno()])
+        setproctitle.setproctitle("python3 query_worker_pool::worker")
+        if self.rlimit_bytes is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self.rlimit_bytes, self.rlimit_bytes))  # set a virtual memory limit for the worker
+        signal.signal(signal.SIGPIPE, _worker_receive_sigpipe)  # exit if the client goes away mid-query, as per-query children do
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # disregard any SIGCHLD signal in the worker process
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        worker_socket.sendall(struct.pack(REPLY_FORMAT, READY, time.time() - fork_time))
+
+        header_size = struct.calcsize(JOB_HEADER_FORMAT)
+        num_queries = 0
+        while True:
+            message, fds, _, _ = socket.recv_fds(worker_socket, header_size, 1)
+            rest_of_header = _receive_exactly(worker_socket, header_size - len(message)) if message else None
+            if rest_of_header is None:
+                for fd in fds:
+                    os.close(fd)
+                return  # The pool has closed
+            query_json_length, runner_name_length = struct.unpack(JOB_HEADER_FORMAT, message + rest_of_header)
+            payload = _receive_exactly(worker_socket, runner_name_length + query_json_length)
+            if payload is None:
+                for fd in fds:
+                    os.close(fd)
+                return  # The pool closed partway through sending the query
+            runner_name = payload[:runner_name_length].decode("utf-8")
+            query_dict = json.loads(payload[runner_name_length:])
+
+            with os.fdopen(fds[0], "w") as write_fo:
+                for json_string in self.query_runners[runner_name](query_dict):
+                    write_fo.write(json_string)
+                    write_fo.flush()
+            num_queries += 1
+
+            is_over_memory = self.max_rss_bytes is not None and \
+                psutil.Process().memory_info().rss > self.max_rss_bytes
+            if num_queries >= self.max_queries_per_worker or is_over_memory:
+                worker_socket.sendall(struct.pack(REPLY_FORMAT, RETIRING, 0.0))
+                return
+            worker_socket.sendall(struct.pack(REPLY_FORMAT, DONE, 0.0))
+
+
+def import_araxi_modules():
+    for module_name in ARAXI_MODULES:
+        __import__(module_name)
+
+
+def _worker_receive_sigpipe(signal_number, frame):
+    if signal_number == signal.SIGPIPE:
+        eprint("[query_worker_pool]: worker process detected a SIGPIPE; exiting python")
+        os._exit(0)
+
+
+def _receive_exactly(sock: socket.socket, num_bytes: int) -> Optional[bytes]:
+    chunks = []
+    while num_bytes:
+        chunk = sock.recv(num_bytes)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        num_bytes -= len(chunk)
+    return b"".join(chunks)
+
+
+def close_inherited_pipes_and_sockets(keep_fds: List[int]):
+    # A long-lived (or detached) process mustn't hold on to the server's client connections or other queries' pipes,
+    # or those would never see their other end close
+    try:
+        fds = [int(fd) for fd in os.listdir("/proc/self/fd")]
+    except OSError:
+        fds = range(3, min(resource.getrlimit(resource.RLIMIT_NOFILE)[0], 65536))
+    for fd in fds:
+        if fd > 2 and fd not in keep_fds:
+            try:
+                if stat.S_ISFIFO(os.fstat(fd).st_mode) or stat.S_ISSOCK(os.fstat(fd).st_mode):
+                    os.close(fd)
+            except OSError:
+                pass
+
+
+def _reap(pid: int):
+    try:
+        os.waitpid(pid, 0)
+    except ChildProcessError:
+        pass  # The server's SIGCHLD handler already reaped it
@@ -227,6 +227,142 @@ def _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge: Dict[str,
     return nx_graph_scorer(result_graphs_nx)
 
 
+class _ResultGraphBatchScorer:
+    """
+    Vectorized counterpart of _score_result_graphs_by_networkx_graph_scorer() for the max flow, longest path and
+    frobenius norm scorers. Every result graph is the query graph with a weight on each qedge, so everything that
+    depends only on the topology (node order, all-pairs shortest path lengths, the node pairs furthest apart) is
+    computed once, and each result graph is just a row of a (results x qedges) weight matrix. Results with identical
+    weight rows are scored once. The floating point operations (and their order) are the same as in the networkx-based
+    scorers, so the scores are numerically identical to theirs.
+    """
+
+    def __init__(self, qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph]):
+        self.qg_nx = qg_nx
+        self.qedge_tuples = list(qg_nx.edges(keys=True))
+        self.qedge_key_to_index = {qedge_key: index for index, (_, _, qedge_key) in enumerate(self.qedge_tuples)}
+        self.node_list = list(qg_nx.nodes)
+        node_to_index = {node_id: index for index, node_id in enumerate(self.node_list)}
+
+        # Adjacency matrix cells and the qedges whose weights nx.to_numpy_matrix() sums into them, in the same order
+        adjacency_cells = dict()
+        for qedge_index, (subject_key, object_key, _) in enumerate(self.qedge_tuples):
+            adjacency_cells.setdefault((node_to_index[subject_key], node_to_index[object_key]), []).append(qedge_index)
+        self.adjacency_cells = list(adjacency_cells.items())
+
+        # Same for the edges of the collapsed graph used for max flow (_collapse_nx_multigraph_to_weighted_graph())
+        collapsed_edges = dict()
+        for qedge_index, (subject_key, object_key, _) in enumerate(self.qedge_tuples):
+            collapsed_edges.setdefault((subject_key, object_key), []).append(qedge_index)
+        self.collapsed_edges = list(collapsed_edges.items())
+        self.collapsed_graph = _collapse_nx_multigraph_to_weighted_graph(qg_nx)
+
+        if len(self.node_list) > 0:
+            apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(qg_nx))
+            path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
+            self.max_path_len = max([path_len_with_pair_list_item[2] for path_len_with_pair_list_item in path_len_with_pairs_list])
+            self.pairs_with_max_path_len = [path_len_with_pair_list_item[0:2] for path_len_with_pair_list_item in path_len_with_pairs_list if
+                                            path_len_with_pair_list_item[2] == self.max_path_len]
+
+    def get_weight_matrix(self, kg_edge_id_to_edge: Dict[str, Edge], results: List[Result]) -> np.ndarray:
+        """
+        Returns the (results x qedges) matrix of edge scores that _get_weighted_graph_networkx_from_result_graph() would
+        put on each result graph's qedges (unbound qedges keep the query graph's weight of 0.0).
+        """
+        weights = np.zeros((len(results), len(self.qedge_tuples)))
+        binding_positions = []
+        max_scores = []
+        non_semmeddb_edge_counts = []
+        drugbank_edge_counts = []
+        for result_index, result in enumerate(results):
+            for analysis in result.analyses:  # For now we only ever have one Analysis per Result
+                for qedge_key, edge_binding_list in analysis.edge_bindings.items():
+                    binding_positions.append((result_index, self.qedge_key_to_index[qedge_key]))
+                    max_scores.append(max([kg_edge_id_to_edge[edge_binding.id].confidence for edge_binding in edge_binding_list]))
+                    non_semmeddb_edge_counts.append(len([edge_binding.id for edge_binding in edge_binding_list if 'infores:' in edge_binding.id and edge_binding.id.split('--')[-1] != 'infores:semmeddb']))
+                    drugbank_edge_counts.append(len([edge_binding.id for edge_binding in edge_binding_list if edge_binding.id.split('--')[-1] == 'infores:drugbank']))
+        if not binding_positions:
+            return weights
+        final_edge_scores = _calculate_final_edge_scores(np.array(max_scores, dtype=float),
+                                                         np.array(non_semmeddb_edge_counts),
+                                                         np.array(drugbank_edge_counts))
+        # Later analyses overwrite earlier ones (like they do on the networkx graph), so assign in order
+        for (result_index, qedge_index), final_edge_score in zip(binding_positions, final_edge_scores):
+            weights[result_index, qedge_index] = final_edge_score
+        return weights
+
+    def score(self, weights: np.ndarray) -> List[np.ndarray]:
+        """
+        Returns the max flow, longest path and frobenius norm scores for each row of the weight matrix.
+        """
+        unique_row_indexes = dict()
+        first_row_indexes = []
+        row_to_unique_index = []
+        for row_index, row in enumerate(weights):
+            row_bytes = row.tobytes()
+            if row_bytes not in unique_row_indexes:
+                unique_row_indexes[row_bytes] = len(first_row_indexes)
+                first_row_indexes.append(row_index)
+            row_to_unique_index.append(unique_row_indexes[row_bytes])
+        unique_weights = weights[first_row_indexes]
+        adjacency_matrices = self._get_adjacency_matrices(unique_weights)
+        unique_scores = [self._score_by_max_flow(unique_weights),
+                         self._score_by_longest_path(adjacency_matrices),
+                         self._score_by_frobenius_norm(adjacency_matrices)]
+        row_to_unique_index = np.array(row_to_unique_index, dtype=int)
+        return [scores[row_to_unique_index] for scores in unique_scores]
+
+    def _get_adjacency_matrices(self, weights: np.ndarray) -> np.ndarray:
+        adjacency_matrices = np.zeros((len(weights), len(self.node_list), len(self.node_list)))
+        for (row_index, column_index), qedge_indexes in self.adjacency_cells:
+            cell_weights = 0  # nx.to_numpy_matrix() sums parallel edges' weights with sum(), which starts from 0
+            for qedge_index in qedge_indexes:
+                cell_weights = cell_weights + weights[:, qedge_index]
+            adjacency_matrices[:, row_index, column_index] = cell_weights
+        return adjacency_matrices
+
+    def _score_by_max_flow(self, weights: np.ndarray) -> np.ndarray:
+        if len(self.node_list) <= 1:
+            return np.full(len(weights), 1.0)
+        max_flow_values = []
+        for row in weights:
+            for (subject_key, object_key), qedge_indexes in self.collapsed_edges:
+                collapsed_weight = row[qedge_indexes[0]].item()
+                for qedge_index in qedge_indexes[1:]:
+                    collapsed_weight += row[qedge_index].item()
+                self.collapsed_graph[subject_key][object_key]['weight'] = collapsed_weight
+            max_flow_values_for_node_pairs = [nx.algorithms.flow.maximum_flow_value(self.collapsed_graph, source_node_id, target_node_id, capacity="weight")
+                                              for source_node_id, target_node_id in self.pairs_with_max_path_len]
+            max_flow_value = 0.0
+            if len(max_flow_values_for_node_pairs) > 0:
+                max_flow_value = sum(max_flow_values_for_node_pairs)/float(len(max_flow_values_for_node_pairs))
+            max_flow_values.append(max_flow_value)
+        return np.array(max_flow_values, dtype=float)
+
+    def _score_by_longest_path(self, adjacency_matrices: np.ndarray) -> np.ndarray:
+        node_to_index = {node_id: index for index, node_id in enumerate(self.node_list)}
+        adjacency_matrix_powers = np.linalg.matrix_power(adjacency_matrices, self.max_path_len)/math.factorial(self.max_path_len)
+        row_indexes = [node_to_index[node_i] for node_i, _ in self.pairs_with_max_path_len]
+        column_indexes = [node_to_index[node_j] for _, node_j in self.pairs_with_max_path_len]
+        return np.mean(adjacency_matrix_powers[:, row_indexes, column_indexes], axis=1)
+
+    @staticmethod
+    def _score_by_frobenius_norm(adjacency_matrices: np.ndarray) -> np.ndarray:
+        return np.array([np.linalg.norm(adjacency_matrix, ord='fro') for adjacency_matrix in adjacency_matrices])
+
+
+def _calculate_final_edge_scores(max_scores: np.ndarray, non_semmeddb_edge_counts: np.ndarray,
+                                 drugbank_edge_counts: np.ndarray, alpha: float = 0.8, beta: float = 0.1) -> np.ndarray:
+    """
+    Vectorized version of _calculate_final_edge_score(), taking the max edge confidence, the number of
+    non-semmeddb nonvirtual edges and the number of drugbank edges of each edge binding list.
+    """
+    normalized_edge_counts = 1.0 / (1 + np.exp(-0.5 * (non_semmeddb_edge_counts - 0)))
+    normalized_drugbank_edge_counts = 1.0 / (1 + np.exp(-3 * (drugbank_edge_counts - 0)))
+    normalized_drugbank_edge_counts[normalized_drugbank_edge_counts == 0.5] = 0.0
+    return alpha * max_scores + beta * normalized_edge_counts + (1 - alpha - beta) * normalized_drugbank_edge_counts
+
+
 def _break_ties_and_preserve_order(scores):
     adjusted_scores = scores.copy()
     n = len(scores)
@@ -288,6 +424,7 @@ class ARAXRanker:
         self.virtual_edge_types = {}
         self.score_stats = dict()  # dictionary that stores that max's and min's of the edge attribute values
         self.kg_edge_id_to_edge = dict()  # map between the edge id's in the results and the actual edges themselves
+        self.use_vectorized_engine = True  # score edges and results in batch (identical scores, much faster on big messages)
 
     def describe_me(self):
         """
@@ -641,6 +778,173 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         normalized_value = max_value / float(1+np.exp(-curve_steepness*(log_abs_value - logistic_midpoint)))
         return normalized_value
 
+    def edge_attribute_score_combiner_vectorized(self, edges: List[Edge]) -> List[float]:
+        """
+        Columnar version of edge_attribute_score_combiner(): computes the confidences of many edges at once. The
+        attribute values are extracted (in a single pass over the edges) into one array per normalizer, each normalizer
+        is applied to its whole array at once (see __normalize_values), and the per-edge maximum is taken with a single
+        reduction. Gives exactly the same confidences as calling edge_attribute_score_combiner() on each edge; edges
+        that the scalar combiner can't score (it raises) are handed to it so that it raises in the same way.
+        """
+        edge_best_score = 1
+        confidences = [edge_best_score] * len(edges)
+        edge_indexes = []  # Edges that have at least one score, in the order their scores appear in 'scores'
+        score_starts = []
+        is_int_score = []  # np.max() of a list of ints is an int, so keep track of which scores are ints
+        scores = []
+        values_to_normalize = dict()  # normalizer name -> (positions in 'scores', values, trusts)
+        for edge_index, edge in enumerate(edges):
+            if edge.attributes is None:
+                continue
+            edge_scores = self.__get_edge_scores(edge)
+            if edge_scores is None:
+                confidences[edge_index] = self.edge_attribute_score_combiner(edge)
+                continue
+            if len(edge_scores) == 0:
+                continue
+            edge_indexes.append(edge_index)
+            score_starts.append(len(scores))
+            for edge_score in edge_scores:
+                if type(edge_score) is tuple:
+                    normalizer_name, value, trust = edge_score
+                    positions, values, trusts = values_to_normalize.setdefault(normalizer_name, ([], [], []))
+                    positions.append(len(scores))
+                    values.append(value)
+                    trusts.append(trust)
+                    edge_score = 0.
+                is_int_score.append(type(edge_score) is int)
+                scores.append(edge_score)
+        if not scores:
+            return confidences
+
+        scores = np.array(scores, dtype=float)
+        for normalizer_name, (positions, values, trusts) in values_to_normalize.items():
+            scores[positions] = self.__normalize_values(normalizer_name, np.array(values)) * np.array(trusts)
+        max_scores = np.maximum.reduceat(scores, score_starts)
+        all_int_scores = np.logical_and.reduceat(np.array(is_int_score), score_starts)
+        for edge_index, max_score, all_int in zip(edge_indexes, max_scores, all_int_scores):
+            confidences[edge_index] = np.int_(max_score) if all_int else max_score
+        return confidences
+
+    def __get_edge_scores(self, edge: Edge) -> Union[List, None]:
+        """
+        Walks an edge's attributes like edge_attribute_score_combiner() does, returning the list of its scores. Scores
+        that don't depend on a normalizer are given as is; the others as (normalizer name, value, trust) tuples. Returns
+        None if edge_attribute_score_combiner() would raise on the edge.
+        """
+        edge_scores = []
+        for edge_attribute in edge.attributes:
+            if edge_attribute.original_attribute_name == "biolink:knowledge_level":
+                edge_scores.append(1)
+                break
+            if edge_attribute.original_attribute_name is not None:
+                normalized_score = self.__get_normalized_score(edge_attribute.original_attribute_name, edge_attribute.value)
+            else:
+                normalized_score = self.__get_normalized_score(edge_attribute.attribute_type_id, edge_attribute.value)
+            if normalized_score is None:
+                return None
+            if edge_attribute.attribute_type_id == "biolink:publications":
+                normalized_score = self.__get_normalized_publication_score(edge_attribute.value)
+                if normalized_score is None:
+                    return None
+
+            if self.known_attributes_to_trust.get(edge_attribute.original_attribute_name, None) is not None:
+                trust = self.known_attributes_to_trust[edge_attribute.original_attribute_name]
+            elif edge_attribute.attribute_type_id == "biolink:publications":
+                trust = self.known_attributes_to_trust['publications']
+            elif edge_attribute.attribute_type_id == "biolink:primary_knowledge_source" and edge_attribute.value == "infores:text-mining-provider-targeted":
+                edge_scores.append(1 * self.known_attributes_to_trust['text-mining-provider'])
+                continue
+            else:
+                continue
+            if type(normalized_score) is tuple:
+                edge_scores.append(normalized_score + (trust,))
+            else:
+                edge_scores.append(normalized_score * trust)
+        return edge_scores
+
+    def __get_normalized_score(self, edge_attribute_name: str, edge_attribute_value) -> Union[float, tuple, None]:
+        """
+        Mirrors edge_attribute_score_normalizer(), but returns a (normalizer name, value) tuple instead of calling the
+        normalizer, or None if edge_attribute_score_normalizer() would raise.
+        """
+        if edge_attribute_name not in self.known_attributes:
+            return -1
+        if edge_attribute_value == "no value!":
+            edge_attribute_value = 0
+        try:
+            edge_attribute_value = float(edge_attribute_value)
+        except (TypeError, ValueError):
+            return 0.
+        except Exception:
+            return None
+        if np.isnan(edge_attribute_value):
+            return 0.
+        normalizer_name = re.sub(r'[- \:]', '_', edge_attribute_name)
+        if normalizer_name == "jaccard_index" and not self.score_stats.get('jaccard_index', {}).get('maximum'):
+            return None  # Division by a missing (or zero) maximum
+        return normalizer_name, edge_attribute_value
+
+    @staticmethod
+    def __get_normalized_publication_score(edge_attribute_value) -> Union[float, tuple, None]:
+        """
+        Mirrors edge_attribute_publication_normalizer() like __get_normalized_score() mirrors
+        edge_attribute_score_normalizer()
+        """
+        if isinstance(edge_attribute_value, str):
+            publications = [edge_attribute_value]
+        elif isinstance(edge_attribute_value, list):
+            publications = edge_attribute_value
+        else:
+            return -1
+        try:
+            n_publications = len(set(publications))
+        except TypeError:
+            return None
+        if n_publications == 0:
+            return None
+        return "publications", n_publications
+
+    def __normalize_values(self, normalizer_name: str, values: np.ndarray) -> np.ndarray:
+        """
+        Vectorized versions of the __normalize_* methods (and of edge_attribute_publication_normalizer()); each does
+        the same floating point operations as its scalar counterpart, so the results are identical
+        """
+        def logistic(values, max_value, curve_steepness, logistic_midpoint):
+            return max_value / (1 + np.exp(-curve_steepness * (values - logistic_midpoint)))
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            if normalizer_name == "probability_treats":
+                return logistic(values, 1, 15, 0.60)
+            elif normalizer_name == "normalized_google_distance":
+                return logistic(values, 1, -9, 0.60)
+            elif normalizer_name == "probability":
+                return logistic(values, 1, 20, 0.8)
+            elif normalizer_name == "jaccard_index":
+                return values / self.score_stats['jaccard_index']['maximum']
+            elif normalizer_name == "paired_concept_frequency":
+                return logistic(values, 1, 2000, 0.002)
+            elif normalizer_name == "observed_expected_ratio":
+                return logistic(values, 1, 2, 2)
+            elif normalizer_name in {"chi_square", "chi_square_pvalue"}:
+                return logistic(-np.log(values), 1, 0.03, 200)
+            elif normalizer_name in {"MAGMA_pvalue", "pValue"}:
+                return logistic(-np.log(values), 1.0, 0.849, 4.97)
+            elif normalizer_name in {"Genetics_quantile", "Richards_effector_genes"}:
+                return values
+            elif normalizer_name == "fisher_exact_test_p_value":
+                return np.where(values <= np.finfo(float).eps, 1., logistic(-np.log(values), 1.0, 3, 2.7))
+            elif normalizer_name == "CMAP_similarity_score":
+                return abs(values / 100)
+            elif normalizer_name == "feature_coefficient":
+                return logistic(np.log(abs(values)), 1, 2.75, 0.15)
+            elif normalizer_name == "publications":
+                return logistic(np.log(values), 1.0, 3.16993, 1.38629)
+            else:
+                # No vectorized version (yet); fall back to the scalar normalizer
+                return np.array([getattr(self, '_' + self.__class__.__name__ + '__normalize_' + normalizer_name)(value=value)
+                                 for value in values.tolist()], dtype=float)
+
     def aggregate_scores_dmk(self, response):
         """
         Take in a message,
@@ -711,6 +1015,7 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         response.info(f"Summary of available edge metrics: {score_stats}")
 
         edge_ids_manual_agent = set()
+        edges_to_score = []
         # Loop over the entire KG and normalize and combine the score of each edge, place that information in the confidence attribute of the edge
         for edge_key, edge in message.knowledge_graph.edges.items():
             if edge.attributes is not None:
@@ -731,9 +1036,15 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
                 edge.confidence = edge_attributes['confidence']
                 #continue
             else:
-                confidence = self.edge_attribute_score_combiner(edge)
-                #edge.attributes.append(Attribute(name="confidence", value=confidence))
-                edge.confidence = confidence
+                edges_to_score.append(edge)
+
+        if self.use_vectorized_engine:
+            confidences = self.edge_attribute_score_combiner_vectorized(edges_to_score)
+        else:
+            confidences = [self.edge_attribute_score_combiner(edge) for edge in edges_to_score]
+        for edge, confidence in zip(edges_to_score, confidences):
+            #edge.attributes.append(Attribute(name="confidence", value=confidence))
+            edge.confidence = confidence
 
         # Now that each edge has a confidence attached to it based on it's attributes, we can now:
         # 1. consider edge types of the results
@@ -751,14 +1062,19 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         qg_nx = _get_query_graph_networkx_from_query_graph(message.query_graph)
         kg_edge_id_to_edge = self.kg_edge_id_to_edge
 
-        ranks_list = list(map(_quantile_rank_list,
-                              map(lambda scorer_func: _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge,
-                                                                                                    qg_nx,
-                                                                                                    results,
-                                                                                                    scorer_func),
-                                  [_score_networkx_graphs_by_max_flow,
-                                   _score_networkx_graphs_by_longest_path,
-                                   _score_networkx_graphs_by_frobenius_norm])))
+        if self.use_vectorized_engine:
+            batch_scorer = _ResultGraphBatchScorer(qg_nx)
+            ranks_list = list(map(_quantile_rank_list,
+                                  batch_scorer.score(batch_scorer.get_weight_matrix(kg_edge_id_to_edge, results))))
+        else:
+            ranks_list = list(map(_quantile_rank_list,
+                                  map(lambda scorer_func: _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge,
+                                                                                                        qg_nx,
+                                                                                                        results,
+                                                                                                        scorer_func),
+                                      [_score_networkx_graphs_by_max_flow,
+                                       _score_networkx_graphs_by_longest_path,
+                                       _score_networkx_graphs_by_frobenius_norm])))
 
 
         result_scores = sum(ranks_list)/float(len(ranks_list))
@@ -802,6 +1118,43 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
 ##########################################################################################
 
 
+# Responses used as fixtures by test_ARAX_ranker.py
+BENCHMARK_RESPONSE_IDS = ['248097', '248115', '248120', '248142', '248160', '248191', '248199']
+
+
+def benchmark_engines(response_ids: List[str], api_link: str = 'https://arax.ncats.io/api/arax/v1.4/response/'):
+    """
+    Ranks each of the given (online) responses with both the legacy and the vectorized engine, checks that they give
+    identical confidences and scores, and prints how long each engine took
+    """
+    import copy
+    import time
+    from ARAX_messenger import ARAXMessenger
+    total_times = {False: 0.0, True: 0.0}
+    for response_id in response_ids:
+        response = ARAXResponse()
+        messenger = ARAXMessenger()
+        messenger.create_envelope(response)
+        response.envelope.message = messenger.fetch_message(f"{api_link}{response_id}")
+        responses = {False: response, True: copy.deepcopy(response)}
+        times = dict()
+        for use_vectorized_engine, engine_response in responses.items():
+            ranker = ARAXRanker()
+            ranker.use_vectorized_engine = use_vectorized_engine
+            start = time.time()
+            ranker.aggregate_scores_dmk(engine_response)
+            times[use_vectorized_engine] = time.time() - start
+            total_times[use_vectorized_engine] += times[use_vectorized_engine]
+        legacy_message, vectorized_message = responses[False].envelope.message, responses[True].envelope.message
+        identical = [result.analyses[0].score for result in legacy_message.results] == \
+                    [result.analyses[0].score for result in vectorized_message.results] and \
+                    all(str(edge.confidence) == str(vectorized_message.knowledge_graph.edges[edge_key].confidence)
+                        for edge_key, edge in legacy_message.knowledge_graph.edges.items())
+        print(f"Response {response_id}: {len(legacy_message.results)} results, {len(legacy_message.knowledge_graph.edges)} edges; "
+              f"legacy {times[False]:.3f}s, vectorized {times[True]:.3f}s; identical scores: {identical}")
+    print(f"Total: legacy {total_times[False]:.3f}s, vectorized {total_times[True]:.3f}s")
+
+
 def main():
     # For faster testing, cache the testing messages locally
     import requests_cache
@@ -810,8 +1163,13 @@ def main():
     import argparse
     argparser = argparse.ArgumentParser(description='Ranker system')
     argparser.add_argument('--local', action='store_true', help='If set, use local RTXFeedback database to fetch messages')
+    argparser.add_argument('--benchmark', action='store_true', help='If set, compare the legacy and vectorized engines on the test fixtures')
     params = argparser.parse_args()
 
+    if params.benchmark:
+        benchmark_engines(BENCHMARK_RESPONSE_IDS)
+        return
+
     # --- Create a response object
     response = ARAXResponse()
     ranker = ARAXRanker()
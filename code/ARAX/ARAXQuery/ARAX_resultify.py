@@ -16,12 +16,14 @@ default is to ignore edge direction).
 '''
 
 import collections
-import copy
 import math
+import multiprocessing
 import os
+import resource
 import sys
-from typing import List, Dict, Set, Union, Iterable, cast, Optional, Tuple, DefaultDict
+from typing import List, Dict, Set, Union, Iterable, cast, Optional, Tuple
 from ARAX_response import ARAXResponse
+from kg_index_by_qg import KGIndexByQG, KG_INDEX_ATTRIBUTE, get_kg_index_by_qg
 
 __author__ = 'Stephen Ramsey and Amy Glen'
 __copyright__ = 'Oregon State University'
@@ -47,6 +49,11 @@ from openapi_server.models.edge_binding import EdgeBinding
 from openapi_server.models.result import Result
 from openapi_server.models.analysis import Analysis
 
+# Result enumeration is split across up to this many (forked) processes, by the KG nodes fulfilling the essence qnode,
+# but only when there are at least MIN_ESSENCE_NODES_PER_PROCESS such nodes per process
+RESULT_ENUMERATION_MAX_PROCESSES = min(4, os.cpu_count() or 1)
+MIN_ESSENCE_NODES_PER_PROCESS = 500
+
 
 class ARAXResultify:
     ALLOWED_PARAMETERS = {'debug', 'ignore_edge_direction'}
@@ -250,12 +257,15 @@ automated reasoning system, not just ones generated by Team ARA Expander."""
                 else:
                     raise e
 
-        # Actually create results
+        # Actually create results (using the message's KG index, which is kept up to date across workflow steps)
+        kg_index = get_kg_index_by_qg(message)
         results = _get_results_for_kg_by_qg(kg,
                                             qg,
                                             mode,
                                             ignore_edge_direction,
-                                            self.response)
+                                            self.response,
+                                            kg_index=kg_index,
+                                            num_processes=RESULT_ENUMERATION_MAX_PROCESSES)
         message_code = 'OK'
         code_description = 'Result list computed from KG and QG'
 
@@ -284,6 +294,11 @@ automated reasoning system, not just ones generated by Team ARA Expander."""
                                     edges={edge_key: edge for edge_key, edge in kg.edges.items() if
                                            {edge.subject, edge.object}.issubset(node_keys_used_in_results)})
         self.message.knowledge_graph = cleaned_kg
+        # The message's KG index is up to date as of this resultify, so just the removed nodes/edges need dropping
+        kg_index = getattr(self.message, KG_INDEX_ATTRIBUTE, None)
+        if kg_index is not None:
+            kg_index.discard(node_keys=kg.nodes.keys() - cleaned_kg.nodes.keys(),
+                             edge_keys=kg.edges.keys() - cleaned_kg.edges.keys())
         self.response.info(f"After cleaning, the KG contains {len(self.message.knowledge_graph.nodes)} nodes and "
                            f"{len(self.message.knowledge_graph.edges)} edges")
 
@@ -462,10 +477,12 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
                               qg: QueryGraph,
                               mode: str = "ARAX",
                               ignore_edge_direction: bool = True,
-                              log: ARAXResponse = ARAXResponse()) -> List[Result]:
+                              log: ARAXResponse = ARAXResponse(),
+                              kg_index: Optional[KGIndexByQG] = None,  # must be up to date with the KG, if provided
+                              num_processes: int = 1) -> List[Result]:
 
     if ignore_edge_direction is None:
-        return _get_results_for_kg_by_qg(kg, qg, mode, log=log)
+        return _get_results_for_kg_by_qg(kg, qg, mode, log=log, kg_index=kg_index, num_processes=num_processes)
 
     kg_node_keys_without_qnode_key = [node_key for node_key, node in kg.nodes.items() if not node.qnode_keys]
     if len(kg_node_keys_without_qnode_key) > 0:
@@ -477,8 +494,11 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
         log.error("these edges do not have qedge_keys set: " + str(kg_edge_keys_without_qedge_key), error_code="MissingQEdgeKeys")
         return []
 
-    kg_edge_keys_by_qg_key = _get_kg_edge_keys_by_qg_key(kg)
-    kg_node_keys_by_qg_key = _get_kg_node_keys_by_qg_key(kg)
+    # Note: These lookups belong to the KG index, so they must not be modified here
+    if kg_index is None:
+        kg_index = KGIndexByQG.build(kg)
+    kg_edge_keys_by_qg_key = kg_index.edge_keys_by_qg_key
+    kg_node_keys_by_qg_key = kg_index.node_keys_by_qg_key
 
     # --------------------- checking for validity of the NodeBindings list --------------
     # we require that every query graph node ID in the "values" slot of the node_bindings_map corresponds to an actual node in the QG
@@ -597,51 +617,33 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
         return results
 
     # Recompute kg_node_keys_by_qg_keys so that it only contains parents (we 'collapse' children into parents)
+    # Note: These are copies, since result graphs are built off of (and may modify) these sets
     kg_node_keys_by_qg_key_collapsed = dict()
     for qnode_key, node_keys in kg_node_keys_by_qg_key.items():
         if qnode_key in subclass_qnode_keys:
             collapsed_node_keys = {child_to_parent_map[qnode_key][node_key] for node_key in node_keys}
             kg_node_keys_by_qg_key_collapsed[qnode_key] = collapsed_node_keys
         else:
-            kg_node_keys_by_qg_key_collapsed[qnode_key] = node_keys
+            kg_node_keys_by_qg_key_collapsed[qnode_key] = set(node_keys)
+
+    essence_qnode_key = _get_essence_node_for_qg(qg)
+    essence_qnode = qg.nodes.get(essence_qnode_key)
 
     # Handle case where QG contains multiple qnodes and no qedges (we'll dump everything in one result)
-    edge_keys_by_node_pair = collections.defaultdict(lambda: collections.defaultdict(lambda: set()))
     if not qg.edges and len(qg.nodes) > 1:
         log.debug(f"QG contains only qnodes (no qedges); will create only one result with all qnodes.")
         result_graph = _create_new_empty_result_graph()
         result_graph["nodes"] = kg_node_keys_by_qg_key_collapsed
         final_result_graphs = [result_graph]
     else:
-        # Build up some indexes for edges in the KG (by their subject/object nodes and qedge keys)
-        log.debug(f"Building helper indexes for faster lookup of edges")
-        edge_keys_by_subject_collapsed = collections.defaultdict(lambda: collections.defaultdict(lambda: set()))
-        edge_keys_by_object_collapsed = collections.defaultdict(lambda: collections.defaultdict(lambda: set()))
-        edge_keys_by_node_pair_collapsed = collections.defaultdict(lambda: collections.defaultdict(lambda: set()))
-        for edge_key, edge in kg.edges.items():
-            for qedge_id in edge.qedge_keys:
-                qedge = qg.edges[qedge_id]
-                # Remap edges to parent concepts for qnodes where subclass answers were provided
-                qnode_subj_fulfills, qnode_obj_fulfills = _get_qnodes_subj_and_obj_fulfill(edge, qedge, kg_node_keys_by_qg_key)
-                edge_subject = child_to_parent_map[qnode_subj_fulfills][edge.subject] if qnode_subj_fulfills in subclass_qnode_keys else edge.subject
-                edge_object = child_to_parent_map[qnode_obj_fulfills][edge.object] if qnode_obj_fulfills in subclass_qnode_keys else edge.object
-                edge_keys_by_subject_collapsed[qedge_id][edge_subject].add(edge_key)
-                edge_keys_by_object_collapsed[qedge_id][edge_object].add(edge_key)
-                edge_keys_by_node_pair_collapsed[qedge_id][(edge_subject, edge_object)].add(edge_key)
-                edge_keys_by_node_pair[qedge_id][(edge.subject, edge.object)].add(edge_key)
-                if ignore_edge_direction:
-                    edge_keys_by_node_pair_collapsed[qedge_id][(edge_object, edge_subject)].add(edge_key)
-                    edge_keys_by_node_pair[qedge_id][(edge.object, edge.subject)].add(edge_key)
-
-        # Create results off the "required" portion of the QG (excluding any qnodes/qedges belong to an "option group")
-        log.info(f"Creating result graphs for required portion of QG")
-        result_graphs_required = _create_result_graphs(required_qg, kg_node_keys_by_qg_key_collapsed,
-                                                       edge_keys_by_subject_collapsed, edge_keys_by_object_collapsed,
-                                                       edge_keys_by_node_pair_collapsed,
-                                                       ignore_edge_direction, log)
-        log.debug(f"Created {len(result_graphs_required)} required result graphs")
-
-        # Then create results for each of the 'option groups' in the QG (including the 'required' portion with each)
+        # Grab lookups for edges in the KG (by their subject/object nodes and qedge keys)
+        log.debug(f"Getting helper indexes for faster lookup of edges")
+        edge_keys_by_subject_collapsed, edge_keys_by_object_collapsed, edge_keys_by_node_pair_collapsed = \
+            _get_collapsed_edge_indexes(kg, qg, kg_index, kg_node_keys_by_qg_key, child_to_parent_map,
+                                        ignore_edge_direction)
+
+        # Figure out the QGs we'll create results off of: the "required" portion of the QG (excluding any
+        # qnodes/qedges belonging to an "option group"), and then each option group (plus the required portion)
         subclass_self_qedge_groups = {qedge.option_group_id for qedge_key, qedge in qg.edges.items()
                                       if _is_subclass_self_qedge(qedge)}
         option_groups_in_qg = {qedge.option_group_id for qedge in qg.edges.values()
@@ -649,8 +651,8 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
         # NOTE: We ignore subclass self-qedge option groups and instead process those in a different way
         if option_groups_in_qg:
             log.info(f"Distinct option groups detected in the QG are: {option_groups_in_qg}")
-        option_group_results_dict = dict()
-        for option_group_id in option_groups_in_qg:
+        option_group_qgs = dict()
+        for option_group_id in sorted(option_groups_in_qg):
             # Include qnodes/qedges that are either required or belong to this option group in our QG for this run
             option_group_qg = QueryGraph(nodes={qnode_key: qnode for qnode_key, qnode in qg.nodes.items()
                                                 if qnode.option_group_id == option_group_id or not qnode.option_group_id},
@@ -666,7 +668,7 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
             if unfulfilled_qnodes or unfulfilled_qedges:
                 log.info(f"No results found for option group {option_group_id}. Unfulfilled qnode(s): "
                          f"{unfulfilled_qnodes}. Unfulfilled qedge(s): {unfulfilled_qedges}")
-                result_graphs_for_option_group = []
+                option_group_qgs[option_group_id] = None
             else:
                 qg_is_disconnected = _qg_is_disconnected(option_group_qg)
                 if qg_is_disconnected:
@@ -674,33 +676,15 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
                               f"This isn't allowed! 'Required'/group {option_group_id} qnode IDs are: "
                               f"{[qnode_key for qnode_key in option_group_qg.nodes]}", error_code="DisconnectedQG")
                     return []
-                log.info(f"Creating result graphs for option group {option_group_id}")
-                result_graphs_for_option_group = _create_result_graphs(option_group_qg, kg_node_keys_by_qg_key_collapsed,
-                                                                       edge_keys_by_subject_collapsed, edge_keys_by_object_collapsed,
-                                                                       edge_keys_by_node_pair_collapsed,
-                                                                       ignore_edge_direction, log,
-                                                                       base_result_graphs=copy.deepcopy(result_graphs_required))
-                log.debug(f"Created {len(result_graphs_for_option_group)} option group {option_group_id} result graphs")
-            option_group_results_dict[option_group_id] = result_graphs_for_option_group
-
-        # Organize our results for the 'required' portion of the QG by the IDs of their is_set=False nodes
-        required_non_set_qnode_keys = [qnode_key for qnode_key, qnode in required_qg.nodes.items() if not qnode.is_set]
-        log.debug(f"Required non-set qnodes are: {required_non_set_qnode_keys}")
-        result_graphs_by_key = dict()
-        for result_graph in result_graphs_required:
-            result_key = _get_result_graph_key(result_graph, required_non_set_qnode_keys, log)
-            result_graphs_by_key[result_key] = result_graph
-        # Then merge our results for each option group ID into the appropriate "required" results
-        if option_groups_in_qg:
-            log.info(f"Merging option group result graphs into required result graphs with matching non-set qnodes")
-        for option_group_id in option_groups_in_qg:
-            for option_group_result_graph in option_group_results_dict[option_group_id]:
-                result_key = _get_result_graph_key(option_group_result_graph, required_non_set_qnode_keys, log)
-                corresponding_result_graph = result_graphs_by_key[result_key]
-                # Merge this optional result's contents into its corresponding "required" result
-                result_graphs_by_key[result_key] = _merge_optional_into_required_result_graph(option_group_result_graph, corresponding_result_graph)
-
-        final_result_graphs = list(result_graphs_by_key.values())
+                option_group_qgs[option_group_id] = option_group_qg
+
+        # Result graphs are grown outward from the essence qnode where possible, so they can be partitioned by it
+        start_qnode_key = essence_qnode_key if essence_qnode_key in required_qg.nodes else None
+        enumerator = _ResultGraphEnumerator(required_qg, option_group_qgs, kg_node_keys_by_qg_key_collapsed,
+                                            edge_keys_by_subject_collapsed, edge_keys_by_object_collapsed,
+                                            edge_keys_by_node_pair_collapsed, ignore_edge_direction, start_qnode_key,
+                                            log)
+        final_result_graphs = _enumerate_result_graphs(enumerator, num_processes, log)
         log.debug(f"There are a total of {len(final_result_graphs)} final result graphs")
 
     # ---------------------- Separate children from parents now that results have been formed ------------------ #
@@ -743,8 +727,6 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
                                                                         edge_bindings=edge_bindings)])
 
         # Fill out the essence for the result
-        essence_qnode_key = _get_essence_node_for_qg(qg)
-        essence_qnode = qg.nodes.get(essence_qnode_key)
         essence_kg_node_key_set = result_graph['nodes'].get(essence_qnode_key, set())
         if len(essence_kg_node_key_set) == 0:
             result.essence = cast(str, None)
@@ -872,28 +854,6 @@ def _get_result_graph_key(result_graph: Dict[str, Dict[str, Set[str]]], qnodes_t
     return result_graph_key
 
 
-def _get_kg_node_keys_by_qg_key(knowledge_graph: KnowledgeGraph) -> Dict[str, Set[str]]:
-    node_keys_by_qg_key = dict()
-    for node_key, node in knowledge_graph.nodes.items():
-        if node.qnode_keys:
-            for qnode_key in node.qnode_keys:
-                if qnode_key not in node_keys_by_qg_key:
-                    node_keys_by_qg_key[qnode_key] = set()
-                node_keys_by_qg_key[qnode_key].add(node_key)
-    return node_keys_by_qg_key
-
-
-def _get_kg_edge_keys_by_qg_key(knowledge_graph: KnowledgeGraph) -> Dict[str, Set[str]]:
-    edge_keys_by_qg_key = dict()
-    for edge_key, edge in knowledge_graph.edges.items():
-        if edge.qedge_keys:
-            for qedge_key in edge.qedge_keys:
-                if qedge_key not in edge_keys_by_qg_key:
-                    edge_keys_by_qg_key[qedge_key] = set()
-                edge_keys_by_qg_key[qedge_key].add(edge_key)
-    return edge_keys_by_qg_key
-
-
 def _get_connected_qnode_keys(qnode_key: str, query_graph: QueryGraph) -> Set[str]:
     qnode_keys_used_on_same_qedges = set()
     for qedge in query_graph.edges.values():
@@ -911,7 +871,13 @@ def _create_new_empty_result_graph() -> Dict[str, Dict[str, Set[str]]]:
 
 
 def _copy_result_graph(result_graph: Dict[str, Dict[str, Set[str]]]) -> Dict[str, Dict[str, Set[str]]]:
-    result_graph_copy = copy.deepcopy(result_graph)
+    # Result graphs only hold sets of keys, so copying them structurally is much cheaper than a deepcopy
+    result_graph_copy = _create_new_empty_result_graph()
+    for qnode_key, node_keys in result_graph["nodes"].items():
+        result_graph_copy["nodes"][qnode_key] = set(node_keys)
+    for qedge_key, edge_keys in result_graph["edges"].items():
+        result_graph_copy["edges"][qedge_key] = set(edge_keys)
+    result_graph_copy["parents"].update(result_graph.get("parents", dict()))
     return result_graph_copy
 
 
@@ -934,7 +900,7 @@ def _get_query_id(node_key: str, node: Node, qnode_key: str, qnode_keys_with_ids
 
 
 def _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key: Dict[str, Set[str]],
-                                   edge_keys_by_node_pair: DefaultDict[str, DefaultDict[Tuple[str], set]],
+                                   edge_keys_by_node_pair: Dict[str, Dict[Tuple[str, str], Set[str]]],
                                    qg: QueryGraph,
                                    log: ARAXResponse) -> Dict[str, Dict[str, Dict[str, Set[str]]]]:
     # Returned dict looks like {'n00': {'UMLS:11234': {'n01': {UniProtKB:122}}}}
@@ -1133,13 +1099,22 @@ def _clean_up_dead_ends(result_graph: Dict[str, Dict[str, Set[str]]],
 
 def _create_result_graphs(qg: QueryGraph,
                           kg_node_keys_by_qg_key: Dict[str, Set[str]],
-                          edge_keys_by_subject: DefaultDict[str, DefaultDict[str, set]],
-                          edge_keys_by_object: DefaultDict[str, DefaultDict[str, set]],
-                          edge_keys_by_node_pair: DefaultDict[str, DefaultDict[Tuple[str], set]],
+                          edge_keys_by_subject: Dict[str, Dict[str, Set[str]]],
+                          edge_keys_by_object: Dict[str, Dict[str, Set[str]]],
+                          edge_keys_by_node_pair: Dict[str, Dict[Tuple[str, str], Set[str]]],
                           ignore_edge_direction: bool = True,
                           log: ARAXResponse = ARAXResponse(),
-                          base_result_graphs: Optional[List[dict]] = None) -> List[dict]:
-    kg_node_adj_map_by_qg_key = _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key, edge_keys_by_node_pair, qg, log)
+                          base_result_graphs: Optional[List[dict]] = None,
+                          kg_node_adj_map_by_qg_key: Optional[Dict[str, Dict[str, Dict[str, Set[str]]]]] = None,
+                          start_qnode_key: Optional[str] = None,
+                          start_node_keys: Optional[Set[str]] = None) -> List[dict]:
+    """
+    Enumerates result graphs for the given QG. Unless the QG's result graphs are being built off of base result graphs,
+    construction starts at start_qnode_key (if specified); start_node_keys can be used to limit the KG nodes
+    fulfilling that start qnode to a subset of those in kg_node_keys_by_qg_key.
+    """
+    if kg_node_adj_map_by_qg_key is None:
+        kg_node_adj_map_by_qg_key = _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key, edge_keys_by_node_pair, qg, log)
     qg_adj_map = _get_qg_adj_map_undirected(qg)
 
     # Iteratively construct "result graphs" (initially containing only nodes, not edges) by walking through all qnodes
@@ -1157,7 +1132,7 @@ def _create_result_graphs(qg: QueryGraph,
     while qnode_keys_remaining:
         # Start with a random qnode if this is our first iteration
         if not qnode_keys_already_handled:
-            current_qnode_key = list(qnode_keys_remaining)[0]
+            current_qnode_key = start_qnode_key if start_qnode_key in qnode_keys_remaining else list(qnode_keys_remaining)[0]
             prior_qnode_connections = set()
         # Otherwise find a yet unhandled qnode ID that connects somehow to the part of the QG we've already handled
         else:
@@ -1169,11 +1144,13 @@ def _create_result_graphs(qg: QueryGraph,
         if not result_graphs:
             log.debug(f"Initiating result graphs with nodes for {current_qnode_key} (is_set={current_qnode.is_set})")
             all_node_keys_in_kg_for_this_qnode_key = kg_node_keys_by_qg_key.get(current_qnode_key)
+            if start_node_keys is not None and current_qnode_key == start_qnode_key:
+                all_node_keys_in_kg_for_this_qnode_key = start_node_keys
             # We'll start with one result graph with ALL corresponding nodes in the KG in this spot if is_set=True
             if current_qnode.is_set:
                 log.debug(f"Starting with one result graph because is_set=True for {current_qnode_key}")
                 new_result_graph = _create_new_empty_result_graph()
-                new_result_graph["nodes"][current_qnode_key] = all_node_keys_in_kg_for_this_qnode_key  # Parents included already
+                new_result_graph["nodes"][current_qnode_key] = set(all_node_keys_in_kg_for_this_qnode_key)  # Parents included already
                 result_graphs.append(new_result_graph)
             # Otherwise, we'll start with a result graph for EACH corresponding node in the KG
             else:
@@ -1241,18 +1218,197 @@ def _create_result_graphs(qg: QueryGraph,
             else:
                 # This technique is more efficient when there are large numbers of both subject and object nodes
                 edges_with_matching_subject = {edge_key for source_node in qedge_source_node_ids
-                                               for edge_key in edge_keys_by_subject[qedge_key][source_node]}
+                                               for edge_key in edge_keys_by_subject[qedge_key].get(source_node, ())}
                 edges_with_matching_object = {edge_key for target_node in qedge_target_node_ids
-                                              for edge_key in edge_keys_by_object[qedge_key][target_node]}
+                                              for edge_key in edge_keys_by_object[qedge_key].get(target_node, ())}
                 result_graph['edges'][qedge_key] = edges_with_matching_subject.intersection(edges_with_matching_object)
                 if ignore_edge_direction:
                     edges_with_reverse_subject = {edge_key for target_node in qedge_target_node_ids
-                                                  for edge_key in edge_keys_by_subject[qedge_key][target_node]}
+                                                  for edge_key in edge_keys_by_subject[qedge_key].get(target_node, ())}
                     edges_with_reverse_object = {edge_key for source_node in qedge_source_node_ids
-                                                 for edge_key in edge_keys_by_object[qedge_key][source_node]}
+                                                 for edge_key in edge_keys_by_object[qedge_key].get(source_node, ())}
                     result_graph['edges'][qedge_key].update(edges_with_reverse_subject.intersection(edges_with_reverse_object))
 
     # Filter out any results for which not every qnode/qedge is fulfilled (with the exception of subclass self-qedges)
     final_result_graphs = [result_graph for result_graph in result_graphs if _result_graph_is_fulfilled(result_graph, qg)]
     log.debug(f"After pruning out result graphs missing edges, there are {len(final_result_graphs)} result graphs")
     return final_result_graphs
+
+
+def _get_collapsed_edge_indexes(kg: KnowledgeGraph, qg: QueryGraph, kg_index: KGIndexByQG,
+                                kg_node_keys_by_qg_key: Dict[str, Set[str]],
+                                child_to_parent_map: Dict[str, Dict[str, str]],
+                                ignore_edge_direction: bool) -> Tuple[Dict[str, Dict[str, Set[str]]],
+                                                                      Dict[str, Dict[str, Set[str]]],
+                                                                      Dict[str, Dict[Tuple[str, str], Set[str]]]]:
+    """
+    This function returns lookups of each qedge's KG edges by subject, by object, and by node pair, with children
+    remapped to their parent concepts for qnodes where subclass answers were provided. Qedges that don't touch any such
+    qnode need no remapping, so the KG index's lookups are used as is for those (these must not be modified).
+    """
+    subclass_qnode_keys = set(child_to_parent_map)
+    kg_index_edge_keys_by_node_pair = kg_index.get_edge_keys_by_node_pair(ignore_edge_direction)
+    edge_keys_by_subject = dict()
+    edge_keys_by_object = dict()
+    edge_keys_by_node_pair = dict()
+    for qedge_key, qedge in qg.edges.items():
+        if not {qedge.subject, qedge.object}.intersection(subclass_qnode_keys):
+            edge_keys_by_subject[qedge_key] = kg_index.edge_keys_by_subject.get(qedge_key, dict())
+            edge_keys_by_object[qedge_key] = kg_index.edge_keys_by_object.get(qedge_key, dict())
+            edge_keys_by_node_pair[qedge_key] = kg_index_edge_keys_by_node_pair.get(qedge_key, dict())
+        else:
+            edge_keys_by_subject[qedge_key] = dict()
+            edge_keys_by_object[qedge_key] = dict()
+            edge_keys_by_node_pair[qedge_key] = dict()
+            for edge_key in kg_index.edge_keys_by_qg_key.get(qedge_key, set()):
+                edge = kg.edges[edge_key]
+                # Remap edges to parent concepts for qnodes where subclass answers were provided
+                qnode_subj_fulfills, qnode_obj_fulfills = _get_qnodes_subj_and_obj_fulfill(edge, qedge, kg_node_keys_by_qg_key)
+                edge_subject = child_to_parent_map[qnode_subj_fulfills][edge.subject] if qnode_subj_fulfills in subclass_qnode_keys else edge.subject
+                edge_object = child_to_parent_map[qnode_obj_fulfills][edge.object] if qnode_obj_fulfills in subclass_qnode_keys else edge.object
+                edge_keys_by_subject[qedge_key].setdefault(edge_subject, set()).add(edge_key)
+                edge_keys_by_object[qedge_key].setdefault(edge_object, set()).add(edge_key)
+                edge_keys_by_node_pair[qedge_key].setdefault((edge_subject, edge_object), set()).add(edge_key)
+                if ignore_edge_direction:
+                    edge_keys_by_node_pair[qedge_key].setdefault((edge_object, edge_subject), set()).add(edge_key)
+    return edge_keys_by_subject, edge_keys_by_object, edge_keys_by_node_pair
+
+
+class _ResultGraphEnumerator:
+    """
+    Enumerates the final result graphs for a QG: those for its required portion, merged with those for each of its
+    option groups. The KG adjacency maps for each of these sub-QGs are computed just once, up front, so that
+    enumeration can be run repeatedly for different subsets of the KG nodes fulfilling the start qnode (which is how
+    enumeration is split across processes).
+    """
+
+    def __init__(self, required_qg: QueryGraph, option_group_qgs: Dict[str, Optional[QueryGraph]],
+                 kg_node_keys_by_qg_key: Dict[str, Set[str]], edge_keys_by_subject: Dict[str, Dict[str, Set[str]]],
+                 edge_keys_by_object: Dict[str, Dict[str, Set[str]]],
+                 edge_keys_by_node_pair: Dict[str, Dict[Tuple[str, str], Set[str]]], ignore_edge_direction: bool,
+                 start_qnode_key: Optional[str], log: ARAXResponse):
+        self.required_qg = required_qg
+        self.option_group_qgs = option_group_qgs  # Option groups that aren't fulfilled by the KG map to None
+        self.kg_node_keys_by_qg_key = kg_node_keys_by_qg_key
+        self.edge_keys_by_subject = edge_keys_by_subject
+        self.edge_keys_by_object = edge_keys_by_object
+        self.edge_keys_by_node_pair = edge_keys_by_node_pair
+        self.ignore_edge_direction = ignore_edge_direction
+        self.start_qnode_key = start_qnode_key
+        self.required_non_set_qnode_keys = [qnode_key for qnode_key, qnode in required_qg.nodes.items() if not qnode.is_set]
+        self.kg_node_adj_map_by_qg_key = _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key, edge_keys_by_node_pair,
+                                                                        required_qg, log)
+        self.kg_node_adj_maps_by_option_group = {option_group_id: _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key,
+                                                                                                 edge_keys_by_node_pair,
+                                                                                                 option_group_qg, log)
+                                                 for option_group_id, option_group_qg in option_group_qgs.items()
+                                                 if option_group_qg}
+
+    def get_start_node_keys(self) -> Set[str]:
+        return self.kg_node_keys_by_qg_key.get(self.start_qnode_key, set()) if self.start_qnode_key else set()
+
+    def enumerate(self, log: ARAXResponse, start_node_keys: Optional[Set[str]] = None) -> List[dict]:
+        log.info(f"Creating result graphs for required portion of QG")
+        result_graphs_required = _create_result_graphs(self.required_qg, self.kg_node_keys_by_qg_key,
+                                                       self.edge_keys_by_subject, self.edge_keys_by_object,
+                                                       self.edge_keys_by_node_pair, self.ignore_edge_direction, log,
+                                                       kg_node_adj_map_by_qg_key=self.kg_node_adj_map_by_qg_key,
+                                                       start_qnode_key=self.start_qnode_key,
+                                                       start_node_keys=start_node_keys)
+        log.debug(f"Created {len(result_graphs_required)} required result graphs")
+
+        # Then create results for each of the 'option groups' in the QG (including the 'required' portion with each)
+        # Note: Option group result graphs are built off of the required ones, so there's nothing to do without those
+        option_group_results_dict = dict()
+        for option_group_id, option_group_qg in self.option_group_qgs.items():
+            if option_group_qg and result_graphs_required:
+                log.info(f"Creating result graphs for option group {option_group_id}")
+                base_result_graphs = [_copy_result_graph(result_graph) for result_graph in result_graphs_required]
+                result_graphs_for_option_group = _create_result_graphs(option_group_qg, self.kg_node_keys_by_qg_key,
+                                                                       self.edge_keys_by_subject, self.edge_keys_by_object,
+                                                                       self.edge_keys_by_node_pair,
+                                                                       self.ignore_edge_direction, log,
+                                                                       base_result_graphs=base_result_graphs,
+                                                                       kg_node_adj_map_by_qg_key=self.kg_node_adj_maps_by_option_group[option_group_id])
+                log.debug(f"Created {len(result_graphs_for_option_group)} option group {option_group_id} result graphs")
+                option_group_results_dict[option_group_id] = result_graphs_for_option_group
+
+        # Organize our results for the 'required' portion of the QG by the IDs of their is_set=False nodes
+        log.debug(f"Required non-set qnodes are: {self.required_non_set_qnode_keys}")
+        result_graphs_by_key = dict()
+        for result_graph in result_graphs_required:
+            result_key = _get_result_graph_key(result_graph, self.required_non_set_qnode_keys, log)
+            result_graphs_by_key[result_key] = result_graph
+        # Then merge our results for each option group ID into the appropriate "required" results
+        if option_group_results_dict:
+            log.info(f"Merging option group result graphs into required result graphs with matching non-set qnodes")
+        for option_group_id, option_group_result_graphs in option_group_results_dict.items():
+            for option_group_result_graph in option_group_result_graphs:
+                result_key = _get_result_graph_key(option_group_result_graph, self.required_non_set_qnode_keys, log)
+                corresponding_result_graph = result_graphs_by_key[result_key]
+                # Merge this optional result's contents into its corresponding "required" result
+                result_graphs_by_key[result_key] = _merge_optional_into_required_result_graph(option_group_result_graph, corresponding_result_graph)
+
+        return list(result_graphs_by_key.values())
+
+
+_result_graph_enumerator_for_workers: Optional[_ResultGraphEnumerator] = None  # Set in each worker process by the pool
+
+
+def _enumerate_result_graphs(enumerator: _ResultGraphEnumerator, num_processes: int,
+                             log: ARAXResponse) -> List[dict]:
+    """
+    This function enumerates result graphs, splitting the work across a pool of worker processes when the QG has a
+    (required, is_set=False) essence qnode fulfilled by enough KG nodes to make that worthwhile. Every result graph
+    contains exactly one node fulfilling the essence qnode, so the KG nodes fulfilling it are simply divided up among
+    the workers. Peak memory usage (of this process and of the hungriest worker) is reported in the log.
+    """
+    start_node_keys = enumerator.get_start_node_keys()
+    num_workers = min(num_processes, len(start_node_keys) // MIN_ESSENCE_NODES_PER_PROCESS)
+    # Note: Daemonic processes (e.g., workers of some other pool) aren't allowed to have children
+    if num_workers < 2 or multiprocessing.current_process().daemon or \
+            "forkserver" not in multiprocessing.get_all_start_methods():
+        result_graphs = enumerator.enumerate(log)
+        log.info(f"Enumerated {len(result_graphs)} result graphs in a single process; peak memory usage "
+                 f"is {_get_peak_memory_usage_mb():.0f} MB")
+        return result_graphs
+
+    log.info(f"Splitting result enumeration across {num_workers} processes by the {len(start_node_keys)} KG nodes "
+             f"fulfilling the essence qnode ({enumerator.start_qnode_key})")
+    sorted_start_node_keys = sorted(start_node_keys)
+    start_node_key_batches = [set(sorted_start_node_keys[index::num_workers]) for index in range(num_workers)]
+    # Workers come from a (single-threaded) fork server rather than being forked from this process, since by now other
+    # threads (e.g., the KP connection pool's event loop) may be holding locks a forked copy would never see released.
+    # Each worker gets the enumerator pickled to it once, as it starts up.
+    with multiprocessing.get_context("forkserver").Pool(processes=num_workers,
+                                                        initializer=_set_result_graph_enumerator_for_worker,
+                                                        initargs=(enumerator,)) as executor:
+        worker_outputs = executor.map(_enumerate_result_graphs_for_batch, start_node_key_batches)
+
+    result_graphs = []
+    max_worker_peak_memory_usage = 0.0
+    for worker_result_graphs, worker_log, worker_peak_memory_usage in worker_outputs:
+        result_graphs += worker_result_graphs
+        log.merge(worker_log)
+        max_worker_peak_memory_usage = max(max_worker_peak_memory_usage, worker_peak_memory_usage)
+    log.info(f"Enumerated {len(result_graphs)} result graphs across {num_workers} processes; peak memory usage is "
+             f"{_get_peak_memory_usage_mb():.0f} MB for the main process and {max_worker_peak_memory_usage:.0f} MB "
+             f"for the largest worker")
+    return result_graphs
+
+
+def _set_result_graph_enumerator_for_worker(enumerator: _ResultGraphEnumerator):
+    global _result_graph_enumerator_for_workers
+    _result_graph_enumerator_for_workers = enumerator
+
+
+def _enumerate_result_graphs_for_batch(start_node_keys: Set[str]) -> Tuple[List[dict], ARAXResponse, float]:
+    worker_log = ARAXResponse()
+    result_graphs = _result_graph_enumerator_for_workers.enumerate(worker_log, start_node_keys)
+    return result_graphs, worker_log, _get_peak_memory_usage_mb()
+
+
+def _get_peak_memory_usage_mb() -> float:
+    peak_memory_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Note: ru_maxrss is in bytes on macOS, but kilobytes on Linux
+    return peak_memory_usage / (1024 * 1024) if sys.platform == "darwin" else peak_memory_usage / 1024
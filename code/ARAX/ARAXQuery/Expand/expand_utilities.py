@@ -22,6 +22,7 @@ from ARAX_response import ARAXResponse
 from ARAX_resultify import ARAXResultify
 from ARAX_overlay import ARAXOverlay
 from ARAX_ranker import ARAXRanker
+from compact_kg import CompactKnowledgeGraph
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../NodeSynonymizer/")
 from node_synonymizer import NodeSynonymizer
@@ -656,9 +657,11 @@ def is_expand_created_subclass_qedge_key(qedge_key: str, qg: QueryGraph) -> bool
     return basic_format_met and qnode_is_valid
 
 
-def create_results(qg: QueryGraph, kg: QGOrganizedKnowledgeGraph, log: ARAXResponse, overlay_fet: bool = False,
-                   rank_results: bool = False, qnode_key_to_prune: Optional[str] = None,) -> Response:
-    regular_format_kg = convert_qg_organized_kg_to_standard_kg(kg)
+def create_results(qg: QueryGraph, kg: Union[QGOrganizedKnowledgeGraph, CompactKnowledgeGraph], log: ARAXResponse,
+                   overlay_fet: bool = False, rank_results: bool = False,
+                   qnode_key_to_prune: Optional[str] = None,) -> Response:
+    # Note: A CompactKnowledgeGraph is read-only, so it can't be used with overlay_fet
+    regular_format_kg = kg if isinstance(kg, CompactKnowledgeGraph) else convert_qg_organized_kg_to_standard_kg(kg)
     resultifier = ARAXResultify()
     prune_response = ARAXResponse()
     prune_response.envelope = Response()
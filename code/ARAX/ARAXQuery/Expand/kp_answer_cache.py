@@ -0,0 +1,153 @@
+#!/bin/env python3
+"""
+The kp_answer_cache.py file defines a class called KPAnswerCache, which persists the answers Expand gets back from KPs
+for individual one-hop sub-queries. Answers are keyed by a normalized hash of the exact request body sent to the KP
+(plus the KP's infores curie), so that identical sub-queries issued by later queries (in any worker process) can skip
+the network round trip entirely. Entries expire after a TTL, the cache is kept under a size limit via LRU eviction,
+and all of a KP's entries are dropped whenever KPInfoCacher notices that the KP's meta knowledge graph has changed.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional, Dict, Iterable
+
+
+class KPAnswerCache:
+
+    ttl = 24 * 60 * 60  # Seconds an answer is considered fresh
+    max_size_bytes = 1024 * 1024 * 1024  # Total (compressed) size of stored answers before LRU eviction kicks in
+    max_answer_bytes = 50 * 1024 * 1024  # Answers bigger than this (compressed) aren't worth caching
+    db_timeout = 10  # Seconds to wait on another process's write lock
+
+    # Hit/miss counters for this process, like {"infores:spoke": {"hits": 2, "misses": 5, "stores": 5}}
+    stats = defaultdict(lambda: defaultdict(int))
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path if db_path else f"{os.path.dirname(os.path.abspath(__file__))}/kp_answer_cache.sqlite"
+
+    # ----------------------------------------- PUBLIC METHODS ------------------------------------------------------ #
+
+    @staticmethod
+    def get_cache_key(request_body: dict, kp_infores_curie: str) -> str:
+        """
+        Returns a hash identifying this sub-query. Lists in the request body (ids, categories, predicates...) are
+        order-insensitive in TRAPI, so they are sorted before hashing.
+        """
+        normalized_body = json.dumps(KPAnswerCache._normalize(request_body), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{kp_infores_curie}|{normalized_body}".encode()).hexdigest()
+
+    def get(self, cache_key: str, kp_infores_curie: str,
+            kp_version: Optional[str] = None) -> Optional["QGOrganizedKnowledgeGraph"]:
+        """
+        Returns a fresh copy of the cached answer for this key, or None if there isn't a usable one (missing, expired,
+        or stored under a different version of the KP).
+        """
+        try:
+            with self._connect() as connection:
+                row = connection.execute("SELECT kp_version, created, answer FROM answers WHERE key = ?",
+                                         (cache_key,)).fetchone()
+                if row and (time.time() - row[1] > self.ttl or (kp_version and row[0] != kp_version)):
+                    connection.execute("DELETE FROM answers WHERE key = ?", (cache_key,))
+                    row = None
+                if row:
+                    connection.execute("UPDATE answers SET last_accessed = ? WHERE key = ?", (time.time(), cache_key))
+            answer_kg = pickle.loads(zlib.decompress(row[2])) if row else None
+        except Exception:
+            answer_kg = None  # A broken cache should never break a query
+        self.stats[kp_infores_curie]["hits" if answer_kg else "misses"] += 1
+        return answer_kg
+
+    def put(self, cache_key: str, kp_infores_curie: str, answer_kg: "QGOrganizedKnowledgeGraph",
+            kp_version: Optional[str] = None) -> bool:
+        """
+        Stores the given answer. Returns True if it was stored. The answer is serialized immediately, so callers are
+        free to modify answer_kg afterwards.
+        """
+        try:
+            answer_blob = zlib.compress(pickle.dumps(answer_kg, protocol=pickle.HIGHEST_PROTOCOL))
+            if len(answer_blob) > self.max_answer_bytes:
+                return False
+            now = time.time()
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO answers (key, kp, kp_version, created, last_accessed, size, answer) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (cache_key, kp_infores_curie, kp_version, now, now, len(answer_blob), answer_blob))
+                self._evict(connection)
+        except Exception:
+            return False
+        self.stats[kp_infores_curie]["stores"] += 1
+        return True
+
+    def invalidate_kps(self, kp_infores_curies: Iterable[str]) -> int:
+        """
+        Deletes all cached answers from the given KPs (e.g., because their meta KG changed). Returns the number of
+        answers deleted.
+        """
+        kp_infores_curies = list(kp_infores_curies)
+        if not kp_infores_curies or not os.path.exists(self.db_path):
+            return 0
+        with self._connect() as connection:
+            placeholders = ",".join("?" for _ in kp_infores_curies)
+            cursor = connection.execute(f"DELETE FROM answers WHERE kp IN ({placeholders})", kp_infores_curies)
+            return cursor.rowcount
+
+    def clear(self):
+        if os.path.exists(self.db_path):
+            with self._connect() as connection:
+                connection.execute("DELETE FROM answers")
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {kp: dict(kp_stats) for kp, kp_stats in self.stats.items()}
+
+    def get_printable_stats(self, kp_infores_curies: Optional[Iterable[str]] = None) -> str:
+        kp_infores_curies = set(kp_infores_curies) if kp_infores_curies is not None else set(self.stats)
+        return ", ".join([f"{kp}: {kp_stats.get('hits', 0)} hits/{kp_stats.get('misses', 0)} misses"
+                          for kp, kp_stats in sorted(self.get_stats().items()) if kp in kp_infores_curies])
+
+    # ----------------------------------------- PRIVATE METHODS ----------------------------------------------------- #
+
+    @contextmanager
+    def _connect(self):
+        # Connections aren't shared (this is used from many forked worker processes), so open one per operation
+        connection = sqlite3.connect(self.db_path, timeout=self.db_timeout)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, kp TEXT, kp_version TEXT, "
+                               "created REAL, last_accessed REAL, size INTEGER, answer BLOB)")
+            connection.execute("CREATE INDEX IF NOT EXISTS answers_by_kp ON answers (kp)")
+            connection.execute("CREATE INDEX IF NOT EXISTS answers_by_last_accessed ON answers (last_accessed)")
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _evict(self, connection: sqlite3.Connection):
+        connection.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+        if total_size > self.max_size_bytes:
+            # Drop least recently used answers until we're back under the limit
+            excess = total_size - self.max_size_bytes
+            freed = 0
+            keys_to_delete = []
+            for key, size in connection.execute("SELECT key, size FROM answers ORDER BY last_accessed"):
+                if freed >= excess:
+                    break
+                keys_to_delete.append((key,))
+                freed += size
+            connection.executemany("DELETE FROM answers WHERE key = ?", keys_to_delete)
+
+    @staticmethod
+    def _normalize(value: any) -> any:
+        if isinstance(value, dict):
+            return {key: KPAnswerCache._normalize(item) for key, item in value.items()}
+        elif isinstance(value, (list, tuple, set)):
+            normalized_items = [KPAnswerCache._normalize(item) for item in value]
+            return sorted(normalized_items, key=lambda item: json.dumps(item, sort_keys=True))
+        else:
+            return value
@@ -0,0 +1,201 @@
+#!/bin/env python3
+"""
+The kp_connection_pool.py file defines a class called KPConnectionPool, which holds long-lived aiohttp sessions
+(one per KP) that Expand uses to send queries to KPs' TRAPI APIs. Sessions are owned by a single background event
+loop so that their keep-alive connections can be reused across qedges and across queries run in the same process,
+instead of repeating DNS, TCP and TLS setup for every KP call.
+"""
+# NOTE: this is a singleton class (same approach as RTXConfiguration). Please do not mutate class variables.
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Coroutine
+
+import aiohttp
+
+
+class KPConnectionPool:
+
+    _instance = None
+    _initialized = False
+
+    limit_per_host = 10  # Max number of simultaneous connections to any one KP host
+    keepalive_timeout = 60  # Seconds an unused connection is kept open by the connector
+    idle_session_timeout = 600  # Seconds after which a KP's session is closed if it hasn't been used
+    eviction_interval = 60  # Seconds between sweeps for idle sessions
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._private_init()
+        return cls._instance
+
+    def _private_init(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._sessions = dict()
+        self._last_used = dict()
+        self._num_in_flight = defaultdict(int)  # KP -> number of requests currently using its session
+        self._tasks = set()  # The pool's own tasks (gathers and the eviction sweep), which close() cancels
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # The background thread (and thus the event loop) doesn't survive a fork, so children must start fresh
+        if cls._instance is not None:
+            cls._instance._initialized = False
+            cls._instance._private_init()
+
+    # ----------------------------------------- PUBLIC METHODS ------------------------------------------------------ #
+
+    def run_until_complete(self, coroutines: List[Coroutine]) -> list:
+        """
+        Runs the given coroutines concurrently on the pool's event loop and blocks until all of them are done.
+        Returns their results in the same order as the coroutines were given (like asyncio.gather()).
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("KPConnectionPool.run_until_complete() cannot be called from the pool's own event loop")
+        loop = self._get_loop()
+        future = asyncio.run_coroutine_threadsafe(self._run_as_own_task(self._gather(coroutines)), loop)
+        return future.result()
+
+    async def get_session(self, kp_infores_curie: str) -> Optional[aiohttp.ClientSession]:
+        """
+        Returns the shared session for the given KP. Must be awaited from within the pool's event loop; returns None
+        if called from any other loop (callers should then fall back to a short-lived session of their own). Callers
+        must call release_session() once they're done with the session, so it isn't evicted while it's in use.
+        """
+        if asyncio.get_running_loop() is not self._loop:
+            return None
+        session = self._sessions.get(kp_infores_curie)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(connector=self._create_connector(),
+                                            trace_configs=[self._create_trace_config(kp_infores_curie)])
+            self._sessions[kp_infores_curie] = session
+            self._stats[kp_infores_curie]["sessions_created"] += 1
+        self._last_used[kp_infores_curie] = time.time()
+        self._num_in_flight[kp_infores_curie] += 1
+        self._stats[kp_infores_curie]["requests"] += 1
+        return session
+
+    def release_session(self, kp_infores_curie: str):
+        """
+        Marks one request using the given KP's session (from get_session()) as done. Must be called from within the
+        pool's event loop.
+        """
+        if self._num_in_flight.get(kp_infores_curie, 0) > 0:
+            self._num_in_flight[kp_infores_curie] -= 1
+        self._last_used[kp_infores_curie] = time.time()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns per-KP counters, like: {"infores:spoke": {"requests": 12, "connections_created": 2,
+        "connections_reused": 10, "sessions_created": 1, "sessions_evicted": 0}, ...}
+        """
+        return {kp: dict(kp_stats) for kp, kp_stats in self._stats.items()}
+
+    def get_printable_stats(self) -> str:
+        return ", ".join([f"{kp}: {kp_stats.get('connections_reused', 0)}/{kp_stats.get('requests', 0)} reused"
+                          for kp, kp_stats in sorted(self.get_stats().items())])
+
+    def close(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            future = asyncio.run_coroutine_threadsafe(self._close_all_sessions(), loop)
+            future.result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+    # ----------------------------------------- PRIVATE METHODS ----------------------------------------------------- #
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run_loop, args=(self._loop,),
+                                                name="KPConnectionPool", daemon=True)
+                self._thread.start()
+                asyncio.run_coroutine_threadsafe(self._run_as_own_task(self._evict_idle_sessions_periodically()),
+                                             self._loop)
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    @staticmethod
+    async def _gather(coroutines: List[Coroutine]) -> list:
+        return await asyncio.gather(*coroutines)
+
+    async def _run_as_own_task(self, coroutine: Coroutine):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await coroutine
+        finally:
+            self._tasks.discard(task)
+
+    def _create_connector(self) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(ssl=False,
+                                    limit_per_host=self.limit_per_host,
+                                    keepalive_timeout=self.keepalive_timeout,
+                                    ttl_dns_cache=self.idle_session_timeout)
+
+    def _create_trace_config(self, kp_infores_curie: str) -> aiohttp.TraceConfig:
+        kp_stats = self._stats[kp_infores_curie]
+
+        async def on_connection_create_end(session, trace_config_ctx, params):
+            kp_stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, trace_config_ctx, params):
+            kp_stats["connections_reused"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def _evict_idle_sessions_periodically(self):
+        while True:
+            await asyncio.sleep(self.eviction_interval)
+            await self._evict_idle_sessions()
+
+    async def _evict_idle_sessions(self):
+        cutoff = time.time() - self.idle_session_timeout
+        # Sessions with requests in flight are never idle, however long ago those requests started
+        idle_kps = [kp for kp, last_used in self._last_used.items()
+                    if last_used < cutoff and not self._num_in_flight.get(kp)]
+        for kp in idle_kps:
+            session = self._sessions.pop(kp, None)
+            self._last_used.pop(kp, None)
+            if session and not session.closed:
+                await session.close()
+                self._stats[kp]["sessions_evicted"] += 1
+
+    async def _close_all_sessions(self):
+        for task in list(self._tasks):
+            if task is not asyncio.current_task():
+                task.cancel()
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+        self._last_used.clear()
+        self._num_in_flight.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=KPConnectionPool._reset_after_fork)
+
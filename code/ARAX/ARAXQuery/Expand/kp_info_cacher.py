@@ -3,6 +3,8 @@ The kp_info_cacher.py file is a Python script that defines a class called KPInfo
 This class is responsible for caching information about knowledge providers (KPs) used by the Reasoner API (TRAPI) service.
 The cached information includes metadata about KPs and their APIs, as well as information about which KPs are currently available and which ones are down.
 '''
+import hashlib
+import json
 import os
 import pathlib
 import pickle
@@ -25,6 +27,7 @@ sys.path.append(os.path.sep.join([*pathlist[:(rtx_index + 1)], 'code', 'ARAX', '
 from ARAX_response import ARAXResponse
 sys.path.append(os.path.sep.join([*pathlist[:(rtx_index + 1)], 'code', 'ARAX', 'ARAXQuery', 'Expand']))
 from smartapi import SmartAPI
+from kp_answer_cache import KPAnswerCache
 
 
 class KPInfoCacher:
@@ -71,10 +74,14 @@ class KPInfoCacher:
             # Grab KPs' meta map info based off of their /meta_knowledge_graph endpoints
             meta_map = self._build_meta_map(allowed_kps_dict=smart_api_cache_contents["allowed_kp_urls"])
 
+            # Fingerprint each KP's URL + meta KG so that cached KP answers can be dropped when a KP changes
+            kp_versions = self._get_kp_versions(smart_api_cache_contents["allowed_kp_urls"], meta_map)
+            self._invalidate_changed_kp_answers(kp_versions)
 
             common_cache = {
                                 "smart_api_cache": smart_api_cache_contents,
-                                "meta_map_cache": meta_map
+                                "meta_map_cache": meta_map,
+                                "kp_versions_cache": kp_versions
                             }
             
             with open(f"{self.smart_api_and_meta_map_cache}.tmp", "wb") as smart_api__and_meta_map_cache_temp:
@@ -155,9 +162,44 @@ class KPInfoCacher:
             cache = pickle.load(cache)
             smart_api_info = cache['smart_api_cache']
             meta_map = cache['meta_map_cache']
+            kp_versions = cache.get('kp_versions_cache', dict())  # Caches built before KP versions were added lack this
 
 
-        return smart_api_info, meta_map
+        return smart_api_info, meta_map, kp_versions
+
+    # --------------------------------- METHODS FOR TRACKING KP VERSIONS -------------------------------------------- #
+
+    @staticmethod
+    def _get_kp_versions(allowed_kps_dict: Dict[str, str], meta_map: dict) -> Dict[str, str]:
+        """
+        KPs don't advertise a data version, so we use a hash of each KP's URL and meta map entry as a proxy for one.
+        """
+        def to_json_compatible(value):
+            if isinstance(value, dict):
+                return {key: to_json_compatible(item) for key, item in value.items()}
+            elif isinstance(value, (set, list, tuple)):
+                return sorted(to_json_compatible(item) for item in value)
+            else:
+                return value
+
+        kp_versions = dict()
+        for kp_infores_curie, kp_endpoint_url in allowed_kps_dict.items():
+            kp_meta_info = to_json_compatible(meta_map.get(kp_infores_curie, dict()))
+            fingerprint_input = json.dumps({"url": kp_endpoint_url, "meta_info": kp_meta_info}, sort_keys=True)
+            kp_versions[kp_infores_curie] = hashlib.sha256(fingerprint_input.encode()).hexdigest()[:16]
+        return kp_versions
+
+    def _invalidate_changed_kp_answers(self, kp_versions: Dict[str, str]):
+        previous_kp_versions = dict()
+        if pathlib.Path(self.smart_api_and_meta_map_cache).exists():
+            with open(self.smart_api_and_meta_map_cache, "rb") as cache:
+                previous_kp_versions = pickle.load(cache).get("kp_versions_cache", dict())
+        changed_kps = {kp for kp, previous_version in previous_kp_versions.items()
+                       if kp_versions.get(kp) != previous_version}
+        if changed_kps:
+            num_deleted = KPAnswerCache().invalidate_kps(changed_kps)
+            eprint(f"Detected changes in {len(changed_kps)} KPs ({', '.join(sorted(changed_kps))}); "
+                   f"deleted {num_deleted} of their cached answers")
 
     # --------------------------------- METHODS FOR BUILDING META MAP ----------------------------------------------- #
     # --- Note: These methods can't go in KPSelector because it would create a circular dependency with this class -- #
@@ -25,28 +25,29 @@ class KPSelector:
         self.log = log
         self.kg2_mode = kg2_mode
         self.kp_cacher = KPInfoCacher()
-        self.meta_map, self.kp_urls, self.kps_excluded_by_version, self.kps_excluded_by_maturity = self._load_cached_kp_info()
+        (self.meta_map, self.kp_urls, self.kps_excluded_by_version, self.kps_excluded_by_maturity,
+         self.kp_versions) = self._load_cached_kp_info()
         self.valid_kps = {"infores:rtx-kg2"} if self.kg2_mode else set(self.kp_urls.keys())
         self.bh = BiolinkHelper()
 
     def _load_cached_kp_info(self) -> tuple:
         if self.kg2_mode:
             # We don't need any KP meta info when in KG2 mode, because there are no KPs to choose from
-            return None, None, None, None
+            return None, None, None, None, dict()
         else:
             # Load cached KP info
             kp_cacher = KPInfoCacher()
             try:
-                smart_api_info, meta_map = kp_cacher.load_kp_info_caches(self.log)
+                smart_api_info, meta_map, kp_versions = kp_cacher.load_kp_info_caches(self.log)
             except Exception as e:
                 self.log.error(f"Failed to load KP info caches due to {e}", error_code="LoadKPCachesFailed")
-                return None, None, None, None
+                return None, None, None, None, dict()
 
             # Record None URLs for our local KPs
             allowed_kp_urls = smart_api_info["allowed_kp_urls"]
 
             return (meta_map, allowed_kp_urls, smart_api_info["kps_excluded_by_version"],
-                    smart_api_info["kps_excluded_by_maturity"])
+                    smart_api_info["kps_excluded_by_maturity"], kp_versions)
 
     def get_kps_for_single_hop_qg(self, qg: QueryGraph) -> Optional[Set[str]]:
         """
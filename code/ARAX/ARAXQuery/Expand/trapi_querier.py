@@ -17,23 +17,29 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import Expand.expand_utilities as eu
 from Expand.expand_utilities import QGOrganizedKnowledgeGraph
 from Expand.kp_selector import KPSelector
+from Expand.kp_connection_pool import KPConnectionPool
+from Expand.kp_answer_cache import KPAnswerCache
+from Expand.trapi_stream_decoder import TRAPIStreamDecoder
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
-from ARAX_messenger import ARAXMessenger
 from ARAX_query import ARAXQuery
+from lazy_trapi_models import LazyEdge, LazyNode, get_unhydrated_value, set_unhydrated_value
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.node import Node
 from openapi_server.models.edge import Edge
 from openapi_server.models.q_node import QNode
 from openapi_server.models.q_edge import QEdge
 from openapi_server.models.query_graph import QueryGraph
-from openapi_server.models.result import Result
 from openapi_server.models.attribute import Attribute
 from openapi_server.models.retrieval_source import RetrievalSource
 
 
 class TRAPIQuerier:
 
+    max_kp_response_bytes = 500 * 1024 * 1024  # KP answers bigger than this are cut off (to protect worker memory)
+    response_chunk_size = 256 * 1024
+    use_answer_cache = True  # Whether to reuse (and store) KP answers to identical sub-queries via KPAnswerCache
+
     def __init__(self, response_object: ARAXResponse, kp_name: str, user_specified_kp: bool, kp_timeout: Optional[int],
                  kp_selector: KPSelector = None, force_local: bool = False):
         self.log = response_object
@@ -172,10 +178,11 @@ class TRAPIQuerier:
             self.log.error(f"answer_single_node_query() was passed a query graph that has edges: "
                            f"{query_graph.to_dict()}", error_code="InvalidQuery")
 
-    def _get_kg_to_qg_mappings_from_results(self, results: List[Result], qg: QueryGraph) -> Tuple[Dict[str, Dict[str, Set[str]]], Dict[str, Set[str]]]:
+    def _get_kg_to_qg_mappings_from_results(self, results: List[dict], qg: QueryGraph) -> Tuple[Dict[str, Dict[str, Set[str]]], Dict[str, Set[str]]]:
         """
         This function returns a dictionary in which one can lookup which qnode_keys/qedge_keys a given node/edge
         fulfills. Like: {"nodes": {"PR:11": {"n00"}, "MESH:22": {"n00", "n01"} ... }, "edges": { ... }}
+        Note that results are plain (JSON) dicts here; we never build Result objects for KP answers.
         """
         qnodes_with_multiple_ids = {qnode_key for qnode_key, qnode in qg.nodes.items() if qnode.ids and len(qnode.ids) > 1}
         qnodes_with_single_id = {qnode_key for qnode_key, qnode in qg.nodes.items() if qnode.ids and len(qnode.ids) == 1}
@@ -184,17 +191,18 @@ class TRAPIQuerier:
         qedge_key_mappings = defaultdict(set)
         for result in results:
             # Record mappings from the returned node to the parent curie listed in the QG that it is fulfilling
-            for qnode_key, node_bindings in result.node_bindings.items():
+            for qnode_key, node_bindings in (result.get("node_bindings") or dict()).items():
                 query_node_ids = set(eu.convert_to_list(qg.nodes[qnode_key].ids))
                 for node_binding in node_bindings:
-                    kg_id = node_binding.id
+                    kg_id = node_binding["id"]
+                    query_id = node_binding.get("query_id")
                     qnode_key_mappings[kg_id].add(qnode_key)
                     # Handle case where the KP does return a query_id
-                    if node_binding.query_id:
-                        if node_binding.query_id in query_node_ids:
-                            kg_id_to_parent_query_id_map[kg_id].add(node_binding.query_id)
+                    if query_id:
+                        if query_id in query_node_ids:
+                            kg_id_to_parent_query_id_map[kg_id].add(query_id)
                         else:
-                            self.log.warning(f"{self.kp_infores_curie} returned a NodeBinding.query_id ({node_binding.query_id})"
+                            self.log.warning(f"{self.kp_infores_curie} returned a NodeBinding.query_id ({query_id})"
                                              f" for {qnode_key} that is not in {qnode_key}'s ids in the QG sent "
                                              f"to {self.kp_infores_curie}. This is invalid TRAPI. Skipping this binding.")
                     # Handle case where KP does NOT return a query_id (may or may not be valid TRAPI)
@@ -212,11 +220,11 @@ class TRAPIQuerier:
                                                  f"query sent to {self.kp_infores_curie}, none of which are the KG ID ({kg_id})."
                                                  f" This is invalid TRAPI. Skipping this binding.")
 
-            for analysis in result.analyses:  # TODO: Maybe later extract Analysis support graphs from KPs?
-                if analysis.edge_bindings:
-                    for qedge_key, edge_bindings in analysis.edge_bindings.items():
+            for analysis in result.get("analyses") or []:  # TODO: Maybe later extract Analysis support graphs from KPs?
+                if analysis.get("edge_bindings"):
+                    for qedge_key, edge_bindings in analysis["edge_bindings"].items():
                         for edge_binding in edge_bindings:
-                            kg_id = edge_binding.id
+                            kg_id = edge_binding["id"]
                             qedge_key_mappings[kg_id].add(qedge_key)
 
         if not self.kp_infores_curie == "infores:rtx-kg2":
@@ -240,43 +248,82 @@ class TRAPIQuerier:
 
         # Avoid calling the KG2 TRAPI endpoint if the 'force_local' flag is set (used only for testing/dev work)
         num_input_curies = max([len(eu.convert_to_list(qnode.ids)) for qnode in query_graph.nodes.values()])
+        start = time.time()
+
+        # Blocking work (the answer cache's sqlite reads/writes, building answer KGs) is run in the loop's thread pool,
+        # since this loop is shared by every query running in the process
+        loop = asyncio.get_running_loop()
+
+        # Reuse this KP's answer to an identical sub-query if we have a fresh one cached
+        use_answer_cache = self.use_answer_cache and not self.force_local
+        if use_answer_cache:
+            answer_cache = KPAnswerCache()
+            cache_key = answer_cache.get_cache_key(request_body, self.kp_infores_curie)
+            kp_version = self.kp_selector.kp_versions.get(self.kp_infores_curie)
+            cached_answer_kg = await loop.run_in_executor(None, answer_cache.get, cache_key, self.kp_infores_curie,
+                                                          kp_version)
+            if cached_answer_kg is not None:
+                self.log.debug(f"{self.kp_infores_curie}: Using cached answer to this sub-query")
+                self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Waiting",
+                                           f"Query with {num_input_curies} curies answered from cache", query=query_sent)
+                done_message = f"Returned {len(cached_answer_kg.edges_by_qg_id.get(qedge_key, dict()))} edges " \
+                               f"from cache in {round(time.time() - start)} seconds"
+                self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Done", done_message)
+                return cached_answer_kg
+
         waiting_message = f"Query with {num_input_curies} curies sent: waiting for response"
         self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Waiting", waiting_message, query=query_sent)
-        start = time.time()
         if self.force_local and self.kp_infores_curie == 'infores:rtx-kg2':
             json_response = self._answer_query_force_local(request_body)
-        # Otherwise send the query graph to the KP's TRAPI API
+            answer_kg = await loop.run_in_executor(None, self._load_kp_json_response, json_response, query_graph)
+        # Otherwise send the query graph to the KP's TRAPI API (and decode its answer as it streams in)
         else:
             self.log.debug(f"{self.kp_infores_curie}: Sending query to {self.kp_infores_curie} API ({self.kp_endpoint})")
-            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(verify_ssl=False)) as session:
-                try:
-                    async with session.post(f"{self.kp_endpoint}/query",
-                                            json=request_body,
-                                            headers={'accept': 'application/json'},
-                                            timeout=query_timeout) as response:
-                        if response.status == 200:
-                            json_response = await response.json()
-                        else:
-                            wait_time = round(time.time() - start)
-                            http_error_message = f"Returned HTTP error {response.status} after {wait_time} seconds"
-                            self.log.warning(f"{self.kp_infores_curie}: {http_error_message}. Query sent to KP was: {request_body}")
-                            self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Error", http_error_message)
+            kp_connection_pool = KPConnectionPool()
+            pooled_session = await kp_connection_pool.get_session(self.kp_infores_curie)
+            # Fall back to a one-off session if we're not running on the connection pool's event loop
+            session = pooled_session if pooled_session else aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False))
+            try:
+                async with session.post(f"{self.kp_endpoint}/query",
+                                        json=request_body,
+                                        headers={'accept': 'application/json'},
+                                        timeout=query_timeout) as response:
+                    if response.status == 200:
+                        answer_kg = await self._load_kp_response_stream(response, query_graph, qedge_key)
+                        if answer_kg is None:
+                            self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Error",
+                                                       "Response did not include a 'message'")
                             return QGOrganizedKnowledgeGraph()
-                except asyncio.exceptions.TimeoutError:
-                    timeout_message = f"Query timed out after {query_timeout} seconds"
-                    self.log.warning(f"{self.kp_infores_curie}: {timeout_message}")
-                    self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Timed out", timeout_message)
-                    return QGOrganizedKnowledgeGraph()
-                except Exception as ex:
-                    wait_time = round(time.time() - start)
-                    exception_message = f"Request threw exception after {wait_time} seconds: {type(ex)}"
-                    self.log.warning(f"{self.kp_infores_curie}: {exception_message}")
-                    self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Error", exception_message)
-                    return QGOrganizedKnowledgeGraph()
+                    else:
+                        wait_time = round(time.time() - start)
+                        http_error_message = f"Returned HTTP error {response.status} after {wait_time} seconds"
+                        self.log.warning(f"{self.kp_infores_curie}: {http_error_message}. Query sent to KP was: {request_body}")
+                        self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Error", http_error_message)
+                        return QGOrganizedKnowledgeGraph()
+            except asyncio.exceptions.TimeoutError:
+                timeout_message = f"Query timed out after {query_timeout} seconds"
+                self.log.warning(f"{self.kp_infores_curie}: {timeout_message}")
+                self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Timed out", timeout_message)
+                return QGOrganizedKnowledgeGraph()
+            except Exception as ex:
+                wait_time = round(time.time() - start)
+                exception_message = f"Request threw exception after {wait_time} seconds: {type(ex)}"
+                self.log.warning(f"{self.kp_infores_curie}: {exception_message}")
+                self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Error", exception_message)
+                return QGOrganizedKnowledgeGraph()
+            finally:
+                if pooled_session:
+                    kp_connection_pool.release_session(self.kp_infores_curie)
+                else:
+                    await session.close()
 
         wait_time = round(time.time() - start)
-        answer_kg = self._load_kp_json_response(json_response, query_graph)
         done_message = f"Returned {len(answer_kg.edges_by_qg_id.get(qedge_key, dict()))} edges in {wait_time} seconds"
+        # A cut-off answer is incomplete, so it's never reused for later identical sub-queries
+        if getattr(answer_kg, "was_truncated", False):
+            done_message += f" (answer was cut off after {round(self.max_kp_response_bytes / 1024 / 1024)} MB)"
+        elif use_answer_cache:
+            await loop.run_in_executor(None, answer_cache.put, cache_key, self.kp_infores_curie, answer_kg, kp_version)
         self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Done", done_message)
         return answer_kg
 
@@ -342,6 +389,55 @@ class TRAPIQuerier:
         json_response = kg2_araxquery_response.envelope.to_dict()
         return json_response
 
+    async def _load_kp_response_stream(self, response: aiohttp.ClientResponse, qg: QueryGraph,
+                                       qedge_key: str) -> Optional[QGOrganizedKnowledgeGraph]:
+        """
+        Decodes the KP's (JSON) response body as it streams in, building nodes/edges one at a time rather than
+        materializing the whole response (and then a whole Message object) in memory. If the response grows beyond
+        max_kp_response_bytes, we stop reading and use whatever portion of the answer we've received so far. The
+        returned answer's was_truncated says which happened; None is returned if the response had no 'message'.
+        """
+        decoder = TRAPIStreamDecoder()
+        kg_nodes, kg_edges, results = dict(), dict(), []
+        was_truncated = False
+        async for chunk in response.content.iter_chunked(self.response_chunk_size):
+            self._add_streamed_elements(decoder.feed(chunk), kg_nodes, kg_edges, results)
+            if decoder.num_bytes_fed > self.max_kp_response_bytes:
+                was_truncated = True
+                break
+        if was_truncated:
+            truncated_message = f"Answer exceeded {round(self.max_kp_response_bytes / 1024 / 1024)} MB; cut it off " \
+                                f"early (using the {len(results)} results received so far)"
+            self.log.warning(f"{self.kp_infores_curie}: {truncated_message}")
+            self.log.update_query_plan(qedge_key, self.kp_infores_curie, "Waiting", truncated_message)
+            response.close()  # Don't bother reading the rest of the body
+        else:
+            self._add_streamed_elements(decoder.close(), kg_nodes, kg_edges, results)
+
+        if ("message",) not in decoder.paths_seen:
+            self.log.warning(f"{self.kp_infores_curie}: No 'message' was included in the response from "
+                             f"{self.kp_infores_curie}.")
+            return None
+        elif not results:
+            self.log.debug(f"{self.kp_infores_curie}: No 'results' were returned.")
+            answer_kg = QGOrganizedKnowledgeGraph()
+        else:
+            self.log.debug(f"{self.kp_infores_curie}: Got results from {self.kp_infores_curie}.")
+            answer_kg = await asyncio.get_running_loop().run_in_executor(None, self._build_answer_kg, kg_nodes,
+                                                                         kg_edges, results, qg)
+        answer_kg.was_truncated = was_truncated
+        return answer_kg
+
+    def _add_streamed_elements(self, events: List[Tuple[str, Optional[str], any]], kg_nodes: Dict[str, Node],
+                               kg_edges: Dict[str, Edge], results: List[dict]):
+        for element_type, element_key, element in events:
+            if element_type == "node":
+                kg_nodes[element_key] = self._convert_kp_node(element)
+            elif element_type == "edge":
+                kg_edges[element_key] = LazyEdge.from_dict(element)
+            elif element_type == "result":
+                results.append(self._slim_down_result(element))
+
     def _load_kp_json_response(self, json_response: dict, qg: QueryGraph) -> QGOrganizedKnowledgeGraph:
         # Load the results into the object model
         answer_kg = QGOrganizedKnowledgeGraph()
@@ -355,37 +451,56 @@ class TRAPIQuerier:
             return answer_kg
         else:
             self.log.debug(f"{self.kp_infores_curie}: Got results from {self.kp_infores_curie}.")
-            kp_message = ARAXMessenger().from_dict(json_response["message"])
+            kp_kg = json_response["message"].get("knowledge_graph") or dict()
+            kg_nodes = {node_key: self._convert_kp_node(node) for node_key, node in (kp_kg.get("nodes") or dict()).items()}
+            kg_edges = {edge_key: LazyEdge.from_dict(edge) for edge_key, edge in (kp_kg.get("edges") or dict()).items()}
+            results = [self._slim_down_result(result) for result in json_response["message"]["results"]]
+            return self._build_answer_kg(kg_nodes, kg_edges, results, qg)
+
+    @staticmethod
+    def _convert_kp_node(node_dict: dict) -> Node:
+        # Some KPs return a string rather than a list for categories (same patch as in ARAXMessenger.from_dict())
+        if isinstance(node_dict.get("categories"), str):
+            node_dict["categories"] = [node_dict["categories"]]
+        return LazyNode.from_dict(node_dict)
+
+    @staticmethod
+    def _slim_down_result(result: dict) -> dict:
+        # We only use results' bindings, so there's no need to hold onto anything else (scores, support graphs..)
+        return {"node_bindings": result.get("node_bindings"),
+                "analyses": [{"edge_bindings": analysis.get("edge_bindings")}
+                             for analysis in result.get("analyses") or [] if isinstance(analysis, dict)]}
+
+    def _build_answer_kg(self, kg_nodes: Dict[str, Node], kg_edges: Dict[str, Edge], results: List[dict],
+                         qg: QueryGraph) -> QGOrganizedKnowledgeGraph:
+        answer_kg = QGOrganizedKnowledgeGraph()
 
         # Work around genetics provider's curie whitespace bug for now  TODO: remove once they've fixed it
         if self.kp_infores_curie == "infores:genetics-data-provider":
-            self._remove_whitespace_from_curies(kp_message)
+            kg_nodes = self._remove_whitespace_from_curies(kg_nodes, kg_edges, results)
 
         # Build a map that indicates which qnodes/qedges a given node/edge fulfills
-        kg_to_qg_mappings, query_curie_mappings = self._get_kg_to_qg_mappings_from_results(kp_message.results, qg)
+        kg_to_qg_mappings, query_curie_mappings = self._get_kg_to_qg_mappings_from_results(results, qg)
 
         # Populate our final KG with the returned nodes and edges
         returned_edge_keys_missing_qg_bindings = set()
-        for returned_edge_key, returned_edge in kp_message.knowledge_graph.edges.items():
+        arax_retrieval_source_dict = self.arax_retrieval_source.to_dict()
+        for returned_edge_key, returned_edge in kg_edges.items():
             arax_edge_key = self._get_arax_edge_key(returned_edge)  # Convert to an ID that's unique for us
 
-            # Put in a placeholder for missing required attribute fields to try to keep our answer TRAPI-compliant
-            if returned_edge.attributes:
-                for attribute in returned_edge.attributes:
-                    if not attribute.attribute_type_id:
-                        attribute.attribute_type_id = f"not provided (this attribute came from {self.kp_infores_curie})"
+            # Put in a placeholder for missing required attribute fields to try to keep our answer TRAPI-compliant,
+            # and delete any support graph references for now # TODO: Extract such support graphs? #2060
+            self._patch_attributes(returned_edge, remove_support_graphs=True)
 
-            # Indicate that this edge passed through ARAX
-            if returned_edge.sources:
+            # Indicate that this edge passed through ARAX (without hydrating its sources, if it's a LazyEdge)
+            raw_sources = get_unhydrated_value(returned_edge, "sources")
+            if raw_sources:
+                set_unhydrated_value(returned_edge, "sources", raw_sources + [arax_retrieval_source_dict])
+            elif returned_edge.sources:
                 returned_edge.sources.append(self.arax_retrieval_source)
             else:
                 returned_edge.sources = [self.arax_retrieval_source]
 
-            # Delete any support graph references for now # TODO: Extract such support graphs? #2060
-            if returned_edge.attributes:
-                returned_edge.attributes = [attribute for attribute in returned_edge.attributes
-                                            if attribute.attribute_type_id != "biolink:support_graphs"]
-
             if returned_edge_key in kg_to_qg_mappings['edges']:
                 for qedge_key in kg_to_qg_mappings['edges'][returned_edge_key]:
                     answer_kg.add_edge(arax_edge_key, returned_edge, qedge_key)
@@ -396,16 +511,13 @@ class TRAPIQuerier:
                              f"KG have no bindings to the QG: {returned_edge_keys_missing_qg_bindings}")
 
         returned_node_keys_missing_qg_bindings = set()
-        for returned_node_key, returned_node in kp_message.knowledge_graph.nodes.items():
+        for returned_node_key, returned_node in kg_nodes.items():
             if returned_node_key not in kg_to_qg_mappings['nodes']:
                 returned_node_keys_missing_qg_bindings.add(returned_node_key)
             else:
                 for qnode_key in kg_to_qg_mappings['nodes'][returned_node_key]:
                     answer_kg.add_node(returned_node_key, returned_node, qnode_key)
-            if returned_node.attributes:
-                for attribute in returned_node.attributes:
-                    if not attribute.attribute_type_id:
-                        attribute.attribute_type_id = f"not provided (this attribute came from {self.kp_infores_curie})"
+            self._patch_attributes(returned_node)
         if returned_node_keys_missing_qg_bindings:
             self.log.warning(f"{self.kp_infores_curie}: {len(returned_node_keys_missing_qg_bindings)} nodes in the KP's answer "
                              f"KG have no bindings to the QG: {returned_node_keys_missing_qg_bindings}")
@@ -427,13 +539,48 @@ class TRAPIQuerier:
                          if dict_version_of_object.get(property_name) not in [None, []]}
         return stripped_dict
 
+    def _patch_attributes(self, node_or_edge: Union[Node, Edge], remove_support_graphs: bool = False):
+        # Works on the raw TRAPI attributes of a LazyNode/LazyEdge that haven't been hydrated yet, so that KP answers
+        # don't get fully materialized just for this; the attribute dicts that need changing are copied, not modified
+        missing_type_id = f"not provided (this attribute came from {self.kp_infores_curie})"
+        raw_attributes = get_unhydrated_value(node_or_edge, "attributes")
+        if raw_attributes is not None:
+            raw_attributes = [attribute for attribute in raw_attributes if isinstance(attribute, dict)]
+            is_support_graph = [remove_support_graphs and attribute.get("attribute_type_id") == "biolink:support_graphs"
+                                for attribute in raw_attributes]
+            if any(is_support_graph) or not all(attribute.get("attribute_type_id") for attribute in raw_attributes):
+                set_unhydrated_value(node_or_edge, "attributes",
+                                     [attribute if attribute.get("attribute_type_id")
+                                      else dict(attribute, attribute_type_id=missing_type_id)
+                                      for attribute, is_removed in zip(raw_attributes, is_support_graph)
+                                      if not is_removed])
+        elif node_or_edge.attributes:
+            for attribute in node_or_edge.attributes:
+                if not attribute.attribute_type_id:
+                    attribute.attribute_type_id = missing_type_id
+            if remove_support_graphs:
+                node_or_edge.attributes = [attribute for attribute in node_or_edge.attributes
+                                           if attribute.attribute_type_id != "biolink:support_graphs"]
+
     def _get_arax_edge_key(self, edge: Edge) -> str:
-        qualifiers_dict = {qualifier.qualifier_type_id: qualifier.qualifier_value for qualifier in edge.qualifiers} if edge.qualifiers else dict()
+        # Uses the raw TRAPI qualifiers/sources of a LazyEdge that haven't been hydrated yet, if there are any
+        raw_qualifiers = get_unhydrated_value(edge, "qualifiers")
+        if raw_qualifiers is not None:
+            qualifiers_dict = {qualifier.get("qualifier_type_id"): qualifier.get("qualifier_value")
+                               for qualifier in raw_qualifiers if isinstance(qualifier, dict)}
+        else:
+            qualifiers_dict = {qualifier.qualifier_type_id: qualifier.qualifier_value for qualifier in edge.qualifiers} if edge.qualifiers else dict()
         qualified_predicate = qualifiers_dict.get("biolink:qualified_predicate")
         qualified_object_direction = qualifiers_dict.get("biolink:object_direction_qualifier")
         qualified_object_aspect = qualifiers_dict.get("biolink:object_aspect_qualifier")
         qualified_portion = f"{qualified_predicate}--{qualified_object_direction}--{qualified_object_aspect}"
-        primary_ks = eu.get_primary_knowledge_source(edge)
+        raw_sources = get_unhydrated_value(edge, "sources")
+        if raw_sources is not None:
+            primary_ks_sources = [source.get("resource_id") for source in raw_sources
+                                  if isinstance(source, dict) and source.get("resource_role") == "primary_knowledge_source"]
+            primary_ks = primary_ks_sources[0] if primary_ks_sources else ""
+        else:
+            primary_ks = eu.get_primary_knowledge_source(edge)
         edge_key = f"{self.kp_infores_curie}:{edge.subject}--{edge.predicate}--{qualified_portion}--{edge.object}--{primary_ks}"
         return edge_key
 
@@ -504,18 +651,15 @@ class TRAPIQuerier:
         return answer_kg
 
     @staticmethod
-    def _remove_whitespace_from_curies(kp_message):
-        kg = kp_message.knowledge_graph
-        for node_key in set(kg.nodes):
-            node = kg.nodes[node_key]
-            del kg.nodes[node_key]
-            kg.nodes[node_key.strip()] = node
-        for edge in kg.edges.values():
+    def _remove_whitespace_from_curies(kg_nodes: Dict[str, Node], kg_edges: Dict[str, Edge],
+                                       results: List[dict]) -> Dict[str, Node]:
+        for edge in kg_edges.values():
             edge.subject = edge.subject.strip()
             edge.object = edge.object.strip()
-        for result in kp_message.results:
-            for qnode_key, node_bindings in result.node_bindings.items():
+        for result in results:
+            for qnode_key, node_bindings in (result.get("node_bindings") or dict()).items():
                 for node_binding in node_bindings:
-                    node_binding.id = node_binding.id.strip()
-                    if node_binding.query_id:
-                        node_binding.query_id = node_binding.query_id.strip()
+                    node_binding["id"] = node_binding["id"].strip()
+                    if node_binding.get("query_id"):
+                        node_binding["query_id"] = node_binding["query_id"].strip()
+        return {node_key.strip(): node for node_key, node in kg_nodes.items()}
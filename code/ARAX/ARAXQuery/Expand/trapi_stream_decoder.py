@@ -0,0 +1,179 @@
+#!/bin/env python3
+"""
+The trapi_stream_decoder.py file defines a class called TRAPIStreamDecoder, which decodes the body of a TRAPI
+response incrementally (as chunks of bytes arrive over HTTP). Instead of building one giant dict for the whole
+response, it emits each knowledge graph node, knowledge graph edge and result as soon as it has been fully received,
+and skips over everything else (query graph, auxiliary graphs, logs, etc.). This keeps peak memory roughly
+proportional to the size of the answer Expand actually keeps, rather than to the size of the raw KP payload.
+"""
+import codecs
+import json
+from typing import List, Tuple, Any, Optional
+
+# Containers the decoder descends into (keyed by their path in the response), and the JSON type they should be
+_CONTAINER_PATHS = {(): "{",
+                    ("message",): "{",
+                    ("message", "knowledge_graph"): "{",
+                    ("message", "knowledge_graph", "nodes"): "{",
+                    ("message", "knowledge_graph", "edges"): "{",
+                    ("message", "results"): "["}
+# Containers whose members are emitted as events (maps container path to event type)
+_ELEMENT_PATHS = {("message", "knowledge_graph", "nodes"): "node",
+                  ("message", "knowledge_graph", "edges"): "edge",
+                  ("message", "results"): "result"}
+
+_WHITESPACE = " \t\n\r"
+_MIN_RETRY_GROWTH = 64 * 1024  # Don't re-attempt decoding an incomplete value until this many more chars arrive
+_COMPACT_THRESHOLD = 1024 * 1024  # Drop already-consumed text from the buffer once it gets this big
+
+
+class _Frame:
+    def __init__(self, path: tuple, is_object: bool):
+        self.path = path
+        self.is_object = is_object
+        self.key = None
+        self.expecting_member = True  # False means we're expecting a ',' or closing bracket
+        self.expecting_colon = False
+
+
+class TRAPIStreamDecoder:
+
+    def __init__(self):
+        self.json_decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.retry_at_length = 0
+        self.stack = []
+        self.started = False
+        self.done = False
+        self.num_bytes_fed = 0
+        self.paths_seen = set()  # Non-null containers/values encountered, like ("message",) or ("message", "results")
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, Optional[str], Any]]:
+        """
+        Feeds the next chunk of the response body to the decoder. Returns a list of any events that could be decoded
+        so far, each of which is a tuple like ("node", node_key, node_dict), ("edge", edge_key, edge_dict), or
+        ("result", None, result_dict).
+        """
+        self.num_bytes_fed += len(chunk)
+        self.buffer += self.text_decoder.decode(chunk)
+        return self._parse()
+
+    def close(self) -> List[Tuple[str, Optional[str], Any]]:
+        """
+        Signals that the whole body has been fed. Returns any final events; raises a json.JSONDecodeError if the
+        body was not a complete JSON object.
+        """
+        self.buffer += self.text_decoder.decode(b"", final=True)
+        self.retry_at_length = 0
+        events = self._parse(final=True)
+        if not self.done:
+            raise json.JSONDecodeError("Response body ended before the JSON object was complete",
+                                       self.buffer, self.position)
+        return events
+
+    def _parse(self, final: bool = False) -> List[Tuple[str, Optional[str], Any]]:
+        events = []
+        if len(self.buffer) < self.retry_at_length:
+            return events
+        buffer = self.buffer
+        while not self.done:
+            # Skip whitespace
+            while self.position < len(buffer) and buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position >= len(buffer):
+                break
+            char = buffer[self.position]
+
+            if not self.started:
+                if char != "{":
+                    raise json.JSONDecodeError("Expecting a JSON object", buffer, self.position)
+                self.started = True
+                self.stack.append(_Frame((), is_object=True))
+                self.position += 1
+                continue
+
+            frame = self.stack[-1]
+            if frame.expecting_colon:
+                if char != ":":
+                    raise json.JSONDecodeError("Expecting ':' delimiter", buffer, self.position)
+                frame.expecting_colon = False
+                self.position += 1
+            elif not frame.expecting_member:
+                if char == ",":
+                    frame.expecting_member = True
+                    frame.key = None
+                    self.position += 1
+                elif char == ("}" if frame.is_object else "]"):
+                    self._pop_frame()
+                    self.position += 1
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, self.position)
+            elif char == ("}" if frame.is_object else "]"):
+                self._pop_frame()
+                self.position += 1
+            elif frame.is_object and frame.key is None:
+                key = self._decode_value(buffer, final)
+                if key is _INCOMPLETE:
+                    break
+                if not isinstance(key, str):
+                    raise json.JSONDecodeError("Expecting property name enclosed in double quotes", buffer, self.position)
+                frame.key = key
+                frame.expecting_colon = True
+            else:
+                child_path = frame.path + (frame.key,) if frame.is_object else frame.path + (None,)
+                expected_container = _CONTAINER_PATHS.get(child_path)
+                if expected_container and char == expected_container:
+                    self.paths_seen.add(child_path)
+                    self.stack.append(_Frame(child_path, is_object=char == "{"))
+                    self.position += 1
+                    continue
+                value = self._decode_value(buffer, final)
+                if value is _INCOMPLETE:
+                    break
+                if frame.path in _ELEMENT_PATHS:
+                    events.append((_ELEMENT_PATHS[frame.path], frame.key, value))
+                elif value is not None:
+                    self.paths_seen.add(child_path)
+                frame.expecting_member = False
+
+        self._compact_buffer()
+        return events
+
+    def _decode_value(self, buffer: str, final: bool) -> Any:
+        try:
+            value, end = self.json_decoder.raw_decode(buffer, self.position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            # Most likely the value just hasn't fully arrived yet; wait for the buffer to grow substantially
+            pending_length = len(buffer) - self.position
+            self.retry_at_length = len(buffer) + max(pending_length, _MIN_RETRY_GROWTH)
+            return _INCOMPLETE
+        # A number at the very end of the buffer may still have more digits on the way
+        if end == len(buffer) and not final and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return _INCOMPLETE
+        self.position = end
+        self.retry_at_length = 0
+        return value
+
+    def _pop_frame(self):
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1].expecting_member = False
+        else:
+            self.done = True
+
+    def _compact_buffer(self):
+        if self.position > _COMPACT_THRESHOLD and self.position > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.position:]
+            self.retry_at_length = max(0, self.retry_at_length - self.position)
+            self.position = 0
+
+
+class _IncompleteValue:
+    pass
+
+
+_INCOMPLETE = _IncompleteValue()
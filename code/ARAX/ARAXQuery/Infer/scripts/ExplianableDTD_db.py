@@ -8,8 +8,9 @@ import sys
 import argparse
 import sqlite3
 import logging
+import threading
+from collections import OrderedDict
 import pandas as pd
-import numpy as np
 import tqdm
 
 # import internal modules
@@ -22,6 +23,8 @@ from ARAX_database_manager import ARAXDatabaseManager
 
 
 DEBUG = True
+MAX_HOT_DISEASES = 64
+SQLITE_MAX_VARIABLES = 900
 
 def get_logger(logname):
     """
@@ -40,6 +43,10 @@ def get_logger(logname):
 
 class ExplainableDTD(object):
 
+    # Paths of recently requested diseases, shared by all instances (ARAX_infer creates a new instance per query)
+    _hot_disease_paths = OrderedDict()
+    _hot_disease_lock = threading.Lock()
+
     # Constructor
     def __init__(self, path_to_score_results=None, path_to_path_results=None, database_name=None, outdir=os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'Prediction']), build=False):
         """
@@ -225,6 +232,7 @@ class ExplainableDTD(object):
             self.connection.execute(f"CREATE INDEX idx_PATH_RESULT_TABLE_drug_name ON PATH_RESULT_TABLE(drug_name)")
             self.connection.execute(f"CREATE INDEX idx_PATH_RESULT_TABLE_disease_id ON PATH_RESULT_TABLE(disease_id)")
             self.connection.execute(f"CREATE INDEX idx_PATH_RESULT_TABLE_disease_name ON PATH_RESULT_TABLE(disease_name)")
+            self.connection.execute(f"CREATE INDEX idx_PATH_RESULT_TABLE_disease_id_drug_id_path_score ON PATH_RESULT_TABLE(disease_id, drug_id, path_score)")
 
             self.logger.info(f"INFO: Creating INDEXes is completed")
 
@@ -241,12 +249,13 @@ class ExplainableDTD(object):
         cursor = self.connection.cursor()
         columns = ["drug_id","drug_name","disease_id","disease_name","tn_score","tp_score","unknown_score"]
         if isinstance(disease_ids, str):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from PREDICTION_SCORE_TABLE where disease_id='{disease_ids}';")
+            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from PREDICTION_SCORE_TABLE where disease_id=?;", (disease_ids,))
             res = cursor.fetchall()
             top_drugs= pd.DataFrame(res, columns=columns)
             return top_drugs
         elif isinstance(disease_ids, list):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from PREDICTION_SCORE_TABLE where disease_id in {tuple(set(disease_ids))};")
+            disease_ids = list(set(disease_ids))
+            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,tn_score,tp_score,unknown_score from PREDICTION_SCORE_TABLE where disease_id in ({','.join('?' * len(disease_ids))});", disease_ids)
             res = cursor.fetchall()
             top_drugs = pd.DataFrame(res, columns=columns)
             return top_drugs
@@ -255,40 +264,76 @@ class ExplainableDTD(object):
             top_drugs = pd.DataFrame([], columns=columns)
             return top_drugs
 
-    def get_top_paths_for_disease(self, disease_ids):
+    def get_top_paths_for_disease(self, disease_ids, top_m=None):
         """get top paths predicted by DTD model for given disease ids
 
         Args:
             disease_ids (str|list): a string of disease curie id or a list of disease curies, e.g. "MONDO:0008753" or ["MONDO:0008753","MONDO:0005148","MONDO:0005155"]
+            top_m (int, optional): if set, only keep the top_m paths (by path_score) for each (drug, disease) pair
 
         Returns:
             top_paths (dict): the top paths predicted by DTD model for given disease ids
         """
 
-        cursor = self.connection.cursor()
-        columns = ["drug_id","drug_name","disease_id","disease_name","path","path_score"]
-        top_paths = dict()
         if isinstance(disease_ids, str):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,path,path_score from PATH_RESULT_TABLE where disease_id='{disease_ids}';")
-            res = cursor.fetchall()
-            temp_df = pd.DataFrame(res, columns=columns)
-            for drug_id, disease_id in temp_df[['drug_id','disease_id']].drop_duplicates().values:
-                temp = np.array(temp_df.loc[(temp_df['drug_id']==drug_id) & (temp_df['disease_id']==disease_id),['path','path_score']].values).tolist()
-                if len(temp) > 0:
-                    top_paths[(drug_id, disease_id)] = temp
-            return top_paths
-        elif isinstance(disease_ids, list):
-            cursor.execute(f"select drug_id,drug_name,disease_id,disease_name,path,path_score from PATH_RESULT_TABLE where disease_id in {tuple(set(disease_ids))};")
-            res = cursor.fetchall()
-            temp_df = pd.DataFrame(res, columns=columns)
-            for drug_id, disease_id in temp_df[['drug_id','disease_id']].drop_duplicates().values:
-                temp = np.array(temp_df.loc[(temp_df['drug_id']==drug_id) & (temp_df['disease_id']==disease_id),['path','path_score']].values).tolist()
-                if len(temp) > 0:
-                    top_paths[(drug_id, disease_id)] = temp
-            return top_paths
-        else:
+            disease_ids = [disease_ids]
+        elif not isinstance(disease_ids, list):
             print("The 'dataset_id' in get_top_drugs_for_disease should be a string or a list", flush=True)
-            return top_paths
+            return dict()
+        top_paths = dict()
+        for paths_by_pair in self.get_top_paths_for_diseases(disease_ids, top_m=top_m).values():
+            top_paths.update(paths_by_pair)
+        return top_paths
+
+    def get_top_paths_for_diseases(self, disease_ids, top_m=None):
+        """get top paths predicted by DTD model for many diseases at once, grouped per disease and per (drug, disease) pair
+
+        Args:
+            disease_ids (list): a list of disease curies, e.g. ["MONDO:0008753","MONDO:0005148","MONDO:0005155"]
+            top_m (int, optional): if set, only keep the top_m paths (by path_score) for each (drug, disease) pair
+
+        Returns:
+            top_paths_by_disease (dict): for each given disease id, a dict mapping (drug_id, disease_id) pairs to their [path, path_score] lists
+                                         (in database order, or by decreasing path_score if top_m is set); diseases without paths map to an empty dict
+        """
+
+        database = f"{self.outdir}/{self.database_name}"
+        disease_ids = list(dict.fromkeys(disease_ids))
+        top_paths_by_disease = dict()
+        with ExplainableDTD._hot_disease_lock:
+            for disease_id in disease_ids:
+                cache_key = (database, disease_id, top_m)
+                if cache_key in ExplainableDTD._hot_disease_paths:
+                    ExplainableDTD._hot_disease_paths.move_to_end(cache_key)
+                    top_paths_by_disease[disease_id] = ExplainableDTD._hot_disease_paths[cache_key]
+        missing_disease_ids = [disease_id for disease_id in disease_ids if disease_id not in top_paths_by_disease]
+
+        if missing_disease_ids:
+            fetched_paths_by_disease = {disease_id: dict() for disease_id in missing_disease_ids}
+            cursor = self.connection.cursor()
+            for i in range(0, len(missing_disease_ids), SQLITE_MAX_VARIABLES):
+                chunk = missing_disease_ids[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                if top_m is None:
+                    # The disease_id index returns each disease's rows in rowid (i.e., database) order
+                    cursor.execute(f"select drug_id,disease_id,path,path_score from PATH_RESULT_TABLE where disease_id in ({placeholders});", chunk)
+                else:
+                    cursor.execute(f"select drug_id,disease_id,path,path_score from "
+                                   f"(select drug_id,disease_id,path,path_score,row_number() over (partition by drug_id,disease_id order by path_score desc, rowid) as path_rank "
+                                   f"from PATH_RESULT_TABLE where disease_id in ({placeholders})) "
+                                   f"where path_rank <= ? order by disease_id,drug_id,path_rank;", chunk + [top_m])
+                for drug_id, disease_id, path, path_score in cursor:
+                    fetched_paths_by_disease[disease_id].setdefault((drug_id, disease_id), []).append([path, path_score])
+            with ExplainableDTD._hot_disease_lock:
+                for disease_id, paths_by_pair in fetched_paths_by_disease.items():
+                    ExplainableDTD._hot_disease_paths[(database, disease_id, top_m)] = paths_by_pair
+                    top_paths_by_disease[disease_id] = paths_by_pair
+                while len(ExplainableDTD._hot_disease_paths) > MAX_HOT_DISEASES:
+                    ExplainableDTD._hot_disease_paths.popitem(last=False)
+
+        # Cached paths are shared, so callers get their own copies of the lists
+        return {disease_id: {pair: [list(path) for path in paths] for pair, paths in top_paths_by_disease[disease_id].items()}
+                for disease_id in disease_ids}
 
 ####################################################################################################
 
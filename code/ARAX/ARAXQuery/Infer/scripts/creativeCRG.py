@@ -1,5 +1,7 @@
 from typing import List, Dict, Set, Union, Optional
 import os, sys
+import threading
+from collections import OrderedDict
 import joblib
 import numpy as np
 import pandas as pd
@@ -20,6 +22,9 @@ from RTXConfiguration import RTXConfiguration
 RTXConfig = RTXConfiguration()
 # response = ARAXResponse()
 
+MAX_CACHED_PREDICTIONS = 256  # number of per-curie prediction vectors kept across queries
+MAX_PREDICTION_ROWS = 1 << 20  # bounds the size of each feature matrix passed to predict_proba
+
 def load_ML_CRGmodel(response: ARAXResponse, model_path: str, model_type: str):
 
     if response is None:
@@ -104,6 +109,12 @@ def extract_path(path_result: openapi_server.models.result.Result, mapping: Dict
 
 class creativeCRG:
 
+    # Embeddings and models are loaded once per data path, and recent predictions are kept across queries; both are
+    # shared by all instances, since ARAX_infer creates a new instance for every query
+    _loaded_data = dict()
+    _cached_probas = OrderedDict()
+    _lock = threading.Lock()
+
     def __init__(self, response: ARAXResponse, data_path: str):
 
         ## set up parameters
@@ -114,21 +125,41 @@ class creativeCRG:
 
         ## load datasets
         self.response.info(f"loading embeddings and models into memory")
-        
-        # load embeddings
         chemical_gene_embeddings_name = RTXConfig.xcrg_embeddings_path.split("/")[-1]
-        npzfile = np.load(os.path.join(self.data_path, chemical_gene_embeddings_name), allow_pickle=True)
-        self.chemical_curies = npzfile['chemical_curies'].tolist()
-        self.chemical_curie_types = npzfile['chemical_curie_types'].tolist()
-        self.chemical_embs = npzfile['chemical_embs']
-        self.gene_curies = npzfile['gene_curies'].tolist()
-        self.gene_curie_types = npzfile['gene_curie_types'].tolist()
-        self.gene_embs = npzfile['gene_embs']
-
-
-        # load ML models
-        self.increase_model = load_ML_CRGmodel(self.response, self.data_path, 'increase')
-        self.decrease_model = load_ML_CRGmodel(self.response, self.data_path, 'decrease')
+        self.data_key = (self.data_path, chemical_gene_embeddings_name, RTXConfig.xcrg_increase_model_path.split("/")[-1], RTXConfig.xcrg_decrease_model_path.split("/")[-1])
+        with creativeCRG._lock:
+            if self.data_key not in creativeCRG._loaded_data:
+                # load embeddings
+                npzfile = np.load(os.path.join(self.data_path, chemical_gene_embeddings_name), allow_pickle=True)
+                loaded_data = dict()
+                loaded_data['chemical_curies'] = npzfile['chemical_curies'].tolist()
+                loaded_data['chemical_curie_types'] = npzfile['chemical_curie_types'].tolist()
+                loaded_data['chemical_embs'] = npzfile['chemical_embs']
+                loaded_data['gene_curies'] = npzfile['gene_curies'].tolist()
+                loaded_data['gene_curie_types'] = npzfile['gene_curie_types'].tolist()
+                loaded_data['gene_embs'] = npzfile['gene_embs']
+                # index the curies (keeping the first row of any repeated curie, like list.index() did)
+                loaded_data['chemical_rows'] = dict()
+                for row, curie in enumerate(loaded_data['chemical_curies']):
+                    loaded_data['chemical_rows'].setdefault(curie, row)
+                loaded_data['gene_rows'] = dict()
+                for row, curie in enumerate(loaded_data['gene_curies']):
+                    loaded_data['gene_rows'].setdefault(curie, row)
+                # load ML models
+                loaded_data['increase_model'] = load_ML_CRGmodel(self.response, self.data_path, 'increase')
+                loaded_data['decrease_model'] = load_ML_CRGmodel(self.response, self.data_path, 'decrease')
+                creativeCRG._loaded_data[self.data_key] = loaded_data
+            loaded_data = creativeCRG._loaded_data[self.data_key]
+        self.chemical_curies = loaded_data['chemical_curies']
+        self.chemical_curie_types = loaded_data['chemical_curie_types']
+        self.chemical_embs = loaded_data['chemical_embs']
+        self.gene_curies = loaded_data['gene_curies']
+        self.gene_curie_types = loaded_data['gene_curie_types']
+        self.gene_embs = loaded_data['gene_embs']
+        self.chemical_rows = loaded_data['chemical_rows']
+        self.gene_rows = loaded_data['gene_rows']
+        self.increase_model = loaded_data['increase_model']
+        self.decrease_model = loaded_data['decrease_model']
 
         # initialize Node Synonymizer
         self.synonymizer = NodeSynonymizer()
@@ -136,12 +167,6 @@ class creativeCRG:
         ## initialize other variables
         self.num_chemicals = len(self.chemical_curies)
         self.num_genes = len(self.gene_curies)
-        self._top_N_chemicals_dict = dict()
-        self._top_N_chemicals_dict['increase'] = dict()
-        self._top_N_chemicals_dict['decrease'] = dict()
-        self._top_N_genes_dict = dict()
-        self._top_N_genes_dict['increase'] = dict()
-        self._top_N_genes_dict['decrease'] = dict()
 
     def get_preferred_curie(self, curie: str):
 
@@ -171,67 +196,24 @@ class creativeCRG:
             self.response.warning(f"The parameter 'threshold' should be float between 0 and 1. But {threshold} is provided.")
             return None   
 
-        if query_gene:
-            self.response.info(f"Predicting top{N} chemicals for gene {query_gene}")
-
-            ## get the preferred curie
-            # preferred_query_gene = self.get_preferred_curie(query_gene)
-            # if not preferred_query_gene:
-            #     return None
-            # self.response.info(f"Use the preferred curie {preferred_query_gene} of gene {query_gene} for prediction")
-            preferred_query_gene = query_gene
-
-            if model_type not in ['increase', 'decrease']:
-                self.response.warning(f"The parameter 'model_type' allows either 'increase' or 'decrease'. But {model_type} is provided.")
-                return None
-            if preferred_query_gene not in self._top_N_genes_dict[model_type]:
-                ## check if the query gene curie was trained in the specific model and if so, get its embedding
-                if preferred_query_gene not in self.gene_curies:
-                    self.response.warning(f"The increase-type model was not trained with gene curie {preferred_query_gene}.")
-                    return None
-                else:
-                    query_gene_array = np.tile(self.gene_embs[self.gene_curies.index(preferred_query_gene)].reshape(1,-1),(self.num_chemicals,1))
-                ## get all chemical embeddings
-                chemical_array = self.chemical_embs
-                ## do prediction
-                X = np.hstack([chemical_array,query_gene_array])
-                if model_type == 'increase':
-                    probas = self.increase_model.predict_proba(X)
-                else:
-                    probas = self.decrease_model.predict_proba(X)
-                res = pd.concat([pd.DataFrame(self.chemical_curies),pd.DataFrame([preferred_query_gene] * self.num_chemicals),pd.DataFrame(probas)], axis=1)
-                res.columns = ['chemical_id','gene_id','tn_prob','tp_prob']
-                res = res.sort_values(by=['tp_prob'],ascending=False).reset_index(drop=True)
-                self._top_N_genes_dict[model_type][preferred_query_gene] = res
-
-                ## filter results according to threshold
-                if threshold:
-                    res = res.loc[res['tp_prob'] >= threshold,:].reset_index(drop=True)
-                
-                ## give warning if the number of result records is smaller than the requirement
-                if len(res) == 0:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold}. Perhaps try using more loose threshold.")
-                if len(res) < N:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold} and top{N}. Only has {len(res)} satisfiable results.")
-
-                return res.iloc[:N,:]
-            else:
-
-                ## filter results according to threshold
-                res = self._top_N_genes_dict[model_type][preferred_query_gene]
-                if threshold:
-                    res = res.loc[res['tp_prob'] >= threshold,:].reset_index(drop=True)
+        self.response.info(f"Predicting top{N} chemicals for gene {query_gene}")
 
-                ## give warning if the number of result records is smaller than the requirement
-                if len(res) == 0:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold}. Perhaps try using more loose threshold.")
-                if len(res) < N:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold} and top{N}. Only has {len(res)} satisfiable results.")
+        ## get the preferred curie
+        # preferred_query_gene = self.get_preferred_curie(query_gene)
+        # if not preferred_query_gene:
+        #     return None
+        # self.response.info(f"Use the preferred curie {preferred_query_gene} of gene {query_gene} for prediction")
+        preferred_query_gene = query_gene
 
-                return res.iloc[:N,:]
-        else:
-            self.response.warning(f"The parameter 'query_gene' is not provided. Please give a gene curie to the parameter 'query_gene'.")
+        if model_type not in ['increase', 'decrease']:
+            self.response.warning(f"The parameter 'model_type' allows either 'increase' or 'decrease'. But {model_type} is provided.")
             return None
+        ## check if the query gene curie was trained in the specific model
+        if preferred_query_gene not in self.gene_rows:
+            self.response.warning(f"The increase-type model was not trained with gene curie {preferred_query_gene}.")
+            return None
+
+        return self.predict_top_N_chemicals_for_genes([preferred_query_gene], N, threshold, model_type)[preferred_query_gene]
 
     def predict_top_N_genes(self, query_chemical: str, N: int = 10, threshold: float = 0.5, model_type: str = 'increase'):
 
@@ -247,69 +229,108 @@ class creativeCRG:
             self.response.warning(f"The parameter 'threshold' should be float between 0 and 1. But {threshold} is provided.")
             return None   
 
-        if query_chemical:
-            self.response.info(f"Predicting top{N} genes for chemical {query_chemical}")
+        self.response.info(f"Predicting top{N} genes for chemical {query_chemical}")
 
-            ## get the preferred curie
-            # preferred_query_chemical = self.get_preferred_curie(query_chemical)
-            # if not preferred_query_chemical:
-            #     return None
-            # self.response.info(f"Use the preferred curie {preferred_query_chemical} of chemical {query_chemical} for prediction.")
-            preferred_query_chemical = query_chemical
-
-            if model_type not in ['increase', 'decrease']:
-                self.response.warning(f"The parameter 'model_type' allows either 'increase' or 'decrease'. But {model_type} is provided.")
-                return None
-            if preferred_query_chemical not in self._top_N_chemicals_dict[model_type]:
-                ## check if the query chemical curie was trained in the specific model and if so, get its embedding 
-                if preferred_query_chemical not in self.chemical_curies:
-                    self.response.warning(f"The increase-type model was not trained with chemical curie {query_chemical}.")
-                    return None
-                else:
-                    query_chemical_array = np.tile(self.chemical_embs[self.chemical_curies.index(preferred_query_chemical)].reshape(1,-1),(self.num_genes,1))
-                ## get all gene embeddings
-                gene_array = self.gene_embs
-                ## do prediction
-                X = np.hstack([query_chemical_array,gene_array])
-                if model_type == 'increase':
-                    probas = self.increase_model.predict_proba(X)
-                else:
-                    probas = self.decrease_model.predict_proba(X)
-                res = pd.concat([pd.DataFrame([preferred_query_chemical] * self.num_genes),pd.DataFrame(self.gene_curies),pd.DataFrame(probas)], axis=1)
-                res.columns = ['chemical_id','gene_id','tn_prob','tp_prob']
-                res = res.sort_values(by=['tp_prob'],ascending=False).reset_index(drop=True)
-                self._top_N_chemicals_dict[model_type][preferred_query_chemical] = res
-
-                ## filter results according to threshold
-                if threshold:
-                    res = res.loc[res['tp_prob'] >= threshold,:].reset_index(drop=True)
+        ## get the preferred curie
+        # preferred_query_chemical = self.get_preferred_curie(query_chemical)
+        # if not preferred_query_chemical:
+        #     return None
+        # self.response.info(f"Use the preferred curie {preferred_query_chemical} of chemical {query_chemical} for prediction.")
+        preferred_query_chemical = query_chemical
 
-                ## give warning if the number of result records is smaller than the requirement
-                if len(res) == 0:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold}. Perhaps try using more loose threshold.")
-                if len(res) < N:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold} and top{N}. Only has {len(res)} satisfiable results.")
-
-                return res.iloc[:N,:]
-            else:
-
-                ## filter results according to threshold
-                res = self._top_N_chemicals_dict[model_type][preferred_query_chemical]
-
-                if threshold:
-                    res = res.loc[res['tp_prob'] >= threshold,:].reset_index(drop=True)
-
-                ## give warning if the number of result records is smaller than the requirement
-                if len(res) == 0:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold}. Perhaps try using more loose threshold.")
-                if len(res) < N:
-                    self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold} and top{N}. Only has {len(res)} satisfiable results.")
-
-                return res.iloc[:N,:]
+        if model_type not in ['increase', 'decrease']:
+            self.response.warning(f"The parameter 'model_type' allows either 'increase' or 'decrease'. But {model_type} is provided.")
+            return None
+        ## check if the query chemical curie was trained in the specific model
+        if preferred_query_chemical not in self.chemical_rows:
+            self.response.warning(f"The increase-type model was not trained with chemical curie {query_chemical}.")
+            return None
 
+        return self.predict_top_N_genes_for_chemicals([preferred_query_chemical], N, threshold, model_type)[preferred_query_chemical]
+
+    def predict_top_N_chemicals_for_genes(self, query_genes: List[str], N: int = 10, threshold: float = 0.5, model_type: str = 'increase', warn: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        Batched version of predict_top_N_chemicals: returns the top N chemicals (with tp_prob >= threshold) for each query gene that the model was trained with.
+        """
+        probas_by_gene = self._get_probas('gene', [gene for gene in query_genes if gene in self.gene_rows], model_type)
+        return {gene: self._get_top_predictions(probas, self.chemical_curies, gene, 'gene_id', N, threshold, warn) for gene, probas in probas_by_gene.items()}
+
+    def predict_top_N_genes_for_chemicals(self, query_chemicals: List[str], N: int = 10, threshold: float = 0.5, model_type: str = 'increase', warn: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        Batched version of predict_top_N_genes: returns the top N genes (with tp_prob >= threshold) for each query chemical that the model was trained with.
+        """
+        probas_by_chemical = self._get_probas('chemical', [chemical for chemical in query_chemicals if chemical in self.chemical_rows], model_type)
+        return {chemical: self._get_top_predictions(probas, self.gene_curies, chemical, 'chemical_id', N, threshold, warn) for chemical, probas in probas_by_chemical.items()}
+
+    def _get_probas(self, query_type: str, query_curies: List[str], model_type: str) -> Dict[str, np.ndarray]:
+        """
+        Returns the model's class probabilities (column 0 is tn_prob, column 1 is tp_prob) of every candidate (all chemicals for a query gene, all
+        genes for a query chemical) for each query curie, predicting the ones that aren't cached in batches.
+        """
+        query_curies = list(dict.fromkeys(query_curies))
+        probas_by_curie = dict()
+        with creativeCRG._lock:
+            for curie in query_curies:
+                cache_key = (self.data_key, model_type, query_type, curie)
+                if cache_key in creativeCRG._cached_probas:
+                    creativeCRG._cached_probas.move_to_end(cache_key)
+                    probas_by_curie[curie] = creativeCRG._cached_probas[cache_key]
+        missing_curies = [curie for curie in query_curies if curie not in probas_by_curie]
+        if not missing_curies:
+            return probas_by_curie
+
+        model = self.increase_model if model_type == 'increase' else self.decrease_model
+        if query_type == 'gene':
+            query_embs, query_rows, candidate_embs = self.gene_embs, self.gene_rows, self.chemical_embs
         else:
-            self.response.warning(f"The parameter 'query_chemical' is not provided. Please assign a chemical curie to the parameter 'query_chemical'.")
-            return None
+            query_embs, query_rows, candidate_embs = self.chemical_embs, self.chemical_rows, self.gene_embs
+        num_candidates, candidate_dim = candidate_embs.shape
+        query_dim = query_embs.shape[1]
+        queries_per_batch = max(1, MAX_PREDICTION_ROWS // max(1, num_candidates))
+        for batch_start in range(0, len(missing_curies), queries_per_batch):
+            batch_curies = missing_curies[batch_start:batch_start + queries_per_batch]
+            batch_query_embs = query_embs[[query_rows[curie] for curie in batch_curies]]
+            ## build the [chemical embedding, gene embedding] features of every candidate pair, without tiling the query embeddings
+            X = np.empty((len(batch_curies), num_candidates, candidate_dim + query_dim), dtype=np.result_type(query_embs, candidate_embs))
+            if query_type == 'gene':
+                X[:, :, :candidate_dim] = candidate_embs[None, :, :]
+                X[:, :, candidate_dim:] = batch_query_embs[:, None, :]
+            else:
+                X[:, :, :query_dim] = batch_query_embs[:, None, :]
+                X[:, :, query_dim:] = candidate_embs[None, :, :]
+            batch_probas = model.predict_proba(X.reshape(-1, candidate_dim + query_dim)).reshape(len(batch_curies), num_candidates, -1)
+            with creativeCRG._lock:
+                for curie, probas in zip(batch_curies, batch_probas):
+                    probas = probas.copy()  # So the cache doesn't hold on to the whole batch
+                    probas_by_curie[curie] = probas
+                    creativeCRG._cached_probas[(self.data_key, model_type, query_type, curie)] = probas
+                while len(creativeCRG._cached_probas) > MAX_CACHED_PREDICTIONS:
+                    creativeCRG._cached_probas.popitem(last=False)
+        return probas_by_curie
+
+    def _get_top_predictions(self, probas: np.ndarray, candidate_curies: List[str], query_curie: str, query_column: str, N: int, threshold: float, warn: bool = True) -> pd.DataFrame:
+
+        ## filter results according to threshold, then pick the top N without sorting every candidate
+        tp_probas = probas[:, 1]
+        passing_rows = np.flatnonzero(tp_probas >= threshold)
+        if len(passing_rows) > N:
+            passing_rows = passing_rows[np.argpartition(-tp_probas[passing_rows], N - 1)[:N]]
+        top_rows = passing_rows[np.argsort(-tp_probas[passing_rows], kind='stable')]
+
+        ## give warning if the number of result records is smaller than the requirement
+        if warn:
+            if len(top_rows) == 0:
+                self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold}. Perhaps try using more loose threshold.")
+            if len(top_rows) < N:
+                self.response.warning(f"No chemical-gene pair meets the requirement of threshold >={threshold} and top{N}. Only has {len(top_rows)} satisfiable results.")
+
+        candidate_ids = [candidate_curies[row] for row in top_rows]
+        query_ids = [query_curie] * len(top_rows)
+        res = pd.DataFrame({'chemical_id': query_ids if query_column == 'chemical_id' else candidate_ids,
+                            'gene_id': query_ids if query_column == 'gene_id' else candidate_ids,
+                            'tn_prob': probas[top_rows, 0],
+                            'tp_prob': tp_probas[top_rows]})
+        return res
 
     def predict_top_M_paths(self, query_chemical: Optional[str], query_gene: Optional[str], model_type: str = 'increase', N: int = 10, M: int = 10, threshold: float = 0.5, kp: Optional[str] = 'infores:rtx-kg2', path_len: int = 2, interm_ids: Optional[List[Optional[str]]] = None, interm_names: Optional[List[Optional[str]]] = None, interm_categories: Optional[List[Optional[str]]] =None):
 
@@ -373,12 +394,11 @@ class creativeCRG:
             # self.response.info(f"Use the preferred curie {preferred_query_chemical} of chemical {query_chemical} for prediction")
             preferred_query_chemical = query_chemical
 
-            if preferred_query_chemical not in self._top_N_chemicals_dict[model_type]:
-                self.response.warning(f"No '{model_type}-type' prediction record for the chemical {preferred_query_chemical}. Please first call the 'predict_top_N_genes' method.")
+            if preferred_query_chemical not in self.chemical_rows:
+                self.response.warning(f"The {model_type}-type model was not trained with chemical curie {preferred_query_chemical}.")
                 return None
             else:
-                res = self._top_N_chemicals_dict[model_type][preferred_query_chemical]
-                res = res.loc[res['tp_prob'] >= threshold,:].reset_index(drop=True).iloc[:N,:]
+                res = self.predict_top_N_genes_for_chemicals([preferred_query_chemical], N, threshold, model_type, warn=False)[preferred_query_chemical]
                 if len(res) == 0:
                     self.response.warning(f"There is no chemical-gene pair satisfying the requirement of top {N} with threshold >={threshold}. Perhaps try using more loose threshold.")
                     return None
@@ -408,12 +428,11 @@ class creativeCRG:
             # self.response.info(f"Use the preferred curie {preferred_query_gene} of gene {preferred_query_gene} for prediction")
             preferred_query_gene = query_gene
 
-            if preferred_query_gene not in self._top_N_genes_dict[model_type]:
-                self.response.warning(f"No '{model_type}-type' prediction record for the gene {preferred_query_gene}. Please first call the 'predict_top_N_chemicals' method.")
+            if preferred_query_gene not in self.gene_rows:
+                self.response.warning(f"The {model_type}-type model was not trained with gene curie {preferred_query_gene}.")
                 return None
             else:
-                res = self._top_N_genes_dict[model_type][preferred_query_gene]
-                res = res.loc[res['tp_prob'] >= threshold,:].reset_index(drop=True).iloc[:N,:]
+                res = self.predict_top_N_chemicals_for_genes([preferred_query_gene], N, threshold, model_type, warn=False)[preferred_query_gene]
                 if len(res) == 0:
                     self.response.warning(f"There is no chemical-gene pair satisfying the requirement of top {N} with threshold >={threshold}. Perhaps try using more loose threshold.")
                     return None
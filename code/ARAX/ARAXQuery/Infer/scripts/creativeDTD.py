@@ -6,15 +6,23 @@ import numpy as np
 import pandas as pd
 import graph_tool.all as gt
 import itertools
+import threading
 import torch
 from tqdm import tqdm, trange
 from knowledge_graph import KnowledgeGraph
 from kg_env import KGEnvironment
 from models import DiscriminatorActorCritic
+from embedding_matrix import load_embedding_matrix
 
 class creativeDTD:
 
-    def __init__(self, data_path: str, model_path: str, use_gpu: bool = False):
+    # The indexes, embeddings, models and graph are loaded once per (data path, model path, device) and shared by all
+    # instances; they're only ever read, and the (stateful) KG environment is still created per instance
+    _loaded_models = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, data_path: str, model_path: str, use_gpu: bool = False, batch_size: Optional[int] = None,
+                 num_threads: Optional[int] = None):
 
         ## set up args
         self.args = model_utilities.set_args()
@@ -23,45 +31,76 @@ class creativeDTD:
 
         ## check device
         self.args.use_gpu, self.args.device = model_utilities.check_device(logger = self.args.logger, use_gpu = use_gpu)
+        ## path scoring runs this many paths per policy net pass, using at most num_threads CPU threads (if given)
+        if batch_size is not None:
+            self.args.batch_size = batch_size
+        self.num_threads = num_threads
+
+        model_key = (data_path, model_path, self.args.use_gpu)
+        with creativeDTD._lock:
+            if model_key not in creativeDTD._loaded_models:
+                creativeDTD._loaded_models[model_key] = self._load_models(data_path, model_path)
+            loaded_models = creativeDTD._loaded_models[model_key]
+        for name in ['entity2id', 'id2entity', 'relation2id', 'id2relation', 'type2id', 'id2type', 'entity2typeid', 'policy_net_file']:
+            setattr(self.args, name, loaded_models[name])
+        self.entity_embeddings = loaded_models['entity_embeddings']
+        self.entity_embedding_rows = loaded_models['entity_embedding_rows']
+        self.drug_curie_ids = loaded_models['drug_curie_ids']
+        self.drug_embedding_rows = loaded_models['drug_embedding_rows']
+        self.ML_model = loaded_models['ML_model']
+        self.kg = loaded_models['kg']
+        self.RL_model = loaded_models['RL_model']
+        self.G, self.etype = loaded_models['G'], loaded_models['etype']
+        self.env = KGEnvironment(self.args, self.kg, max_path_len=self.args.max_path, state_pre_history=self.args.state_history)
+
+        ## other variables
+        self.disease_curie = None
+        self.top_N_drugs = None
+
+    def _load_models(self, data_path: str, model_path: str):
+        self.args.logger.info(f"Loading xDTD models and embeddings from {data_path} and {model_path}")
+        loaded_models = dict()
 
         ## load datasets
-        self.entity_embeddings_dict = model_utilities.load_graphsage_unsupervised_embeddings(self.args.data_dir)
-        self.args.entity2id, self.args.id2entity = model_utilities.load_index(os.path.join(self.args.data_dir, 'entity2freq.txt'))
-        self.args.relation2id, self.args.id2relation = model_utilities.load_index(os.path.join(self.args.data_dir, 'relation2freq.txt'))
-        self.args.type2id, self.args.id2type = model_utilities.load_index(os.path.join(self.args.data_dir, 'type2freq.txt'))
-        with open(os.path.join(self.args.data_dir, 'entity2typeid.pkl'), 'rb') as infile:
+        loaded_models['entity_embeddings'], loaded_models['entity_embedding_rows'] = load_embedding_matrix(data_path)
+        self.args.entity2id, self.args.id2entity = model_utilities.load_index(os.path.join(data_path, 'entity2freq.txt'))
+        self.args.relation2id, self.args.id2relation = model_utilities.load_index(os.path.join(data_path, 'relation2freq.txt'))
+        self.args.type2id, self.args.id2type = model_utilities.load_index(os.path.join(data_path, 'type2freq.txt'))
+        with open(os.path.join(data_path, 'entity2typeid.pkl'), 'rb') as infile:
             self.args.entity2typeid = pickle.load(infile)
+        for name in ['entity2id', 'id2entity', 'relation2id', 'id2relation', 'type2id', 'id2type', 'entity2typeid']:
+            loaded_models[name] = getattr(self.args, name)
         drug_type = ['biolink:Drug', 'biolink:SmallMolecule']
         drug_type_ids = [self.args.type2id[x] for x in drug_type]
-        self.drug_curie_ids = [self.args.id2entity[index] for index, typeid in enumerate(self.args.entity2typeid) if typeid in drug_type_ids]
+        loaded_models['drug_curie_ids'] = [self.args.id2entity[index] for index, typeid in enumerate(self.args.entity2typeid) if typeid in drug_type_ids]
+        loaded_models['drug_embedding_rows'] = np.array([loaded_models['entity_embedding_rows'][drug_curie_id] for drug_curie_id in loaded_models['drug_curie_ids']], dtype=np.int64)
 
         ## load ML model
-        self.ML_model = model_utilities.load_ML_DTDmodel(model_path)
+        loaded_models['ML_model'] = model_utilities.load_ML_DTDmodel(model_path)
 
         ## load RL model
-        # self.kg = KnowledgeGraph(self.args, bandwidth=self.args.bandwidth, emb_dropout_rate=self.args.emb_dropout_rate, bucket_interval=self.args.bucket_interval, load_graph=True)
+        # kg = KnowledgeGraph(self.args, bandwidth=self.args.bandwidth, emb_dropout_rate=self.args.emb_dropout_rate, bucket_interval=self.args.bucket_interval, load_graph=True)
         if self.args.use_gpu:
             with open(os.path.join(data_path,'kg_gpu.pkl'),'rb') as infile:
-                self.kg = pickle.load(infile)
+                kg = pickle.load(infile)
         else:
             with open(os.path.join(data_path,'kg_cpu.pkl'),'rb') as infile:
-                self.kg = pickle.load(infile)
-        self.env = KGEnvironment(self.args, self.kg, max_path_len=self.args.max_path, state_pre_history=self.args.state_history)
-        self.RL_model = DiscriminatorActorCritic(self.args, self.kg, self.args.state_history, self.args.gamma, self.args.target_update, self.args.ac_hidden, self.args.disc_hidden, self.args.metadisc_hidden)
-        self.args.policy_net_file = os.path.join(model_path,'RL_model','RL_policy_model.pt')
+                kg = pickle.load(infile)
+        RL_model = DiscriminatorActorCritic(self.args, kg, self.args.state_history, self.args.gamma, self.args.target_update, self.args.ac_hidden, self.args.disc_hidden, self.args.metadisc_hidden)
+        loaded_models['policy_net_file'] = self.args.policy_net_file = os.path.join(model_path,'RL_model','RL_policy_model.pt')
         policy_net = torch.load(self.args.policy_net_file, map_location=self.args.device)
-        model_temp = self.RL_model.policy_net.state_dict()
+        model_temp = RL_model.policy_net.state_dict()
         model_temp.update(policy_net)
-        self.RL_model.policy_net.load_state_dict(model_temp)
+        RL_model.policy_net.load_state_dict(model_temp)
+        RL_model.policy_net.eval()
         del policy_net
         del model_temp
+        loaded_models['kg'] = kg
+        loaded_models['RL_model'] = RL_model
 
         ## load graph
-        self.G, self.etype = model_utilities.load_gt_kg(self.kg)
-
-        ## other variables
-        self.disease_curie = None
-        self.top_N_drugs = None
+        loaded_models['G'], loaded_models['etype'] = model_utilities.load_gt_kg(kg)
+        return loaded_models
 
     def set_query_disease(self, disease_curie: str):
         bool_value, normalized_disease_curie = model_utilities.check_curie_available(logger = self.args.logger, curie = disease_curie, available_curies_dict = self.args.entity2id)
@@ -73,7 +112,9 @@ class creativeDTD:
     def predict_top_N_drugs(self, N: int = 50):
         self.args.logger.info(f"Predicting top{N} drugs for disease {self.disease_curie}")
         if self.disease_curie:
-            X = np.vstack([np.hstack([self.entity_embeddings_dict[drug_curie_id],self.entity_embeddings_dict[self.disease_curie]]) for drug_curie_id in self.drug_curie_ids])
+            drug_embeddings = self.entity_embeddings[self.drug_embedding_rows]
+            disease_embedding = self.entity_embeddings[self.entity_embedding_rows[self.disease_curie]]
+            X = np.hstack([drug_embeddings, np.broadcast_to(disease_embedding, (len(drug_embeddings), len(disease_embedding)))])
             res_temp = self.ML_model.predict_proba(X)
             res = pd.concat([pd.DataFrame(self.drug_curie_ids),pd.DataFrame([self.disease_curie]*len(self.drug_curie_ids)),pd.DataFrame(res_temp)], axis=1)
             res.columns = ['drug_id','disease_id','tn_score','tp_score','unknown_score']
@@ -158,6 +199,20 @@ class creativeDTD:
 
     def _batch_calculate_prob_score(self, args, batch_paths, env, model):
 
+        if args.use_gpu or self.num_threads is None:
+            with torch.no_grad():
+                return self._score_batches(args, batch_paths, env, model)
+        # torch's thread count is process-wide, so restore it once these paths are scored
+        previous_num_threads = torch.get_num_threads()
+        torch.set_num_threads(self.num_threads)
+        try:
+            with torch.no_grad():
+                return self._score_batches(args, batch_paths, env, model)
+        finally:
+            torch.set_num_threads(previous_num_threads)
+
+    def _score_batches(self, args, batch_paths, env, model):
+
         env.reset()
         model.policy_net.eval()
         dataloader = model_utilities.ACDataLoader(list(range(batch_paths[1].shape[0])), args.batch_size, permutation=False)
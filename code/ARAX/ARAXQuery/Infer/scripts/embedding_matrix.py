@@ -0,0 +1,68 @@
+import fcntl
+import json
+import os
+import pickle
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+EMBEDDING_PICKLE_NAME = 'unsuprvised_graphsage_entity_embeddings.pkl'
+EMBEDDING_MATRIX_NAME = 'unsuprvised_graphsage_entity_embeddings.f32.npy'
+EMBEDDING_CURIES_NAME = 'unsuprvised_graphsage_entity_embeddings.curies.json'
+
+
+def load_embedding_matrix(data_path: str) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Returns the GraphSAGE entity embeddings as a read-only, memory-mapped float32 matrix, plus a dict mapping each curie
+    to its row. The matrix is converted from the embeddings pickle the first time (and whenever the pickle is newer),
+    by whichever process gets the file lock first; the others wait for it and then map the result. If the matrix
+    can't be saved next to the pickle, it's kept in memory instead.
+    """
+    pickle_path = os.path.join(data_path, EMBEDDING_PICKLE_NAME)
+    matrix_path = os.path.join(data_path, EMBEDDING_MATRIX_NAME)
+    curies_path = os.path.join(data_path, EMBEDDING_CURIES_NAME)
+    try:
+        lock_file = open(f"{matrix_path}.lock", 'a')
+    except OSError:
+        matrix, curies = _convert_embeddings_pickle(pickle_path)
+        return matrix, _get_rows_by_curie(curies)
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the lock file is closed
+        is_up_to_date = all(os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(pickle_path)
+                            for path in (matrix_path, curies_path))
+        if not is_up_to_date:
+            matrix, curies = _convert_embeddings_pickle(pickle_path)
+            try:
+                _save_file(matrix_path, 'wb', lambda outfile: np.save(outfile, matrix))
+                _save_file(curies_path, 'w', lambda outfile: json.dump(curies, outfile))
+            except OSError:
+                return matrix, _get_rows_by_curie(curies)
+        with open(curies_path, 'r') as infile:
+            curies = json.load(infile)
+        return np.load(matrix_path, mmap_mode='r'), _get_rows_by_curie(curies)
+
+
+def _convert_embeddings_pickle(pickle_path: str) -> Tuple[np.ndarray, List[str]]:
+    with open(pickle_path, 'rb') as infile:
+        entity_embeddings_dict = pickle.load(infile)
+    curies = list(entity_embeddings_dict)
+    matrix = np.array([entity_embeddings_dict[curie] for curie in curies], dtype=np.float32)
+    return matrix, curies
+
+
+def _save_file(file_path: str, mode: str, write: Callable):
+    # Written under a unique temp name and then renamed into place, so a reader never sees a half-written file
+    directory, file_name = os.path.split(file_path)
+    with tempfile.NamedTemporaryFile(mode, dir=directory, prefix=f"{file_name}.", suffix='.tmp', delete=False) as outfile:
+        try:
+            write(outfile)
+            os.chmod(outfile.name, 0o644)  # Temp files are only readable by their owner
+        except BaseException:
+            os.remove(outfile.name)
+            raise
+    os.replace(outfile.name, file_path)
+
+
+def _get_rows_by_curie(curies: List[str]) -> Dict[str, int]:
+    return {curie: row for row, curie in enumerate(curies)}
@@ -1,6 +1,5 @@
 # This class will overlay the normalized google distance on a message (all edges)
 #!/bin/env python3
-import functools
 import json
 import math
 import subprocess
@@ -10,8 +9,7 @@ import sqlite3
 import traceback
 import numpy as np
 from datetime import datetime
-from typing import List
-import itertools
+from typing import List, Optional, Tuple
 import copy
 
 import random
@@ -28,6 +26,10 @@ from openapi_server.models.q_edge import QEdge
 from openapi_server.models.retrieval_source import RetrievalSource
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer/")
 from node_synonymizer import NodeSynonymizer
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/ngd/")
+from pmid_index import PMIDIndex, get_marginal_and_joint_counts, get_pmid_index_path
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")
+from mmap_index import get_file_stamp
 
 pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
@@ -41,6 +43,8 @@ from ARAX_database_manager import ARAXDatabaseManager
 
 class ComputeNGD:
 
+    _pmid_indexes = dict()  # Memory-mapped PMID indexes (and the file stamps they were loaded at), shared by all ComputeNGD instances in this process
+
     #### Constructor
     def __init__(self, response, message, parameters):
         self.response = response
@@ -49,6 +53,7 @@ class ComputeNGD:
         self.global_iter = 0
         self.ngd_database_name = RTXConfig.curie_to_pmids_path.split('/')[-1]
         self.connection, self.cursor = self._setup_ngd_database()
+        self.pmid_index = self._load_pmid_index()
         self.curie_to_pmids_map = dict()
         self.ngd_normalizer = 3.5e+7 * 20  # From PubMed home page there are 35 million articles (based on the information on https://pubmed.ncbi.nlm.nih.gov/ on 08/09/2023); avg 20 MeSH terms per article
         self.first_ngd_log = True
@@ -104,13 +109,13 @@ class ComputeNGD:
                     canonicalized_curie_lookup = self._get_canonical_curies_map(list(involved_curies))
                     self.load_curie_to_pmids_data(canonicalized_curie_lookup.values())
                     added_flag = False  # check to see if any edges where added
-                    self.response.debug(f"Looping through {len(node_pairs_to_evaluate)} node pairs and calculating NGD values")
+                    self.response.debug(f"Calculating NGD values for {len(node_pairs_to_evaluate)} node pairs")
+                    ngd_results = self.calculate_ngd_batch([(canonicalized_curie_lookup.get(subject_curie, subject_curie),
+                                                             canonicalized_curie_lookup.get(object_curie, object_curie))
+                                                            for subject_curie, object_curie in node_pairs_to_evaluate])
                     # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
-                    for (subject_curie, object_curie) in node_pairs_to_evaluate:
+                    for (subject_curie, object_curie), (ngd_value, pmid_set) in zip(node_pairs_to_evaluate, ngd_results):
                         # create the edge attribute if it can be
-                        canonical_subject_curie = canonicalized_curie_lookup.get(subject_curie, subject_curie)
-                        canonical_object_curie = canonicalized_curie_lookup.get(object_curie, object_curie)
-                        ngd_value, pmid_set = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
                         if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
                             edge_value = ngd_value
                         else:
@@ -218,13 +223,13 @@ class ComputeNGD:
             canonicalized_curie_lookup = self._get_canonical_curies_map(list(involved_curies))
             self.load_curie_to_pmids_data(canonicalized_curie_lookup.values())
             added_flag = False  # check to see if any edges where added
-            self.response.debug(f"Looping through {len(node_pairs_to_evaluate)} node pairs and calculating NGD values")
+            self.response.debug(f"Calculating NGD values for {len(node_pairs_to_evaluate)} node pairs")
+            ngd_results = self.calculate_ngd_batch([(canonicalized_curie_lookup.get(subject_curie, subject_curie),
+                                                     canonicalized_curie_lookup.get(object_curie, object_curie))
+                                                    for subject_curie, object_curie in node_pairs_to_evaluate])
             # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
-            for (subject_curie, object_curie) in node_pairs_to_evaluate:
+            for (subject_curie, object_curie), (ngd_value, pmid_set) in zip(node_pairs_to_evaluate, ngd_results):
                 # create the edge attribute if it can be
-                canonical_subject_curie = canonicalized_curie_lookup.get(subject_curie, subject_curie)
-                canonical_object_curie = canonicalized_curie_lookup.get(object_curie, object_curie)
-                ngd_value, pmid_set = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
                 if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
                     edge_value = ngd_value
                 else:
@@ -328,17 +333,15 @@ class ComputeNGD:
                 # Map all nodes to their canonicalized curies in one batch (need canonical IDs for the local NGD system)
                 canonicalized_curie_map = self._get_canonical_curies_map([key for key in self.message.knowledge_graph.nodes.keys()])
                 self.load_curie_to_pmids_data(canonicalized_curie_map.values())
-                self.response.debug(f"Looping through edges and calculating NGD values")
-                for edge in self.message.knowledge_graph.edges.values():
+                self.response.debug(f"Calculating NGD values for all edges")
+                edges = list(self.message.knowledge_graph.edges.values())
+                ngd_results = self.calculate_ngd_batch([(canonicalized_curie_map.get(edge.subject, edge.subject),
+                                                         canonicalized_curie_map.get(edge.object, edge.object))
+                                                        for edge in edges])
+                for edge, (ngd_value, pmid_set) in zip(edges, ngd_results):
                     # Make sure the attributes are not None
                     if not edge.attributes:
                         edge.attributes = []  # should be an array, but why not a list?
-                    # now go and actually get the NGD
-                    subject_curie = edge.subject
-                    object_curie = edge.object
-                    canonical_subject_curie = canonicalized_curie_map.get(subject_curie, subject_curie)
-                    canonical_object_curie = canonicalized_curie_map.get(object_curie, object_curie)
-                    ngd_value, pmid_set = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
                     if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
                         edge_value = ngd_value
                     else:
@@ -361,8 +364,15 @@ class ComputeNGD:
         return self.response
 
     def load_curie_to_pmids_data(self, canonicalized_curies):
-        self.response.debug(f"Extracting PMID lists from sqlite database for relevant nodes")
         curies = list(set(canonicalized_curies))
+        if self.pmid_index:
+            self.response.debug(f"Extracting PMID lists from the PMID index for relevant nodes")
+            for curie in curies:
+                pmids = self.pmid_index.get_pmids(curie)
+                if pmids is not None:
+                    self.curie_to_pmids_map[curie] = pmids
+            return
+        self.response.debug(f"Extracting PMID lists from sqlite database for relevant nodes")
         chunk_size = 20000
         num_chunks = len(curies) // chunk_size if len(curies) % chunk_size == 0 else (len(curies) // chunk_size) + 1
         start_index = 0
@@ -373,54 +383,55 @@ class ComputeNGD:
             self.cursor.execute(f"SELECT * FROM curie_to_pmids WHERE curie in ({curie_list_str})")
             rows = self.cursor.fetchall()
             for row in rows:
-                self.curie_to_pmids_map[row[0]] = json.loads(row[1])  # PMID list is stored as JSON string in sqlite db
+                # PMID list is stored as JSON string in sqlite db; we keep it as a sorted array (like the PMID index)
+                self.curie_to_pmids_map[row[0]] = np.unique(np.array(json.loads(row[1]), dtype=np.uint32))
             start_index += chunk_size
             stop_index += chunk_size
 
     def calculate_ngd_fast(self, subject_curie, object_curie):
-        if subject_curie in self.curie_to_pmids_map and object_curie in self.curie_to_pmids_map:
-            pubmed_ids_for_curies = [self.curie_to_pmids_map.get(subject_curie),
-                                     self.curie_to_pmids_map.get(object_curie)]
-            pubmed_id_set = set(self.curie_to_pmids_map.get(subject_curie)).intersection(set(self.curie_to_pmids_map.get(object_curie)))
-            n_pmids = len(pubmed_id_set)
-            if n_pmids > 30:
-                if self.first_ngd_log:
-                    #self.response.debug(f"{n_pmids} publications found for edge ({subject_curie})-[]-({object_curie}) limiting to 30...")
-                    self.response.debug(f"More than 30 publications found for some edges limiting to 30...")
-                    self.first_ngd_log = False
-                # limited_pmids = set()
-                # for i, val in enumerate(itertools.islice(pubmed_id_set, 30)):
-                #     limited_pmids.add(val)
-                # pubmed_id_set = limited_pmids
-                pubmed_id_set = set([val for val in itertools.islice(pubmed_id_set, 30)])
-            counts_res = self._compute_marginal_and_joint_counts(pubmed_ids_for_curies)
-            return self._compute_multiway_ngd_from_counts(*counts_res), pubmed_id_set
-        else:
-            return math.nan, {}
+        return self.calculate_ngd_batch([(subject_curie, object_curie)])[0]
 
-    @staticmethod
-    def _compute_marginal_and_joint_counts(concept_pubmed_ids: List[List[int]]) -> list:
-        return [list(map(lambda pmid_list: len(set(pmid_list)), concept_pubmed_ids)),
-                len(functools.reduce(lambda pmids_intersec_cumul, pmids_next:
-                                     set(pmids_next).intersection(pmids_intersec_cumul),
-                                     concept_pubmed_ids))]
-
-    def _compute_multiway_ngd_from_counts(self, marginal_counts: List[int],
-                                          joint_count: int) -> float:
-        # Make sure that things are within the right domain for the logs
-        # Should also make sure things are not negative, but I'll just do this with a ValueError
-        if None in marginal_counts:
-            return math.nan
-        elif 0 in marginal_counts or 0. in marginal_counts:
-            return math.nan
-        elif joint_count == 0 or joint_count == 0.:
-            return math.nan
-        else:
-            try:
-                return (max([math.log(count) for count in marginal_counts]) - math.log(joint_count)) / \
-                   (math.log(self.ngd_normalizer) - min([math.log(count) for count in marginal_counts]))
-            except ValueError:
-                return math.nan
+    def calculate_ngd_batch(self, curie_pairs: List[Tuple[str, str]]) -> List[Tuple[float, List[int]]]:
+        """
+        Computes the NGD for each (canonical) curie pair in one vectorized pass over the loaded PMID lists. Returns an
+        (ngd_value, shared_pmids) tuple for each pair, where shared_pmids is limited to the first 30 shared PMIDs.
+        """
+        results = [(math.nan, []) for _ in curie_pairs]
+        curie_indexes = dict()
+        pmid_arrays = []
+        pair_positions, subject_indexes, object_indexes = [], [], []
+        for pair_position, curie_pair in enumerate(curie_pairs):
+            if curie_pair[0] in self.curie_to_pmids_map and curie_pair[1] in self.curie_to_pmids_map:
+                for curie in curie_pair:
+                    if curie not in curie_indexes:
+                        curie_indexes[curie] = len(pmid_arrays)
+                        pmid_arrays.append(self.curie_to_pmids_map[curie])
+                pair_positions.append(pair_position)
+                subject_indexes.append(curie_indexes[curie_pair[0]])
+                object_indexes.append(curie_indexes[curie_pair[1]])
+        if not pair_positions:
+            return results
+        subject_counts, object_counts, joint_counts, shared_pmids = get_marginal_and_joint_counts(pmid_arrays,
+                                                                                                  subject_indexes,
+                                                                                                  object_indexes,
+                                                                                                  max_shared_pmids=30)
+        if self.first_ngd_log and (joint_counts > 30).any():
+            self.response.debug(f"More than 30 publications found for some edges limiting to 30...")
+            self.first_ngd_log = False
+        ngd_values = self._compute_multiway_ngd_from_counts(subject_counts, object_counts, joint_counts)
+        for pair_position, ngd_value, pair_shared_pmids in zip(pair_positions, ngd_values.tolist(), shared_pmids):
+            results[pair_position] = (ngd_value, pair_shared_pmids.tolist())
+        return results
+
+    def _compute_multiway_ngd_from_counts(self, subject_counts: np.ndarray, object_counts: np.ndarray,
+                                          joint_counts: np.ndarray) -> np.ndarray:
+        # Pairs with a zero count (marginal or joint) are outside the domain of the logs, so their NGD is nan
+        min_counts = np.minimum(subject_counts, object_counts)
+        max_counts = np.maximum(subject_counts, object_counts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ngd_values = (np.log(max_counts) - np.log(joint_counts)) / (math.log(self.ngd_normalizer) - np.log(min_counts))
+        ngd_values[(min_counts == 0) | (joint_counts == 0)] = math.nan
+        return ngd_values
 
     def _get_canonical_curies_map(self, curies):
         self.response.debug(f"Canonicalizing curies of relevant nodes using NodeSynonymizer")
@@ -441,13 +452,16 @@ class ComputeNGD:
                     canonical_curies_map[input_curie] = input_curie
             return canonical_curies_map
 
-    def _setup_ngd_database(self):
+    def _get_ngd_database_path(self):
         ngd_filepath = os.path.sep.join([*pathlist[:(RTXindex + 1)],
                                          'code',
                                          'ARAX',
                                          'KnowledgeSources',
                                          'NormalizedGoogleDistance'])
-        db_path_local = f"{ngd_filepath}{os.path.sep}{self.ngd_database_name}"
+        return f"{ngd_filepath}{os.path.sep}{self.ngd_database_name}"
+
+    def _setup_ngd_database(self):
+        db_path_local = self._get_ngd_database_path()
         # Set up a connection to the database so it's ready for use
         try:
             connection = sqlite3.connect(db_path_local)
@@ -465,3 +479,34 @@ class ComputeNGD:
             self.cursor.close()
         if self.connection:
             self.connection.close()
+
+    def _load_pmid_index(self):
+        # PMID lists are served from a memory-mapped index of the NGD database, if one has been built next to it; the
+        # cached index is reloaded (or dropped) whenever the index or the database has changed since it was loaded
+        db_path_local = self._get_ngd_database_path()
+        index_path = get_pmid_index_path(db_path_local)
+        stamps = (self._get_file_stamp(index_path), self._get_file_stamp(db_path_local))
+        cached_stamps, pmid_index = self._pmid_indexes.get(index_path, (None, None))
+        if cached_stamps != stamps:
+            pmid_index = None
+            if stamps[0] is not None:
+                try:
+                    pmid_index = PMIDIndex(index_path)
+                except Exception as e:
+                    self.response.warning(f"Couldn't load PMID index {index_path}: {e}")
+                else:
+                    if stamps[1] is not None and not pmid_index.is_up_to_date_with(db_path_local):
+                        self.response.warning(f"Ignoring PMID index {index_path} because it was built from a "
+                                              f"different version of {self.ngd_database_name}")
+                        pmid_index.close()
+                        pmid_index = None
+            # An index being replaced isn't closed, since other ComputeNGD instances may still be using it
+            self._pmid_indexes[index_path] = (stamps, pmid_index)
+        return pmid_index
+
+    @staticmethod
+    def _get_file_stamp(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            return get_file_stamp(file_path)
+        except OSError:
+            return None
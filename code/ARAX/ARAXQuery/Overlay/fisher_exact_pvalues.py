@@ -0,0 +1,60 @@
+"""
+The fisher_exact_pvalues.py file defines a vectorized version of the (two-sided) Fisher's exact test, which computes
+p-values for many 2x2 contingency tables in one call. Rather than calling scipy.stats.fisher_exact() one table at a
+time, it evaluates the hypergeometric log-probabilities of every possible table (with the same margins) for a whole
+chunk of tables at once, as a 2-D numpy array. The p-value of a table is the total probability of all tables with the
+same margins that are no more likely than it, which is how scipy and R define the two-sided test.
+"""
+import math
+
+import numpy as np
+from scipy.special import gammaln
+
+MAX_CELLS_PER_CHUNK = 1 << 22  # Bounds the size of the (tables x possible tables) matrices (~32 MB each)
+RELATIVE_TOLERANCE = 1e-7  # Tables whose probabilities are this close to the observed one count as 'as extreme' (as in R)
+
+
+def calculate_fisher_exact_pvalues(a, b, c, d) -> np.ndarray:
+    """
+    Computes two-sided Fisher's exact test p-values for the contingency tables [[a[i], b[i]], [c[i], d[i]]]. Returns
+    an array of p-values (tables with an empty row or column get a p-value of 1, like scipy.stats.fisher_exact()).
+    """
+    a, b, c, d = (np.asarray(counts, dtype=np.int64).reshape(-1) for counts in (a, b, c, d))
+    if (a < 0).any() or (b < 0).any() or (c < 0).any() or (d < 0).any():
+        raise ValueError("All values in the contingency tables must be nonnegative")
+    row1, row2, column1 = a + b, c + d, a + c
+    total = row1 + row2
+    pvalues = np.ones(len(a), dtype=np.float64)
+
+    # Given its margins, a table is determined by its top-left value, which can range from low to high
+    lows = np.maximum(0, column1 - row2)
+    highs = np.minimum(column1, row1)
+    widths = highs - lows + 1
+    is_degenerate = (row1 == 0) | (row2 == 0) | (column1 == 0) | (column1 == total)
+    table_indexes = np.flatnonzero(~is_degenerate)
+    # Group tables with similar numbers of possible tables together so little of each chunk's matrix is wasted
+    table_indexes = table_indexes[np.argsort(widths[table_indexes], kind="stable")]
+
+    chunk_start = 0
+    while chunk_start < len(table_indexes):
+        chunk_end = min(len(table_indexes), chunk_start + max(1, MAX_CELLS_PER_CHUNK // widths[table_indexes[chunk_start]]))
+        max_width = widths[table_indexes[chunk_end - 1]]
+        chunk_end = chunk_start + max(1, min(chunk_end - chunk_start, MAX_CELLS_PER_CHUNK // max_width))
+        chunk = table_indexes[chunk_start:chunk_end]
+        offsets = np.arange(widths[chunk].max())
+        is_possible = offsets < widths[chunk, None]
+        possible_values = lows[chunk, None] + np.minimum(offsets, widths[chunk, None] - 1)
+        log_normalizer = _log_binomial(total[chunk], column1[chunk])[:, None]
+        log_probabilities = (_log_binomial(row1[chunk, None], possible_values)
+                             + _log_binomial(row2[chunk, None], column1[chunk, None] - possible_values) - log_normalizer)
+        observed_log_probabilities = (_log_binomial(row1[chunk], a[chunk])
+                                      + _log_binomial(row2[chunk], column1[chunk] - a[chunk]) - log_normalizer[:, 0])
+        is_as_extreme = is_possible & (log_probabilities <= observed_log_probabilities[:, None]
+                                       + math.log1p(RELATIVE_TOLERANCE))
+        pvalues[chunk] = np.minimum(1.0, np.where(is_as_extreme, np.exp(log_probabilities), 0.0).sum(axis=1))
+        chunk_start = chunk_end
+    return pvalues
+
+
+def _log_binomial(n, k):
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
@@ -3,7 +3,6 @@
 # a list of source nodes with certain qnode_id in KG and each of the target nodes with specified type.
 
 # relative imports
-import scipy.stats as stats
 import traceback
 import sys
 import os
@@ -16,6 +15,7 @@ from RTXConfiguration import RTXConfiguration
 RTXConfig = RTXConfiguration()
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")
 from ARAX_query import ARAXQuery
+from mmap_index import get_file_stamp
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.attribute import Attribute as EdgeAttribute
 from openapi_server.models.edge import Edge
@@ -25,16 +25,23 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../NodeSynonymiz
 from node_synonymizer import NodeSynonymizer
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import overlay_utilities as ou
+from neighbor_count_index import NeighborCountIndex, get_neighbor_count_index_path
+from fisher_exact_pvalues import calculate_fisher_exact_pvalues
 import collections
+import json
 import sqlite3
+import numpy as np
 class ComputeFTEST:
 
+    _neighbor_count_indexes = dict()  # Memory-mapped neighbor count indexes (and the file stamps they were loaded at), shared by all ComputeFTEST instances in this process
+
     #### Constructor
     def __init__(self, response, message, parameters):
         self.response = response
         self.message = message
         self.parameters = parameters
         self.nodesynonymizer = NodeSynonymizer()
+        self.neighbor_count_index = None
 
     def fisher_exact_test(self):
         """
@@ -77,6 +84,7 @@ class ComputeFTEST:
         else:
             os.system(f"scp {RTXConfig.db_username}@{RTXConfig.db_host}:{RTXConfig.kg2c_sqlite_path} {sqlite_file_path}")
         self.sqlite_file_path = sqlite_file_path
+        self.neighbor_count_index = self._load_neighbor_count_index()
 
         if rel_edge_key is not None:
             self.response.warning(f"The 'rel_edge_key' option in FET is specified, it will cause slow for the calculation of FEST test.")
@@ -365,25 +373,17 @@ class ComputeFTEST:
             parameter_list = [(node, len(object_node_dict[node]), size_of_object[node]-len(object_node_dict[node]), size_of_query_sample - len(object_node_dict[node]), (size_of_total - size_of_object[node]) - (size_of_query_sample - len(object_node_dict[node]))) for node in object_node_dict]
 
             try:
-                # with multiprocessing.Pool() as executor:
-                #     FETpvalue_list = [elem for elem in executor.map(self._calculate_FET_pvalue_parallel, parameter_list)]
-                FETpvalue_list = [elem for elem in map(self._calculate_FET_pvalue_parallel, parameter_list)]
+                # All of the contingency tables are evaluated at once (in a vectorized fashion)
+                contingency_tables = np.array([parameters[1:] for parameters in parameter_list], dtype=np.int64).reshape(-1, 4)
+                FETpvalues = calculate_fisher_exact_pvalues(*contingency_tables.T)
             except:
                 tb = traceback.format_exc()
                 error_type, error, _ = sys.exc_info()
                 self.response.error(tb, error_code=error_type.__name__)
                 self.response.error(f"Something went wrong with computing Fisher's Exact Test P-value")
                 return self.response
-
-            if any([type(elem) is list for elem in FETpvalue_list]):
-                for msg in [elem2 for elem1 in FETpvalue_list if type(elem1) is list for elem2 in elem1]:
-                    if type(msg) is tuple:
-                        self.response.error(msg[0], error_code=msg[1])
-                    else:
-                        self.response.error(msg)
-                return self.response
             else:
-                output = dict(FETpvalue_list)
+                output = dict(zip([parameters[0] for parameters in parameter_list], FETpvalues.tolist()))
 
             # check if the results need to be filtered
             output = dict(sorted(output.items(), key=lambda x: x[1]))
@@ -462,7 +462,10 @@ class ComputeFTEST:
         adjacent_type = ComputeFTEST.convert_string_to_snake_case(adjacent_type.replace('biolink:',''))
         adjacent_type = ComputeFTEST.convert_string_biolinkformat(adjacent_type)
 
-        if rel_type is None:
+        # Note: Indexes built from the KG2c sqlite have no per-predicate counts, so those fall back to querying KG2
+        if self.neighbor_count_index and self.neighbor_count_index.has_counts_for_predicate(rel_type):
+            return self._query_size_of_adjacent_nodes_from_index(node_curie, adjacent_type, rel_type)
+        elif rel_type is None:
             normalized_nodes = self.nodesynonymizer.get_canonical_curies(node_curie)
             failure_nodes = list()
             mapping = {node:normalized_nodes[node]['preferred_curie'] for node in normalized_nodes if normalized_nodes[node] is not None}
@@ -486,7 +489,7 @@ class ComputeFTEST:
             connection.close()
 
             # Load the counts into a dictionary
-            neighbor_counts_dict = {row[0]:eval(row[1]) for row in rows}
+            neighbor_counts_dict = {row[0]:json.loads(row[1]) for row in rows}
 
             res_dict = {node:neighbor_counts_dict[mapping[node]].get(adjacent_type) for node in mapping if mapping[node] in neighbor_counts_dict and neighbor_counts_dict[mapping[node]].get(adjacent_type) is not None}
             failure_nodes += list(mapping.keys() - res_dict.keys())
@@ -539,8 +542,12 @@ class ComputeFTEST:
                 else:
                     res_dict = dict()
                     message = araxq.response.envelope.message
+                    edge_keys_by_node = collections.defaultdict(set)  ## edge has no direction
+                    for edge_key, edge in message.knowledge_graph.edges.items():
+                        edge_keys_by_node[edge.subject].add(edge_key)
+                        edge_keys_by_node[edge.object].add(edge_key)
                     if type(node_curie) is str:
-                        tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph.edges[edge_key].subject == node_curie or message.knowledge_graph.edges[edge_key].object == node_curie])  ## edge has no direction
+                        tmplist = edge_keys_by_node.get(node_curie, set())
                         if len(tmplist) == 0:
                             self.response.warning(f"Fail to query adjacent nodes from {kp} for {node_curie} in FET probably because expander ignores node type. For more details, please see issue897.")
                             return (res_dict,[node_curie])
@@ -550,7 +557,7 @@ class ComputeFTEST:
                         check_empty = False
                         failure_nodes = list()
                         for node in node_curie:
-                            tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph.edges[edge_key].subject == node or message.knowledge_graph.edges[edge_key].object == node])  ## edge has no direction
+                            tmplist = edge_keys_by_node.get(node, set())
                             if len(tmplist) == 0:
                                 self.response.warning(f"Fail to query adjacent nodes from {kp} for {node} in FET probably because expander ignores node type. For more details, please see issue897.")
                                 failure_nodes.append(node)
@@ -582,6 +589,9 @@ class ComputeFTEST:
         node_type = ComputeFTEST.convert_string_to_snake_case(node_type.replace('biolink:',''))
         node_type = ComputeFTEST.convert_string_biolinkformat(node_type)
 
+        if self.neighbor_count_index and self.neighbor_count_index.get_category_count(node_type) is not None:
+            return self.neighbor_count_index.get_category_count(node_type)
+
         # Get connected to kg2c sqlite
         connection = sqlite3.connect(self.sqlite_file_path)
         cursor = connection.cursor()
@@ -598,35 +608,49 @@ class ComputeFTEST:
 
         return size_of_total
 
-    def _calculate_FET_pvalue_parallel(self, this):
-        # *Note*: The arugment 'this' is a list containing five sub-arguments below since this function is exectued in parallel.
-        # This method is expected to be run within this class
+    def _query_size_of_adjacent_nodes_from_index(self, node_curie, adjacent_type, rel_type=None):
         """
-        Calculate Fisher Exact Test' p-value.
-        *param this is a list containing five sub-arguments below since this function is exectued in parallel.
-        :return a list of FET p-values
+        Look up the number of adjacent nodes of the given type for the query node(s) in the neighbor count index.
+        :return a tuple with a dict containing the number of adjacent nodes for the query node and a list of removed nodes
         """
-        #:sub-argument node: (required) the curie name of node, eg. "UniProtKB:Q13330"
-        #:sub-argument a: (required) count of in_sample and in_pathway
-        #:sub-argument b: (required) count of not_in_sample but in_pathway
-        #:sub-argument c: (required) count of in_sample but not in_pathway
-        #:sub-argument d: (required) count of not in_sample and not in_pathway
-
-        # this should contain five variables and assign them to different variables
-        node, a, b, c, d = this
-        error_message = []
+        node_curies = [node_curie] if type(node_curie) is str else node_curie
+        normalized_nodes = self.nodesynonymizer.get_canonical_curies(node_curies)
+        mapping = {node:normalized_nodes[node]['preferred_curie'] for node in normalized_nodes if normalized_nodes[node] is not None}
+        failure_nodes = list(normalized_nodes.keys() - mapping.keys())
+        neighbor_counts = self.neighbor_count_index.get_neighbor_counts(set(mapping.values()), adjacent_type, predicate=rel_type)
+        res_dict = {node:neighbor_counts[mapping[node]] for node in mapping if mapping[node] in neighbor_counts}
+        failure_nodes += list(mapping.keys() - res_dict.keys())
+        return (res_dict, failure_nodes)
+
+    def _load_neighbor_count_index(self):
+        # Neighbor counts are served from a memory-mapped index, if one has been built next to the KG2c sqlite; the
+        # cached index is reloaded (or dropped) whenever the index or the sqlite has changed since it was loaded
+        index_path = get_neighbor_count_index_path(self.sqlite_file_path)
+        stamps = (self._get_file_stamp(index_path), self._get_file_stamp(self.sqlite_file_path))
+        cached_stamps, neighbor_count_index = self._neighbor_count_indexes.get(index_path, (None, None))
+        if cached_stamps != stamps:
+            neighbor_count_index = None
+            if stamps[0] is not None:
+                try:
+                    neighbor_count_index = NeighborCountIndex(index_path)
+                except Exception as e:
+                    self.response.warning(f"Couldn't load neighbor count index {index_path}: {e}")
+                else:
+                    if stamps[1] is None or not neighbor_count_index.is_up_to_date_with(self.sqlite_file_path):
+                        self.response.warning(f"Ignoring neighbor count index {index_path} because it was built from "
+                                              f"a different version of {os.path.basename(self.sqlite_file_path)}")
+                        neighbor_count_index.close()
+                        neighbor_count_index = None
+            # An index being replaced isn't closed, since other ComputeFTEST instances may still be using it
+            self._neighbor_count_indexes[index_path] = (stamps, neighbor_count_index)
+        return neighbor_count_index
 
+    @staticmethod
+    def _get_file_stamp(file_path: str):
         try:
-            contingency_table = [[a, b], [c, d]]
-            pvalue = stats.fisher_exact(contingency_table)[1]
-            return (node, pvalue)
-        except:
-            tb = traceback.format_exc()
-            error_type, error, _ = sys.exc_info()
-            error_message.append((tb, error_type.__name__))
-            error_message.append(f"Something went wrong for target node {node} to calculate FET p-value")
-            error_message.append(f"a, b, c, d are respectively {a}, {b}, {c}, {d} ")
-            return error_message
+            return get_file_stamp(file_path)
+        except OSError:
+            return None
 
     @staticmethod
     def convert_string_to_snake_case(input_string: str) -> str:
@@ -0,0 +1,213 @@
+"""
+The neighbor_count_index.py file defines a read-only, memory-mapped index of KG2c neighbor counts, which is built
+alongside the KG2c sqlite (by kg2c/record_kg2c_meta_info.py) and used by the Fisher's exact test overlay. For each
+(canonical) node, it records how many distinct neighbors of each (expanded) category the node has, both overall and
+per (expanded) predicate; it also records the total number of nodes of each category. This replaces the
+'neighbors' and 'category_counts' sqlite tables for FET, as well as the ARAX queries FET used to have to run to count
+neighbors connected via a particular predicate.
+
+An index is tied to the exact KG2c sqlite file it was built next to (by its size and modification time), and FET
+ignores it once that file changes. ARAX_database_manager doesn't download these indexes, so a server only uses one if
+it's been built there, against the sqlite the server actually has (e.g., with the command below, which can't include
+per-predicate counts); otherwise FET falls back to the sqlite tables and ARAX queries.
+
+File layout (in the common format described in ARAXQuery/mmap_index.py):
+    header:          magic, counts, size and modification time (ns) of the KG2c sqlite file, and the offset of each
+                     section below
+    vocabulary:      JSON; the categories and predicates used in entry keys, plus the node count for each category
+    curie offsets:   uint64[num_nodes + 1]; curie i is curie_pool[offsets[i]:offsets[i + 1]] (UTF-8)
+    curie pool:      bytes; curies are sorted by their UTF-8 bytes
+    entry offsets:   uint64[num_nodes + 1]; the entries of node i are entries[offsets[i]:offsets[i + 1]]
+    entry keys:      uint32[num_entries]; category index << 16 | predicate index + 1 (or 0 for the count over all
+                     predicates); sorted within each node
+    entry counts:    uint32[num_entries]; number of neighbors for each entry key
+
+Usage (to build an index from an existing KG2c sqlite, without per-predicate counts):
+    python neighbor_count_index.py <path to kg2c sqlite>
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from array import array
+from typing import Optional, Dict, Tuple, Iterable, Callable
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")
+from mmap_index import get_file_stamp, open_index_file, write_index_file
+
+MAGIC = b"ARAXNCI2"
+HEADER_FORMAT = "<8s11Q"  # magic, 4 counts/stamps (nodes, entries, source size, source mtime in ns), 6 offsets, file size
+MAX_VOCABULARY_SIZE = 1 << 16  # Entry keys pack a category index and a predicate index into 16 bits each
+
+
+class NeighborCountIndex:
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.mmap, header_fields = open_index_file(index_path, HEADER_FORMAT, MAGIC, "neighbor count index")
+        (self.num_nodes, self.num_entries, self.source_size, self.source_mtime_ns, vocabulary_start, curie_offsets_start,
+         curie_pool_start, entry_offsets_start, entry_keys_start, entry_counts_start) = header_fields
+        vocabulary = json.loads(self.mmap[vocabulary_start:curie_offsets_start].rstrip(b"\0"))
+        self.category_indexes = {category: index for index, category in enumerate(vocabulary["categories"])}
+        self.predicate_indexes = {predicate: index for index, predicate in enumerate(vocabulary["predicates"])}
+        self.category_counts = vocabulary["category_counts"]
+        self.curie_offsets = np.frombuffer(self.mmap, dtype=np.uint64, count=self.num_nodes + 1,
+                                           offset=curie_offsets_start)
+        self.curie_pool_start = curie_pool_start
+        self.entry_offsets = np.frombuffer(self.mmap, dtype=np.uint64, count=self.num_nodes + 1,
+                                           offset=entry_offsets_start)
+        self.entry_keys = np.frombuffer(self.mmap, dtype=np.uint32, count=self.num_entries, offset=entry_keys_start)
+        self.entry_counts = np.frombuffer(self.mmap, dtype=np.uint32, count=self.num_entries, offset=entry_counts_start)
+
+    def is_up_to_date_with(self, sqlite_path: str) -> bool:
+        return get_file_stamp(sqlite_path) == (self.source_size, self.source_mtime_ns)
+
+    def get_neighbor_counts(self, curies: Iterable[str], adjacent_category: str,
+                            predicate: Optional[str] = None) -> Dict[str, int]:
+        """
+        Returns the number of neighbors of the given category (connected via the given predicate or any of its
+        descendants, if a predicate is specified) that each curie has in KG2c. Curies that aren't in the index or that
+        have no such neighbors are left out of the returned dictionary.
+        """
+        entry_key = self._find_entry_key(adjacent_category, predicate)
+        if entry_key is None:
+            return dict()
+        neighbor_counts = dict()
+        for curie in curies:
+            node_index = self._find_node_index(curie)
+            if node_index is not None:
+                start, end = int(self.entry_offsets[node_index]), int(self.entry_offsets[node_index + 1])
+                position = start + int(np.searchsorted(self.entry_keys[start:end], entry_key))
+                if position < end and self.entry_keys[position] == entry_key:
+                    neighbor_counts[curie] = int(self.entry_counts[position])
+        return neighbor_counts
+
+    def has_counts_for_predicate(self, predicate: Optional[str]) -> bool:
+        """
+        Returns whether the index holds per-predicate counts for the given predicate (counts over any predicate are
+        always there). If it doesn't, the index can't answer for that predicate, which is not the same as a count of 0.
+        """
+        return not predicate or predicate in self.predicate_indexes
+
+    def get_category_count(self, category: str) -> Optional[int]:
+        return self.category_counts.get(category)
+
+    def close(self):
+        self.curie_offsets = self.entry_offsets = self.entry_keys = self.entry_counts = None
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass  # Someone still holds a view of the map; it's closed once they're garbage collected
+
+    def _find_entry_key(self, category: str, predicate: Optional[str]) -> Optional[int]:
+        category_index = self.category_indexes.get(category)
+        predicate_index = self.predicate_indexes.get(predicate) if predicate else -1
+        if category_index is None or predicate_index is None:
+            return None
+        return _get_entry_key(category_index, predicate_index)
+
+    def _get_curie_bytes(self, node_index: int) -> bytes:
+        start = self.curie_pool_start + int(self.curie_offsets[node_index])
+        end = self.curie_pool_start + int(self.curie_offsets[node_index + 1])
+        return self.mmap[start:end]
+
+    def _find_node_index(self, curie: str) -> Optional[int]:
+        target = curie.encode("utf-8")
+        low, high = 0, self.num_nodes
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_curie_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_nodes and self._get_curie_bytes(low) == target:
+            return low
+        return None
+
+
+def build_neighbor_count_index(node_ids: Iterable[str],
+                               get_neighbor_counts: Callable[[str], Dict[Tuple[str, Optional[str]], int]],
+                               category_counts: Dict[str, int], sqlite_path: str,
+                               index_path: Optional[str] = None) -> str:
+    """
+    Builds a neighbor count index for the given nodes of the given (already complete) KG2c sqlite; get_neighbor_counts()
+    should return a node's neighbor counts, keyed by (category, predicate) tuples, where a predicate of None means 'any
+    predicate'. (Counts are requested one node at a time so that the caller never has to hold all of them in memory.)
+    Returns the path of the index file.
+    """
+    index_path = index_path if index_path else get_neighbor_count_index_path(sqlite_path)
+    source_stamp = get_file_stamp(sqlite_path)  # Taken before reading, so a concurrent rebuild makes the index stale
+    category_indexes = {category: index for index, category in enumerate(sorted(category_counts))}
+    predicate_indexes = dict()
+
+    print(f"Sorting nodes..")
+    sorted_curies = sorted(node_id.encode("utf-8") for node_id in node_ids)
+    print(f"Gathering neighbor counts for {len(sorted_curies)} nodes..")
+    curie_offsets = array("Q", [0])
+    entry_offsets = array("Q", [0])
+    entry_keys = array("I")
+    entry_counts = array("I")
+    for curie_bytes in sorted_curies:
+        node_entries = []
+        for (category, predicate), count in get_neighbor_counts(curie_bytes.decode("utf-8")).items():
+            category_index = category_indexes.setdefault(category, len(category_indexes))
+            predicate_index = predicate_indexes.setdefault(predicate, len(predicate_indexes)) if predicate else -1
+            node_entries.append((_get_entry_key(category_index, predicate_index), count))
+        node_entries.sort()
+        curie_offsets.append(curie_offsets[-1] + len(curie_bytes))
+        entry_offsets.append(entry_offsets[-1] + len(node_entries))
+        entry_keys.extend(entry_key for entry_key, _ in node_entries)
+        entry_counts.extend(count for _, count in node_entries)
+    if len(category_indexes) > MAX_VOCABULARY_SIZE or len(predicate_indexes) >= MAX_VOCABULARY_SIZE:
+        raise ValueError(f"Neighbor count indexes can hold at most {MAX_VOCABULARY_SIZE} categories/predicates")
+    vocabulary = json.dumps({"categories": sorted(category_indexes, key=category_indexes.get),
+                             "predicates": sorted(predicate_indexes, key=predicate_indexes.get),
+                             "category_counts": category_counts}).encode("utf-8")
+
+    sections = [vocabulary, curie_offsets.tobytes(), b"".join(sorted_curies), entry_offsets.tobytes(),
+                entry_keys.tobytes(), entry_counts.tobytes()]
+    print(f"Writing neighbor count index to {index_path}..")
+    write_index_file(index_path, HEADER_FORMAT, (MAGIC, len(sorted_curies), len(entry_keys), *source_stamp), sections)
+    print(f"Done. Neighbor count index has {len(sorted_curies)} nodes and {len(entry_keys)} entries")
+    return index_path
+
+
+def build_neighbor_count_index_from_sqlite(sqlite_path: str, index_path: Optional[str] = None) -> str:
+    """
+    Builds a neighbor count index from the 'neighbors' and 'category_counts' tables of a KG2c sqlite. These tables
+    don't record predicates, so the resulting index only has counts over all predicates.
+    """
+    print(f"Loading neighbor counts from {sqlite_path}..")
+    connection = sqlite3.connect(sqlite_path)
+    neighbor_counts_json = dict(connection.execute("SELECT id, neighbor_counts FROM neighbors"))
+    category_counts = dict(connection.execute("SELECT category, count FROM category_counts"))
+    connection.close()
+    return build_neighbor_count_index(neighbor_counts_json,
+                                      lambda node_id: {(category, None): count for category, count
+                                                       in json.loads(neighbor_counts_json[node_id]).items()},
+                                      category_counts, sqlite_path, index_path)
+
+
+def _get_entry_key(category_index: int, predicate_index: int) -> int:
+    return (category_index << 16) | (predicate_index + 1)
+
+
+def get_neighbor_count_index_path(sqlite_path: str) -> str:
+    base_path, _, test_suffix = sqlite_path.partition(".sqlite")  # Test builds name their sqlite 'kg2c.sqlite_TEST'
+    return f"{base_path}.neighbor_counts{test_suffix}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("sqlite_path", help="Path to the KG2c sqlite to build a neighbor count index from")
+    arg_parser.add_argument("-o", "--output", dest="index_path", default=None,
+                            help="Where to save the index (defaults to next to the sqlite, with a .neighbor_counts suffix)")
+    args = arg_parser.parse_args()
+    build_neighbor_count_index_from_sqlite(args.sqlite_path, args.index_path)
+
+
+if __name__ == "__main__":
+    main()
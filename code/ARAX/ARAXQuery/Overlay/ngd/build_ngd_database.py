@@ -12,8 +12,11 @@ There are two halves to the (full) build process:
      - Contains mappings from canonicalized curies to their list of PMIDs based on the data scraped from Pubmed AND
        from KG2 data (node.publications and edge.publications)
      - The NodeSynonymizer is used to link curies to concept names from step 1
-Usage: python build_ngd_database.py [--test] [--full]
-       By default, only step 2 above will be performed. To do a "full" build, use the --full flag.
+     - A memory-mapped PMID index ("curie_to_pmids.pmidx") is built from this file, which is what ARAX uses to
+       compute NGD if it's present next to the sqlite (see pmid_index.py)
+Usage: python build_ngd_database.py [--test] [--full] [--index-only]
+       By default, only step 2 above will be performed. To do a "full" build, use the --full flag. To only (re)build
+       the PMID index from an existing curie_to_pmids.sqlite, use the --index-only flag.
 """
 import argparse
 import gzip
@@ -40,6 +43,7 @@ sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'N
 from node_synonymizer import NodeSynonymizer
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))  # code directory
 from RTXConfiguration import RTXConfiguration
+from pmid_index import build_pmid_index, get_pmid_index_path
 
 
 class NGDDatabaseBuilder:
@@ -154,6 +158,18 @@ class NGDDatabaseBuilder:
         logging.info(f"  In the end, found PMID lists for {len(curie_to_pmids_map)} (canonical) curies")
         self._save_data_in_sqlite_db(curie_to_pmids_map)
         logging.info(f"Done! Building {self.curie_to_pmids_db_name} took {round((time.time() - start) / 60)} minutes.")
+        self.build_pmid_index()
+
+    def build_pmid_index(self):
+        # This function creates a memory-mapped index of the final sqlite's PMID lists (as sorted uint32 arrays)
+        logging.info(f"Starting to build PMID index {get_pmid_index_path(self.curie_to_pmids_db_name)}..")
+        start = time.time()
+        if not pathlib.Path(self.curie_to_pmids_db_path).exists():
+            logging.error(f"{self.curie_to_pmids_db_name} must exist in order to build the PMID index.")
+            self.status = 'ERROR'
+            return
+        build_pmid_index(self.curie_to_pmids_db_path)
+        logging.info(f"Done! Building the PMID index took {round((time.time() - start) / 60)} minutes.")
 
     # Helper methods
 
@@ -343,11 +359,15 @@ def main():
     arg_parser = argparse.ArgumentParser(description="Builds database of curie->PMID mappings needed for NGD")
     arg_parser.add_argument("--full", dest="full", action="store_true", default=False)
     arg_parser.add_argument("--test", dest="test", action="store_true", default=False)
+    arg_parser.add_argument("--index-only", dest="index_only", action="store_true", default=False)
     args = arg_parser.parse_args()
 
     # Build the database(s)
     database_builder = NGDDatabaseBuilder(args.test)
-    database_builder.build_ngd_database(args.full)
+    if args.index_only:
+        database_builder.build_pmid_index()
+    else:
+        database_builder.build_ngd_database(args.full)
 
 
 if __name__ == '__main__':
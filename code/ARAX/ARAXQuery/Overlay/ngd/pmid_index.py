@@ -0,0 +1,205 @@
+"""
+The pmid_index.py file defines a read-only, memory-mapped index of the curie->PMIDs mappings in the NGD database
+(curie_to_pmids.sqlite), plus a batched kernel that computes the NGD marginal and joint counts for many curie pairs at
+once. Each curie's PMIDs are stored as a sorted array of uint32s, so loading a curie's PMIDs is a binary search plus a
+zero-copy numpy view into the mapped file (instead of a sqlite query and a json.loads() of its PMID list).
+
+File layout (in the common format described in ARAXQuery/mmap_index.py):
+    header:          magic, counts, size and modification time of the source sqlite file, and the offset of each
+                     section below
+    curie offsets:   uint64[num_curies + 1]; curie i is curie_pool[offsets[i]:offsets[i + 1]] (UTF-8)
+    curie pool:      bytes; curies are sorted by their UTF-8 bytes
+    pmid offsets:    uint64[num_curies + 1]; the PMIDs of curie i are pmids[offsets[i]:offsets[i + 1]]
+    pmids:           uint32[num_pmids]; sorted and unique within each curie
+
+Usage (to build an index):
+    python pmid_index.py <path to curie_to_pmids sqlite>
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from array import array
+from typing import Optional, List, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
+from mmap_index import get_file_stamp, open_index_file, write_index_file
+
+MAGIC = b"ARAXPMI2"
+HEADER_FORMAT = "<8s9Q"  # magic, 4 counts/stamps (curies, pmids, source size, source mtime in ns), 4 offsets, file size
+PMID_MASK = np.uint64(0xFFFFFFFF)
+MAX_PROBES_PER_CHUNK = 1 << 22  # Bounds the memory used by get_marginal_and_joint_counts() (~100 MB per chunk)
+
+
+class PMIDIndex:
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.mmap, header_fields = open_index_file(index_path, HEADER_FORMAT, MAGIC, "PMID index")
+        (self.num_curies, self.num_pmids, self.source_size, self.source_mtime_ns, curie_offsets_start,
+         curie_pool_start, pmid_offsets_start, pmids_start) = header_fields
+        self.curie_offsets = np.frombuffer(self.mmap, dtype=np.uint64, count=self.num_curies + 1,
+                                           offset=curie_offsets_start)
+        self.curie_pool_start = curie_pool_start
+        self.pmid_offsets = np.frombuffer(self.mmap, dtype=np.uint64, count=self.num_curies + 1,
+                                          offset=pmid_offsets_start)
+        self.pmids = np.frombuffer(self.mmap, dtype=np.uint32, count=self.num_pmids, offset=pmids_start)
+
+    def is_up_to_date_with(self, sqlite_path: str) -> bool:
+        return get_file_stamp(sqlite_path) == (self.source_size, self.source_mtime_ns)
+
+    def get_pmids(self, curie: str) -> Optional[np.ndarray]:
+        """
+        Returns a (read-only) sorted array of the PMIDs the curie appears in, or None if the curie isn't in the index.
+        """
+        curie_index = self._find_curie_index(curie)
+        if curie_index is None:
+            return None
+        return self.pmids[int(self.pmid_offsets[curie_index]):int(self.pmid_offsets[curie_index + 1])]
+
+    def close(self):
+        self.curie_offsets = self.pmid_offsets = self.pmids = None
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass  # Someone still holds a view of the PMIDs; the map is closed once they're garbage collected
+
+    def _get_curie_bytes(self, curie_index: int) -> bytes:
+        start = self.curie_pool_start + int(self.curie_offsets[curie_index])
+        end = self.curie_pool_start + int(self.curie_offsets[curie_index + 1])
+        return self.mmap[start:end]
+
+    def _find_curie_index(self, curie: str) -> Optional[int]:
+        target = curie.encode("utf-8")
+        low, high = 0, self.num_curies
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_curie_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_curies and self._get_curie_bytes(low) == target:
+            return low
+        return None
+
+
+def get_marginal_and_joint_counts(pmid_arrays: List[np.ndarray], subject_indexes, object_indexes,
+                                  max_shared_pmids: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                                                                   List[np.ndarray]]:
+    """
+    Computes NGD counts for many (subject, object) pairs in one vectorized pass. pmid_arrays holds one sorted, unique
+    PMID array per curie, and the i-th pair is (pmid_arrays[subject_indexes[i]], pmid_arrays[object_indexes[i]]).
+    Returns the subject counts, object counts, and joint counts for each pair, as well as the PMIDs each pair shares
+    (sorted, and limited to the first max_shared_pmids, if specified).
+    """
+    subject_indexes = np.asarray(subject_indexes, dtype=np.int64)
+    object_indexes = np.asarray(object_indexes, dtype=np.int64)
+    if not len(subject_indexes):
+        no_counts = np.zeros(0, dtype=np.int64)
+        return no_counts, no_counts, no_counts, []
+    lengths = np.array([len(pmid_array) for pmid_array in pmid_arrays], dtype=np.int64)
+    subject_counts = lengths[subject_indexes]
+    object_counts = lengths[object_indexes]
+
+    # Pairs that differ only in direction (or repeat, e.g. for edges with different predicates) only get counted once
+    unique_pairs, pair_inverse = np.unique(np.stack([np.minimum(subject_indexes, object_indexes),
+                                                     np.maximum(subject_indexes, object_indexes)], axis=1),
+                                           axis=0, return_inverse=True)
+    pair_inverse = pair_inverse.reshape(-1)
+    num_unique_pairs = len(unique_pairs)
+    unique_joint_counts = np.zeros(num_unique_pairs, dtype=np.int64)
+    unique_shared_pmids = [np.zeros(0, dtype=np.uint32)] * num_unique_pairs
+
+    # Tag each PMID with the curie it belongs to; because each array is sorted, the tagged keys are globally sorted
+    keys = np.zeros(0, dtype=np.uint64)
+    if lengths.sum():
+        curie_ids = np.repeat(np.arange(len(pmid_arrays), dtype=np.uint64), lengths)
+        keys = (curie_ids << np.uint64(32)) | np.concatenate(pmid_arrays).astype(np.uint64)
+    key_starts = np.cumsum(lengths) - lengths
+
+    # For each pair, look up each PMID of its smaller array in its larger array, a chunk of pairs at a time
+    if num_unique_pairs and len(keys):
+        first_ids, second_ids = unique_pairs[:, 0], unique_pairs[:, 1]
+        first_is_smaller = lengths[first_ids] <= lengths[second_ids]
+        probe_ids = np.where(first_is_smaller, first_ids, second_ids)
+        target_ids = np.where(first_is_smaller, second_ids, first_ids).astype(np.uint64)
+        probe_counts = lengths[probe_ids]
+        probe_ends = np.cumsum(probe_counts)
+        chunk_start = 0
+        while chunk_start < num_unique_pairs:
+            probes_before_chunk = probe_ends[chunk_start - 1] if chunk_start else 0
+            chunk_end = int(np.searchsorted(probe_ends, probes_before_chunk + MAX_PROBES_PER_CHUNK, side="right"))
+            chunk_end = max(chunk_end, chunk_start + 1)
+            chunk_probe_counts = probe_counts[chunk_start:chunk_end]
+            num_probes = int(chunk_probe_counts.sum())
+            if num_probes:
+                pair_positions = np.repeat(np.arange(chunk_end - chunk_start), chunk_probe_counts)
+                probe_starts = np.cumsum(chunk_probe_counts) - chunk_probe_counts
+                probe_positions = (np.repeat(key_starts[probe_ids[chunk_start:chunk_end]] - probe_starts, chunk_probe_counts)
+                                   + np.arange(num_probes))
+                query_keys = ((target_ids[chunk_start:chunk_end][pair_positions] << np.uint64(32))
+                              | (keys[probe_positions] & PMID_MASK))
+                found_positions = np.minimum(np.searchsorted(keys, query_keys), len(keys) - 1)
+                is_shared = keys[found_positions] == query_keys
+                chunk_joint_counts = np.bincount(pair_positions[is_shared], minlength=chunk_end - chunk_start)
+                unique_joint_counts[chunk_start:chunk_end] = chunk_joint_counts
+                shared_pmids = (query_keys[is_shared] & PMID_MASK).astype(np.uint32)
+                split_shared_pmids = np.split(shared_pmids, np.cumsum(chunk_joint_counts)[:-1])
+                if max_shared_pmids is not None:
+                    split_shared_pmids = [pmids[:max_shared_pmids] for pmids in split_shared_pmids]
+                unique_shared_pmids[chunk_start:chunk_end] = split_shared_pmids
+            chunk_start = chunk_end
+
+    joint_counts = unique_joint_counts[pair_inverse]
+    shared_pmids_by_pair = [unique_shared_pmids[unique_pair_index] for unique_pair_index in pair_inverse.tolist()]
+    return subject_counts, object_counts, joint_counts, shared_pmids_by_pair
+
+
+def build_pmid_index(sqlite_path: str, index_path: Optional[str] = None) -> str:
+    """
+    Builds a PMID index from the given curie_to_pmids sqlite; returns the path of the index file.
+    """
+    index_path = index_path if index_path else get_pmid_index_path(sqlite_path)
+    print(f"Loading PMID lists from {sqlite_path}..")
+    source_stamp = get_file_stamp(sqlite_path)  # Taken before reading, so a concurrent rebuild makes the index stale
+    db_connection = sqlite3.connect(sqlite_path)
+    rows = [(curie.encode("utf-8"), pmids_json) for curie, pmids_json in
+            db_connection.execute("SELECT curie, pmids FROM curie_to_pmids")]
+    db_connection.close()
+
+    print(f"Sorting {len(rows)} curies..")
+    rows.sort(key=lambda row: row[0])
+    curie_offsets = array("Q", [0])
+    pmid_offsets = array("Q", [0])
+    pmid_chunks = []
+    for curie_bytes, pmids_json in rows:
+        pmids = np.unique(np.array(json.loads(pmids_json), dtype=np.uint32))
+        curie_offsets.append(curie_offsets[-1] + len(curie_bytes))
+        pmid_offsets.append(pmid_offsets[-1] + len(pmids))
+        pmid_chunks.append(pmids.tobytes())
+
+    sections = [curie_offsets.tobytes(), b"".join(row[0] for row in rows), pmid_offsets.tobytes(), b"".join(pmid_chunks)]
+    print(f"Writing PMID index to {index_path}..")
+    write_index_file(index_path, HEADER_FORMAT, (MAGIC, len(rows), pmid_offsets[-1], *source_stamp), sections)
+    print(f"Done. PMID index has {len(rows)} curies and {pmid_offsets[-1]} curie->PMID mappings")
+    return index_path
+
+
+def get_pmid_index_path(sqlite_path: str) -> str:
+    return f"{sqlite_path[:-len('.sqlite')] if sqlite_path.endswith('.sqlite') else sqlite_path}.pmidx"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("sqlite_path", help="Path to the curie_to_pmids sqlite to build a PMID index from")
+    arg_parser.add_argument("-o", "--output", dest="index_path", default=None,
+                            help="Where to save the index (defaults to next to the sqlite, with a .pmidx suffix)")
+    args = arg_parser.parse_args()
+    build_pmid_index(args.sqlite_path, args.index_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,175 @@
 import sys
 import os
+import heapq
 import math
-import threading
+import time
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from BreadthFirstSearch import BreadthFirstSearch
+from constants import NEIGHBOR_LIMIT, NODE_DEGREE_LIMIT, PLOVER_BATCH_SIZE
 from model.Node import Node
 from model.Path import Path
-from model.PathContainer import PathContainer
 
 
 class BidirectionalPathFinder:
+    """
+    Finds paths between two nodes by searching outwards from both of them and meeting in the middle. Both searches
+    expand a whole frontier (every node at the current depth, on both sides) per level, so neighbors and degrees are
+    fetched from the repository in batches. Partial paths are kept as tuples of integer node ids, and the joined paths
+    are streamed in order of increasing weight, so only the paths that are returned are ever materialized.
+    """
 
     def __init__(self, repository):
         self.repo = repository
+        self.is_truncated = False
+        self.node_ids = []
+        self.node_indexes = dict()
+        self.adjacency = dict()
 
-    def find_all_paths(self, node_id_1, node_id_2, hops_numbers=1):
-        result = set()
+    def find_all_paths(self, node_id_1, node_id_2, hops_numbers=1, max_paths=None, max_partial_paths=None,
+                       time_limit=None):
+        """
+        Returns the (simple) paths of at most hops_numbers edges between the two nodes, sorted by weight. At most
+        max_paths paths are returned, each search side holds at most max_partial_paths partial paths, and the search
+        stops early once time_limit seconds have passed; is_truncated says whether any of these limits was hit.
+        """
+        self.is_truncated = False
         if hops_numbers == 0:
-            return result
+            return []
         if node_id_1 == node_id_2:
-            return result
+            return []
+        deadline = time.time() + time_limit if time_limit is not None else math.inf
 
         hops_numbers_1 = math.floor((hops_numbers + 1) / 2)
         hops_numbers_2 = math.floor(hops_numbers / 2)
+        paths_1, weights_1, paths_2, weights_2 = self._search_both_sides(
+            self._get_node_index(node_id_1), hops_numbers_1, self._get_node_index(node_id_2), hops_numbers_2,
+            max_partial_paths, deadline)
 
-        path_container_1 = PathContainer()
-        bfs_1 = BreadthFirstSearch(self.repo, path_container_1)
+        return [self._make_path(path_1, path_2) for path_1, path_2 in
+                self._join_paths(paths_1, weights_1, paths_2, weights_2, max_paths, deadline)]
 
-        path_container_2 = PathContainer()
-        bfs_2 = BreadthFirstSearch(self.repo, path_container_2)
+    def _search_both_sides(self, source_1, hops_numbers_1, source_2, hops_numbers_2, max_partial_paths, deadline):
+        paths = [[(source_1,)], [(source_2,)]]
+        weights = [[0], [0]]
+        frontiers = [[0], [0]]  # Indexes of the partial paths that end at the current depth
+        hops_numbers = [hops_numbers_1, hops_numbers_2]
+        for depth in range(max(hops_numbers)):
+            expanding_sides = [side for side in (0, 1) if depth < hops_numbers[side] and frontiers[side]]
+            if not expanding_sides:
+                break
+            if time.time() > deadline:
+                self.is_truncated = True
+                break
+            if not self._fetch_neighbors({paths[side][path_index][-1] for side in expanding_sides
+                                          for path_index in frontiers[side]}, deadline):
+                self.is_truncated = True
+                break
+            for side in expanding_sides:
+                side_paths, side_weights = paths[side], weights[side]
+                new_frontier = []
+                for path_index in frontiers[side]:
+                    path = side_paths[path_index]
+                    for neighbor, weight in self.adjacency[path[-1]]:
+                        if neighbor not in path:
+                            if max_partial_paths is not None and len(side_paths) >= max_partial_paths:
+                                self.is_truncated = True
+                                break
+                            new_frontier.append(len(side_paths))
+                            side_paths.append(path + (neighbor,))
+                            side_weights.append(side_weights[path_index] + weight)
+                frontiers[side] = new_frontier
+        return paths[0], weights[0], paths[1], weights[1]
 
-        thread_1 = threading.Thread(target=lambda: bfs_1.traverse(node_id_1, hops_numbers_1))
-        thread_2 = threading.Thread(target=lambda: bfs_2.traverse(node_id_2, hops_numbers_2))
-        thread_1.start()
-        thread_2.start()
-        thread_1.join()
-        thread_2.join()
+    def _fetch_neighbors(self, node_indexes, deadline):
+        """
+        Fetches the neighbors of the given nodes in batches (each one a single Plover request), checking the deadline
+        between batches; returns False if it ran out of time before all of them were fetched.
+        """
+        nodes = [Node(self.node_ids[node_index]) for node_index in node_indexes if node_index not in self.adjacency]
+        if not nodes:
+            return True
+        node_degrees = self.repo.get_node_degrees(nodes)
+        for i in range(0, len(nodes), PLOVER_BATCH_SIZE):
+            if time.time() > deadline:
+                return False
+            batch = nodes[i:i + PLOVER_BATCH_SIZE]
+            expandable_nodes = [node for node in batch if node_degrees[node.id] <= NODE_DEGREE_LIMIT]
+            neighbors_by_node = self.repo.get_neighbors_of_nodes(expandable_nodes, NEIGHBOR_LIMIT) \
+                if expandable_nodes else dict()
+            for node in batch:
+                self.adjacency[self._get_node_index(node.id)] = [
+                    (self._get_node_index(neighbor.id), self._get_weight(neighbor))
+                    for neighbor in neighbors_by_node.get(node.id, [])]
+        return True
 
-        intersection_list = path_container_1.path_dict.keys() & path_container_2.path_dict.keys()
+    def _join_paths(self, paths_1, weights_1, paths_2, weights_2, max_paths, deadline):
+        """
+        Yields the pairs of partial paths (as tuples of node indexes) to join, in order of increasing weight. For each
+        node where the two searches meet, the partial paths ending there are sorted by weight; a heap then merges the
+        (sorted) pairwise sums across all meeting nodes, so pairs are only combined when they're next in line.
+        """
+        paths_by_end_1 = self._group_by_end_node(paths_1, weights_1)
+        paths_by_end_2 = self._group_by_end_node(paths_2, weights_2)
+        meeting_nodes = sorted(paths_by_end_1.keys() & paths_by_end_2.keys())
+        heap = [(weights_1[paths_by_end_1[node][0]] + weights_2[paths_by_end_2[node][0]], meeting_index, 0, 0)
+                for meeting_index, node in enumerate(meeting_nodes)]
+        heapq.heapify(heap)
+        seen_paths = set()
+        while heap and (max_paths is None or len(seen_paths) < max_paths):
+            if time.time() > deadline:
+                self.is_truncated = True
+                break
+            _, meeting_index, index_1, index_2 = heapq.heappop(heap)
+            meeting_node = meeting_nodes[meeting_index]
+            ends_1, ends_2 = paths_by_end_1[meeting_node], paths_by_end_2[meeting_node]
+            if index_2 + 1 < len(ends_2):
+                heapq.heappush(heap, (weights_1[ends_1[index_1]] + weights_2[ends_2[index_2 + 1]],
+                                      meeting_index, index_1, index_2 + 1))
+            if index_2 == 0 and index_1 + 1 < len(ends_1):
+                heapq.heappush(heap, (weights_1[ends_1[index_1 + 1]] + weights_2[ends_2[0]],
+                                      meeting_index, index_1 + 1, 0))
+            path_1, path_2 = paths_1[ends_1[index_1]], paths_2[ends_2[index_2]]
+            if len(set(path_1).intersection(path_2)) > 1:
+                continue  # The joined path would visit a node twice
+            joined_path = path_1 + path_2[-2::-1]
+            if joined_path not in seen_paths:  # The same path can be split at more than one meeting node
+                seen_paths.add(joined_path)
+                yield path_1, path_2
+        if heap and max_paths is not None and len(seen_paths) >= max_paths:
+            self.is_truncated = True
 
-        for node in intersection_list:
-            for path_1 in path_container_1.path_dict[node]:
-                for path_2 in path_container_2.path_dict[node]:
-                    temp_path_1 = [Node(link.id, link.weight) for link in path_1.links]
-                    temp_path_2 = []
-                    for i in range(len(path_2.links) - 2, -1, -1):
-                        temp_path_2.append(Node(path_2.links[i].id, path_2.links[i + 1].weight))
-                    temp_path_1.extend(temp_path_2)
-                    if len(temp_path_1) == len(set(temp_path_1)):
-                        result.add(Path(0, temp_path_1))
+    def _make_path(self, path_1, path_2):
+        # Each node keeps the weight of the edge it was reached by; nodes on the second half were reached backwards
+        links = [Node(self.node_ids[path_1[0]], 0)]
+        links.extend(Node(self.node_ids[node], self._get_edge_weight(previous_node, node))
+                     for previous_node, node in zip(path_1, path_1[1:]))
+        links.extend(Node(self.node_ids[path_2[i]], self._get_edge_weight(path_2[i], path_2[i + 1]))
+                     for i in range(len(path_2) - 2, -1, -1))
+        return Path(0, links)
 
-        result = sorted(list(result), key=lambda path: path.compute_weight())
+    def _get_edge_weight(self, node, neighbor):
+        for adjacent_node, weight in self.adjacency[node]:
+            if adjacent_node == neighbor:
+                return weight
+        return math.inf
 
-        return result
+    def _get_node_index(self, node_id):
+        node_index = self.node_indexes.get(node_id)
+        if node_index is None:
+            node_index = len(self.node_ids)
+            self.node_indexes[node_id] = node_index
+            self.node_ids.append(node_id)
+        return node_index
+
+    @staticmethod
+    def _group_by_end_node(paths, weights):
+        paths_by_end = dict()
+        for path_index, path in enumerate(paths):
+            paths_by_end.setdefault(path[-1], []).append(path_index)
+        for path_indexes in paths_by_end.values():
+            path_indexes.sort(key=weights.__getitem__)
+        return paths_by_end
+
+    @staticmethod
+    def _get_weight(neighbor):
+        return math.inf if neighbor.weight is None else neighbor.weight
@@ -1,3 +1,9 @@
 NEIGHBOR_LIMIT = 30
 NUMBER_OF_WORKER_THREADS = 10
 NODE_DEGREE_LIMIT = 30000
+PLOVER_BATCH_SIZE = 50
+PLOVER_REQUEST_TIMEOUT = 30
+SQLITE_BATCH_SIZE = 10000
+MAX_PATHS = 10000
+MAX_PARTIAL_PATHS = 1000000
+PATH_FINDER_TIME_LIMIT = 300
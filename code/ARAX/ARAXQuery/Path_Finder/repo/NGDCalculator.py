@@ -5,7 +5,7 @@ log_NGD_normalizer = math.log(NGD_normalizer)
 
 
 def calculate_ngd(first_element_set, second_element_set):
-    if first_element_set is None or second_element_set is None:
+    if not first_element_set or not second_element_set:
         return None
 
     log_length_of_first_element = math.log(len(first_element_set))
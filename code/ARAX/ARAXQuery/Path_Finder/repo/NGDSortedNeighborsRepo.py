@@ -1,13 +1,16 @@
 import sys
 import os
-import sqlite3
+import json
+import threading
 
 from RTXConfiguration import RTXConfiguration
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+from constants import NUMBER_OF_WORKER_THREADS, SQLITE_BATCH_SIZE
 from repo.NGDCalculator import calculate_ngd
 from repo.Repository import Repository
 from repo.NodeDegreeRepo import NodeDegreeRepo
+from repo.SqliteConnectionPool import SqliteConnectionPool
 from model.Node import Node
 
 
@@ -19,73 +22,80 @@ def get_curie_to_pmids_path():
     return f"{ngd_filepath}{os.path.sep}{RTXConfiguration().curie_to_pmids_path.split('/')[-1]}"
 
 
-def get_node_pmids(node_id):
-    query_to_find_pmids_for_node_id = f"SELECT pmids FROM curie_to_pmids WHERE curie == '{node_id}'"
-    conn = sqlite3.connect(get_curie_to_pmids_path())
-    cursor = conn.cursor()
-    cursor.execute(query_to_find_pmids_for_node_id)
-    node_pmids = cursor.fetchone()
-    conn.close()
-    return node_pmids
-
-
-def get_neighbors_pmids(neighbors):
-    chunk_size = 100000
-    connection = sqlite3.connect(get_curie_to_pmids_path())
-    base_query = "SELECT curie, pmids FROM curie_to_pmids WHERE curie IN ({})"
-    results = []
-    for i in range(0, len(neighbors), chunk_size):
-        chunk = neighbors[i:i + chunk_size]
-        placeholders = ', '.join('?' * len(chunk))
-        query = base_query.format(placeholders)
-        cursor = connection.cursor()
-        cursor.execute(query, chunk)
-        results.extend(cursor.fetchall())
-    connection.close()
-    return results
-
-
 class NGDSortedNeighborsRepo(Repository):
 
-    def __init__(self, repo, degree_repo=NodeDegreeRepo()):
+    def __init__(self, repo, degree_repo=None, curie_to_pmids_path=None):
         self.repo = repo
-        self.degree_repo = degree_repo
+        self.degree_repo = degree_repo if degree_repo else NodeDegreeRepo()
+        self.connection_pool = SqliteConnectionPool(curie_to_pmids_path if curie_to_pmids_path
+                                                    else get_curie_to_pmids_path(), NUMBER_OF_WORKER_THREADS)
+        self.sorted_neighbors_cache = dict()
+        self.lock = threading.Lock()
 
     def get_neighbors(self, node, limit=-1):
+        return self.get_neighbors_of_nodes([node], limit)[node.id]
+
+    def get_neighbors_of_nodes(self, nodes, limit=-1):
+        nodes = list({node.id: node for node in nodes}.values())
+        with self.lock:
+            missing_nodes = [node for node in nodes if node.id not in self.sorted_neighbors_cache]
+        if missing_nodes:
+            neighbors_by_node = self.repo.get_neighbors_of_nodes(missing_nodes)
+            pmids_by_curie = self.get_pmids(set(neighbors_by_node).union(neighbor.id for neighbors in
+                                                                         neighbors_by_node.values()
+                                                                         for neighbor in neighbors))
+            sorted_neighbors_by_node = {node_id: self._sort_neighbors_by_ngd(pmids_by_curie.get(node_id), neighbors,
+                                                                             pmids_by_curie)
+                                        for node_id, neighbors in neighbors_by_node.items()}
+            with self.lock:
+                self.sorted_neighbors_cache.update(sorted_neighbors_by_node)
+
+        with self.lock:
+            sorted_neighbors_by_node = {node.id: self.sorted_neighbors_cache.get(node.id, []) for node in nodes}
+        if limit == -1:
+            return {node_id: [Node(neighbor.id, neighbor.weight) for neighbor in neighbors]
+                    for node_id, neighbors in sorted_neighbors_by_node.items()}
+        else:
+            return {node_id: [Node(neighbor.id, neighbor.weight) for neighbor in neighbors[0:min(limit, len(neighbors))]]
+                    for node_id, neighbors in sorted_neighbors_by_node.items()}
+
+    def get_pmids(self, curies):
+        """
+        Returns the set of PMIDs (as ints) that each curie appears in; curies without any PMIDs are left out. These
+        aren't cached: they're only needed to sort a batch of nodes' neighbors (whose sorted order is cached), and
+        keeping the set of every neighbor seen would make the cache grow with the whole search.
+        """
+        pmids_by_curie = dict()
+        curies = list(curies)
+        base_query = "SELECT curie, pmids FROM curie_to_pmids WHERE curie IN ({})"
+        with self.connection_pool.connection() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(curies), SQLITE_BATCH_SIZE):
+                chunk = curies[i:i + SQLITE_BATCH_SIZE]
+                cursor.execute(base_query.format(', '.join('?' * len(chunk))), chunk)
+                for curie, pmids in cursor.fetchall():
+                    pmids_by_curie[curie] = frozenset(json.loads(pmids))
+        return pmids_by_curie
+
+    def get_node_degree(self, node):
+        return self.degree_repo.get_node_degree(node)
+
+    def get_node_degrees(self, nodes):
+        return self.degree_repo.get_node_degrees(nodes)
 
-        neighbors = self.repo.get_neighbors(node, limit=limit)
+    def close(self):
+        self.connection_pool.close()
 
-        node_pmids = get_node_pmids(node.id)
+    @staticmethod
+    def _sort_neighbors_by_ngd(node_pmids, neighbors, pmids_by_curie):
         if node_pmids is None:
-            if limit == -1:
-                return neighbors
-            else:
-                return neighbors[0:min(limit, len(neighbors))]
-
-        neighbors_to_pmids = get_neighbors_pmids([neighbor.id for neighbor in neighbors])
-        if neighbors_to_pmids is None:
-            if limit == -1:
-                return neighbors
-            else:
-                return neighbors[0:min(limit, len(neighbors))]
-
-        curie_pmids_dict = dict(neighbors_to_pmids)
+            return neighbors
+
         ngd_key_value = dict()
-        node_pmids_set = set(node_pmids[0].strip('][').split(','))
-        for key, value in curie_pmids_dict.items():
-            second_element_pmids = value.strip('][').split(',')
-            ngd_key_value[key] = calculate_ngd(node_pmids_set, set(second_element_pmids))
+        for neighbor in neighbors:
+            if neighbor.id in pmids_by_curie:
+                ngd_key_value[neighbor.id] = calculate_ngd(node_pmids, pmids_by_curie[neighbor.id])
 
         sorted_neighbors_tuple = sorted(ngd_key_value.items(),
                                         key=lambda x: (x[1] is None, x[1] if x[1] is not None else float('inf')))
-
-        if limit == -1:
-            sorted_neighbors = [Node(item[0], item[1]) for item in sorted_neighbors_tuple]
-        else:
-            sorted_neighbors = [Node(item[0], item[1]) for item in
-                                sorted_neighbors_tuple[0:min(limit, len(sorted_neighbors_tuple))]]
-
-        return sorted_neighbors
-
-    def get_node_degree(self, node):
-        return self.degree_repo.get_node_degree(node)
+        return [Node(item[0], item[1]) for item in sorted_neighbors_tuple]
@@ -1,28 +1,44 @@
 import os
 import sys
-import sqlite3
 import json
-
-
+import threading
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+from constants import NUMBER_OF_WORKER_THREADS, SQLITE_BATCH_SIZE
+from repo.SqliteConnectionPool import SqliteConnectionPool
 from repo.utility import get_kg2c_db_path
 
 
 class NodeDegreeRepo:
 
-    def __init__(self, db_path=get_kg2c_db_path()):
-        self.db_path = db_path
+    def __init__(self, db_path=None):
+        self.db_path = db_path if db_path else get_kg2c_db_path()
+        self.connection_pool = SqliteConnectionPool(self.db_path, NUMBER_OF_WORKER_THREADS)
+        self.degree_cache = dict()
+        self.lock = threading.Lock()
 
     def get_node_degree(self, node):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        query = "SELECT neighbor_counts FROM neighbors WHERE id = ?"
-        cursor.execute(query, (node.id,))
-        result = cursor.fetchone()
-        conn.close()
-        if result:
-            degree_by_biolink_type = json.loads(result[0])
-            return degree_by_biolink_type["biolink:NamedThing"]
-        else:
-            return 0
+        return self.get_node_degrees([node])[node.id]
+
+    def get_node_degrees(self, nodes):
+        node_ids = {node.id for node in nodes}
+        with self.lock:
+            missing_ids = [node_id for node_id in node_ids if node_id not in self.degree_cache]
+        if missing_ids:
+            degrees = {node_id: 0 for node_id in missing_ids}
+            query = "SELECT id, neighbor_counts FROM neighbors WHERE id IN ({})"
+            with self.connection_pool.connection() as conn:
+                cursor = conn.cursor()
+                for i in range(0, len(missing_ids), SQLITE_BATCH_SIZE):
+                    chunk = missing_ids[i:i + SQLITE_BATCH_SIZE]
+                    cursor.execute(query.format(', '.join('?' * len(chunk))), chunk)
+                    for node_id, neighbor_counts in cursor.fetchall():
+                        degree_by_biolink_type = json.loads(neighbor_counts)
+                        degrees[node_id] = degree_by_biolink_type["biolink:NamedThing"]
+            with self.lock:
+                self.degree_cache.update(degrees)
+        with self.lock:
+            return {node_id: self.degree_cache[node_id] for node_id in node_ids}
+
+    def close(self):
+        self.connection_pool.close()
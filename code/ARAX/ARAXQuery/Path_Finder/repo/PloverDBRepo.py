@@ -1,21 +1,56 @@
 import os
 import sys
+import threading
 
 import requests
+from requests.adapters import HTTPAdapter
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+from constants import NUMBER_OF_WORKER_THREADS, PLOVER_BATCH_SIZE, PLOVER_REQUEST_TIMEOUT
 from repo.Repository import Repository
 from repo.NodeDegreeRepo import NodeDegreeRepo
 from model.Node import Node
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../BiolinkHelper/")
+from biolink_helper import BiolinkHelper
 
 
 class PloverDBRepo(Repository):
 
-    def __init__(self, plover_url, degree_repo=NodeDegreeRepo()):
+    def __init__(self, plover_url, degree_repo=None):
         self.plover_url = plover_url
-        self.degree_repo = degree_repo
+        self.degree_repo = degree_repo if degree_repo else NodeDegreeRepo()
+        self.session = requests.Session()
+        self.session.mount(plover_url, HTTPAdapter(pool_connections=1, pool_maxsize=NUMBER_OF_WORKER_THREADS))
+        self.neighbors_cache = dict()
+        self.lock = threading.Lock()
+        self.biolink_helper = None
 
     def get_neighbors(self, node, limit=-1):
+        return self.get_neighbors_of_nodes([node], limit)[node.id]
+
+    def get_neighbors_of_nodes(self, nodes, limit=-1):
+        node_ids = list(dict.fromkeys(node.id for node in nodes))
+        with self.lock:
+            missing_ids = [node_id for node_id in node_ids if node_id not in self.neighbors_cache]
+        for i in range(0, len(missing_ids), PLOVER_BATCH_SIZE):
+            neighbor_ids_by_node = self._query_neighbors(missing_ids[i:i + PLOVER_BATCH_SIZE])
+            if neighbor_ids_by_node is not None:  # Failed requests aren't cached, so that they're retried
+                with self.lock:
+                    self.neighbors_cache.update(neighbor_ids_by_node)
+        with self.lock:
+            return {node_id: [Node(neighbor_id) for neighbor_id in self.neighbors_cache.get(node_id, [])]
+                    for node_id in node_ids}
+
+    def get_node_degree(self, node):
+        return self.degree_repo.get_node_degree(node)
+
+    def get_node_degrees(self, nodes):
+        return self.degree_repo.get_node_degrees(nodes)
+
+    def close(self):
+        self.session.close()
+
+    def _query_neighbors(self, node_ids):
         endpoint = "/query"
         data = {
             "edges": {
@@ -26,7 +61,7 @@ class PloverDBRepo(Repository):
             },
             "nodes": {
                 "n00": {
-                    "ids": [node.id]
+                    "ids": node_ids
                 },
                 "n01": {
                     "categories": ["biolink:NamedThing"]
@@ -35,12 +70,12 @@ class PloverDBRepo(Repository):
             "include_metadata": True,
             "respect_predicate_symmetry": True
         }
-        result = []
         try:
-            response = requests.post(self.plover_url + endpoint, headers={'accept': 'application/json'}, json=data)
+            response = self.session.post(self.plover_url + endpoint, headers={'accept': 'application/json'}, json=data,
+                                         timeout=PLOVER_REQUEST_TIMEOUT)
             response.raise_for_status()
             json = response.json()
-            result = [Node(i) for i in json['nodes']['n01'].keys()]
+            return self._group_neighbors_by_node(node_ids, json['nodes']['n01'], json['edges']['e00'])
         except requests.exceptions.RequestException as e:
             # log here print(f"Request error: {e}")
             pass
@@ -52,7 +87,33 @@ class PloverDBRepo(Repository):
             pass
         except Exception as e:
             pass
-        return result
+        return None
 
-    def get_node_degree(self, node):
-        return self.degree_repo.get_node_degree(node)
+    def _group_neighbors_by_node(self, node_ids, answer_nodes, answer_edges):
+        """
+        Splits a batched Plover answer into each queried node's neighbors, listed in the order Plover returned them
+        (which is the order a single-node query would list them in).
+        """
+        queried_ids = set(node_ids)
+        neighbor_ids_by_node = {node_id: set() for node_id in node_ids}
+        for edge_tuple in answer_edges.values():
+            subject_id, object_id, predicate = edge_tuple[0], edge_tuple[1], edge_tuple[2]
+            if subject_id in queried_ids:
+                neighbor_ids_by_node[subject_id].add(object_id)
+            # Plover only returns an edge 'backwards' if its predicate is symmetric; when both ends were queried, the
+            # edge may have matched either way, so we have to check
+            if object_id in queried_ids and (subject_id not in queried_ids or self._is_symmetric(predicate)):
+                neighbor_ids_by_node[object_id].add(subject_id)
+        answer_node_positions = {answer_node_id: position for position, answer_node_id in enumerate(answer_nodes)}
+        return {node_id: sorted(neighbor_ids, key=lambda neighbor_id: answer_node_positions.get(neighbor_id, len(answer_nodes)))
+                for node_id, neighbor_ids in neighbor_ids_by_node.items()}
+
+    def _is_symmetric(self, predicate):
+        """
+        Only predicates that Biolink says are symmetric count as such; unrecognized predicates and mixins (which
+        BiolinkHelper.is_symmetric() reports as symmetric or unknown) are treated as asymmetric.
+        """
+        if self.biolink_helper is None:
+            self.biolink_helper = BiolinkHelper()
+        return self.biolink_helper.is_symmetric(predicate) is True and \
+            self.biolink_helper.get_root_predicate() in self.biolink_helper.get_ancestors(predicate)
@@ -9,4 +9,10 @@ class Repository(ABC):
 
     @abstractmethod
     def get_node_degree(self, node):
-        pass
\ No newline at end of file
+        pass
+
+    def get_neighbors_of_nodes(self, nodes, limit=-1):
+        return {node.id: self.get_neighbors(node, limit) for node in nodes}
+
+    def get_node_degrees(self, nodes):
+        return {node.id: self.get_node_degree(node) for node in nodes}
@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SqliteConnectionPool:
+
+    def __init__(self, db_path, max_size):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.idle_connections = []
+        self.checked_out_connections = set()
+        self.connections_to_close = set()  # Checked-out connections that are closed when returned (see close())
+        self.num_connections = 0
+        self.generation = 0  # Bumped whenever the pool is closed
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """
+        Closes all of the pool's connections: idle ones right away, and ones that are checked out as soon as they're
+        returned. The pool opens new connections if used again.
+        """
+        with self.condition:
+            for conn in self.idle_connections:
+                conn.close()
+            self.idle_connections.clear()
+            self.connections_to_close.update(self.checked_out_connections)
+            self.checked_out_connections.clear()
+            self.num_connections = 0
+            self.generation += 1
+            self.condition.notify_all()
+
+    def _acquire(self):
+        with self.condition:
+            while not self.idle_connections and self.num_connections >= self.max_size:
+                self.condition.wait()
+            if self.idle_connections:
+                conn = self.idle_connections.pop()
+                self.checked_out_connections.add(conn)
+                return conn
+            self.num_connections += 1
+            generation = self.generation
+        try:
+            # Connections are handed from thread to thread, but only ever used by one thread at a time
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        except BaseException:
+            with self.condition:
+                if generation == self.generation:
+                    self.num_connections -= 1
+                    self.condition.notify()
+            raise
+        with self.condition:
+            if generation == self.generation:
+                self.checked_out_connections.add(conn)
+            else:
+                self.connections_to_close.add(conn)  # The pool was closed while this connection was being opened
+        return conn
+
+    def _release(self, conn):
+        with self.condition:
+            if conn in self.connections_to_close:
+                self.connections_to_close.discard(conn)
+                conn.close()
+            else:
+                self.checked_out_connections.discard(conn)
+                self.idle_connections.append(conn)
+                self.condition.notify()
@@ -1,3 +1,5 @@
+import sqlite3
+
 from code.ARAX.ARAXQuery.Path_Finder.model.Node import Node
 from code.ARAX.ARAXQuery.Path_Finder.repo.NodeDegreeRepo import NodeDegreeRepo
 
@@ -5,3 +7,35 @@ from code.ARAX.ARAXQuery.Path_Finder.repo.NodeDegreeRepo import NodeDegreeRepo
 def test_get_node_degree():
     repo = NodeDegreeRepo()
     assert repo.get_node_degree(Node(id="PUBCHEM.COMPOUND:5105")) == 241
+
+
+def test_get_node_degrees(tmp_path):
+    db_path = str(tmp_path / "kg2c.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE neighbors (id TEXT, neighbor_counts TEXT)")
+    conn.executemany("INSERT INTO neighbors VALUES (?, ?)",
+                     [("CHEBI:1", '{"biolink:NamedThing": 3, "biolink:Gene": 1}'),
+                      ("CHEBI:2", '{"biolink:NamedThing": 5}')])
+    conn.commit()
+    conn.close()
+    repo = NodeDegreeRepo(db_path)
+    assert repo.get_node_degrees([Node("CHEBI:1"), Node("CHEBI:2"), Node("CHEBI:3")]) == \
+           {"CHEBI:1": 3, "CHEBI:2": 5, "CHEBI:3": 0}
+    # Degrees are cached, so they're still available once the database is gone
+    (tmp_path / "kg2c.sqlite").unlink()
+    assert repo.get_node_degree(Node("CHEBI:2")) == 5
+    repo.close()
+
+
+def test_closing_repo_closes_checked_out_connections(tmp_path):
+    db_path = str(tmp_path / "kg2c.sqlite")
+    sqlite3.connect(db_path).close()
+    repo = NodeDegreeRepo(db_path)
+    with repo.connection_pool.connection() as conn:
+        repo.close()  # E.g., while a path finding worker thread is still running
+        conn.execute("SELECT 1")
+    try:
+        conn.execute("SELECT 1")
+        assert False, "Connection should have been closed when it was returned to the closed pool"
+    except sqlite3.ProgrammingError:
+        pass
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+The compact_kg.py file defines a class called CompactKnowledgeGraph, an integer-encoded, array-backed representation of
+a knowledge graph for in-query processing. Node keys, edge keys, predicates, and the (few distinct) lists of categories
+and qnode/qedge keys are interned, so each node/edge is just a handful of integers in typed arrays, rather than an
+openapi model object holding its own strings. Attributes, qualifiers, and sources are stored out of line as pickled
+blobs, which are deduplicated (many edges share identical sources/attributes). Per-qedge adjacency is available in
+CSR form (built lazily). Code that only reads a KnowledgeGraph can be handed the CompactKnowledgeGraph itself: its
+'nodes' and 'edges' are read-only mappings of lightweight views that look like openapi Node/Edge objects, and TRAPI
+model objects (or the TRAPI dict) can be produced from it on request. A structure-only compact KG
+(include_properties=False) skips attributes, qualifiers, and sources altogether.
+
+For now, its only user is Expand's dead-end pruning, which runs resultify over a structure-only copy of the KG it has
+built up. The message's knowledge graph itself (which Expand, Overlay, Filter_KG, and resultify all modify) is still
+made up of openapi model objects.
+"""
+import os
+import pickle
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple, Iterable, Iterator
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.attribute import Attribute
+from openapi_server.models.edge import Edge
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.node import Node
+from openapi_server.models.qualifier import Qualifier
+from openapi_server.models.retrieval_source import RetrievalSource
+
+NONE_ID = -1  # Used in the (signed) id arrays for properties that are None
+IS_SET_CODES = {None: 0, False: 1, True: 2}
+IS_SET_VALUES = [None, False, True]
+
+
+class _Interner:
+    """Assigns consecutive integer ids to distinct (hashable) values"""
+
+    def __init__(self):
+        self.ids = dict()
+        self.values = []
+
+    def intern(self, value) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def get_id(self, value) -> Optional[int]:
+        return self.ids.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class CompactKnowledgeGraph:
+
+    def __init__(self, include_properties: bool = True):
+        self.include_properties = include_properties  # If False, attributes/qualifiers/sources are not stored (None)
+        self.node_keys = _Interner()  # A node's id is the id of its interned key
+        self.edge_keys = _Interner()
+        self.strings = _Interner()  # Predicates
+        self.tuples = _Interner()  # Lists of categories, qnode/qedge keys, and query IDs
+        self.blobs = _Interner()  # Pickled lists of attributes/qualifiers/sources
+        # Node columns (indexed by node id)
+        self.node_alive = bytearray()
+        self.node_names: List[Optional[str]] = []
+        self.node_categories = array("i")
+        self.node_is_set = bytearray()
+        self.node_qnode_keys = array("i")
+        self.node_query_ids = array("i")
+        self.node_attributes = array("i")
+        # Edge columns (indexed by edge id)
+        self.edge_alive = bytearray()
+        self.edge_subjects = array("I")
+        self.edge_objects = array("I")
+        self.edge_predicates = array("i")
+        self.edge_qedge_keys = array("i")
+        self.edge_attributes = array("i")
+        self.edge_qualifiers = array("i")
+        self.edge_sources = array("i")
+        self.num_nodes = 0
+        self.num_edges = 0
+        self._csr_cache = dict()
+        self.nodes = _NodeMapping(self)
+        self.edges = _EdgeMapping(self)
+
+    # ----------------------------------------- PUBLIC METHODS ------------------------------------------------------ #
+
+    @classmethod
+    def from_knowledge_graph(cls, knowledge_graph: KnowledgeGraph,
+                             include_properties: bool = True) -> "CompactKnowledgeGraph":
+        compact_kg = cls(include_properties)
+        for node_key, node in (knowledge_graph.nodes or dict()).items():
+            compact_kg.add_node(node_key, node)
+        for edge_key, edge in (knowledge_graph.edges or dict()).items():
+            compact_kg.add_edge(edge_key, edge)
+        return compact_kg
+
+    @classmethod
+    def from_qg_organized_kg(cls, organized_kg, include_properties: bool = True) -> "CompactKnowledgeGraph":
+        """
+        Creates a compact KG from a QGOrganizedKnowledgeGraph (as used by Expand); the qnode/qedge keys of each
+        node/edge are the qg keys it's listed under.
+        """
+        compact_kg = cls(include_properties)
+        qnode_keys_by_node_key = dict()
+        for qnode_key, nodes in organized_kg.nodes_by_qg_id.items():
+            for node_key, node in nodes.items():
+                qnode_keys_by_node_key.setdefault(node_key, (node, []))[1].append(qnode_key)
+        for node_key, (node, qnode_keys) in qnode_keys_by_node_key.items():
+            compact_kg.add_node(node_key, node, qnode_keys=qnode_keys)
+        qedge_keys_by_edge_key = dict()
+        for qedge_key, edges in organized_kg.edges_by_qg_id.items():
+            for edge_key, edge in edges.items():
+                qedge_keys_by_edge_key.setdefault(edge_key, (edge, []))[1].append(qedge_key)
+        for edge_key, (edge, qedge_keys) in qedge_keys_by_edge_key.items():
+            compact_kg.add_edge(edge_key, edge, qedge_keys=qedge_keys)
+        return compact_kg
+
+    def add_node(self, node_key: str, node: Node, qnode_keys: Optional[Iterable[str]] = None):
+        """
+        Adds the node to the KG, replacing any existing node with the same key. The node's own qnode_keys are used
+        unless qnode_keys are specified.
+        """
+        node_id = self.node_keys.intern(node_key)
+        if qnode_keys is None:
+            qnode_keys = getattr(node, "qnode_keys", None)
+        values = (node.name, self._intern_tuple(node.categories), IS_SET_CODES.get(node.is_set, 0),
+                  self._intern_tuple(qnode_keys), self._intern_tuple(getattr(node, "query_ids", None)),
+                  self._intern_blob(node.attributes))
+        if node_id == len(self.node_alive):
+            self.node_alive.append(1)
+            self.node_names.append(values[0])
+            for column, value in zip(self._get_node_id_columns(), values[1:]):
+                column.append(value)
+            self.num_nodes += 1
+        else:
+            if not self.node_alive[node_id]:
+                self.node_alive[node_id] = 1
+                self.num_nodes += 1
+            self.node_names[node_id] = values[0]
+            for column, value in zip(self._get_node_id_columns(), values[1:]):
+                column[node_id] = value
+
+    def add_edge(self, edge_key: str, edge: Edge, qedge_keys: Optional[Iterable[str]] = None):
+        """
+        Adds the edge to the KG, replacing any existing edge with the same key. The edge's own qedge_keys are used
+        unless qedge_keys are specified. Its subject and object must already be in the KG.
+        """
+        subject_id = self._get_alive_node_id(edge.subject)
+        object_id = self._get_alive_node_id(edge.object)
+        if subject_id is None or object_id is None:
+            raise ValueError(f"Edge {edge_key} refers to a node that isn't in the KG ({edge.subject}, {edge.object})")
+        edge_id = self.edge_keys.intern(edge_key)
+        if qedge_keys is None:
+            qedge_keys = getattr(edge, "qedge_keys", None)
+        values = (subject_id, object_id,
+                  self.strings.intern(edge.predicate) if edge.predicate is not None else NONE_ID,
+                  self._intern_tuple(qedge_keys), self._intern_blob(edge.attributes),
+                  self._intern_blob(edge.qualifiers), self._intern_blob(edge.sources))
+        if edge_id == len(self.edge_alive):
+            self.edge_alive.append(1)
+            for column, value in zip(self._get_edge_columns(), values):
+                column.append(value)
+            self.num_edges += 1
+        else:
+            if not self.edge_alive[edge_id]:
+                self.edge_alive[edge_id] = 1
+                self.num_edges += 1
+            for column, value in zip(self._get_edge_columns(), values):
+                column[edge_id] = value
+        self._csr_cache.clear()
+
+    def remove_nodes(self, node_keys: Iterable[str]):
+        """Removes the nodes (and any edges using them) from the KG"""
+        node_ids = {self._get_existing_node_id(node_key) for node_key in node_keys}
+        for edge_id in list(self._get_alive_edge_ids()):
+            if self.edge_subjects[edge_id] in node_ids or self.edge_objects[edge_id] in node_ids:
+                self._remove_edge_id(edge_id)
+        for node_id in node_ids:
+            self.node_alive[node_id] = 0
+        self.num_nodes -= len(node_ids)
+
+    def remove_edge(self, edge_key: str):
+        edge_id = self._get_alive_edge_id(edge_key)
+        if edge_id is None:
+            raise KeyError(edge_key)
+        self._remove_edge_id(edge_id)
+
+    def set_qnode_keys(self, node_key: str, qnode_keys: Iterable[str]):
+        self.node_qnode_keys[self._get_existing_node_id(node_key)] = self._intern_tuple(qnode_keys)
+
+    def set_qedge_keys(self, edge_key: str, qedge_keys: Iterable[str]):
+        edge_id = self._get_alive_edge_id(edge_key)
+        if edge_id is None:
+            raise KeyError(edge_key)
+        self.edge_qedge_keys[edge_id] = self._intern_tuple(qedge_keys)
+        self._csr_cache.clear()
+
+    def get_csr_adjacency(self, qedge_key: str, by_subject: bool = True) -> Tuple[array, array]:
+        """
+        Returns the adjacency of the edges fulfilling the given qedge in CSR form, as (offsets, edge_ids): the ids of
+        the edges whose subject (or object, if by_subject=False) is node id i are edge_ids[offsets[i]:offsets[i + 1]].
+        Use edge_subjects/edge_objects to get from edge ids to neighboring node ids.
+        """
+        cache_key = (qedge_key, by_subject)
+        if cache_key not in self._csr_cache:
+            node_id_column = self.edge_subjects if by_subject else self.edge_objects
+            qedge_edge_ids = self.get_edge_ids_for_qedge(qedge_key)
+            counts = array("I", bytes(4 * (len(self.node_alive) + 1)))
+            for edge_id in qedge_edge_ids:
+                counts[node_id_column[edge_id] + 1] += 1
+            offsets = array("I", [0])
+            for node_id in range(len(self.node_alive)):
+                offsets.append(offsets[-1] + counts[node_id + 1])
+            edge_ids = array("I", bytes(4 * len(qedge_edge_ids)))
+            next_slot = array("I", offsets[:-1]) if len(offsets) > 1 else array("I")
+            for edge_id in qedge_edge_ids:
+                node_id = node_id_column[edge_id]
+                edge_ids[next_slot[node_id]] = edge_id
+                next_slot[node_id] += 1
+            self._csr_cache[cache_key] = (offsets, edge_ids)
+        return self._csr_cache[cache_key]
+
+    def get_edge_ids_for_qedge(self, qedge_key: str) -> List[int]:
+        matching_tuple_ids = {tuple_id for tuple_id, qg_keys in enumerate(self.tuples.values) if qedge_key in qg_keys}
+        return [edge_id for edge_id in self._get_alive_edge_ids() if self.edge_qedge_keys[edge_id] in matching_tuple_ids]
+
+    def get_node_ids_for_qnode(self, qnode_key: str) -> List[int]:
+        matching_tuple_ids = {tuple_id for tuple_id, qg_keys in enumerate(self.tuples.values) if qnode_key in qg_keys}
+        return [node_id for node_id in range(len(self.node_alive))
+                if self.node_alive[node_id] and self.node_qnode_keys[node_id] in matching_tuple_ids]
+
+    def get_node_key(self, node_id: int) -> str:
+        return self.node_keys.values[node_id]
+
+    def get_edge_key(self, edge_id: int) -> str:
+        return self.edge_keys.values[edge_id]
+
+    def to_knowledge_graph(self) -> KnowledgeGraph:
+        """Materializes the KG as TRAPI model objects"""
+        return KnowledgeGraph(nodes={node_key: node_view.to_model() for node_key, node_view in self.nodes.items()},
+                              edges={edge_key: edge_view.to_model() for edge_key, edge_view in self.edges.items()})
+
+    def to_qg_organized_kg(self):
+        """Materializes the KG as a QGOrganizedKnowledgeGraph (as used by Expand)"""
+        organized_nodes = dict()
+        for node_key, node_view in self.nodes.items():
+            node = node_view.to_model()
+            for qnode_key in node_view.qnode_keys or []:
+                organized_nodes.setdefault(qnode_key, dict())[node_key] = node
+        organized_edges = dict()
+        for edge_key, edge_view in self.edges.items():
+            edge = edge_view.to_model()
+            for qedge_key in edge_view.qedge_keys or []:
+                organized_edges.setdefault(qedge_key, dict())[edge_key] = edge
+        # Note: Imported here because expand_utilities pulls in a lot (e.g., the NodeSynonymizer) that isn't needed otherwise
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/Expand/")
+        from expand_utilities import QGOrganizedKnowledgeGraph
+        return QGOrganizedKnowledgeGraph(nodes=organized_nodes, edges=organized_edges)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the KG as a TRAPI dict (same as KnowledgeGraph.to_dict() on the materialized KG), without creating any
+        model objects along the way.
+        """
+        nodes_dict = dict()
+        for node_id in range(len(self.node_alive)):
+            if self.node_alive[node_id]:
+                nodes_dict[self.node_keys.values[node_id]] = {
+                    "name": self.node_names[node_id],
+                    "categories": self._get_list(self.node_categories[node_id]),
+                    "attributes": self._get_blob(self.node_attributes[node_id]),
+                    "is_set": IS_SET_VALUES[self.node_is_set[node_id]]}
+        edges_dict = dict()
+        for edge_id in self._get_alive_edge_ids():
+            predicate_id = self.edge_predicates[edge_id]
+            edges_dict[self.edge_keys.values[edge_id]] = {
+                "predicate": self.strings.values[predicate_id] if predicate_id != NONE_ID else None,
+                "subject": self.node_keys.values[self.edge_subjects[edge_id]],
+                "object": self.node_keys.values[self.edge_objects[edge_id]],
+                "attributes": self._get_blob(self.edge_attributes[edge_id]),
+                "qualifiers": self._get_blob(self.edge_qualifiers[edge_id]),
+                "sources": self._get_blob(self.edge_sources[edge_id])}
+        return {"nodes": nodes_dict, "edges": edges_dict}
+
+    def get_printable_stats(self) -> str:
+        return (f"{self.num_nodes} nodes, {self.num_edges} edges ({len(self.strings)} distinct predicates, "
+                f"{len(self.tuples)} distinct key/category lists, {len(self.blobs)} distinct attribute/source blobs)")
+
+    # ----------------------------------------- PRIVATE METHODS ----------------------------------------------------- #
+
+    def _get_node_id_columns(self) -> List:
+        return [self.node_categories, self.node_is_set, self.node_qnode_keys, self.node_query_ids,
+                self.node_attributes]
+
+    def _get_edge_columns(self) -> List[array]:
+        return [self.edge_subjects, self.edge_objects, self.edge_predicates, self.edge_qedge_keys,
+                self.edge_attributes, self.edge_qualifiers, self.edge_sources]
+
+    def _intern_tuple(self, values: Optional[Iterable[str]]) -> int:
+        return self.tuples.intern(tuple(values)) if values is not None else NONE_ID
+
+    def _intern_blob(self, models: Optional[list]) -> int:
+        if models is None or not self.include_properties:
+            return NONE_ID
+        model_dicts = [model.to_dict() if hasattr(model, "to_dict") else model for model in models]
+        return self.blobs.intern(pickle.dumps(model_dicts, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _get_list(self, tuple_id: int) -> Optional[List[str]]:
+        return list(self.tuples.values[tuple_id]) if tuple_id != NONE_ID else None
+
+    def _get_blob(self, blob_id: int) -> Optional[List[dict]]:
+        return pickle.loads(self.blobs.values[blob_id]) if blob_id != NONE_ID else None
+
+    def _get_alive_node_id(self, node_key: str) -> Optional[int]:
+        node_id = self.node_keys.get_id(node_key)
+        return node_id if node_id is not None and self.node_alive[node_id] else None
+
+    def _get_existing_node_id(self, node_key: str) -> int:
+        node_id = self._get_alive_node_id(node_key)
+        if node_id is None:
+            raise KeyError(node_key)
+        return node_id
+
+    def _get_alive_edge_id(self, edge_key: str) -> Optional[int]:
+        edge_id = self.edge_keys.get_id(edge_key)
+        return edge_id if edge_id is not None and self.edge_alive[edge_id] else None
+
+    def _get_alive_edge_ids(self) -> Iterator[int]:
+        return (edge_id for edge_id in range(len(self.edge_alive)) if self.edge_alive[edge_id])
+
+    def _remove_edge_id(self, edge_id: int):
+        self.edge_alive[edge_id] = 0
+        self.num_edges -= 1
+        self._csr_cache.clear()
+
+
+class NodeView:
+    """A read-only, Node-like view of a node in a CompactKnowledgeGraph"""
+    __slots__ = ("compact_kg", "node_id")
+
+    def __init__(self, compact_kg: CompactKnowledgeGraph, node_id: int):
+        self.compact_kg = compact_kg
+        self.node_id = node_id
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.compact_kg.node_names[self.node_id]
+
+    @property
+    def categories(self) -> Optional[List[str]]:
+        return self.compact_kg._get_list(self.compact_kg.node_categories[self.node_id])
+
+    @property
+    def is_set(self) -> Optional[bool]:
+        return IS_SET_VALUES[self.compact_kg.node_is_set[self.node_id]]
+
+    @property
+    def qnode_keys(self) -> Optional[List[str]]:
+        return self.compact_kg._get_list(self.compact_kg.node_qnode_keys[self.node_id])
+
+    @property
+    def query_ids(self) -> Optional[List[str]]:
+        return self.compact_kg._get_list(self.compact_kg.node_query_ids[self.node_id])
+
+    @property
+    def attributes(self) -> Optional[List[Attribute]]:
+        return _deserialize_list(self.compact_kg._get_blob(self.compact_kg.node_attributes[self.node_id]), Attribute)
+
+    def to_model(self) -> Node:
+        node = Node(name=self.name, categories=self.categories, attributes=self.attributes, is_set=self.is_set)
+        node.qnode_keys = self.qnode_keys
+        query_ids = self.query_ids
+        if query_ids is not None:
+            node.query_ids = query_ids
+        return node
+
+
+class EdgeView:
+    """A read-only, Edge-like view of an edge in a CompactKnowledgeGraph"""
+    __slots__ = ("compact_kg", "edge_id")
+
+    def __init__(self, compact_kg: CompactKnowledgeGraph, edge_id: int):
+        self.compact_kg = compact_kg
+        self.edge_id = edge_id
+
+    @property
+    def subject(self) -> str:
+        return self.compact_kg.node_keys.values[self.compact_kg.edge_subjects[self.edge_id]]
+
+    @property
+    def object(self) -> str:
+        return self.compact_kg.node_keys.values[self.compact_kg.edge_objects[self.edge_id]]
+
+    @property
+    def predicate(self) -> Optional[str]:
+        predicate_id = self.compact_kg.edge_predicates[self.edge_id]
+        return self.compact_kg.strings.values[predicate_id] if predicate_id != NONE_ID else None
+
+    @property
+    def qedge_keys(self) -> Optional[List[str]]:
+        return self.compact_kg._get_list(self.compact_kg.edge_qedge_keys[self.edge_id])
+
+    @property
+    def attributes(self) -> Optional[List[Attribute]]:
+        return _deserialize_list(self.compact_kg._get_blob(self.compact_kg.edge_attributes[self.edge_id]), Attribute)
+
+    @property
+    def qualifiers(self) -> Optional[List[Qualifier]]:
+        return _deserialize_list(self.compact_kg._get_blob(self.compact_kg.edge_qualifiers[self.edge_id]), Qualifier)
+
+    @property
+    def sources(self) -> Optional[List[RetrievalSource]]:
+        return _deserialize_list(self.compact_kg._get_blob(self.compact_kg.edge_sources[self.edge_id]), RetrievalSource)
+
+    def to_model(self) -> Edge:
+        edge = Edge(predicate=self.predicate, subject=self.subject, object=self.object, attributes=self.attributes,
+                    qualifiers=self.qualifiers, sources=self.sources)
+        edge.qedge_keys = self.qedge_keys
+        return edge
+
+
+class _NodeMapping(Mapping):
+    """Read-only mapping of node key to NodeView (so a CompactKnowledgeGraph can stand in for a KnowledgeGraph)"""
+
+    def __init__(self, compact_kg: CompactKnowledgeGraph):
+        self.compact_kg = compact_kg
+
+    def __getitem__(self, node_key: str) -> NodeView:
+        node_id = self.compact_kg._get_alive_node_id(node_key)
+        if node_id is None:
+            raise KeyError(node_key)
+        return NodeView(self.compact_kg, node_id)
+
+    def __iter__(self) -> Iterator[str]:
+        node_alive = self.compact_kg.node_alive
+        return (node_key for node_id, node_key in enumerate(self.compact_kg.node_keys.values) if node_alive[node_id])
+
+    def __len__(self) -> int:
+        return self.compact_kg.num_nodes
+
+
+class _EdgeMapping(Mapping):
+    """Read-only mapping of edge key to EdgeView (so a CompactKnowledgeGraph can stand in for a KnowledgeGraph)"""
+
+    def __init__(self, compact_kg: CompactKnowledgeGraph):
+        self.compact_kg = compact_kg
+
+    def __getitem__(self, edge_key: str) -> EdgeView:
+        edge_id = self.compact_kg._get_alive_edge_id(edge_key)
+        if edge_id is None:
+            raise KeyError(edge_key)
+        return EdgeView(self.compact_kg, edge_id)
+
+    def __iter__(self) -> Iterator[str]:
+        edge_alive = self.compact_kg.edge_alive
+        return (edge_key for edge_id, edge_key in enumerate(self.compact_kg.edge_keys.values) if edge_alive[edge_id])
+
+    def __len__(self) -> int:
+        return self.compact_kg.num_edges
+
+
+def _deserialize_list(model_dicts: Optional[List[dict]], model_class) -> Optional[list]:
+    return [model_class.from_dict(model_dict) for model_dict in model_dicts] if model_dicts is not None else None
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+The kg_index_by_qg.py file defines a class called KGIndexByQG, which indexes the nodes and edges of a message's
+knowledge graph by the qnode/qedge keys they fulfill (plus, for each qedge, its edges by subject, object, and node
+pair). These are the lookups Resultify needs in order to enumerate result graphs. Rather than being rebuilt from
+scratch on every resultify call, the index is kept on the message and brought up to date by diffing it against the
+KG when resultify next runs: only nodes/edges that have been added, removed, or re-annotated since (e.g., by Expand or
+Filter_KG) are re-indexed. Callers that know exactly which nodes/edges they removed can instead drop just those.
+The index is made of plain dicts and sets, so it can be pickled or shared with forked worker processes.
+"""
+from typing import Dict, Set, Tuple, Optional, List, Iterable
+
+KG_INDEX_ATTRIBUTE = "_kg_index_by_qg"  # Name of the (non-TRAPI) attribute the index is stored under on a Message
+
+
+class KGIndexByQG:
+
+    def __init__(self):
+        self.node_keys_by_qg_key: Dict[str, Set[str]] = dict()
+        self.edge_keys_by_qg_key: Dict[str, Set[str]] = dict()
+        self.edge_keys_by_subject: Dict[str, Dict[str, Set[str]]] = dict()
+        self.edge_keys_by_object: Dict[str, Dict[str, Set[str]]] = dict()
+        self.edge_keys_by_node_pair: Dict[str, Dict[Tuple[str, str], Set[str]]] = dict()
+        self.edge_keys_by_node_pair_undirected: Dict[str, Dict[Tuple[str, str], Set[str]]] = dict()
+        # What each node/edge looked like when it was last indexed (so we can tell when it changes)
+        self.indexed_nodes: Dict[str, List[str]] = dict()
+        self.indexed_edges: Dict[str, Tuple[str, str, List[str]]] = dict()
+
+    # ----------------------------------------- PUBLIC METHODS ------------------------------------------------------ #
+
+    @classmethod
+    def build(cls, knowledge_graph) -> "KGIndexByQG":
+        kg_index = cls()
+        kg_index.sync(knowledge_graph)
+        return kg_index
+
+    def sync(self, knowledge_graph) -> int:
+        """
+        Brings the index up to date with the given knowledge graph. Returns the number of nodes/edges (re-)indexed or
+        dropped from the index.
+        """
+        nodes = knowledge_graph.nodes if knowledge_graph is not None and knowledge_graph.nodes else dict()
+        edges = knowledge_graph.edges if knowledge_graph is not None and knowledge_graph.edges else dict()
+        num_changed = 0
+        for node_key in [node_key for node_key in self.indexed_nodes if node_key not in nodes]:
+            self._unindex_node(node_key)
+            num_changed += 1
+        for edge_key in [edge_key for edge_key in self.indexed_edges if edge_key not in edges]:
+            self._unindex_edge(edge_key)
+            num_changed += 1
+        # Nodes/edges are compared against copies of what they looked like, without building anything for unchanged ones
+        for node_key, node in nodes.items():
+            qnode_keys = node.qnode_keys or []
+            indexed_qnode_keys = self.indexed_nodes.get(node_key)
+            if indexed_qnode_keys != qnode_keys:
+                if indexed_qnode_keys is not None:
+                    self._unindex_node(node_key)
+                self._index_node(node_key, list(qnode_keys))
+                num_changed += 1
+        for edge_key, edge in edges.items():
+            qedge_keys = edge.qedge_keys or []
+            indexed_edge_info = self.indexed_edges.get(edge_key)
+            if indexed_edge_info is None or indexed_edge_info[2] != qedge_keys or \
+                    indexed_edge_info[0] != edge.subject or indexed_edge_info[1] != edge.object:
+                if indexed_edge_info is not None:
+                    self._unindex_edge(edge_key)
+                self._index_edge(edge_key, (edge.subject, edge.object, list(qedge_keys)))
+                num_changed += 1
+        return num_changed
+
+    def discard(self, node_keys: Iterable[str] = (), edge_keys: Iterable[str] = ()):
+        """
+        Drops the given nodes/edges (which have been removed from the KG) from the index, without a full sync().
+        """
+        for node_key in node_keys:
+            if node_key in self.indexed_nodes:
+                self._unindex_node(node_key)
+        for edge_key in edge_keys:
+            if edge_key in self.indexed_edges:
+                self._unindex_edge(edge_key)
+
+    def get_edge_keys_by_node_pair(self, ignore_edge_direction: bool) -> Dict[str, Dict[Tuple[str, str], Set[str]]]:
+        return self.edge_keys_by_node_pair_undirected if ignore_edge_direction else self.edge_keys_by_node_pair
+
+    def equals(self, other: "KGIndexByQG") -> bool:
+        return vars(self) == vars(other)
+
+    # ----------------------------------------- PRIVATE METHODS ----------------------------------------------------- #
+
+    def _index_node(self, node_key: str, qnode_keys: List[str]):
+        self.indexed_nodes[node_key] = qnode_keys
+        for qnode_key in qnode_keys:
+            self.node_keys_by_qg_key.setdefault(qnode_key, set()).add(node_key)
+
+    def _unindex_node(self, node_key: str):
+        for qnode_key in self.indexed_nodes.pop(node_key):
+            _discard(self.node_keys_by_qg_key, qnode_key, node_key)
+
+    def _index_edge(self, edge_key: str, edge_info: Tuple[str, str, List[str]]):
+        self.indexed_edges[edge_key] = edge_info
+        subject_key, object_key, qedge_keys = edge_info
+        for qedge_key in qedge_keys:
+            self.edge_keys_by_qg_key.setdefault(qedge_key, set()).add(edge_key)
+            self.edge_keys_by_subject.setdefault(qedge_key, dict()).setdefault(subject_key, set()).add(edge_key)
+            self.edge_keys_by_object.setdefault(qedge_key, dict()).setdefault(object_key, set()).add(edge_key)
+            self.edge_keys_by_node_pair.setdefault(qedge_key, dict()).setdefault((subject_key, object_key), set()).add(edge_key)
+            edge_keys_by_undirected_pair = self.edge_keys_by_node_pair_undirected.setdefault(qedge_key, dict())
+            edge_keys_by_undirected_pair.setdefault((subject_key, object_key), set()).add(edge_key)
+            edge_keys_by_undirected_pair.setdefault((object_key, subject_key), set()).add(edge_key)
+
+    def _unindex_edge(self, edge_key: str):
+        subject_key, object_key, qedge_keys = self.indexed_edges.pop(edge_key)
+        for qedge_key in qedge_keys:
+            _discard(self.edge_keys_by_qg_key, qedge_key, edge_key)
+            _discard_nested(self.edge_keys_by_subject, qedge_key, subject_key, edge_key)
+            _discard_nested(self.edge_keys_by_object, qedge_key, object_key, edge_key)
+            _discard_nested(self.edge_keys_by_node_pair, qedge_key, (subject_key, object_key), edge_key)
+            _discard_nested(self.edge_keys_by_node_pair_undirected, qedge_key, (subject_key, object_key), edge_key)
+            _discard_nested(self.edge_keys_by_node_pair_undirected, qedge_key, (object_key, subject_key), edge_key)
+
+
+def _discard(sets_by_key: dict, key, value):
+    # Empty sets are deleted so that an updated index looks exactly like a freshly built one
+    value_set = sets_by_key.get(key)
+    if value_set is not None:
+        value_set.discard(value)
+        if not value_set:
+            del sets_by_key[key]
+
+
+def _discard_nested(sets_by_key_by_qg_key: dict, qg_key: str, key, value):
+    sets_by_key = sets_by_key_by_qg_key.get(qg_key)
+    if sets_by_key is not None:
+        _discard(sets_by_key, key, value)
+        if not sets_by_key:
+            del sets_by_key_by_qg_key[qg_key]
+
+
+def get_kg_index_by_qg(message) -> KGIndexByQG:
+    """
+    Returns the message's KG index, creating it (and storing it on the message) if the message doesn't have one yet.
+    The returned index is up to date with message.knowledge_graph.
+    """
+    kg_index = getattr(message, KG_INDEX_ATTRIBUTE, None)
+    if kg_index is None:
+        kg_index = KGIndexByQG.build(message.knowledge_graph)
+        setattr(message, KG_INDEX_ATTRIBUTE, kg_index)
+    else:
+        kg_index.sync(message.knowledge_graph)
+    return kg_index
+
+
+def update_kg_index_by_qg(message) -> Optional[int]:
+    """
+    Brings the message's KG index up to date after its KG has been modified; does nothing if the message has no index
+    (i.e., it hasn't been resultified yet). Returns the number of nodes/edges that had to be (re-)indexed, if any.
+    """
+    kg_index = getattr(message, KG_INDEX_ATTRIBUTE, None)
+    if kg_index is None:
+        return None
+    return kg_index.sync(message.knowledge_graph)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+The lazy_trapi_models.py file defines LazyNode and LazyEdge, drop-in subclasses of the openapi Node and Edge models
+that are hydrated lazily from the TRAPI dicts they're loaded from. Loading a large knowledge graph (a user's query
+with a big knowledge_graph, or a KP's answer) with Model.from_dict() builds every attribute, qualifier, and source of
+every node and edge as a model object up front, even though most passes only read ids, predicates, and categories.
+
+A lazy node or edge sets its plain fields (names, categories, predicates, subjects, objects...) right away, via the
+models' own setters, so required fields are validated just like from_dict() does. Its other fields (attributes,
+qualifiers, sources) are only deserialized into model objects the first time they're read. The TRAPI dicts are never
+modified: a field that's set before it's read simply replaces the dict it would have been hydrated from.
+"""
+import os
+import sys
+import threading
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server import util
+from openapi_server.models.edge import Edge
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.node import Node
+
+PLAIN_FIELD_TYPES = (str, int, float, bool, List[str])  # Fields of these types are cheap to set right away
+
+_hydration_lock = threading.Lock()
+
+
+class _LazyModel:
+    """
+    Mixin for a lazily hydrated subclass of an openapi model class; _lazy_fields maps each of the model's fields that
+    is hydrated lazily to its openapi type and the model class's property for it.
+    """
+    _lazy_fields = dict()
+
+    @classmethod
+    def from_dict(cls, dikt):
+        if dikt is None:
+            return None
+        instance = cls()
+        unhydrated = set()
+        for attr, attr_type in instance.openapi_types.items():
+            json_key = instance.attribute_map[attr]
+            if json_key in dikt:
+                if attr in cls._lazy_fields:
+                    # Set the field to its TRAPI value for now (so the model's setter still validates it)
+                    cls._lazy_fields[attr][1].fset(instance, dikt[json_key])
+                    if dikt[json_key] is not None:
+                        unhydrated.add(attr)
+                else:
+                    setattr(instance, attr, util._deserialize(dikt[json_key], attr_type))
+        if unhydrated:
+            instance._unhydrated = unhydrated
+        return instance
+
+    def hydrate(self):
+        """Deserializes all of this model's fields that haven't been read yet, and returns the model"""
+        for attr in list(self.__dict__.get("_unhydrated", ())):
+            self._hydrate_field(attr)
+        return self
+
+    def __eq__(self, other):
+        if isinstance(other, _LazyModel):
+            other.hydrate()
+        return self.hydrate().__dict__ == other.__dict__
+
+    def _hydrate_field(self, attr: str):
+        with _hydration_lock:
+            unhydrated = self.__dict__.get("_unhydrated")
+            if unhydrated is None or attr not in unhydrated:
+                return  # Another thread got to it first
+            attr_type, model_property = self._lazy_fields[attr]
+            model_property.fset(self, util._deserialize(model_property.fget(self), attr_type))
+            self._mark_hydrated(attr)
+
+    def _mark_hydrated(self, attr: str):
+        unhydrated = self.__dict__.get("_unhydrated")
+        if unhydrated is not None:
+            unhydrated.discard(attr)
+            if not unhydrated:
+                del self._unhydrated  # So a fully hydrated model's __dict__ is just like a regular model's
+
+
+class LazyNode(_LazyModel, Node):
+    pass
+
+
+class LazyEdge(_LazyModel, Edge):
+    pass
+
+
+def knowledge_graph_from_dict(knowledge_graph_dict: Optional[dict]) -> Optional[KnowledgeGraph]:
+    """
+    Returns the same KnowledgeGraph as KnowledgeGraph.from_dict(), but with LazyNodes and LazyEdges
+    """
+    if knowledge_graph_dict is None:
+        return None
+    knowledge_graph = KnowledgeGraph()
+    if "nodes" in knowledge_graph_dict:
+        nodes = knowledge_graph_dict["nodes"]
+        knowledge_graph.nodes = {node_key: LazyNode.from_dict(node) for node_key, node in nodes.items()} \
+            if nodes is not None else None
+    if "edges" in knowledge_graph_dict:
+        edges = knowledge_graph_dict["edges"]
+        knowledge_graph.edges = {edge_key: LazyEdge.from_dict(edge) for edge_key, edge in edges.items()} \
+            if edges is not None else None
+    return knowledge_graph
+
+
+def get_unhydrated_value(model, attr: str):
+    """
+    Returns the TRAPI value (e.g., a list of dicts) that the given field of a lazy model will be hydrated from, or None
+    if the field has already been hydrated (or the model isn't lazy). Reading it this way doesn't hydrate the field.
+    """
+    with _hydration_lock:
+        unhydrated = model.__dict__.get("_unhydrated")
+        if unhydrated is None or attr not in unhydrated:
+            return None
+        return model._lazy_fields[attr][1].fget(model)
+
+
+def set_unhydrated_value(model, attr: str, value):
+    """
+    Replaces the TRAPI value that the given (not yet hydrated) field of a lazy model will be hydrated from, so that the
+    field can be changed without hydrating it. The TRAPI dict the model was loaded from is left untouched.
+    """
+    with _hydration_lock:
+        unhydrated = model.__dict__.get("_unhydrated")
+        if unhydrated is None or attr not in unhydrated:
+            raise ValueError(f"The {attr} of this {type(model).__name__} have already been hydrated")
+        model._lazy_fields[attr][1].fset(model, value)
+
+
+def _make_lazy_property(attr: str, model_property: property) -> property:
+    def get_value(self):
+        unhydrated = self.__dict__.get("_unhydrated")
+        if unhydrated is not None and attr in unhydrated:
+            self._hydrate_field(attr)
+        return model_property.fget(self)
+
+    def set_value(self, value):
+        with _hydration_lock:
+            model_property.fset(self, value)
+            self._mark_hydrated(attr)
+
+    return property(get_value, set_value, doc=model_property.__doc__)
+
+
+def _add_lazy_properties(lazy_class, model_class):
+    lazy_fields = dict()
+    for attr, attr_type in model_class().openapi_types.items():
+        if attr_type not in PLAIN_FIELD_TYPES:
+            model_property = getattr(model_class, attr)
+            lazy_fields[attr] = (attr_type, model_property)
+            setattr(lazy_class, attr, _make_lazy_property(attr, model_property))
+    lazy_class._lazy_fields = lazy_fields
+
+
+_add_lazy_properties(LazyNode, Node)
+_add_lazy_properties(LazyEdge, Edge)
@@ -0,0 +1,79 @@
+"""
+The mmap_index.py file defines what ARAX's read-only, memory-mapped index files (the synonymizer snapshot, the NGD
+PMID index, and the KG2c neighbor count index) have in common: how they're laid out, written, opened, and tied to the
+version of the file they were built from. Because such an index is simply mmap'd, all worker processes on a server
+share its pages through the OS page cache, rather than each loading its own copy of the data.
+
+Each index file is a fixed-size header followed by a number of sections. The header is packed with the index's own
+struct format, which starts with an 8-byte magic and ends with the offset of each section and the total file size.
+All integers are little-endian, and every section starts on an 8-byte boundary, so that it can be viewed as an array
+of integers right in the mapped file.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from typing import List, Tuple
+
+SECTION_ALIGNMENT = 8
+
+
+def write_index_file(index_path: str, header_format: str, header_fields: tuple, sections: List[bytes]):
+    """
+    Writes an index file made up of the given sections. header_fields are the header's leading fields (the magic,
+    counts, stamps, etc.); the section offsets and the file size are filled in after them.
+    """
+    if sys.byteorder != "little":
+        raise ValueError("Memory-mapped indexes can only be built on little-endian machines")
+    section_offsets = []
+    position = struct.calcsize(header_format)
+    for section in sections:
+        position += -position % SECTION_ALIGNMENT
+        section_offsets.append(position)
+        position += len(section)
+    header = struct.pack(header_format, *header_fields, *section_offsets, position)
+
+    # Each writer gets its own temp file, which is then renamed into place, so that no process ever maps a
+    # half-written index (even if several are building the same one at once)
+    index_dir, index_name = os.path.split(os.path.abspath(index_path))
+    with tempfile.NamedTemporaryFile(dir=index_dir, prefix=f"{index_name}.", suffix=".tmp", delete=False) as temp_file:
+        try:
+            temp_file.write(header)
+            for section, section_offset in zip(sections, section_offsets):
+                temp_file.write(b"\0" * (section_offset - temp_file.tell()))
+                temp_file.write(section)
+            os.chmod(temp_file.name, 0o644)  # Temp files are only readable by their owner
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+    os.replace(temp_file.name, index_path)
+
+
+def open_index_file(index_path: str, header_format: str, magic: bytes, kind: str) -> Tuple[mmap.mmap, tuple]:
+    """
+    Maps the given index file (read-only) and returns the map along with its header fields, minus the magic and the
+    file size (i.e., the counts, stamps, etc. followed by the section offsets).
+    """
+    if sys.byteorder != "little":
+        raise ValueError("Memory-mapped indexes can only be read on little-endian machines")
+    with open(index_path, "rb") as index_file:
+        index_mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        header_fields = struct.unpack_from(header_format, index_mmap, 0)
+    except struct.error:
+        header_fields = (None,)
+    if header_fields[0] != magic or header_fields[-1] != len(index_mmap):
+        index_mmap.close()
+        raise ValueError(f"{index_path} is not a valid {kind}")
+    return index_mmap, header_fields[1:-1]
+
+
+def get_file_stamp(file_path: str) -> Tuple[int, int]:
+    """
+    Returns the (size, modification time in ns) of a file, e.g., to identify the version of the source file an index
+    was built from. The size alone isn't enough: sqlite files grow in whole pages, so a rebuilt one can have the
+    same size.
+    """
+    stat_result = os.stat(file_path)
+    return stat_result.st_size, stat_result.st_mtime_ns
@@ -0,0 +1,204 @@
+"""
+The trapi_json_encoder.py file defines a fast serializer for TRAPI model objects (a Response envelope, a Message, a
+KnowledgeGraph, a Result, etc.). It produces the same data as the openapi-generator Model.to_dict(), without going
+through its generic recursion:
+
+- model_to_dict() converts a model to the same dict as to_dict() does, using each model class's (cached) field list
+  and a fast path for plain values; ResponseCache uses it to get the dict it stores.
+- iter_model_json() writes the JSON for a model a chunk at a time: the model and the models it directly holds (e.g.
+  the message and its knowledge graph) are walked field by field, and each item of their lists and dicts (each
+  knowledge graph node or edge, each result, each auxiliary graph) is converted and encoded on its own. So a large
+  response never has to exist as one big dict plus one big string, and its first chunk can be sent long before its
+  last result is encoded.
+
+Items are encoded with orjson when it's installed (its output is compact, and not ASCII-escaped), and with the json
+module otherwise (in which case the output is byte-for-byte that of json.dumps(model.to_dict(), sort_keys=True)).
+Non-finite floats (NaN, inf), which JSON can't represent, are written as null either way: since part of the response
+may already have been sent by the time one is found, failing the whole response (like json.dumps(...,
+allow_nan=False)) isn't an option.
+"""
+import json
+import math
+import os
+import sys
+from typing import Iterator, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.base_model_ import Model
+
+
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+
+CHUNK_SIZE = 1 << 20  # Encoded pieces are gathered into chunks of about this many characters
+PLAIN_TYPES = frozenset([str, int, float, bool, type(None)])
+
+_model_fields = dict()  # model class -> its fields (from the keys of its openapi_types), in order
+
+
+def model_to_dict(model: Model) -> dict:
+    """
+    Returns the same dict as model.to_dict().
+    """
+    result = dict()
+    model_vars = model.__dict__
+    for attr, private_attr, plain_key in _get_model_fields(model):
+        value = model_vars[private_attr] if private_attr is not None else getattr(model, attr)
+        if value.__class__ in PLAIN_TYPES:
+            result[plain_key] = value
+        elif isinstance(value, list):
+            result[attr] = [item if item.__class__ in PLAIN_TYPES else _to_dict(item) for item in value]
+        elif hasattr(value, "to_dict"):
+            result[attr] = _to_dict(value)
+        elif isinstance(value, dict):
+            result[attr] = {key: _convert_dict_value(item) for key, item in value.items()}
+        else:
+            result[plain_key] = value
+    return result
+
+
+def iter_model_json(model: Model, chunk_size: int = CHUNK_SIZE, sort_keys: bool = True,
+                    use_orjson: Optional[bool] = None) -> Iterator[str]:
+    """
+    Yields the JSON encoding of a TRAPI model object in chunks of about chunk_size characters. orjson is used if it's
+    installed, unless use_orjson is False.
+    """
+    encoder = _JSONEncoder(sort_keys, orjson is not None if use_orjson is None else use_orjson)
+    pieces = []
+    num_buffered_chars = 0
+    for piece in _iter_model(model, encoder):
+        pieces.append(piece)
+        num_buffered_chars += len(piece)
+        if num_buffered_chars >= chunk_size:
+            yield "".join(pieces)
+            pieces = []
+            num_buffered_chars = 0
+    if pieces:
+        yield "".join(pieces)
+
+
+def dumps_model(model: Model, sort_keys: bool = True, use_orjson: Optional[bool] = None) -> str:
+    return "".join(iter_model_json(model, sort_keys=sort_keys, use_orjson=use_orjson))
+
+
+class _JSONEncoder:
+
+    def __init__(self, sort_keys: bool, use_orjson: bool):
+        if use_orjson and orjson is None:
+            raise ValueError("orjson is not installed")
+        self.sort_keys = sort_keys
+        self.use_orjson = use_orjson
+        self.item_separator, self.key_separator = (",", ":") if use_orjson else (", ", ": ")
+        self.orjson_options = (orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)) if use_orjson else 0
+
+    def encode(self, value) -> str:
+        if self.use_orjson:
+            try:
+                return orjson.dumps(value, option=self.orjson_options).decode("utf-8")
+            except orjson.JSONEncodeError:
+                pass  # e.g. integers too big for 64 bits; the json module (below) can encode those
+        try:
+            return json.dumps(value, allow_nan=False, sort_keys=self.sort_keys, ensure_ascii=not self.use_orjson,
+                              separators=(self.item_separator, self.key_separator))
+        except ValueError:
+            eprint("[trapi_json_encoder]: writing non-finite float values as null")
+            return json.dumps(_replace_non_finite_floats(value), allow_nan=False, sort_keys=self.sort_keys,
+                              ensure_ascii=not self.use_orjson, separators=(self.item_separator, self.key_separator))
+
+
+def _iter_model(model: Model, encoder: _JSONEncoder) -> Iterator[str]:
+    # Mirrors model_to_dict(), writing each field as it goes
+    fields = dict()
+    for attr, _, _ in _get_model_fields(model):
+        value = getattr(model, attr)
+        if attr == '_not' and not (isinstance(value, (list, dict)) or hasattr(value, "to_dict")):
+            attr = 'not'
+        fields[attr] = value
+    separator = ""
+    yield "{"
+    for key, value in (sorted(fields.items()) if encoder.sort_keys else fields.items()):
+        yield f"{separator}{encoder.encode(key)}{encoder.key_separator}"
+        separator = encoder.item_separator
+        if type(value) in PLAIN_TYPES:
+            yield encoder.encode(value)
+        elif isinstance(value, list):
+            yield "["
+            for index, item in enumerate(value):
+                yield f"{encoder.item_separator if index else ''}{encoder.encode(_to_dict(item))}"
+            yield "]"
+        elif _is_walkable(value):
+            yield from _iter_model(value, encoder)
+        elif hasattr(value, "to_dict"):
+            yield encoder.encode(value.to_dict())
+        elif isinstance(value, dict):
+            items = sorted(value.items()) if encoder.sort_keys else value.items()
+            yield "{"
+            for index, (item_key, item) in enumerate(items):
+                yield (f"{encoder.item_separator if index else ''}{encoder.encode(item_key)}{encoder.key_separator}"
+                       f"{encoder.encode(_convert_dict_value(item))}")
+            yield "}"
+        else:
+            yield encoder.encode(value)
+    yield "}"
+
+
+def _get_model_fields(model: Model) -> tuple:
+    """
+    Returns (field name, private attribute, key) for each field of the model, where the private attribute is where
+    the field's value is stored (so it can be read straight from the model's __dict__), if the field's getter does
+    nothing but return it, and the key is the field's key in to_dict() (when its value is a plain value).
+    """
+    # openapi_types is set per instance, but it's the same for every instance of a model class
+    fields = _model_fields.get(type(model))
+    if fields is None:
+        fields = []
+        for attr in model.openapi_types:
+            getter = getattr(getattr(type(model), attr, None), "fget", None)
+            private_attr = f"_{attr}"
+            is_plain_getter = getter is not None and getter.__code__.co_code == _plain_getter.__code__.co_code and \
+                getter.__code__.co_names == (private_attr,) and private_attr in model.__dict__
+            fields.append((attr, private_attr if is_plain_getter else None, 'not' if attr == '_not' else attr))
+        fields = _model_fields[type(model)] = tuple(fields)
+    return fields
+
+
+def _plain_getter(self):
+    """A getter like the ones openapi-generator writes"""
+    return self._value
+
+
+def _is_walkable(value) -> bool:
+    # Models that override to_dict() (or aren't Models at all) are left to convert themselves
+    return isinstance(value, Model) and type(value).to_dict is Model.to_dict
+
+
+def _to_dict(value):
+    if type(value) in PLAIN_TYPES:
+        return value
+    if _is_walkable(value):
+        return model_to_dict(value)
+    return value.to_dict() if hasattr(value, "to_dict") else value
+
+
+def _convert_dict_value(value):
+    # Model.to_dict() converts the values of dict fields two levels deep
+    if isinstance(value, list):
+        return [_to_dict(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_dict(item) for key, item in value.items()}
+    return _to_dict(value)
+
+
+def _replace_non_finite_floats(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _replace_non_finite_floats(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite_floats(item) for item in value]
+    return value
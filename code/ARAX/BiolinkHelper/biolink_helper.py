@@ -10,8 +10,9 @@ import os
 import sys
 import pathlib
 import pickle
+import threading
 from collections import defaultdict
-from typing import Optional, List, Set, Dict, Union, Tuple
+from typing import Optional, List, Set, Dict, FrozenSet, Union, Tuple
 
 import requests
 import yaml
@@ -20,11 +21,16 @@ from treelib import Tree
 def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
 
 class BiolinkHelper:
+    """
+    All BiolinkHelpers for the same Biolink version share one set of lookups (see _BiolinkLookups), which is loaded
+    the first time a BiolinkHelper is created for that version. So creating a BiolinkHelper is cheap, and a server
+    that creates one before forking its workers shares the lookups with all of them.
+    """
+    _shared_lookups = dict()  # Biolink version -> its _BiolinkLookups
+    _lock = threading.Lock()
+    _current_arax_biolink_version = None
 
     def __init__(self, biolink_version: Optional[str] = None, is_test: bool = False):
-        timestamp = str(datetime.datetime.now().isoformat())
-        eprint(f"{timestamp}: DEBUG: In BiolinkHelper init")
-
         self.biolink_version = biolink_version if biolink_version else self.get_current_arax_biolink_version()
         self.root_category = "biolink:NamedThing"
         self.root_predicate = "biolink:related_to"
@@ -32,12 +38,6 @@ class BiolinkHelper:
         biolink_helper_dir = os.path.dirname(os.path.abspath(__file__))
         self.biolink_lookup_map_path = f"{biolink_helper_dir}/biolink_lookup_map_{self.biolink_version}_v4.pickle"
 
-        timestamp = str(datetime.datetime.now().isoformat())
-        eprint(f"{timestamp}: DEBUG: Loading BL lookup map...")
-        self.biolink_lookup_map = self._load_biolink_lookup_map(is_test=is_test)
-        timestamp = str(datetime.datetime.now().isoformat())
-        eprint(f"{timestamp}: DEBUG: Done loading BL lookup map")
-
         protein_like_categories = {"biolink:Protein", "biolink:Gene"}
         disease_like_categories = {"biolink:Disease", "biolink:PhenotypicFeature", "biolink:DiseaseOrPhenotypicFeature"}
         self.arax_conflations = {
@@ -48,6 +48,9 @@ class BiolinkHelper:
             "biolink:DiseaseOrPhenotypicFeature": disease_like_categories
         }
 
+        self.lookups = self._get_lookups(is_test=is_test)
+        self.biolink_lookup_map = self.lookups.biolink_lookup_map
+
     def get_ancestors(self, biolink_items: Union[str, List[str]], include_mixins: bool = True, include_conflations: bool = True) -> List[str]:
         """
         Returns the ancestors of Biolink categories, predicates, category mixins, or predicate mixins. Input
@@ -58,30 +61,8 @@ class BiolinkHelper:
         be included in that case). Inclusion of ARAX-defined conflations (e.g., gene == protein) can be controlled via
         the include_conflations parameter.
         """
-        input_item_set = self._convert_to_set(biolink_items)
-        categories = input_item_set.intersection(set(self.biolink_lookup_map["categories"]))
-        predicates = input_item_set.intersection(set(self.biolink_lookup_map["predicates"]))
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        aspects = input_item_set.intersection(set(self.biolink_lookup_map["aspects"]))
-        directions = input_item_set.intersection(set(self.biolink_lookup_map["directions"]))
-        ancestors = input_item_set.copy()
-        ancestor_property = "ancestors_with_mixins" if include_mixins else "ancestors"
-        if include_conflations:
-            categories = set(self.add_conflations(categories))
-        for category in categories:
-            ancestors.update(self.biolink_lookup_map["categories"][category][ancestor_property])
-        for predicate in predicates:
-            ancestors.update(self.biolink_lookup_map["predicates"][predicate][ancestor_property])
-        for category_mixin in category_mixins:
-            ancestors.update(self.biolink_lookup_map["category_mixins"][category_mixin]["ancestors"])
-        for predicate_mixin in predicate_mixins:
-            ancestors.update(self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["ancestors"])
-        for aspect in aspects:
-            ancestors.update(self.biolink_lookup_map["aspects"][aspect]["ancestors"])
-        for direction in directions:
-            ancestors.update(self.biolink_lookup_map["directions"][direction]["ancestors"])
-        return list(ancestors)
+        return list(self.lookups.get_closure(self._convert_to_set(biolink_items), "ancestors", include_mixins,
+                                             include_conflations))
 
     def get_descendants(self, biolink_items: Union[str, List[str], Set[str]], include_mixins: bool = True, include_conflations: bool = True) -> List[str]:
         """
@@ -93,30 +74,24 @@ class BiolinkHelper:
         be included in that case). Inclusion of ARAX-defined conflations (e.g., gene == protein) can be controlled
         via the include_conflations parameter.
         """
-        input_item_set = self._convert_to_set(biolink_items)
-        categories = input_item_set.intersection(set(self.biolink_lookup_map["categories"]))
-        predicates = input_item_set.intersection(set(self.biolink_lookup_map["predicates"]))
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        aspects = input_item_set.intersection(set(self.biolink_lookup_map["aspects"]))
-        directions = input_item_set.intersection(set(self.biolink_lookup_map["directions"]))
-        descendants = input_item_set.copy()
-        descendant_property = "descendants_with_mixins" if include_mixins else "descendants"
-        if include_conflations:
-            categories = set(self.add_conflations(categories))
-        for category in categories:
-            descendants.update(self.biolink_lookup_map["categories"][category][descendant_property])
-        for predicate in predicates:
-            descendants.update(self.biolink_lookup_map["predicates"][predicate][descendant_property])
-        for category_mixin in category_mixins:
-            descendants.update(self.biolink_lookup_map["category_mixins"][category_mixin]["descendants"])
-        for predicate_mixin in predicate_mixins:
-            descendants.update(self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["descendants"])
-        for aspect in aspects:
-            descendants.update(self.biolink_lookup_map["aspects"][aspect]["descendants"])
-        for direction in directions:
-            descendants.update(self.biolink_lookup_map["directions"][direction]["descendants"])
-        return list(descendants)
+        return list(self.lookups.get_closure(self._convert_to_set(biolink_items), "descendants", include_mixins,
+                                             include_conflations))
+
+    def get_ancestors_of_each(self, biolink_items: Union[str, List[str], Set[str]], include_mixins: bool = True, include_conflations: bool = True) -> Dict[str, FrozenSet[str]]:
+        """
+        Returns the ancestors of each of the input items (as get_ancestors() would for that item alone), for looking
+        up many categories/predicates at once. The returned frozensets are shared, so they can't be modified.
+        """
+        return {item: self.lookups.get_item_closure(item, "ancestors", include_mixins, include_conflations)
+                for item in self._convert_to_set(biolink_items)}
+
+    def get_descendants_of_each(self, biolink_items: Union[str, List[str], Set[str]], include_mixins: bool = True, include_conflations: bool = True) -> Dict[str, FrozenSet[str]]:
+        """
+        Returns the descendants of each of the input items (as get_descendants() would for that item alone), for
+        looking up many categories/predicates at once. The returned frozensets are shared, so they can't be modified.
+        """
+        return {item: self.lookups.get_item_closure(item, "descendants", include_mixins, include_conflations)
+                for item in self._convert_to_set(biolink_items)}
 
     def get_canonical_predicates(self, predicates: Union[str, List[str], Set[str]]) -> List[str]:
         """
@@ -148,8 +123,8 @@ class BiolinkHelper:
 
     def replace_mixins_with_direct_mappings(self, biolink_items: Union[str, List[str], Set[str]]) -> List[str]:
         input_item_set = self._convert_to_set(biolink_items)
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
+        category_mixins = input_item_set.intersection(self.lookups.item_sets["category_mixins"])
+        predicate_mixins = input_item_set.intersection(self.lookups.item_sets["predicate_mixins"])
         non_mixins = input_item_set.difference(category_mixins).difference(predicate_mixins)
         mixin_direct_mappings = set()
         for category_mixin in category_mixins:
@@ -165,8 +140,8 @@ class BiolinkHelper:
         Removes any predicate or category mixins in the input list.
         """
         input_item_set = self._convert_to_set(biolink_items)
-        all_predicate_mixins = set(self.biolink_lookup_map["predicate_mixins"])
-        all_category_mixins = set(self.biolink_lookup_map["category_mixins"])
+        all_predicate_mixins = self.lookups.item_sets["predicate_mixins"]
+        all_category_mixins = self.lookups.item_sets["category_mixins"]
         non_mixin_items = input_item_set.difference(all_predicate_mixins).difference(all_category_mixins)
         return list(non_mixin_items)
 
@@ -189,6 +164,8 @@ class BiolinkHelper:
         """
         Returns the current Biolink version that the ARAX system is using, according to the OpenAPI YAML file.
         """
+        if BiolinkHelper._current_arax_biolink_version is not None:
+            return BiolinkHelper._current_arax_biolink_version
         code_dir = f"{os.path.dirname(os.path.abspath(__file__))}/../.."
         openapi_yaml_path = f"{code_dir}/UI/OpenAPI/python-flask-server/openapi_server/openapi/openapi.yaml"
         openapi_json_path = f"{code_dir}/UI/OpenAPI/python-flask-server/openapi_server/openapi/openapi.json"
@@ -201,10 +178,25 @@ class BiolinkHelper:
         else:
             with open(openapi_yaml_path) as api_file:
                 opanapi_data = yaml.safe_load(api_file)
-        return opanapi_data["info"]["x-translator"]["biolink-version"]
+        BiolinkHelper._current_arax_biolink_version = opanapi_data["info"]["x-translator"]["biolink-version"]
+        return BiolinkHelper._current_arax_biolink_version
 
     # ------------------------------------- Internal methods -------------------------------------------------- #
 
+    def _get_lookups(self, is_test: bool = False) -> "_BiolinkLookups":
+        if is_test:
+            return _BiolinkLookups(self._load_biolink_lookup_map(is_test=True), self.arax_conflations)
+        with BiolinkHelper._lock:
+            lookups = BiolinkHelper._shared_lookups.get(self.biolink_version)
+            if lookups is None:
+                timestamp = str(datetime.datetime.now().isoformat())
+                eprint(f"{timestamp}: DEBUG: Loading BL lookup map...")
+                lookups = _BiolinkLookups(self._load_biolink_lookup_map(), self.arax_conflations)
+                BiolinkHelper._shared_lookups[self.biolink_version] = lookups
+                timestamp = str(datetime.datetime.now().isoformat())
+                eprint(f"{timestamp}: DEBUG: Done loading BL lookup map")
+            return lookups
+
     def _load_biolink_lookup_map(self, is_test: bool = False):
         lookup_map_file = pathlib.Path(self.biolink_lookup_map_path)
         timestamp = str(datetime.datetime.now().isoformat())
@@ -503,6 +495,63 @@ class BiolinkHelper:
         return dict(reversed_map)
 
 
+class _BiolinkLookups:
+    """
+    A Biolink lookup map, plus the ancestors and descendants (the 'closure') of every item in it, precomputed for
+    each combination of the include_mixins/include_conflations flags. Closures are stored as frozensets, and identical
+    ones are stored only once. The closures of sets of items are memoized as well.
+    """
+    ITEM_TYPES = ["categories", "predicates", "category_mixins", "predicate_mixins", "aspects", "directions"]
+    MAX_MEMOIZED_CLOSURES = 100000
+
+    def __init__(self, biolink_lookup_map: dict, arax_conflations: Dict[str, Set[str]]):
+        self.biolink_lookup_map = biolink_lookup_map
+        self.arax_conflations = arax_conflations
+        self.item_sets = {item_type: frozenset(biolink_lookup_map[item_type]) for item_type in self.ITEM_TYPES}
+        all_items = set().union(*self.item_sets.values())
+        interned_closures = dict()
+        self.item_closures = dict()  # (direction, include_mixins, include_conflations) -> item -> closure
+        for direction in ("ancestors", "descendants"):
+            for include_mixins in (True, False):
+                for include_conflations in (True, False):
+                    self.item_closures[(direction, include_mixins, include_conflations)] = {
+                        item: interned_closures.setdefault(closure, closure)
+                        for item in all_items
+                        for closure in [self._compute_closure(item, direction, include_mixins, include_conflations)]}
+        self.memoized_closures = dict()
+
+    def get_item_closure(self, item: str, direction: str, include_mixins: bool, include_conflations: bool) -> FrozenSet[str]:
+        closure = self.item_closures[(direction, include_mixins, include_conflations)].get(item)
+        return closure if closure is not None else frozenset([item])  # Unrecognized items are their own closure
+
+    def get_closure(self, items: Set[str], direction: str, include_mixins: bool, include_conflations: bool) -> FrozenSet[str]:
+        if len(items) == 1:
+            return self.get_item_closure(next(iter(items)), direction, include_mixins, include_conflations)
+        key = (frozenset(items), direction, include_mixins, include_conflations)
+        closure = self.memoized_closures.get(key)
+        if closure is None:
+            closure = frozenset().union(*(self.get_item_closure(item, direction, include_mixins, include_conflations)
+                                          for item in items))
+            if len(self.memoized_closures) >= self.MAX_MEMOIZED_CLOSURES:
+                self.memoized_closures = dict()
+            self.memoized_closures[key] = closure
+        return closure
+
+    def _compute_closure(self, item: str, direction: str, include_mixins: bool, include_conflations: bool) -> FrozenSet[str]:
+        closure = {item}
+        proper_property = f"{direction}_with_mixins" if include_mixins else direction
+        if item in self.item_sets["categories"]:
+            categories = self.arax_conflations.get(item, {item}) if include_conflations else {item}
+            for category in categories:
+                closure.update(self.biolink_lookup_map["categories"][category][proper_property])
+        if item in self.item_sets["predicates"]:
+            closure.update(self.biolink_lookup_map["predicates"][item][proper_property])
+        for item_type in ["category_mixins", "predicate_mixins", "aspects", "directions"]:
+            if item in self.item_sets[item_type]:
+                closure.update(self.biolink_lookup_map[item_type][item][direction])
+        return frozenset(closure)
+
+
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('version', nargs='?', help="The Biolink Model version number to use")
@@ -541,6 +590,13 @@ def main():
     assert "biolink:Gene" in combined_ancestors
     assert "biolink:BiologicalEntity" in combined_ancestors
 
+    # Test bulk lookups
+    ancestors_of_each = bh.get_ancestors_of_each(["biolink:Gene", "biolink:Drug", "biolink:treats"])
+    assert ancestors_of_each["biolink:Drug"] == frozenset(bh.get_ancestors("biolink:Drug"))
+    assert ancestors_of_each["biolink:treats"] == frozenset(bh.get_ancestors("biolink:treats"))
+    descendants_of_each = bh.get_descendants_of_each(["biolink:ChemicalEntity"], include_mixins=False)
+    assert descendants_of_each["biolink:ChemicalEntity"] == frozenset(chemical_entity_descenants_no_mixins)
+
     # Test conflations
     protein_ancestors = bh.get_ancestors("biolink:Protein", include_conflations=True)
     assert "biolink:Gene" in protein_ancestors
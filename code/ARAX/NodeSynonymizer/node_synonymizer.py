@@ -6,7 +6,10 @@ import pathlib
 import sqlite3
 import string
 import sys
-from collections import defaultdict
+import threading
+import weakref
+from array import array
+from collections import defaultdict, OrderedDict
 from typing import Optional, Union, List, Set, Dict, Tuple
 
 import pandas as pd
@@ -18,6 +21,10 @@ from RTXConfiguration import RTXConfiguration
 
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'ARAXQuery']))
 from ARAX_database_manager import ARAXDatabaseManager
+from mmap_index import get_file_stamp
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synonymizer_snapshot import SynonymizerSnapshot, get_snapshot_path
 
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'UI', 'OpenAPI', 'python-flask-server']))
 from openapi_server.models.knowledge_graph import KnowledgeGraph
@@ -27,8 +34,64 @@ from openapi_server.models.attribute import Attribute
 from openapi_server.models.retrieval_source import RetrievalSource
 
 
+class _LRUCache:
+    """
+    A mapping that evicts its least recently used entries once their total (approximate) size exceeds max_cost.
+    Each entry costs one unit for its key, plus one per item if its value is a tuple. Safe to share across threads.
+    """
+
+    def __init__(self, max_cost: int):
+        self.max_cost = max_cost
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.cost = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Set[str]) -> Tuple[dict, Set[str]]:
+        found = dict()
+        missing = set()
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+                else:
+                    missing.add(key)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, items: dict):
+        with self.lock:
+            for key, value in items.items():
+                if key in self.entries:
+                    self.cost -= self._get_cost(self.entries[key])
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                self.cost += self._get_cost(value)
+            while self.cost > self.max_cost and self.entries:
+                _, evicted_value = self.entries.popitem(last=False)
+                self.cost -= self._get_cost(evicted_value)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+    @staticmethod
+    def _get_cost(value: any) -> int:
+        return 1 + len(value) if isinstance(value, tuple) else 1
+
+
 class NodeSynonymizer:
 
+    # In-process caches of curie lookups, shared by all NodeSynonymizer instances using the same sqlite file
+    lru_cache_max_cost = 2000000  # Roughly how many curies (looked up or cached as cluster members) to remember, per lookup type
+    _lookup_caches = dict()
+    _lookup_caches_lock = threading.Lock()
+    _instances = weakref.WeakSet()  # So that their per-instance locks and connections can be reset after a fork
+    _snapshots = dict()  # Memory-mapped snapshots (and the file stamps they were loaded at), shared by all NodeSynonymizer instances in this process
+
     def __init__(self, sqlite_file_name: Optional[str] = None):
         self.rtx_config = RTXConfiguration()
         self.sqlite_file_name = sqlite_file_name
@@ -46,11 +109,31 @@ class NodeSynonymizer:
             raise ValueError(f"Specified synonymizer does not exist locally."
                              f" It should be at: {self.database_path}")
         else:
-            self.db_connection = sqlite3.connect(self.database_path)
+            # Each thread gets its own (read-only) connection, so that one NodeSynonymizer can be shared across threads
+            self._thread_local = threading.local()
+            self._db_connections = dict()  # Maps threads to the connections they opened
+            self._db_connections_lock = threading.Lock()
+            self._instances.add(self)
+            self._get_db_connection()
+            # Newer synonymizers store cluster members/edges as packed arrays of int ids (see kg2c/synonymizer_build/pack_cluster_members.py)
+            cluster_columns = {row[1] for row in self._execute_sql_query("PRAGMA table_info(clusters)")}
+            self.has_packed_cluster_members = "member_int_ids" in cluster_columns
+            # Curie lookups are served from a memory-mapped snapshot of the synonymizer, if one has been built
+            self.snapshot = self._load_snapshot()
 
     def __del__(self):
-        if hasattr(self, "db_connection"):
-            self.db_connection.close()
+        self.close()
+
+    def close(self):
+        """
+        Closes all of this instance's sqlite connections (a thread that uses the instance again will open a new one).
+        """
+        if hasattr(self, "_db_connections"):
+            with self._db_connections_lock:
+                for db_connection in self._db_connections.values():
+                    db_connection.close()
+                self._db_connections.clear()
+                self._thread_local = threading.local()
 
     # --------------------------------------- EXTERNAL MAIN METHODS ----------------------------------------------- #
 
@@ -67,22 +150,13 @@ class NodeSynonymizer:
             # First transform curies so that their prefixes are entirely uppercase
             curies_to_capitalized_curies, capitalized_curies = self._map_to_capitalized_curies(curies_set)
 
-            # Query the synonymizer sqlite database for these identifiers
-            sql_query_template = f"""
-                        SELECT N.id_simplified, N.cluster_id, C.name, C.category
-                        FROM nodes as N
-                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.id_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, capitalized_curies)
+            # Look up these identifiers (in our in-process cache, or else the synonymizer sqlite database)
+            canonical_info_capitalized = self._lookup_canonical_info(capitalized_curies)
 
             # Transform the results into the proper response format
-            results_dict_capitalized = {row[0]: self._create_preferred_node_dict(preferred_id=row[1],
-                                                                                 preferred_category=row[3],
-                                                                                 preferred_name=row[2])
-                                        for row in matching_rows}
-            results_dict = {input_curie: results_dict_capitalized[capitalized_curie]
+            results_dict = {input_curie: self._create_preferred_node_dict(*canonical_info_capitalized[capitalized_curie])
                             for input_curie, capitalized_curie in curies_to_capitalized_curies.items()
-                            if capitalized_curie in results_dict_capitalized}
+                            if canonical_info_capitalized.get(capitalized_curie)}
 
         if names_set:
             # First transform to simplified names (lowercase, no punctuation/whitespace)
@@ -93,8 +167,8 @@ class NodeSynonymizer:
                         SELECT N.id, N.name_simplified, N.cluster_id, C.name, C.category
                         FROM nodes as N
                         INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.name_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, simplified_names)
+                        WHERE N.name_simplified in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, simplified_names)
 
             # For each simplified name, pick the cluster that nodes with that simplified name most often belong to
             names_to_best_cluster_id = self._count_clusters_per_name(matching_rows, name_index=1, cluster_id_index=2)
@@ -124,8 +198,8 @@ class NodeSynonymizer:
             sql_query_template = f"""
                         SELECT N.cluster_id, N.category
                         FROM nodes as N
-                        WHERE N.cluster_id in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, cluster_ids)
+                        WHERE N.cluster_id in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, cluster_ids)
 
             # Count up how many members this cluster has with different categories
             clusters_by_category_counts = defaultdict(lambda: defaultdict(int))
@@ -159,19 +233,13 @@ class NodeSynonymizer:
             # First transform curies so that their prefixes are entirely uppercase
             curies_to_capitalized_curies, capitalized_curies = self._map_to_capitalized_curies(curies_set)
 
-            # Query the synonymizer sqlite database for these identifiers (in batches, if necessary)
-            sql_query_template = f"""
-                        SELECT N.id_simplified, C.member_ids
-                        FROM nodes as N
-                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.id_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, capitalized_curies)
+            # Look up these identifiers (in our in-process cache, or else the synonymizer sqlite database)
+            member_ids_capitalized = self._lookup_cluster_member_ids(capitalized_curies)
 
             # Transform the results into the proper response format
-            results_dict_capitalized = {row[0]: ast.literal_eval(row[1]) for row in matching_rows}
-            results_dict = {input_curie: results_dict_capitalized[capitalized_curie]
+            results_dict = {input_curie: list(member_ids_capitalized[capitalized_curie])
                             for input_curie, capitalized_curie in curies_to_capitalized_curies.items()
-                            if capitalized_curie in results_dict_capitalized}
+                            if member_ids_capitalized.get(capitalized_curie) is not None}
 
         if names_set:
             # First transform to simplified names (lowercase, no punctuation/whitespace)
@@ -179,11 +247,11 @@ class NodeSynonymizer:
 
             # Query the synonymizer sqlite database for these names
             sql_query_template = f"""
-                        SELECT N.id, N.name_simplified, C.cluster_id, C.member_ids
+                        SELECT N.id, N.name_simplified, C.cluster_id
                         FROM nodes as N
                         INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                        WHERE N.name_simplified in ('{self.placeholder_lookup_values_str}')"""
-            matching_rows = self._run_sql_query_in_batches(sql_query_template, simplified_names)
+                        WHERE N.name_simplified in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, simplified_names)
 
             # For each simplified name, pick the cluster that nodes with that simplified name most often belong to
             names_to_best_cluster_id = self._count_clusters_per_name(matching_rows, name_index=1, cluster_id_index=2)
@@ -195,7 +263,8 @@ class NodeSynonymizer:
                                      for name, cluster_id in names_to_best_cluster_id.items()}
 
             # Transform the results into the proper response format
-            results_dict_names_simplified = {name: ast.literal_eval(cluster_row[3])
+            member_ids_by_cluster_id = self._get_member_ids_for_clusters(set(names_to_best_cluster_id.values()))
+            results_dict_names_simplified = {name: member_ids_by_cluster_id[cluster_row[2]]
                                              for name, cluster_row in names_to_cluster_rows.items()}
             results_dict_names = {input_name: results_dict_names_simplified[simplified_name]
                                   for input_name, simplified_name in names_to_simplified_names.items()
@@ -239,8 +308,8 @@ class NodeSynonymizer:
                     SELECT N.id, N.cluster_id, N.name, N.category, N.major_branch, N.name_sri, N.category_sri, N.name_kg2pre, N.category_kg2pre, C.name
                     FROM nodes as N
                     INNER JOIN clusters as C on C.cluster_id == N.cluster_id
-                    WHERE N.id in ('{self.placeholder_lookup_values_str}')"""
-        matching_rows = self._run_sql_query_in_batches(sql_query_template, all_node_ids)
+                    WHERE N.id in ({self.placeholder_lookup_values_str})"""
+        matching_rows = self._run_bulk_lookup_query(sql_query_template, all_node_ids)
         nodes_dict = {row[0]: {"identifier": row[0],
                                "category": self._add_biolink_prefix(row[3]),
                                "label": row[2],
@@ -300,6 +369,19 @@ class NodeSynonymizer:
 
         return results_dict
 
+    def get_cache_stats(self) -> dict:
+        """
+        Returns hit/miss counters for the in-process curie lookup caches, like:
+        {"canonical": {"hits": 10, "misses": 3, "size": 3}, "equivalent": {"hits": 0, "misses": 2, "size": 2}}
+        """
+        return {lookup_type: self._get_lookup_cache(lookup_type).get_stats()
+                for lookup_type in ["canonical", "equivalent"]}
+
+    @classmethod
+    def clear_caches(cls):
+        with cls._lookup_caches_lock:
+            cls._lookup_caches.clear()
+
     # ---------------------------------------- EXTERNAL DEBUG METHODS --------------------------------------------- #
 
     def print_cluster_table(self, curie_or_name: str, include_edges: bool = True):
@@ -312,23 +394,13 @@ class NodeSynonymizer:
         if canonical_info[curie_or_name]:
             cluster_id = canonical_info[curie_or_name]["preferred_curie"]
 
-            sql_query = f"SELECT member_ids, intra_cluster_edge_ids FROM clusters WHERE cluster_id = '{cluster_id}'"
-            results = self._execute_sql_query(sql_query)
-            if results:
-                cluster_row = results[0]
-                member_ids = ast.literal_eval(cluster_row[0])  # Lists are stored as strings in sqlite
-                intra_cluster_edge_ids_str = "[]" if cluster_row[1] == "nan" else cluster_row[1]
-                intra_cluster_edge_ids = ast.literal_eval(
-                    intra_cluster_edge_ids_str)  # Lists are stored as strings in sqlite
-
-                nodes_query = f"SELECT * FROM nodes WHERE id IN ('{self._convert_to_str_format(member_ids)}')"
-                node_rows = self._execute_sql_query(nodes_query)
+            cluster_rows = self._get_cluster_node_and_edge_rows(cluster_id)
+            if cluster_rows:
+                node_rows, edge_rows = cluster_rows
                 nodes_df = self._load_records_into_dataframe(node_rows, "nodes")
 
                 # TODO: Improve formatting! (indicate if in SRI vs. KG2pre, etc...)
                 nodes_df = nodes_df[["id", "category", "name"]]
-                edges_query = f"SELECT * FROM edges WHERE id IN ('{self._convert_to_str_format(intra_cluster_edge_ids)}')"
-                edge_rows = self._execute_sql_query(edges_query)
                 edges_df = self._load_records_into_dataframe(edge_rows, "edges")
                 edges_df = edges_df[["subject", "predicate", "object", "upstream_resource_id", "primary_knowledge_source"]]
 
@@ -345,12 +417,6 @@ class NodeSynonymizer:
 
     # ---------------------------------------- INTERNAL HELPER METHODS -------------------------------------------- #
 
-    @staticmethod
-    def _convert_to_str_format(list_or_set: Union[Set[str], List[str]]) -> str:
-        preprocessed_list = [item.replace("'", "''") for item in list_or_set if item]  # Need to escape ' characters for SQL
-        list_str = "','".join(preprocessed_list)  # SQL wants ('id1', 'id2') format for string lists
-        return list_str
-
     @staticmethod
     def _convert_to_set_format(some_value: any) -> set:
         if isinstance(some_value, set):
@@ -384,11 +450,6 @@ class NodeSynonymizer:
                                     for name, cluster_counts in names_to_cluster_counts.items()}
         return names_to_best_cluster_id
 
-    @staticmethod
-    def _divide_into_chunks(some_set: Set[str], chunk_size: int) -> List[List[str]]:
-        some_list = list(some_set)
-        return [some_list[start:start + chunk_size] for start in range(0, len(some_list), chunk_size)]
-
     @staticmethod
     def _capitalize_curie_prefix(curie: str) -> str:
         curie_chunks = curie.split(":")
@@ -411,15 +472,9 @@ class NodeSynonymizer:
         kg.nodes = trapi_nodes
 
         # Add TRAPI edges for any intra-cluster edges
-        sql_query = f"SELECT intra_cluster_edge_ids FROM clusters WHERE cluster_id = '{cluster_id}'"
-        results = self._execute_sql_query(sql_query)
-        if results:
-            cluster_row = results[0]
-            intra_cluster_edge_ids_str = "[]" if cluster_row[0] == "nan" else cluster_row[0]
-            intra_cluster_edge_ids = ast.literal_eval(intra_cluster_edge_ids_str)  # Lists are stored as strings in sqlite
-
-            edges_query = f"SELECT * FROM edges WHERE id IN ('{self._convert_to_str_format(intra_cluster_edge_ids)}')"
-            edge_rows = self._execute_sql_query(edges_query)
+        cluster_rows = self._get_cluster_node_and_edge_rows(cluster_id, include_nodes=False)
+        if cluster_rows:
+            _, edge_rows = cluster_rows
             edges_df = self._load_records_into_dataframe(edge_rows, "edges")
             edge_dicts = edges_df.to_dict(orient="records")
             trapi_edges = {edge["id"]: self._convert_to_trapi_edge(edge)
@@ -529,26 +584,206 @@ class NodeSynonymizer:
             "preferred_category": self._add_biolink_prefix(preferred_category)
         }
 
-    def _run_sql_query_in_batches(self, sql_query_template: str, lookup_values: Set[str]) -> list:
+    def _run_bulk_lookup_query(self, sql_query_template: str, lookup_values: Set[Union[str, int]],
+                               lookup_table: str = "lookup_values") -> list:
         """
-        Sqlite has a max length allowed for SQL statements, so we divide really long curie/name lists into batches.
+        Loads the lookup values into a temp table and runs the query against that (in place of the placeholder), so
+        that any number of curies/names can be looked up in one statement without splicing them into the SQL.
+        Integer values (i.e., int ids) should use the 'lookup_int_ids' table.
         """
-        lookup_values_batches = self._divide_into_chunks(lookup_values, 5000)
-        all_matching_rows = []
-        for lookup_values_batch in lookup_values_batches:
-            sql_query = sql_query_template.replace(self.placeholder_lookup_values_str,
-                                                   self._convert_to_str_format(lookup_values_batch))
-            matching_rows = self._execute_sql_query(sql_query)
-            all_matching_rows += matching_rows
-        return all_matching_rows
-
-    def _execute_sql_query(self, sql_query: str) -> list:
-        cursor = self.db_connection.cursor()
-        cursor.execute(sql_query)
+        db_connection = self._get_db_connection()
+        sql_query = sql_query_template.replace(self.placeholder_lookup_values_str, f"SELECT value FROM temp.{lookup_table}")
+        db_connection.execute("BEGIN")
+        try:
+            db_connection.execute(f"DELETE FROM temp.{lookup_table}")
+            db_connection.executemany(f"INSERT OR IGNORE INTO temp.{lookup_table} VALUES (?)",
+                                      [(value,) for value in lookup_values if value])
+            matching_rows = db_connection.execute(sql_query).fetchall()
+        finally:
+            db_connection.execute("COMMIT")
+        return matching_rows
+
+    def _execute_sql_query(self, sql_query: str, parameters: tuple = ()) -> list:
+        cursor = self._get_db_connection().cursor()
+        cursor.execute(sql_query, parameters)
         matching_rows = cursor.fetchall()
         cursor.close()
         return matching_rows
 
+    def _get_db_connection(self) -> sqlite3.Connection:
+        db_connection = getattr(self._thread_local, "db_connection", None)
+        if db_connection is None or self._thread_local.pid != os.getpid():  # Connections can't be reused after a fork
+            db_connection = sqlite3.connect(f"{pathlib.Path(self.database_path).as_uri()}?mode=ro", uri=True,
+                                            isolation_level=None, check_same_thread=False)
+            db_connection.execute("CREATE TEMP TABLE lookup_values (value TEXT PRIMARY KEY)")
+            db_connection.execute("CREATE TEMP TABLE lookup_int_ids (value INTEGER PRIMARY KEY)")
+            with self._db_connections_lock:
+                # Close connections left behind by threads that have since finished (or by this thread, pre-fork)
+                for thread in [thread for thread in self._db_connections
+                               if not thread.is_alive() or thread is threading.current_thread()]:
+                    self._db_connections.pop(thread).close()
+                self._db_connections[threading.current_thread()] = db_connection
+                self._thread_local.db_connection = db_connection
+                self._thread_local.pid = os.getpid()
+        return db_connection
+
+    def _get_lookup_cache(self, lookup_type: str) -> _LRUCache:
+        with self._lookup_caches_lock:
+            cache_key = (self.database_path, lookup_type)
+            if cache_key not in self._lookup_caches:
+                self._lookup_caches[cache_key] = _LRUCache(self.lru_cache_max_cost)
+            return self._lookup_caches[cache_key]
+
+    def _lookup_canonical_info(self, capitalized_curies: Set[str]) -> Dict[str, Optional[tuple]]:
+        """
+        Returns a (preferred_id, preferred_category, preferred_name) tuple for each curie (None if unrecognized).
+        """
+        if self.snapshot:
+            # No need for a per-process cache; the snapshot's pages are shared by all processes via the OS page cache
+            return {curie: self.snapshot.get_canonical_info(curie) for curie in capitalized_curies}
+        lookup_cache = self._get_lookup_cache("canonical")
+        canonical_info, uncached_curies = lookup_cache.get_many(capitalized_curies)
+        if uncached_curies:
+            sql_query_template = f"""
+                        SELECT N.id_simplified, N.cluster_id, C.name, C.category
+                        FROM nodes as N
+                        INNER JOIN clusters as C on C.cluster_id == N.cluster_id
+                        WHERE N.id_simplified in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, uncached_curies)
+            looked_up_info = {curie: None for curie in uncached_curies}
+            looked_up_info.update({row[0]: (row[1], row[3], row[2]) for row in matching_rows})
+            lookup_cache.put_many(looked_up_info)
+            canonical_info.update(looked_up_info)
+        return canonical_info
+
+    def _lookup_cluster_member_ids(self, capitalized_curies: Set[str]) -> Dict[str, Optional[tuple]]:
+        """
+        Returns the ids of all members of each curie's cluster (None if the curie is unrecognized).
+        """
+        if self.snapshot:
+            return {curie: self.snapshot.get_member_ids(curie) for curie in capitalized_curies}
+        lookup_cache = self._get_lookup_cache("equivalent")
+        member_ids, uncached_curies = lookup_cache.get_many(capitalized_curies)
+        if uncached_curies:
+            sql_query_template = f"""
+                        SELECT N.id_simplified, N.cluster_id
+                        FROM nodes as N
+                        WHERE N.id_simplified in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, uncached_curies)
+            # Members of the same cluster share one tuple, rather than each getting their own copy in the cache
+            member_ids_by_cluster_id = {cluster_id: tuple(cluster_member_ids) for cluster_id, cluster_member_ids
+                                        in self._get_member_ids_for_clusters({row[1] for row in matching_rows}).items()}
+            looked_up_member_ids = {curie: None for curie in uncached_curies}
+            looked_up_member_ids.update({row[0]: member_ids_by_cluster_id[row[1]] for row in matching_rows
+                                         if row[1] in member_ids_by_cluster_id})
+            lookup_cache.put_many(looked_up_member_ids)
+            member_ids.update(looked_up_member_ids)
+        return member_ids
+
+    def _get_member_ids_for_clusters(self, cluster_ids: Set[str]) -> Dict[str, List[str]]:
+        if self.has_packed_cluster_members:
+            sql_query_template = f"""
+                        SELECT C.cluster_id, C.member_int_ids
+                        FROM clusters as C
+                        WHERE C.cluster_id in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, cluster_ids)
+            member_int_ids_by_cluster_id = {row[0]: self._decode_int_ids(row[1]) for row in matching_rows}
+            node_ids_by_int_id = dict(self._run_bulk_lookup_query(
+                f"SELECT int_id, id FROM nodes WHERE int_id in ({self.placeholder_lookup_values_str})",
+                set().union(*member_int_ids_by_cluster_id.values()),
+                lookup_table="lookup_int_ids"))
+            return {cluster_id: [node_ids_by_int_id[int_id] for int_id in member_int_ids]
+                    for cluster_id, member_int_ids in member_int_ids_by_cluster_id.items()}
+        else:
+            sql_query_template = f"""
+                        SELECT C.cluster_id, C.member_ids
+                        FROM clusters as C
+                        WHERE C.cluster_id in ({self.placeholder_lookup_values_str})"""
+            matching_rows = self._run_bulk_lookup_query(sql_query_template, cluster_ids)
+            return {row[0]: ast.literal_eval(row[1]) for row in matching_rows}  # Lists are stored as strings in sqlite
+
+    def _get_cluster_node_and_edge_rows(self, cluster_id: str, include_nodes: bool = True) -> Optional[Tuple[list, list]]:
+        """
+        Returns the full nodes table rows and edges table rows for the given cluster's members and intra-cluster
+        edges, or None if no such cluster exists.
+        """
+        if self.has_packed_cluster_members:
+            sql_query = "SELECT member_int_ids, intra_cluster_edge_int_ids FROM clusters WHERE cluster_id = ?"
+            results = self._execute_sql_query(sql_query, (cluster_id,))
+            if not results:
+                return None
+            member_keys, edge_keys = (self._decode_int_ids(blob) for blob in results[0])
+            nodes_query = f"SELECT * FROM nodes WHERE int_id IN ({self.placeholder_lookup_values_str})"
+            edges_query = f"SELECT * FROM edges WHERE int_id IN ({self.placeholder_lookup_values_str})"
+            lookup_table = "lookup_int_ids"  # Members/edges are identified by their int ids
+        else:
+            sql_query = "SELECT member_ids, intra_cluster_edge_ids FROM clusters WHERE cluster_id = ?"
+            results = self._execute_sql_query(sql_query, (cluster_id,))
+            if not results:
+                return None
+            cluster_row = results[0]
+            member_keys = ast.literal_eval(cluster_row[0])  # Lists are stored as strings in sqlite
+            edge_keys = ast.literal_eval("[]" if cluster_row[1] == "nan" else cluster_row[1])
+            nodes_query = f"SELECT * FROM nodes WHERE id IN ({self.placeholder_lookup_values_str})"
+            edges_query = f"SELECT * FROM edges WHERE id IN ({self.placeholder_lookup_values_str})"
+            lookup_table = "lookup_values"  # Members/edges are identified by their ids
+
+        node_rows = self._run_bulk_lookup_query(nodes_query, set(member_keys), lookup_table) if include_nodes else []
+        edge_rows = self._run_bulk_lookup_query(edges_query, set(edge_keys), lookup_table)
+        return node_rows, edge_rows
+
+    @staticmethod
+    def _decode_int_ids(blob: Optional[bytes]) -> array:
+        # Packed as little-endian uint32s (see kg2c/synonymizer_build/pack_cluster_members.py)
+        int_ids = array("I")
+        if blob:
+            int_ids.frombytes(blob)
+            if sys.byteorder == "big":
+                int_ids.byteswap()
+        return int_ids
+
+    def _load_snapshot(self) -> Optional[SynonymizerSnapshot]:
+        # The cached snapshot is reloaded (or dropped) whenever the snapshot or the sqlite has changed since it was loaded
+        snapshot_path = get_snapshot_path(self.database_path)
+        stamps = (self._get_file_stamp(snapshot_path), self._get_file_stamp(self.database_path))
+        with self._lookup_caches_lock:
+            cached_stamps, snapshot = self._snapshots.get(snapshot_path, (None, None))
+            if cached_stamps != stamps:
+                snapshot = None
+                if stamps[0] is not None:
+                    try:
+                        snapshot = SynonymizerSnapshot(snapshot_path)
+                    except Exception as e:
+                        print(f"WARNING: Couldn't load synonymizer snapshot {snapshot_path}: {e}", file=sys.stderr)
+                    else:
+                        if not snapshot.is_up_to_date_with(self.database_path):
+                            print(f"WARNING: Ignoring synonymizer snapshot {snapshot_path} because it was built from "
+                                  f"a different version of {self.database_name}", file=sys.stderr)
+                            snapshot.close()
+                            snapshot = None
+                # A snapshot being replaced isn't closed, since other NodeSynonymizer instances may still be using it
+                self._snapshots[snapshot_path] = (stamps, snapshot)
+            return snapshot
+
+    @staticmethod
+    def _get_file_stamp(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            return get_file_stamp(file_path)
+        except OSError:
+            return None
+
+    @classmethod
+    def _reset_locks_after_fork(cls):
+        # A lock held by some other thread at the time of a fork would otherwise stay locked forever in the child
+        cls._lookup_caches_lock = threading.Lock()
+        for lookup_cache in cls._lookup_caches.values():
+            lookup_cache.lock = threading.Lock()
+        # The parent's connections (and its threads) don't carry over, so each instance starts over with fresh ones
+        for synonymizer in list(cls._instances):
+            synonymizer._db_connections_lock = threading.Lock()
+            synonymizer._db_connections = dict()
+            synonymizer._thread_local = threading.local()
+
     def _map_to_capitalized_curies(self, curies_set: Set[str]) -> Tuple[Dict[str, str], Set[str]]:
         curies_to_capitalized_curies = {curie: self._capitalize_curie_prefix(curie) for curie in curies_set}
         capitalized_curies = set(curies_to_capitalized_curies.values())
@@ -567,6 +802,10 @@ class NodeSynonymizer:
         return records_df
 
 
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=NodeSynonymizer._reset_locks_after_fork)
+
+
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("curie_or_name")
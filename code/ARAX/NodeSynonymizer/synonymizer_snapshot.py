@@ -0,0 +1,182 @@
+"""
+The synonymizer_snapshot.py file defines a read-only, memory-mapped 'snapshot' of the NodeSynonymizer's curie lookups,
+which can optionally be built from a synonymizer sqlite. When a snapshot is present next to the sqlite file, the
+NodeSynonymizer uses it to answer get_canonical_curies() and get_equivalent_nodes() for curies, instead of each
+worker process building up its own caches; lookups are O(log n) binary searches over a sorted key index.
+
+File layout (in the common format described in ARAXQuery/mmap_index.py):
+    header:          magic, counts, size and modification time (ns) of the source sqlite file, and the offset of each
+                     section below
+    string offsets:  uint64[num_strings + 1]; string i is string_pool[offsets[i]:offsets[i + 1]] (UTF-8)
+    string pool:     bytes
+    key strings:     uint32[num_keys]; string index of each key (simplified curie), sorted by UTF-8 bytes
+    key clusters:    uint32[num_keys]; cluster index for each key
+    cluster table:   uint32[num_clusters * 5]; cluster id, name and category string indexes, member start, member count
+    members:         uint32[num_members]; string index of each member's curie (grouped by cluster, in the order of
+                     the cluster's member_ids in the sqlite)
+
+Usage (to build a snapshot):
+    python synonymizer_snapshot.py <path to synonymizer sqlite>
+"""
+import argparse
+import ast
+import os
+import sqlite3
+import sys
+from array import array
+from typing import Optional, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/")
+from mmap_index import get_file_stamp, open_index_file, write_index_file
+
+MAGIC = b"ARAXSNP2"
+HEADER_FORMAT = "<8s13Q"  # magic, 6 counts/stamps (strings, keys, clusters, members, source size, source mtime), 6 offsets, file size
+NULL_STRING_INDEX = 0xFFFFFFFF
+CLUSTER_ROW_WIDTH = 5
+
+
+class SynonymizerSnapshot:
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+        self.mmap, header_fields = open_index_file(snapshot_path, HEADER_FORMAT, MAGIC, "synonymizer snapshot")
+        (self.num_strings, self.num_keys, self.num_clusters, self.num_members, self.source_size, self.source_mtime_ns,
+         string_offsets_start, string_pool_start, key_strings_start, key_clusters_start, cluster_table_start,
+         members_start) = header_fields
+        view = memoryview(self.mmap)
+        self.string_offsets = view[string_offsets_start:string_pool_start].cast("Q")
+        self.string_pool_start = string_pool_start
+        self.key_strings = view[key_strings_start:key_strings_start + 4 * self.num_keys].cast("I")
+        self.key_clusters = view[key_clusters_start:key_clusters_start + 4 * self.num_keys].cast("I")
+        self.cluster_table = view[cluster_table_start:members_start].cast("I")
+        self.members = view[members_start:members_start + 4 * self.num_members].cast("I")
+
+    def is_up_to_date_with(self, sqlite_path: str) -> bool:
+        return get_file_stamp(sqlite_path) == (self.source_size, self.source_mtime_ns)
+
+    def get_canonical_info(self, simplified_curie: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Returns a (preferred_id, preferred_category, preferred_name) tuple for the curie, or None if unrecognized.
+        """
+        cluster_index = self._find_cluster_index(simplified_curie)
+        if cluster_index is None:
+            return None
+        row_start = cluster_index * CLUSTER_ROW_WIDTH
+        cluster_id, name, category = (self._get_string(self.cluster_table[row_start + offset]) for offset in range(3))
+        return cluster_id, category, name
+
+    def get_member_ids(self, simplified_curie: str) -> Optional[List[str]]:
+        """
+        Returns the curies of all members of the curie's cluster, or None if unrecognized.
+        """
+        cluster_index = self._find_cluster_index(simplified_curie)
+        if cluster_index is None:
+            return None
+        row_start = cluster_index * CLUSTER_ROW_WIDTH
+        member_start = self.cluster_table[row_start + 3]
+        member_count = self.cluster_table[row_start + 4]
+        return [self._get_string(string_index) for string_index in self.members[member_start:member_start + member_count]]
+
+    def close(self):
+        for view in [self.string_offsets, self.key_strings, self.key_clusters, self.cluster_table, self.members]:
+            view.release()
+        self.mmap.close()
+
+    def _get_string_bytes(self, string_index: int) -> bytes:
+        start = self.string_pool_start + self.string_offsets[string_index]
+        end = self.string_pool_start + self.string_offsets[string_index + 1]
+        return self.mmap[start:end]
+
+    def _get_string(self, string_index: int) -> Optional[str]:
+        if string_index == NULL_STRING_INDEX:
+            return None
+        return self._get_string_bytes(string_index).decode("utf-8")
+
+    def _find_cluster_index(self, simplified_curie: str) -> Optional[int]:
+        target = simplified_curie.encode("utf-8")
+        low, high = 0, self.num_keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_string_bytes(self.key_strings[middle]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_keys and self._get_string_bytes(self.key_strings[low]) == target:
+            return self.key_clusters[low]
+        return None
+
+
+def build_snapshot(sqlite_path: str, snapshot_path: Optional[str] = None) -> str:
+    """
+    Builds a snapshot from the given synonymizer sqlite; returns the path of the snapshot file.
+    """
+    snapshot_path = snapshot_path if snapshot_path else get_snapshot_path(sqlite_path)
+    db_connection = sqlite3.connect(sqlite_path)
+    string_indexes = dict()
+    string_pool = []
+
+    def get_string_index(value: Optional[str]) -> int:
+        if value is None:
+            return NULL_STRING_INDEX
+        if value not in string_indexes:
+            string_indexes[value] = len(string_pool)
+            string_pool.append(value.encode("utf-8"))
+        return string_indexes[value]
+
+    source_stamp = get_file_stamp(sqlite_path)
+
+    print(f"Loading clusters from {sqlite_path}..")
+    cluster_indexes = dict()
+    cluster_table = array("I")
+    members = array("I")
+    cluster_rows = db_connection.execute("SELECT cluster_id, name, category, member_ids FROM clusters ORDER BY cluster_id")
+    for cluster_id, name, category, member_ids_str in cluster_rows:
+        # Members are kept in the same order as the sqlite-based lookups return them (that of member_ids)
+        member_ids = [] if not member_ids_str or member_ids_str == "nan" else ast.literal_eval(member_ids_str)
+        cluster_indexes[cluster_id] = len(cluster_indexes)
+        cluster_table.extend([get_string_index(cluster_id), get_string_index(name), get_string_index(category),
+                              len(members), len(member_ids)])
+        members.extend(get_string_index(member_id) for member_id in member_ids)
+
+    print(f"Loading node keys..")
+    key_rows = []
+    for node_id_simplified, cluster_id in db_connection.execute("SELECT id_simplified, cluster_id FROM nodes"):
+        if cluster_id not in cluster_indexes:
+            continue  # The sqlite-based lookups join on the clusters table, so these nodes are unrecognized there too
+        key_rows.append((node_id_simplified.encode("utf-8"), get_string_index(node_id_simplified),
+                         cluster_indexes[cluster_id]))
+    db_connection.close()
+
+    print(f"Sorting {len(key_rows)} keys..")
+    key_rows.sort(key=lambda key_row: key_row[0])
+    key_strings = array("I", (key_row[1] for key_row in key_rows))
+    key_clusters = array("I", (key_row[2] for key_row in key_rows))
+
+    string_offsets = array("Q", [0])
+    for string_bytes in string_pool:
+        string_offsets.append(string_offsets[-1] + len(string_bytes))
+
+    sections = [string_offsets.tobytes(), b"".join(string_pool), key_strings.tobytes(), key_clusters.tobytes(),
+                cluster_table.tobytes(), members.tobytes()]
+    print(f"Writing snapshot to {snapshot_path}..")
+    write_index_file(snapshot_path, HEADER_FORMAT,
+                     (MAGIC, len(string_pool), len(key_rows), len(cluster_indexes), len(members), *source_stamp), sections)
+    print(f"Done. Snapshot has {len(key_rows)} keys, {len(cluster_indexes)} clusters, {len(string_pool)} strings")
+    return snapshot_path
+
+
+def get_snapshot_path(sqlite_path: str) -> str:
+    return f"{sqlite_path[:-len('.sqlite')] if sqlite_path.endswith('.sqlite') else sqlite_path}.snapshot"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("sqlite_path", help="Path to the synonymizer sqlite to build a snapshot from")
+    arg_parser.add_argument("-o", "--output", dest="snapshot_path", default=None,
+                            help="Where to save the snapshot (defaults to next to the sqlite, with a .snapshot suffix)")
+    args = arg_parser.parse_args()
+    build_snapshot(args.sqlite_path, args.snapshot_path)
+
+
+if __name__ == "__main__":
+    main()
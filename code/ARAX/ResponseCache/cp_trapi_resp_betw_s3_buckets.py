@@ -2,8 +2,9 @@
 
 import argparse
 import boto3
+import botocore
 
-obj_prefix = '/responses'
+from response_storage import get_stored_response_keys
 
 def _get_args() -> argparse.Namespace:
     arg_parser = \
@@ -58,13 +59,20 @@ if __name__ == "__main__":
     id_ctr = 0
     for resp_id in resp_ids:
         if id_ctr % M == N:
-            obj_name = obj_prefix + '/' + str(resp_id) + '.json'
-            copy_source = {'Bucket': src_bucket,
-                           'Key': obj_name}
-            src_url = src_bucket + '/' + obj_name
-            rsrc.meta.client.copy(copy_source, dst_bucket, obj_name)
-            if args.verbose:
-                print(f"s3://{src_bucket}/{obj_name} => "
-                      f"s3://{dst_bucket}/{obj_name}")
+            # responses may be stored compressed (.json.zst/.json.gz) or, if old, as plain .json
+            for _, obj_name in get_stored_response_keys(resp_id):
+                try:
+                    rsrc.meta.client.head_object(Bucket=src_bucket, Key=obj_name)
+                except botocore.exceptions.ClientError:
+                    continue
+                copy_source = {'Bucket': src_bucket,
+                               'Key': obj_name}
+                rsrc.meta.client.copy(copy_source, dst_bucket, obj_name)
+                if args.verbose:
+                    print(f"s3://{src_bucket}/{obj_name} => "
+                          f"s3://{dst_bucket}/{obj_name}")
+                break
+            else:
+                print(f"WARNING: no stored object found for response {resp_id} in s3://{src_bucket}")
             print(f"percent complete: {100.0 * id_ctr / num_ids:0.2f}")
         id_ctr += 1
@@ -41,8 +41,14 @@ from reasoner_validator.validator import TRAPIResponseValidator
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../..")
 from RTXConfiguration import RTXConfiguration
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from response_storage import ResponseStorage, get_results_page
+from trapi_validation_cache import TRAPIValidationCache, PENDING_STATUS
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
 from ARAX_attribute_parser import ARAXAttributeParser
+from ARAX_query_worker_pool import close_inherited_pipes_and_sockets
+from trapi_json_encoder import model_to_dict
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response as Envelope
@@ -67,6 +73,79 @@ def validate_envelope(process_params):
     return(validator)
 
 
+def run_trapi_validation(envelope, schema_version):
+    validator = TRAPIResponseValidator(trapi_version=schema_version, biolink_version=biolink_version)
+    eprint(f"Validating TRAPI with version {schema_version} and {biolink_version}")
+    validator.check_compliance_of_trapi_response(envelope)
+    validation_messages_text = validator.dumps()
+    raw_messages: Dict[str, List[Dict[str,str]]] = validator.get_all_messages()
+    messages = raw_messages['Validate TRAPI Response']['Standards Test']
+
+    critical_errors = 0
+    errors = 0
+    if 'critical' in messages and len(messages['critical']) > 0:
+        critical_errors = len(messages['critical'])
+    if 'error' in messages and len(messages['error']) > 0:
+        errors = len(messages['error'])
+    if critical_errors > 0:
+        return { 'status': 'FAIL', 'version': schema_version, 'message': 'There were critical validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
+    elif errors > 0:
+        return { 'status': 'ERROR', 'version': schema_version, 'message': 'There were validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
+    else:
+        return { 'status': 'PASS', 'version': schema_version, 'message': '', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
+
+
+#### Run in a separate process for asynchronous validation: store the outcome in the validation cache for later fetches
+def run_trapi_validation_in_background(envelope, schema_version, cache_key):
+    validation_cache = TRAPIValidationCache()
+    try:
+        validation_result = run_trapi_validation(envelope, schema_version)
+    except Exception as error:
+        eprint(f"ERROR: Background TRAPI validation crashed with error: {error}")
+        validation_cache.remove(cache_key)  # So that the next fetch tries again
+        return
+    validation_cache.put(cache_key, validation_result)
+
+
+def start_trapi_validation_in_background(envelope, schema_version, cache_key):
+    """
+    Runs run_trapi_validation_in_background() in a double-forked process: the intermediate child exits right away (and
+    is reaped here), so the validation itself is reparented to init and never lingers as a zombie of a long-lived
+    server process. With fork, the validation gets its own snapshot of the envelope, so later changes to it don't matter.
+    The validation lets go of every inherited pipe and socket (except stderr), so that it can't hold open the pipe a
+    response is being streamed through, or the server's listening sockets, until it finishes
+    """
+    sys.stderr.flush()
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:  # I am the intermediate child process
+        exit_code = 0
+        try:
+            if os.fork() == 0:  # I am the detached grandchild process
+                try:
+                    os.setsid()
+                    dev_null_fd = os.open(os.devnull, os.O_RDWR)
+                    os.dup2(dev_null_fd, 0)
+                    os.dup2(dev_null_fd, 1)
+                    os.close(dev_null_fd)
+                    close_inherited_pipes_and_sockets(keep_fds=[])
+                    run_trapi_validation_in_background(envelope, schema_version, cache_key)
+                except BaseException as error:
+                    eprint(f"ERROR: Background TRAPI validation process failed with error: {error}")
+                    exit_code = 1
+                finally:
+                    sys.stderr.flush()
+                    os._exit(exit_code)
+        except BaseException as error:
+            eprint(f"ERROR: Couldn't fork the background TRAPI validation process: {error}")
+            exit_code = 1
+        os._exit(exit_code)
+    try:
+        os.waitpid(pid, 0)
+    except ChildProcessError:
+        pass  # Already reaped, e.g., if SIGCHLD is ignored in this process
+
+
 Base = declarative_base()
 
 #### Define the Response table a class for SQLalchemy
@@ -92,6 +171,9 @@ class ResponseCacheConfigSetting(Base):
 #### The main ResponseCache class
 class ResponseCache:
 
+    enable_validation = True
+    async_validation = False    # If True, get_response() returns before validating and a later fetch gets the outcome
+
     #### Constructor
     def __init__(self):
         self.rtxConfig = RTXConfiguration()
@@ -267,16 +349,18 @@ class ResponseCache:
                     print(f"DEBUG: Since we're before the cutover date, use {bucket_tag} " +
                         f"{buckets[bucket_tag]['region_name']} S3 bucket {buckets[bucket_tag]['bucket_name']}")
 
-            serialized_response = json.dumps(envelope.to_dict(), sort_keys=True, indent=2)
+            envelope_dict = model_to_dict(envelope)
 
             try:
                 region_name = buckets[bucket_tag]['region_name']
                 bucket_name = buckets[bucket_tag]['bucket_name']
                 eprint(f"INFO: Attempting to write to S3 bucket {region_name}:{bucket_name}:{response_filename}")
 
+                #### Stream the envelope as compressed, compact JSON into the bucket
                 t0 = timeit.default_timer()
                 s3 = boto3.resource('s3', region_name=region_name, aws_access_key_id=KEY_ID, aws_secret_access_key=ACCESS_KEY)
-                s3.Object(bucket_name, response_filename).put(Body=serialized_response)
+                response_storage = ResponseStorage(s3_bucket=s3.Bucket(bucket_name))
+                response_filename = response_storage.store_envelope(response_id, envelope_dict)
                 t1 = timeit.default_timer()
 
                 response.info(f"INFO: Successfully wrote {response_filename} to {region_name} S3 bucket {bucket_name} in {t1-t0} seconds")
@@ -285,8 +369,18 @@ class ResponseCache:
             except:
                 response.error(f"Unable to write response {response_filename} to {region_name} S3 bucket {bucket_name}", error_code="InternalError")
 
+            #### Also store the result index used to serve pages of results (not fatal if it fails; paging then falls back to the full envelope)
+            if succeeded_to_s3:
+                try:
+                    t0 = timeit.default_timer()
+                    response_storage.store_result_index(response_id, envelope_dict)
+                    t1 = timeit.default_timer()
+                    response.debug(f"Wrote result index for response {response_id} to {region_name} S3 bucket {bucket_name} in {t1-t0} seconds")
+                except:
+                    response.warning(f"Unable to write result index for response {response_id} to {region_name} S3 bucket {bucket_name}")
 
-            #### if the S3 write failed, store it as a JSON file on the filesystem
+
+            #### if the S3 write failed, store it as a compressed JSON file on the filesystem
             if not succeeded_to_s3:
                 response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
                 if not os.path.exists(response_dir):
@@ -296,13 +390,13 @@ class ResponseCache:
                         eprint(f"ERROR: Unable to create dir {response_dir}")
 
                 if os.path.exists(response_dir):
-                    response_filename = f"{stored_response.response_id}.json"
-                    response_path = f"{response_dir}/{response_filename}"
                     try:
-                        with open(response_path, 'w') as outfile:
-                            json.dump(serialized_response, outfile, sort_keys=True, indent=2)
+                        local_storage = ResponseStorage(local_dir=response_dir)
+                        response_path = local_storage.store_envelope(stored_response.response_id, envelope_dict)
+                        local_storage.store_result_index(stored_response.response_id, envelope_dict)
+                        eprint(f"INFO: Wrote response to file {response_path}")
                     except:
-                        eprint(f"ERROR: Unable to write response to file {response_path}")
+                        eprint(f"ERROR: Unable to write response {stored_response.response_id} to dir {response_dir}")
         else:
             response.warning(f"Not saving response to S3 because I don't know the S3BucketMigrationDatetime")
 
@@ -311,10 +405,12 @@ class ResponseCache:
 
     ##################################################################################################
     #### Fetch a cached response
-    def get_response(self, response_id):
+    def get_response(self, response_id, async_validation=None):
         session = self.session
 
         DEBUG = False
+        if async_validation is None:
+            async_validation = self.async_validation
 
         if response_id is None:
             return( { "status": 400, "title": "response_id missing", "detail": "Required attribute response_id is missing from URL", "type": "about:blank" }, 400)
@@ -328,16 +424,14 @@ class ResponseCache:
             stored_response = session.query(Response).filter(Response.response_id==int(response_id)).first()
             if stored_response is not None:
 
-                #### See if a very old response is still found locally
+                #### See if a very old response (or one that failed to go to S3) is still found locally
                 found_response_locally = False
                 response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-                response_filename = f"{stored_response.response_id}.json"
-                response_path = f"{response_dir}/{response_filename}"
                 try:
-                    with open(response_path) as infile:
-                        envelope = json.load(infile)
-                    found_response_locally = True
-                    eprint(f"INFO: Wow, found the response locally at '{response_path}'. It must be very old")
+                    envelope = ResponseStorage(local_dir=response_dir).fetch_envelope(stored_response.response_id)
+                    if envelope is not None:
+                        found_response_locally = True
+                        eprint(f"INFO: Wow, found response {stored_response.response_id} locally in '{response_dir}'. It must be very old")
                 except:
                     pass
 
@@ -386,12 +480,14 @@ class ResponseCache:
                             bucket_name = buckets[bucket_tag]['bucket_name']
                             s3 = boto3.resource('s3', region_name=region_name, aws_access_key_id=KEY_ID, aws_secret_access_key=ACCESS_KEY)
 
-                            response_filename = f"/responses/{response_id}.json"
+                            response_filename = f"/responses/{response_id}"
                             eprint(f"INFO: Attempting to read {region_name}:{bucket_name}:{response_filename} from S3")
                             t0 = timeit.default_timer()
 
-                            content = s3.Object(bucket_name, response_filename).get()["Body"].read()
-                            envelope = json.loads(content)
+                            #### Streams and decompresses the stored object, falling back to old uncompressed .json objects
+                            envelope = ResponseStorage(s3_bucket=s3.Bucket(bucket_name)).fetch_envelope(response_id)
+                            if envelope is None:
+                                raise FileNotFoundError(f"No stored object for response {response_id}")
                             t1 = timeit.default_timer()
                             eprint(f"INFO: Successfully read {response_filename} from {region_name} S3 bucket {bucket_name} in {t1-t0} seconds")
                             break
@@ -402,49 +498,8 @@ class ResponseCache:
                                 return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
 
 
-                #### Perform a validation on it
-                enable_validation = True
-                schema_version = trapi_version
-                if enable_validation:
-                    #if True:
-                    try:
-
-                        #### Perform the validation
-                        eprint(f"Validating TRAPI with version {schema_version} and {biolink_version}")
-                        validator = TRAPIResponseValidator(trapi_version=schema_version, biolink_version=biolink_version)
-                        validator.check_compliance_of_trapi_response(envelope)
-                        validation_messages_text = validator.dumps()
-                        raw_messages: Dict[str, List[Dict[str,str]]] = validator.get_all_messages()
-                        messages = raw_messages['Validate TRAPI Response']['Standards Test']
-                        #eprint(json.dumps(messages, indent=2, sort_keys=True))
-
-                        critical_errors = 0
-                        errors = 0
-                        if 'critical' in messages and len(messages['critical']) > 0:
-                            critical_errors = len(messages['critical'])
-                        if 'error' in messages and len(messages['error']) > 0:
-                            errors = len(messages['error'])
-                        if critical_errors > 0:
-                            envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'message': 'There were critical validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-                        elif errors > 0:
-                            envelope['validation_result'] = { 'status': 'ERROR', 'version': schema_version, 'message': 'There were validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-                        else:
-                            envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'message': '', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-
-                    #else:
-                    except Exception as error:
-                        timestamp = str(datetime.now().isoformat())
-                        if 'logs' not in envelope or envelope['logs'] is None:
-                            envelope['logs'] = []
-                        envelope['logs'].append( { "code": 'ValidatorFailed', "level": "ERROR", "message": "TRAPI validator crashed with error: " + str(error),
-                            "timestamp": timestamp } )
-                        if 'description' not in envelope or envelope['description'] is None:
-                            envelope['description'] = ''
-                        envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'message': 'TRAPI validator crashed with error: ' + str(error) + ' --- ' + envelope['description'] }
-
-                else:
-                    envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'message': 'Validation disabled.', 'validation_messages': { "errors": [], "warnings": [], "information": [ 'Validation has been temporarily disabled due to problems with dependencies. Will return again soon.' ] } }
-
+                #### Perform a validation on it (or reuse a cached validation result)
+                self.attach_validation_result(envelope, async_validation=async_validation)
 
                 #### Count provenance information
                 attribute_parser = ARAXAttributeParser(envelope,envelope['message'])
@@ -496,43 +551,8 @@ class ResponseCache:
                 return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
 
 
-            #### Perform a validation on it
-            enable_validation = True
-            schema_version = trapi_version
-            #if 'schema_version' in envelope:
-            #    schema_version = envelope['schema_version']
-            try:
-                if enable_validation:
-
-                    validator = TRAPIResponseValidator(trapi_version=schema_version, biolink_version=biolink_version)
-                    validator.check_compliance_of_trapi_response(envelope)
-                    raw_messages: Dict[str, List[Dict[str,str]]] = validator.get_all_messages()
-                    messages = raw_messages['Validate TRAPI Response']['Standards Test']
-
-                    critical_errors = 0
-                    errors = 0
-                    if 'critical' in messages and len(messages['critical']) > 0:
-                        critical_errors = len(messages['critical'])
-                    if 'error' in messages and len(messages['error']) > 0:
-                       errors = len(messages['error'])
-                    if critical_errors > 0:
-                        envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'message': 'There were critical validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-                    elif errors > 0:
-                        envelope['validation_result'] = { 'status': 'ERROR', 'version': schema_version, 'message': 'There were validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-                    else:
-                        envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'message': '', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-
-                else:
-                    envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'message': 'Validation disabled. too many dependency failures', 'validation_messages': { "errors": [], "warnings": [], "information": [ 'Validation has been temporarily disabled due to problems with dependencies. Will return again soon.' ] } }
-            except Exception as error:
-                timestamp = str(datetime.now().isoformat())
-                if 'logs' not in envelope or envelope['logs'] is None:
-                    envelope['logs'] = []
-                envelope['logs'].append( { "code": 'ValidatorFailed', "level": "ERROR", "message": "TRAPI validator crashed with error: " + str(error),
-                    "timestamp": timestamp } )
-                if 'description' not in envelope or envelope['description'] is None:
-                    envelope['description'] = ''
-                envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'message': 'TRAPI validator crashed with error: ' + str(error) + ' --- ' + envelope['description'] }
+            #### Perform a validation on it (or reuse a cached validation result)
+            self.attach_validation_result(envelope, async_validation=async_validation)
 
             #### Count provenance information
             attribute_parser = ARAXAttributeParser(envelope,envelope['message'])
@@ -552,6 +572,10 @@ class ResponseCache:
             if os.path.exists(filename):
                 with open(filename) as infile:
                     envelope = json.load(infile)
+                #### If it was cached before its background validation finished, see if that's done now
+                if self.refresh_pending_validation_result(envelope):
+                    with open(filename, 'w') as outfile:
+                        json.dump(envelope, outfile)
                 return envelope
 
             #### If it started with Z, this is a special temporary cache, and if it's not there, all is lost
@@ -722,47 +746,9 @@ class ResponseCache:
                     return envelope
 
 
-                #### Perform a validation on it
-                enable_validation = True
-                schema_version = trapi_version
-                try:
-                    if enable_validation:
-
-                        #### Set up the validator
-                        validator = TRAPIResponseValidator(trapi_version=schema_version, biolink_version=biolink_version)
-
-                        eprint(f"Validating response with trapi_version={schema_version}, biolink_version={biolink_version}")
-                        validator.check_compliance_of_trapi_response(envelope)
-
-                        raw_messages: Dict[str, List[Dict[str,str]]] = validator.get_all_messages()
-                        messages = raw_messages['Validate TRAPI Response']['Standards Test']
-                        validation_messages_text = validator.dumps()
-
-                        critical_errors = 0
-                        errors = 0
-                        if 'critical' in messages and len(messages['critical']) > 0:
-                            critical_errors = len(messages['critical'])
-                        if 'error' in messages and len(messages['error']) > 0:
-                            errors = len(messages['error'])
-                        if critical_errors > 0:
-                            envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'size': content_size, 'message': 'There were critical validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-                        elif errors > 0:
-                            envelope['validation_result'] = { 'status': 'ERROR', 'version': schema_version, 'size': content_size, 'message': 'There were validator errors', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-                        else:
-                            envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'size': content_size, 'message': '', 'validation_messages': messages, 'validation_messages_text': validation_messages_text }
-
-                    else:
-                        envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'size': content_size, 'message': 'Validation disabled. too many dependency failures', 'validation_messages': { "errors": [], "warnings": [], "information": [ 'Validation has been temporarily disabled due to problems with dependencies. Will return again soon.' ] } }
-
-                except Exception as error:
-                    timestamp = str(datetime.now().isoformat())
-                    if 'logs' not in envelope or envelope['logs'] is None:
-                        envelope['logs'] = []
-                    envelope['logs'].append( { "code": 'ValidatorFailed', "level": "ERROR", "message": "TRAPI validator crashed with error: " + str(error),
-                        "timestamp": timestamp } )
-                    if 'description' not in envelope or envelope['description'] is None:
-                        envelope['description'] = ''
-                    envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'size': content_size, 'message': 'TRAPI validator crashed with error: ' + str(error) + ' --- ' + envelope['description'] }
+                #### Perform a validation on it (or reuse a cached validation result)
+                self.attach_validation_result(envelope, async_validation=async_validation)
+                envelope['validation_result']['size'] = content_size
 
                 #### Try to add the resource_id
                 if 'name' in response_dict['fields'] and response_dict['fields']['name'] is not None:
@@ -834,6 +820,12 @@ class ResponseCache:
                     with open(filename, 'w') as outfile:
                         json.dump(envelope, outfile)
 
+                    #### Also index the results so that get_response_page() can serve pages without re-reading the whole thing
+                    try:
+                        ResponseStorage(local_dir=component_cache_dir).store_result_index(response_id, envelope)
+                    except:
+                        eprint(f"WARNING: Unable to write result index for {response_id} to {component_cache_dir}")
+
 
 
 
@@ -845,6 +837,131 @@ class ResponseCache:
         return( { "status": 404, "title": "UnrecognizedResponse_idFormat", "detail": "Unrecognized response_id format", "type": "about:blank" }, 404)
 
 
+    ##################################################################################################
+    #### Validate an envelope and attach the validation_result, reusing the outcome of an earlier validation of the
+    #### same content if there is one. With async_validation, if there is no outcome yet, the validation is started in
+    #### the background and a PENDING validation_result is attached instead; a later fetch will find the outcome
+    def attach_validation_result(self, envelope, async_validation=False):
+
+        schema_version = trapi_version
+        if not self.enable_validation:
+            envelope['validation_result'] = { 'status': 'PASS', 'version': schema_version, 'message': 'Validation disabled.', 'validation_messages': { "errors": [], "warnings": [], "information": [ 'Validation has been temporarily disabled due to problems with dependencies. Will return again soon.' ] } }
+            return
+
+        validation_cache = TRAPIValidationCache()
+        cache_key = validation_cache.get_cache_key(envelope, schema_version, biolink_version)
+        validation_result = validation_cache.get(cache_key)
+        if validation_result is not None and (validation_result['status'] != PENDING_STATUS or async_validation):
+            eprint(f"INFO: Using cached TRAPI validation result ({validation_result['status']})")
+            envelope['validation_result'] = validation_result
+            return
+
+        if async_validation:
+            validation_result = { 'status': PENDING_STATUS, 'version': schema_version, 'message': 'Validation is in progress. Fetch this response again to get the result',
+                'validation_key': cache_key, 'validation_messages': { "errors": [], "warnings": [], "information": [] } }
+            if validation_cache.mark_pending(cache_key, validation_result):
+                eprint(f"INFO: Starting TRAPI validation in the background")
+                start_trapi_validation_in_background(envelope, schema_version, cache_key)
+            envelope['validation_result'] = validation_result
+            return
+
+        try:
+            validation_result = run_trapi_validation(envelope, schema_version)
+            validation_cache.put(cache_key, validation_result)
+            envelope['validation_result'] = validation_result
+
+        except Exception as error:
+            timestamp = str(datetime.now().isoformat())
+            if 'logs' not in envelope or envelope['logs'] is None:
+                envelope['logs'] = []
+            envelope['logs'].append( { "code": 'ValidatorFailed', "level": "ERROR", "message": "TRAPI validator crashed with error: " + str(error),
+                "timestamp": timestamp } )
+            if 'description' not in envelope or envelope['description'] is None:
+                envelope['description'] = ''
+            envelope['validation_result'] = { 'status': 'FAIL', 'version': schema_version, 'message': 'TRAPI validator crashed with error: ' + str(error) + ' --- ' + envelope['description'] }
+
+
+    ##################################################################################################
+    #### If the envelope carries a PENDING validation_result whose background validation has since finished, swap in
+    #### the outcome (keeping any extra summary information added to it). Returns True if the envelope was updated
+    def refresh_pending_validation_result(self, envelope):
+
+        pending_result = envelope.get('validation_result')
+        if not isinstance(pending_result, dict) or pending_result.get('status') != PENDING_STATUS or 'validation_key' not in pending_result:
+            return False
+        validation_result = TRAPIValidationCache().get(pending_result['validation_key'])
+        if validation_result is None or validation_result['status'] == PENDING_STATUS:
+            return False
+        extra_info = { key: value for key, value in pending_result.items() if key not in [ 'status', 'message', 'validation_key', 'validation_messages' ] }
+        envelope['validation_result'] = { **validation_result, **extra_info }
+        return True
+
+
+    ##################################################################################################
+    #### Fetch a page of results from a cached response, along with only the part of the KG they reference
+    def get_response_page(self, response_id, offset=0, limit=100, async_validation=None):
+
+        if response_id is None:
+            return( { "status": 400, "title": "response_id missing", "detail": "Required attribute response_id is missing from URL", "type": "about:blank" }, 400)
+        response_id = str(response_id)
+        offset = int(offset) if offset is not None else 0
+        limit = int(limit) if limit is not None else 100
+
+        #### Find the result index written at store time (for an ARS response, written when it was first fetched)
+        for response_storage in self._get_result_index_storages(response_id):
+            try:
+                envelope = response_storage.fetch_results_page(response_id, offset=offset, limit=limit)
+            except:
+                eprint(f"WARNING: Unable to read the result index for response {response_id}")
+                continue
+            if envelope is not None:
+                self.refresh_pending_validation_result(envelope)
+                return envelope
+
+        #### Otherwise go through get_response(), which for ARS responses also writes the result index
+        envelope = self.get_response(response_id, async_validation=async_validation)
+        if isinstance(envelope, tuple) or not isinstance(envelope, dict):
+            return envelope
+        if len(response_id) > 30:
+            paged_envelope = ResponseStorage(local_dir=component_cache_dir).fetch_results_page(response_id, offset=offset, limit=limit)
+            if paged_envelope is not None:
+                self.refresh_pending_validation_result(paged_envelope)
+                return paged_envelope
+        if 'message' not in envelope:
+            return envelope
+        return get_results_page(envelope, offset=offset, limit=limit)
+
+
+    ##################################################################################################
+    #### Return the ResponseStorages that may hold a result index for this response_id, in the order to try them
+    def _get_result_index_storages(self, response_id):
+
+        storages = []
+        if re.match(r'\d+\s*$', response_id):
+            storages.append(ResponseStorage(local_dir=os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'))
+            bucket_config = self.get_configs()
+            if bucket_config.get('S3BucketMigrationDatetime') is None:
+                return storages
+            rtx_config = RTXConfiguration()
+            KEY_ID = rtx_config.config_secrets['s3']['access']
+            ACCESS_KEY = rtx_config.config_secrets['s3']['secret']
+            buckets = {
+                'old': { 'region_name': 'us-west-2', 'bucket_name': 'arax-response-storage' },
+                'new': { 'region_name': 'us-east-1', 'bucket_name': 'arax-response-storage-2' }
+            }
+            bucket_tags = [ 'old', 'new' ]
+            if str(datetime.now()) > bucket_config['S3BucketMigrationDatetime']:
+                bucket_tags = [ 'new', 'old' ]
+            for bucket_tag in bucket_tags:
+                s3 = boto3.resource('s3', region_name=buckets[bucket_tag]['region_name'], aws_access_key_id=KEY_ID, aws_secret_access_key=ACCESS_KEY)
+                storages.append(ResponseStorage(s3_bucket=s3.Bucket(buckets[bucket_tag]['bucket_name'])))
+
+        elif len(response_id) > 30:
+            storages.append(ResponseStorage(local_dir=component_cache_dir))
+
+        return storages
+
+
     ##################################################################################################
     #### Store a received callback content
     def store_callback(self, body):
@@ -956,6 +1073,9 @@ def main():
     argparser.add_argument('--show_config', action='count', help='Show all the database config settings')
     argparser.add_argument('--set_config', action='store', help='Specify a key and value to insert or update with format key=value')
     argparser.add_argument('--response_id', action='store', help='Id of a response to display')
+    argparser.add_argument('--offset', action='store', type=int, default=0, help='With --limit, index of the first result (by descending score) to fetch')
+    argparser.add_argument('--limit', action='store', type=int, help='If set, only fetch this many results of the response (and the KG they reference)')
+    argparser.add_argument('--async_validation', action='count', help='If set, do not wait for TRAPI validation of the response (fetch it again for the result)')
     params = argparser.parse_args()
 
     #### Create a new ResponseStore object
@@ -972,9 +1092,19 @@ def main():
             print(f"response_id={response.response_id}  response_datetime={response.response_datetime}")
         return
 
+    if params.response_id is not None and len(params.response_id) > 0 and params.limit is not None:
+        print(f"Loading results {params.offset} to {params.offset + params.limit} of response_id {params.response_id}:")
+        envelope = response_cache.get_response_page(params.response_id, offset=params.offset, limit=params.limit, async_validation=params.async_validation is not None)
+        if isinstance(envelope, dict) and 'result_page' in envelope:
+            print(json.dumps(envelope['result_page'], indent=2, sort_keys=True))
+            print(f"Got {len(envelope['message']['results'])} results, {len(envelope['message']['knowledge_graph']['nodes'])} nodes, {len(envelope['message']['knowledge_graph']['edges'])} edges")
+        return
+
     if params.response_id is not None and len(params.response_id) > 0:
         print(f"Loading response_id {params.response_id}:")
-        envelope = response_cache.get_response(params.response_id)
+        envelope = response_cache.get_response(params.response_id, async_validation=params.async_validation is not None)
+        if isinstance(envelope, dict) and 'validation_result' in envelope:
+            print(f"Validation status: {envelope['validation_result'].get('status')}")
         #print(json.dumps(ast.literal_eval(repr(envelope)), sort_keys=True, indent=2))
         #print(json.dumps(envelope, sort_keys=True, indent=2))
         return
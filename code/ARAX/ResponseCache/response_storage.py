@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+"""
+The response_storage.py file defines a class called ResponseStorage, which reads and writes the response envelopes
+that ResponseCache stores, either in an S3 bucket or in a local directory. Envelopes are written as compact (no indent)
+JSON compressed with zstd (if the zstandard package is installed) or gzip, and are streamed through the compressor
+and into the upload rather than being built up as one big pretty-printed string. Responses stored before compression
+was introduced (plain '<response_id>.json' objects) are still found and read transparently.
+
+Alongside each envelope, a result index can be stored, so that a page of results (sorted by score) can be fetched
+together with just the part of the knowledge graph those results reference, without reading the whole envelope.
+The results are split into fixed-size pages, each written as an independently gzipped JSON member of a single
+'<response_id>.result_pages' object; the small '<response_id>.result_index.json' object holds the envelope minus its
+results and knowledge graph, plus the byte range of each page, so a page is fetched with a single ranged read.
+"""
+import gzip
+import io
+import json
+import os
+import tempfile
+from typing import Optional, List, Tuple, Iterable, Set
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_SUFFIX = ".json.gz"
+ZSTD_SUFFIX = ".json.zst"
+LEGACY_SUFFIX = ".json"
+RESULT_PAGES_SUFFIX = ".result_pages"
+RESULT_INDEX_SUFFIX = ".result_index.json"
+RESULT_INDEX_VERSION = 1
+
+
+class ResponseStorage:
+
+    s3_key_prefix = "/responses"
+    gzip_compression_level = 6
+    zstd_compression_level = 10
+    spool_max_bytes = 64 * 1024 * 1024  # Compressed envelopes bigger than this are spooled to disk before uploading
+    chunk_size = 1024 * 1024
+    results_page_size = 100  # Number of results per stored page
+
+    def __init__(self, s3_bucket=None, local_dir: Optional[str] = None):
+        """
+        Exactly one of s3_bucket (a boto3 Bucket resource, or anything with the same Object() interface) or local_dir
+        must be given.
+        """
+        if (s3_bucket is None) == (local_dir is None):
+            raise ValueError("ResponseStorage needs exactly one of s3_bucket or local_dir")
+        self.s3_bucket = s3_bucket
+        self.local_dir = local_dir
+
+    # ----------------------------------------- PUBLIC METHODS ------------------------------------------------------ #
+
+    def store_envelope(self, response_id, envelope: dict) -> str:
+        """
+        Serializes and compresses the envelope and stores it under this response_id. Returns the name (S3 key or local
+        path) it was stored under.
+        """
+        suffix = self.get_preferred_suffix()
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes) as buffer:
+            self.write_compressed_json(envelope, buffer, suffix)
+            buffer.seek(0)
+            return self._store_object(response_id, suffix, buffer)
+
+    def fetch_envelope(self, response_id) -> Optional[dict]:
+        """
+        Returns the stored envelope for this response_id (whichever format it was stored in), or None if there isn't
+        one. Errors other than the object not existing (e.g., S3 permission problems) are raised.
+        """
+        for suffix in self.get_readable_suffixes():
+            stream = self._open_stored_object(response_id, suffix)
+            if stream is None:
+                continue
+            try:
+                return self.read_compressed_json(stream, suffix)
+            finally:
+                stream.close()
+        return None
+
+    def store_result_index(self, response_id, envelope: dict) -> str:
+        """
+        Stores the envelope's results as pages sorted by score (each with the knowledge graph subset it references),
+        plus an index of those pages, so that fetch_results_page() can later serve any page cheaply. Returns the name
+        the index was stored under.
+        """
+        message = envelope.get("message") or {}
+        results = sort_results_by_score(message.get("results") or [])
+        page_ranges = []
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes) as buffer:
+            for page_start in range(0, len(results), self.results_page_size):
+                page_results = results[page_start:page_start + self.results_page_size]
+                page_start_byte = buffer.tell()
+                with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=self.gzip_compression_level) as page_stream:
+                    page_stream.write(json.dumps(get_results_subset_message(message, page_results),
+                                                 separators=(",", ":")).encode("utf-8"))
+                page_ranges.append([page_start_byte, buffer.tell()])
+            buffer.seek(0)
+            self._store_object(response_id, RESULT_PAGES_SUFFIX, buffer)
+
+        result_index = {"version": RESULT_INDEX_VERSION,
+                        "n_results": len(results),
+                        "page_size": self.results_page_size,
+                        "page_ranges": page_ranges,
+                        "envelope_header": get_envelope_header(envelope)}
+        # The index goes in last, so that its presence means the pages are ready
+        return self._store_object(response_id, RESULT_INDEX_SUFFIX,
+                                  io.BytesIO(json.dumps(result_index, separators=(",", ":")).encode("utf-8")))
+
+    def fetch_results_page(self, response_id, offset: int = 0, limit: int = 100) -> Optional[dict]:
+        """
+        Returns an envelope containing only results [offset, offset + limit) (in order of descending score) and the
+        knowledge graph nodes/edges/auxiliary graphs they reference, or None if no result index was stored for this
+        response (in which case the caller has to fall back to the full envelope).
+        """
+        index_bytes = self._read_object_bytes(response_id, RESULT_INDEX_SUFFIX)
+        if index_bytes is None:
+            return None
+        result_index = json.loads(index_bytes)
+        if result_index.get("version") != RESULT_INDEX_VERSION:
+            return None
+        offset = max(offset, 0)
+        limit = max(limit, 0)
+        end = min(offset + limit, result_index["n_results"])
+        page_size = result_index["page_size"]
+        page_ranges = result_index["page_ranges"]
+        first_page, last_page = offset // page_size, (end - 1) // page_size
+        merged_message = {"results": [], "knowledge_graph": {"nodes": {}, "edges": {}}, "auxiliary_graphs": {}}
+        if end > offset:
+            # The pages we need are contiguous, so they can all be fetched with a single ranged read
+            range_start, range_end = page_ranges[first_page][0], page_ranges[last_page][1]
+            pages_bytes = self._read_object_bytes(response_id, RESULT_PAGES_SUFFIX, (range_start, range_end))
+            if pages_bytes is None:
+                return None
+            for page_start_byte, page_end_byte in page_ranges[first_page:last_page + 1]:
+                page = json.loads(gzip.decompress(pages_bytes[page_start_byte - range_start:page_end_byte - range_start]))
+                merged_message["results"].extend(page["results"])
+                merged_message["knowledge_graph"]["nodes"].update(page["knowledge_graph"]["nodes"])
+                merged_message["knowledge_graph"]["edges"].update(page["knowledge_graph"]["edges"])
+                merged_message["auxiliary_graphs"].update(page["auxiliary_graphs"])
+        start_within_pages = offset - first_page * page_size
+        page_results = merged_message["results"][start_within_pages:start_within_pages + (end - offset)]
+        # The fetched pages may include results outside the requested window, so trim the KG to what's referenced
+        return build_results_page_envelope(result_index["envelope_header"],
+                                           get_results_subset_message(merged_message, page_results),
+                                           offset, limit, result_index["n_results"])
+
+    @staticmethod
+    def get_preferred_suffix() -> str:
+        return ZSTD_SUFFIX if zstandard is not None else GZIP_SUFFIX
+
+    @staticmethod
+    def get_readable_suffixes() -> List[str]:
+        """
+        Returns the suffixes to look for when fetching a response, in order: the format we'd write now first, then
+        the other compressed format, and finally the legacy uncompressed format.
+        """
+        if zstandard is not None:
+            return [ZSTD_SUFFIX, GZIP_SUFFIX, LEGACY_SUFFIX]
+        else:
+            return [GZIP_SUFFIX, ZSTD_SUFFIX, LEGACY_SUFFIX]
+
+    @classmethod
+    def write_compressed_json(cls, envelope: dict, outfile, suffix: str):
+        """
+        Streams the envelope as compact JSON through the compressor for this suffix into the (binary) outfile, which
+        is left open.
+        """
+        if suffix == ZSTD_SUFFIX:
+            compressor = zstandard.ZstdCompressor(level=cls.zstd_compression_level)
+            compressed_stream = compressor.stream_writer(outfile, closefd=False)
+        elif suffix == GZIP_SUFFIX:
+            compressed_stream = gzip.GzipFile(fileobj=outfile, mode="wb", compresslevel=cls.gzip_compression_level)
+        else:
+            compressed_stream = None
+        text_stream = io.TextIOWrapper(compressed_stream if compressed_stream else outfile, encoding="utf-8",
+                                       write_through=False)
+        # json.dump() writes the encoding out chunk by chunk, so the full JSON string never exists in memory
+        json.dump(envelope, text_stream, separators=(",", ":"))
+        text_stream.flush()
+        text_stream.detach()
+        if compressed_stream:
+            compressed_stream.close()
+
+    @classmethod
+    def read_compressed_json(cls, infile, suffix: str) -> dict:
+        """
+        Decompresses (according to the suffix) and parses JSON from the (binary) infile, which is left open.
+        """
+        if suffix == ZSTD_SUFFIX:
+            if zstandard is None:
+                raise ImportError(f"Cannot read a {ZSTD_SUFFIX} response because the zstandard package is not installed")
+            decompressed_stream = zstandard.ZstdDecompressor().stream_reader(infile, read_size=cls.chunk_size,
+                                                                             closefd=False)
+        elif suffix == GZIP_SUFFIX:
+            decompressed_stream = gzip.GzipFile(fileobj=infile, mode="rb")
+        else:
+            decompressed_stream = None
+        try:
+            return json.load(decompressed_stream if decompressed_stream else infile)
+        finally:
+            if decompressed_stream:
+                decompressed_stream.close()
+
+    # ----------------------------------------- PRIVATE METHODS ----------------------------------------------------- #
+
+    def _get_s3_key(self, response_id, suffix: str) -> str:
+        return f"{self.s3_key_prefix}/{response_id}{suffix}"
+
+    def _get_local_path(self, response_id, suffix: str) -> str:
+        return f"{self.local_dir}/{response_id}{suffix}"
+
+    def _store_object(self, response_id, suffix: str, fileobj) -> str:
+        if self.s3_bucket is not None:
+            key = self._get_s3_key(response_id, suffix)
+            self.s3_bucket.Object(key).upload_fileobj(fileobj)
+            return key
+        else:
+            path = self._get_local_path(response_id, suffix)
+            with open(f"{path}.tmp", "wb") as outfile:
+                while chunk := fileobj.read(self.chunk_size):
+                    outfile.write(chunk)
+            os.replace(f"{path}.tmp", path)  # So that readers never see a half-written file
+            return path
+
+    def _read_object_bytes(self, response_id, suffix: str, byte_range: Optional[Tuple[int, int]] = None) -> Optional[bytes]:
+        """
+        Returns the contents of the stored object with this suffix (only bytes [start, end) if a byte_range is given),
+        or None if no such object exists.
+        """
+        if self.s3_bucket is not None:
+            s3_object = self.s3_bucket.Object(self._get_s3_key(response_id, suffix))
+            try:
+                if byte_range:
+                    return s3_object.get(Range=f"bytes={byte_range[0]}-{byte_range[1] - 1}")["Body"].read()
+                return s3_object.get()["Body"].read()
+            except Exception as error:
+                if self._is_missing_object_error(error):
+                    return None
+                raise
+        else:
+            path = self._get_local_path(response_id, suffix)
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as infile:
+                if byte_range:
+                    infile.seek(byte_range[0])
+                    return infile.read(byte_range[1] - byte_range[0])
+                return infile.read()
+
+    def _open_stored_object(self, response_id, suffix: str):
+        """
+        Returns a readable binary stream for the stored object with this suffix, or None if no such object exists.
+        """
+        if self.s3_bucket is not None:
+            try:
+                return self.s3_bucket.Object(self._get_s3_key(response_id, suffix)).get()["Body"]
+            except Exception as error:
+                if self._is_missing_object_error(error):
+                    return None
+                raise
+        else:
+            path = self._get_local_path(response_id, suffix)
+            return open(path, "rb") if os.path.exists(path) else None
+
+    @staticmethod
+    def _is_missing_object_error(error: Exception) -> bool:
+        # botocore's ClientError carries the S3 error code in its response dict
+        error_response = getattr(error, "response", None)
+        if not isinstance(error_response, dict):
+            return False
+        return error_response.get("Error", {}).get("Code") in {"NoSuchKey", "404", "NotFound"}
+
+
+def get_stored_response_keys(response_id) -> List[Tuple[str, str]]:
+    """
+    Returns (suffix, S3 key) pairs for every format a response may be stored in, in the order they should be tried.
+    """
+    return [(suffix, f"{ResponseStorage.s3_key_prefix}/{response_id}{suffix}")
+            for suffix in ResponseStorage.get_readable_suffixes()]
+
+
+def sort_results_by_score(results: List[dict]) -> List[dict]:
+    """
+    Returns the results ordered by descending score (the best score among each result's analyses); results without
+    a score go last, and ties keep their original order.
+    """
+    def get_result_score(result: dict) -> float:
+        scores = [analysis.get("score") for analysis in result.get("analyses") or []
+                  if isinstance(analysis, dict) and analysis.get("score") is not None]
+        return max(scores) if scores else float("-inf")
+    return sorted(results, key=get_result_score, reverse=True)
+
+
+def get_results_subset_message(message: dict, results: List[dict]) -> dict:
+    """
+    Returns a message containing just the given results and the knowledge graph nodes, edges and auxiliary graphs
+    they (directly or via support graphs) reference.
+    """
+    knowledge_graph = message.get("knowledge_graph") or {}
+    kg_nodes = knowledge_graph.get("nodes") or {}
+    kg_edges = knowledge_graph.get("edges") or {}
+    auxiliary_graphs = message.get("auxiliary_graphs") or {}
+
+    node_keys, edge_keys, auxiliary_graph_keys = set(), set(), set()
+    pending_edge_keys, pending_auxiliary_graph_keys = [], []
+    for result in results:
+        for bindings in (result.get("node_bindings") or {}).values():
+            node_keys.update(binding["id"] for binding in bindings if binding.get("id") in kg_nodes)
+        for analysis in result.get("analyses") or []:
+            for bindings in (analysis.get("edge_bindings") or {}).values():
+                pending_edge_keys.extend(binding["id"] for binding in bindings if "id" in binding)
+            pending_auxiliary_graph_keys.extend(analysis.get("support_graphs") or [])
+
+    # Edges can point to support graphs, whose edges can point to further support graphs, and so on
+    while pending_edge_keys or pending_auxiliary_graph_keys:
+        while pending_edge_keys:
+            edge_key = pending_edge_keys.pop()
+            if edge_key in edge_keys or edge_key not in kg_edges:
+                continue
+            edge_keys.add(edge_key)
+            edge = kg_edges[edge_key]
+            node_keys.update(node_key for node_key in [edge.get("subject"), edge.get("object")] if node_key in kg_nodes)
+            pending_auxiliary_graph_keys.extend(_get_support_graph_keys(edge.get("attributes")))
+        while pending_auxiliary_graph_keys:
+            auxiliary_graph_key = pending_auxiliary_graph_keys.pop()
+            if auxiliary_graph_key in auxiliary_graph_keys or auxiliary_graph_key not in auxiliary_graphs:
+                continue
+            auxiliary_graph_keys.add(auxiliary_graph_key)
+            pending_edge_keys.extend(auxiliary_graphs[auxiliary_graph_key].get("edges") or [])
+
+    return {"results": results,
+            "knowledge_graph": {"nodes": {node_key: kg_nodes[node_key] for node_key in node_keys},
+                                "edges": {edge_key: kg_edges[edge_key] for edge_key in edge_keys}},
+            "auxiliary_graphs": {auxiliary_graph_key: auxiliary_graphs[auxiliary_graph_key]
+                                 for auxiliary_graph_key in auxiliary_graph_keys}}
+
+
+def get_envelope_header(envelope: dict) -> dict:
+    """
+    Returns a copy of the envelope without its results, knowledge graph and auxiliary graphs.
+    """
+    envelope_header = {key: value for key, value in envelope.items() if key != "message"}
+    envelope_header["message"] = {key: value for key, value in (envelope.get("message") or {}).items()
+                                  if key not in {"results", "knowledge_graph", "auxiliary_graphs"}}
+    return envelope_header
+
+
+def build_results_page_envelope(envelope_header: dict, subset_message: dict, offset: int, limit: int,
+                                n_results: int) -> dict:
+    envelope = dict(envelope_header)
+    envelope["message"] = {**envelope_header.get("message", {}), **subset_message}
+    envelope["result_page"] = {"offset": offset, "limit": limit, "n_results": n_results}
+    return envelope
+
+
+def get_results_page(envelope: dict, offset: int = 0, limit: int = 100) -> dict:
+    """
+    Builds the same page that ResponseStorage.fetch_results_page() would return, but from an envelope in memory
+    (for responses stored before result indexes existed).
+    """
+    message = envelope.get("message") or {}
+    results = sort_results_by_score(message.get("results") or [])
+    offset = max(offset, 0)
+    limit = max(limit, 0)
+    return build_results_page_envelope(get_envelope_header(envelope),
+                                       get_results_subset_message(message, results[offset:offset + limit]),
+                                       offset, limit, len(results))
+
+
+def _get_support_graph_keys(attributes: Optional[Iterable[dict]]) -> Set[str]:
+    support_graph_keys = set()
+    for attribute in attributes or []:
+        if isinstance(attribute, dict) and attribute.get("attribute_type_id") == "biolink:support_graphs":
+            value = attribute.get("value")
+            support_graph_keys.update(value if isinstance(value, list) else [value])
+    return support_graph_keys
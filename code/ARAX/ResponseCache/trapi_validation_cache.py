@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+The trapi_validation_cache.py file defines a class called TRAPIValidationCache, which persists the outcomes of running
+the TRAPI validator over response envelopes. Outcomes are keyed by a hash of the envelope's content plus the TRAPI and
+Biolink versions validated against, so an envelope that is fetched again and again (e.g., an ARS response that the UI
+keeps polling) only has to be validated once, by whichever worker process gets to it first. The number of stored
+outcomes is bounded via LRU eviction. The cache also records which envelopes are currently being validated in the
+background, so that concurrent fetches don't each start their own validation.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+PENDING_STATUS = "PENDING"
+
+
+class TRAPIValidationCache:
+
+    max_entries = 10000  # Number of validation outcomes kept before LRU eviction kicks in
+    pending_timeout = 15 * 60  # Seconds after which a background validation that never finished is presumed dead
+    db_timeout = 10  # Seconds to wait on another process's write lock
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path if db_path else f"{os.path.dirname(os.path.abspath(__file__))}/trapi_validation_cache.sqlite"
+
+    # ----------------------------------------- PUBLIC METHODS ------------------------------------------------------ #
+
+    @staticmethod
+    def get_cache_key(envelope: dict, trapi_version: str, biolink_version: str) -> str:
+        # Any validation_result already attached to the envelope isn't part of what gets validated
+        content = json.dumps({key: value for key, value in envelope.items() if key != "validation_result"},
+                             sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{trapi_version}|{biolink_version}|{content}".encode()).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        """
+        Returns the cached validation result for this key, or None if there isn't one. If the envelope is currently
+        being validated in the background, returns a result with status PENDING.
+        """
+        try:
+            with self._connect() as connection:
+                row = connection.execute("SELECT status, created, validation_result FROM validation_results "
+                                         "WHERE key = ?", (cache_key,)).fetchone()
+                if row and row[0] == PENDING_STATUS and time.time() - row[1] > self.pending_timeout:
+                    connection.execute("DELETE FROM validation_results WHERE key = ?", (cache_key,))
+                    row = None
+                if row:
+                    connection.execute("UPDATE validation_results SET last_accessed = ? WHERE key = ?",
+                                       (time.time(), cache_key))
+            return json.loads(row[2]) if row else None
+        except Exception:
+            return None  # A broken cache should never break a fetch
+
+    def put(self, cache_key: str, validation_result: dict) -> bool:
+        try:
+            now = time.time()
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO validation_results "
+                                   "(key, status, created, last_accessed, validation_result) VALUES (?, ?, ?, ?, ?)",
+                                   (cache_key, validation_result.get("status"), now, now, json.dumps(validation_result)))
+                self._evict(connection)
+        except Exception:
+            return False
+        return True
+
+    def mark_pending(self, cache_key: str, pending_validation_result: dict) -> bool:
+        """
+        Records that this envelope is being validated in the background. Returns False if there already is a result
+        (pending or not) for it, in which case the caller shouldn't start another validation.
+        """
+        try:
+            now = time.time()
+            with self._connect() as connection:
+                cursor = connection.execute("INSERT OR IGNORE INTO validation_results "
+                                            "(key, status, created, last_accessed, validation_result) "
+                                            "VALUES (?, ?, ?, ?, ?)",
+                                            (cache_key, PENDING_STATUS, now, now, json.dumps(pending_validation_result)))
+                return cursor.rowcount > 0
+        except Exception:
+            return False
+
+    def remove(self, cache_key: str):
+        try:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM validation_results WHERE key = ?", (cache_key,))
+        except Exception:
+            pass
+
+    def clear(self):
+        if os.path.exists(self.db_path):
+            with self._connect() as connection:
+                connection.execute("DELETE FROM validation_results")
+
+    # ----------------------------------------- PRIVATE METHODS ----------------------------------------------------- #
+
+    @contextmanager
+    def _connect(self):
+        # Fetches are served by forked child processes, so connections aren't shared; open one per operation
+        connection = sqlite3.connect(self.db_path, timeout=self.db_timeout)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS validation_results (key TEXT PRIMARY KEY, status TEXT, "
+                               "created REAL, last_accessed REAL, validation_result TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS validation_results_by_last_accessed "
+                               "ON validation_results (last_accessed)")
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _evict(self, connection: sqlite3.Connection):
+        num_entries = connection.execute("SELECT COUNT(*) FROM validation_results").fetchone()[0]
+        if num_entries > self.max_entries:
+            connection.execute("DELETE FROM validation_results WHERE key IN (SELECT key FROM validation_results "
+                               "ORDER BY last_accessed LIMIT ?)", (num_entries - self.max_entries,))
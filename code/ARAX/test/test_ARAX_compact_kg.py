@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Usage:
+    Run all tests: pytest -v test_ARAX_compact_kg.py
+    Run a single test: pytest -v test_ARAX_compact_kg.py -k test_compact_kg_round_trip
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from ARAX_response import ARAXResponse
+import ARAX_resultify
+from compact_kg import CompactKnowledgeGraph, NodeView
+from kg_index_by_qg import KGIndexByQG
+from openapi_server.models.attribute import Attribute
+from openapi_server.models.edge import Edge
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.node import Node
+from openapi_server.models.q_edge import QEdge
+from openapi_server.models.q_node import QNode
+from openapi_server.models.qualifier import Qualifier
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.retrieval_source import RetrievalSource
+
+
+def _get_example_kg(num_genes: int = 30) -> KnowledgeGraph:
+    nodes = {"MONDO:0005015": Node(name="diabetes mellitus", categories=["biolink:Disease"])}
+    nodes["MONDO:0005015"].qnode_keys = ["n0"]
+    for index in range(num_genes):
+        gene = Node(name=f"gene {index}", categories=["biolink:Gene", "biolink:Protein"],
+                    attributes=[Attribute(attribute_type_id="biolink:synonym", value=[f"G{index}", f"gene{index}"])])
+        gene.qnode_keys = ["n1"]
+        nodes[f"NCBIGene:{index}"] = gene
+        if index % 3 == 0:
+            gene.query_ids = [f"NCBIGene:{index}"]
+    for index in range(4):
+        chemical = Node(name=f"chemical {index}", categories=["biolink:ChemicalEntity"], is_set=False)
+        chemical.qnode_keys = ["n2"]
+        nodes[f"CHEBI:{index}"] = chemical
+    edges = dict()
+    kg2_source = [RetrievalSource(resource_id="infores:rtx-kg2", resource_role="aggregator_knowledge_source")]
+    for index in range(num_genes):
+        edge = Edge(subject=f"NCBIGene:{index}", object="MONDO:0005015", predicate="biolink:gene_associated_with_condition",
+                    sources=kg2_source,
+                    attributes=[Attribute(attribute_type_id="biolink:publications", value=[f"PMID:{index % 5}"])])
+        edge.qedge_keys = ["e0"]
+        edges[f"NCBIGene:{index}--biolink:gene_associated_with_condition--MONDO:0005015--infores:rtx-kg2"] = edge
+        if index % 2 == 0:
+            edge = Edge(subject=f"CHEBI:{index % 4}", object=f"NCBIGene:{index}", predicate="biolink:affects",
+                        sources=kg2_source, qualifiers=[Qualifier(qualifier_type_id="biolink:object_direction_qualifier",
+                                                                  qualifier_value="increased")])
+            edge.qedge_keys = ["e1"]
+            edges[f"CHEBI:{index % 4}--biolink:affects--NCBIGene:{index}"] = edge
+    return KnowledgeGraph(nodes=nodes, edges=edges)
+
+
+def test_compact_kg_round_trip():
+    kg = _get_example_kg()
+    compact_kg = CompactKnowledgeGraph.from_knowledge_graph(kg)
+    assert len(compact_kg.nodes) == len(kg.nodes) and len(compact_kg.edges) == len(kg.edges)
+    # Identical sources/qualifiers/attributes are only stored once
+    assert len(compact_kg.blobs) < 50
+    assert compact_kg.to_dict() == kg.to_dict()
+    materialized_kg = compact_kg.to_knowledge_graph()
+    assert materialized_kg.to_dict() == kg.to_dict()
+    for node_key, node in kg.nodes.items():
+        assert materialized_kg.nodes[node_key].qnode_keys == node.qnode_keys
+        assert getattr(materialized_kg.nodes[node_key], "query_ids", None) == getattr(node, "query_ids", None)
+    for edge_key, edge in kg.edges.items():
+        assert materialized_kg.edges[edge_key].qedge_keys == edge.qedge_keys
+
+    # Views look like the original model objects
+    node_view = compact_kg.nodes["NCBIGene:3"]
+    assert isinstance(node_view, NodeView)
+    assert node_view.name == "gene 3" and node_view.categories == ["biolink:Gene", "biolink:Protein"]
+    assert node_view.attributes == kg.nodes["NCBIGene:3"].attributes
+    edge_view = compact_kg.edges["CHEBI:2--biolink:affects--NCBIGene:2"]
+    assert (edge_view.subject, edge_view.object, edge_view.predicate) == ("CHEBI:2", "NCBIGene:2", "biolink:affects")
+    assert edge_view.qualifiers[0].qualifier_value == "increased"
+
+
+def test_compact_kg_qg_organized_round_trip():
+    kg = _get_example_kg()
+    compact_kg = CompactKnowledgeGraph.from_knowledge_graph(kg)
+    organized_kg = compact_kg.to_qg_organized_kg()
+    assert set(organized_kg.nodes_by_qg_id["n1"]) == {node_key for node_key in kg.nodes if node_key.startswith("NCBIGene")}
+    assert CompactKnowledgeGraph.from_qg_organized_kg(organized_kg).to_dict() == kg.to_dict()
+
+
+def test_compact_kg_updates():
+    kg = _get_example_kg()
+    compact_kg = CompactKnowledgeGraph.from_knowledge_graph(kg)
+    compact_kg.remove_nodes(["NCBIGene:0", "NCBIGene:1"])
+    assert "NCBIGene:0" not in compact_kg.nodes
+    assert not any("NCBIGene:0" in {edge.subject, edge.object} for edge in compact_kg.edges.values())
+    assert len(compact_kg.edges) == len(kg.edges) - 3
+    compact_kg.remove_edge("NCBIGene:2--biolink:gene_associated_with_condition--MONDO:0005015--infores:rtx-kg2")
+    compact_kg.set_qedge_keys("CHEBI:2--biolink:affects--NCBIGene:2", ["e1", "e2"])
+    compact_kg.set_qnode_keys("NCBIGene:2", ["n1", "n2"])
+    # Nodes that were removed can be added back
+    compact_kg.add_node("NCBIGene:0", kg.nodes["NCBIGene:0"])
+    assert compact_kg.nodes["NCBIGene:0"].name == "gene 0"
+
+    updated_kg = compact_kg.to_knowledge_graph()
+    assert set(updated_kg.nodes) == set(kg.nodes).difference({"NCBIGene:1"})
+    assert updated_kg.edges["CHEBI:2--biolink:affects--NCBIGene:2"].qedge_keys == ["e1", "e2"]
+    assert updated_kg.nodes["NCBIGene:2"].qnode_keys == ["n1", "n2"]
+
+
+def test_compact_kg_csr_adjacency():
+    compact_kg = CompactKnowledgeGraph.from_knowledge_graph(_get_example_kg())
+    for qedge_key in ["e0", "e1"]:
+        for by_subject in [True, False]:
+            offsets, edge_ids = compact_kg.get_csr_adjacency(qedge_key, by_subject=by_subject)
+            for node_key, node_id in compact_kg.node_keys.ids.items():
+                csr_edge_keys = {compact_kg.get_edge_key(edge_id) for edge_id in edge_ids[offsets[node_id]:offsets[node_id + 1]]}
+                expected_edge_keys = {edge_key for edge_key, edge in compact_kg.edges.items() if qedge_key in edge.qedge_keys
+                                      and (edge.subject if by_subject else edge.object) == node_key}
+                assert csr_edge_keys == expected_edge_keys
+    # The CSR is rebuilt after the KG changes
+    compact_kg.remove_nodes(["CHEBI:0"])
+    offsets, edge_ids = compact_kg.get_csr_adjacency("e1")
+    chebi_0_id = compact_kg.node_keys.get_id("CHEBI:0")
+    assert offsets[chebi_0_id] == offsets[chebi_0_id + 1]
+
+
+def test_resultify_over_compact_kg():
+    kg = _get_example_kg()
+    compact_kg = CompactKnowledgeGraph.from_knowledge_graph(kg)
+    assert KGIndexByQG.build(compact_kg).equals(KGIndexByQG.build(kg))
+    qg = QueryGraph(nodes={"n0": QNode(ids=["MONDO:0005015"]), "n1": QNode(categories=["biolink:Gene"]),
+                           "n2": QNode(categories=["biolink:ChemicalEntity"])},
+                    edges={"e0": QEdge(subject="n1", object="n0"), "e1": QEdge(subject="n2", object="n1")})
+    results = ARAX_resultify._get_results_for_kg_by_qg(kg, qg, log=ARAXResponse())
+    compact_results = ARAX_resultify._get_results_for_kg_by_qg(compact_kg, qg, log=ARAXResponse())
+    assert len(results) == 15
+    assert sorted(result.to_dict().__repr__() for result in compact_results) == \
+           sorted(result.to_dict().__repr__() for result in results)
+
+
+def test_structure_only_compact_kg():
+    kg = _get_example_kg()
+    compact_kg = CompactKnowledgeGraph.from_knowledge_graph(kg, include_properties=False)
+    assert len(compact_kg.blobs) == 0
+    edge_key = "CHEBI:2--biolink:affects--NCBIGene:2"
+    assert compact_kg.edges[edge_key].predicate == "biolink:affects" and compact_kg.edges[edge_key].qualifiers is None
+    assert compact_kg.nodes["NCBIGene:3"].query_ids == ["NCBIGene:3"] and compact_kg.nodes["NCBIGene:3"].attributes is None
+    # Resultify (as used by Expand to prune dead ends) gives the same results over it
+    qg = QueryGraph(nodes={"n0": QNode(ids=["MONDO:0005015"]), "n1": QNode(categories=["biolink:Gene"]),
+                           "n2": QNode(categories=["biolink:ChemicalEntity"])},
+                    edges={"e0": QEdge(subject="n1", object="n0"), "e1": QEdge(subject="n2", object="n1")})
+    results = ARAX_resultify._get_results_for_kg_by_qg(kg, qg, log=ARAXResponse())
+    compact_results = ARAX_resultify._get_results_for_kg_by_qg(compact_kg, qg, log=ARAXResponse())
+    assert sorted(result.to_dict().__repr__() for result in compact_results) == \
+           sorted(result.to_dict().__repr__() for result in results)
@@ -5,6 +5,7 @@ Usage:
     Run a single test: pytest -v test_ARAX_expand.py -k test_branched_query
 """
 
+import json
 import sys
 import os
 from typing import List, Dict, Optional
@@ -1572,5 +1573,256 @@ def test_treats_patch_issue_2328():
     assert any(edge for edge in kg2_edges_treats_or if edge.predicate == "biolink:treats_or_applied_or_studied_to_treat")
 
 
+def test_pipelined_expand():
+    actions_list = [
+        "add_qnode(key=n00, ids=MONDO:0014324)",
+        "add_qnode(key=n01, categories=biolink:Protein)",
+        "add_qnode(key=n02, categories=biolink:ChemicalEntity)",
+        "add_qedge(key=e00, subject=n00, object=n01)",
+        "add_qedge(key=e01, subject=n01, object=n02, predicates=biolink:physically_interacts_with)",
+        "expand(kp=infores:rtx-kg2, pipelined=true)",
+        "return(message=true, store=false)"
+    ]
+    nodes_by_qg_id, edges_by_qg_id = _run_query_and_do_standard_testing(actions_list)
+    assert nodes_by_qg_id["n02"]
+    assert edges_by_qg_id["e01"]
+
+
+def test_streamed_kp_response_decoding():
+    from Expand.trapi_stream_decoder import TRAPIStreamDecoder
+    kp_response = {"message": {"query_graph": {"nodes": {"n00": {"ids": ["MONDO:0005148"]}}, "edges": {}},
+                               "knowledge_graph": {"nodes": {"MONDO:0005148": {"name": "type 2 diabetes mellitus"},
+                                                             "CHEBI:6801": {"name": "metformin", "categories": ["biolink:SmallMolecule"]}},
+                                                   "edges": {"e1": {"subject": "CHEBI:6801", "object": "MONDO:0005148",
+                                                                    "predicate": "biolink:treats"}}},
+                               "results": [{"node_bindings": {"n00": [{"id": "MONDO:0005148"}]}, "analyses": []}]},
+                   "logs": [{"message": "done"}]}
+    body = json.dumps(kp_response, indent=2).encode()
+    decoder = TRAPIStreamDecoder()
+    events = []
+    for start in range(0, len(body), 7):  # Feed in small chunks to exercise values split across chunks
+        events += decoder.feed(body[start:start + 7])
+    events += decoder.close()
+    assert [(event_type, key) for event_type, key, _ in events] == [("node", "MONDO:0005148"), ("node", "CHEBI:6801"),
+                                                                    ("edge", "e1"), ("result", None)]
+    assert events[2][2] == kp_response["message"]["knowledge_graph"]["edges"]["e1"]
+    assert ("message",) in decoder.paths_seen
+
+    truncated_decoder = TRAPIStreamDecoder()
+    truncated_decoder.feed(body[:len(body) // 2])
+    with pytest.raises(json.JSONDecodeError):
+        truncated_decoder.close()
+
+
+def test_kp_answer_cache(tmp_path):
+    from Expand.kp_answer_cache import KPAnswerCache
+    answer_cache = KPAnswerCache(db_path=str(tmp_path / "kp_answer_cache.sqlite"))
+    request_body = {"message": {"query_graph": {"nodes": {"n00": {"ids": ["CHEBI:6801", "CHEBI:45783"]}}, "edges": {}}}}
+    reordered_request_body = {"message": {"query_graph": {"edges": {}, "nodes": {"n00": {"ids": ["CHEBI:45783", "CHEBI:6801"]}}}}}
+    cache_key = answer_cache.get_cache_key(request_body, "infores:spoke")
+    assert cache_key == answer_cache.get_cache_key(reordered_request_body, "infores:spoke")
+    assert cache_key != answer_cache.get_cache_key(request_body, "infores:molepro")
+    assert answer_cache.get(cache_key, "infores:spoke") is None
+
+    answer_kg = eu.QGOrganizedKnowledgeGraph()
+    answer_kg.add_node("CHEBI:6801", Node(name="metformin"), "n00")
+    assert answer_cache.put(cache_key, "infores:spoke", answer_kg, kp_version="v1")
+    answer_kg.nodes_by_qg_id["n00"]["CHEBI:6801"].name = "modified after storing"
+    cached_answer_kg = answer_cache.get(cache_key, "infores:spoke", kp_version="v1")
+    assert cached_answer_kg.nodes_by_qg_id["n00"]["CHEBI:6801"].name == "metformin"
+    assert answer_cache.get(cache_key, "infores:spoke", kp_version="v2") is None  # Stale KP version
+
+    answer_cache.put(cache_key, "infores:spoke", answer_kg, kp_version="v2")
+    assert answer_cache.invalidate_kps(["infores:spoke"]) == 1
+    assert answer_cache.get(cache_key, "infores:spoke") is None
+    assert answer_cache.get_stats()["infores:spoke"]["hits"] >= 1
+
+
+def test_concurrent_queries_share_kp_pool_loop(monkeypatch):
+    import asyncio
+    import threading
+    import time
+    from types import SimpleNamespace
+    import ARAX_expander
+    from ARAX_expander import ARAXExpander
+    from Expand.kp_connection_pool import KPConnectionPool
+    from Expand.trapi_querier import TRAPIQuerier
+    from openapi_server.models.q_node import QNode
+    from openapi_server.models.q_edge import QEdge
+    from openapi_server.models.query_graph import QueryGraph
+
+    async def answer_after_kp_delay(self, query_graph, alter_kg2_treats_edges=False):
+        await asyncio.sleep(0.2)  # Stands in for waiting on the KP
+        answer_kg = eu.QGOrganizedKnowledgeGraph()
+        answer_kg.add_node("CHEBI:6801", Node(name="metformin"), "n00")
+        answer_kg.add_node("MONDO:0005148", Node(name="type 2 diabetes mellitus"), "n01")
+        answer_kg.add_edge("e1", Edge(subject="CHEBI:6801", object="MONDO:0005148", predicate="biolink:treats"), "e00")
+        return answer_kg
+
+    def slow_deduplicate_nodes(self, answer_kg, kp_name, log):
+        time.sleep(0.5)  # Stands in for blocking synonymizer lookups
+        return answer_kg
+
+    monkeypatch.setattr(TRAPIQuerier, "answer_one_hop_query_async", answer_after_kp_delay)
+    monkeypatch.setattr(ARAXExpander, "_deduplicate_nodes", slow_deduplicate_nodes)
+    monkeypatch.setattr(ARAX_expander.eu, "check_for_canonical_predicates", lambda kg, kp_name, log: kg)
+    expander = ARAXExpander.__new__(ARAXExpander)  # Skips loading the Biolink model, which isn't needed here
+    kp_selector = SimpleNamespace(valid_kps={"infores:spoke"}, kp_urls={"infores:spoke": "http://localhost"})
+    edge_qg = QueryGraph(nodes={"n00": QNode(ids=["CHEBI:6801"]), "n01": QNode()},
+                         edges={"e00": QEdge(subject="n00", object="n01")})
+    answers = []
+
+    def run_query():
+        log = ARAXResponse()
+        answers.extend(KPConnectionPool().run_until_complete(
+            [expander._expand_edge_async(edge_qg, "infores:spoke", False, None, False, kp_selector, log)]))
+
+    # Two queries' blocking post-processing runs side by side, rather than one after the other on the pool's loop
+    start = time.time()
+    threads = [threading.Thread(target=run_query) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.time() - start < 1.0
+    assert len(answers) == 2
+    assert all(set(answer_kg.edges_by_qg_id["e00"]) == {"e1"} for answer_kg, _ in answers)
+
+
+def test_pipelined_expand_respects_prune_threshold(monkeypatch):
+    import copy
+    from collections import defaultdict
+    from types import SimpleNamespace
+    import ARAX_expander
+    from ARAX_expander import ARAXExpander
+    from openapi_server.models.q_node import QNode
+    from openapi_server.models.q_edge import QEdge
+    from openapi_server.models.query_graph import QueryGraph
+    input_curies_received = defaultdict(list)
+
+    async def expand_edge_with_fake_kp(self, edge_qg, kp_to_use, *args, **kwargs):
+        qedge_key, qedge = next(iter(edge_qg.edges.items()))
+        answer_kg = eu.QGOrganizedKnowledgeGraph()
+        for input_curie in edge_qg.nodes[qedge.subject].ids:
+            input_curies_received[qedge_key].append(input_curie)
+            for index in range(5):
+                output_curie = f"{input_curie}.{index}"
+                answer_kg.add_node(input_curie, Node(), qedge.subject)
+                answer_kg.add_node(output_curie, Node(), qedge.object)
+                answer_kg.add_edge(f"{input_curie}--{output_curie}", Edge(subject=input_curie, object=output_curie,
+                                                                          predicate="biolink:related_to"), qedge_key)
+        return answer_kg, None
+
+    monkeypatch.setattr(ARAXExpander, "_expand_edge_async", expand_edge_with_fake_kp)
+    monkeypatch.setattr(ARAXExpander, "_get_kps_to_query", staticmethod(lambda *args: ["infores:spoke"]))
+    monkeypatch.setattr(ARAX_expander.eu, "get_canonical_curies_list", lambda curies, log: curies)
+    expander = ARAXExpander.__new__(ARAXExpander)  # Skips loading the Biolink model, which isn't needed here
+    query_graph = QueryGraph(nodes={"n00": QNode(ids=["CHEBI:1"]), "n01": QNode(), "n02": QNode()},
+                             edges={"e00": QEdge(subject="n00", object="n01"), "e01": QEdge(subject="n01", object="n02")})
+    message = SimpleNamespace(query_graph=copy.deepcopy(query_graph))
+    response = ARAXResponse()
+    overarching_kg = expander._expand_pipelined(["e00", "e01"], query_graph, eu.QGOrganizedKnowledgeGraph(), message,
+                                                {"prune_threshold": 3}, None, True, None, False, response)
+    assert response.status == 'OK'
+    assert len(overarching_kg.nodes_by_qg_id["n01"]) == 5
+    # Only as many n01 curies as the prune threshold allows are expanded further
+    assert len(input_curies_received["e01"]) == 3
+    assert len(overarching_kg.nodes_by_qg_id["n02"]) == 15
+
+
+def test_truncated_kp_answer_is_not_cached(monkeypatch, tmp_path):
+    import asyncio
+    from types import SimpleNamespace
+    from Expand import trapi_querier
+    from Expand.kp_answer_cache import KPAnswerCache
+    from Expand.kp_connection_pool import KPConnectionPool
+    from Expand.trapi_querier import TRAPIQuerier
+    from openapi_server.models.q_node import QNode
+    from openapi_server.models.q_edge import QEdge
+    from openapi_server.models.query_graph import QueryGraph
+    # The KP's answer is cut off while its knowledge graph is still streaming in, before any results arrive
+    kp_nodes = {f"CHEBI:{index}": {"name": f"chemical {index}", "categories": ["biolink:SmallMolecule"]} for index in range(200)}
+    body = json.dumps({"message": {"knowledge_graph": {"nodes": kp_nodes, "edges": {}}, "results": []}}).encode()
+
+    class FakeKPResponse:
+        status = 200
+
+        def __init__(self):
+            self.content = self
+
+        async def iter_chunked(self, chunk_size):
+            for start in range(0, len(body), chunk_size):
+                yield body[start:start + chunk_size]
+
+        def close(self):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            return False
+
+    async def get_fake_session(self, kp_infores_curie):
+        return SimpleNamespace(post=lambda *args, **kwargs: FakeKPResponse())
+
+    answer_cache = KPAnswerCache(db_path=str(tmp_path / "kp_answer_cache.sqlite"))
+    monkeypatch.setattr(KPConnectionPool, "get_session", get_fake_session)
+    monkeypatch.setattr(trapi_querier, "KPAnswerCache", lambda: answer_cache)
+    monkeypatch.setattr(TRAPIQuerier, "max_kp_response_bytes", len(body) // 2)
+    monkeypatch.setattr(TRAPIQuerier, "response_chunk_size", 256)
+    kp_selector = SimpleNamespace(kp_urls={"infores:spoke": "http://localhost"}, kp_versions={"infores:spoke": "v1"})
+    querier = TRAPIQuerier(ARAXResponse(), "infores:spoke", True, None, kp_selector=kp_selector)
+    query_graph = QueryGraph(nodes={"n00": QNode(ids=["MONDO:0005148"]), "n01": QNode(categories=["biolink:SmallMolecule"])},
+                             edges={"e00": QEdge(subject="n01", object="n00")})
+    answer_kg = asyncio.run(querier._answer_query_using_kp_async(query_graph))
+    assert answer_kg.was_truncated
+    assert not answer_kg.edges_by_qg_id
+    cache_key = answer_cache.get_cache_key(querier._get_prepped_request_body(query_graph), "infores:spoke")
+    assert answer_cache.get(cache_key, "infores:spoke", "v1") is None
+
+
+def test_kp_answer_edges_are_not_hydrated(monkeypatch):
+    from types import SimpleNamespace
+    from Expand.trapi_querier import TRAPIQuerier
+    from lazy_trapi_models import LazyEdge, LazyNode
+    from openapi_server.models.q_node import QNode
+    from openapi_server.models.q_edge import QEdge
+    from openapi_server.models.query_graph import QueryGraph
+    monkeypatch.setattr(eu, "get_canonical_curies_dict", lambda curies, log: dict())
+    edge_dict = {"subject": "CHEBI:1", "object": "MONDO:0005148", "predicate": "biolink:affects",
+                 "qualifiers": [{"qualifier_type_id": "biolink:object_direction_qualifier", "qualifier_value": "decreased"},
+                                {"qualifier_type_id": "biolink:qualified_predicate", "qualifier_value": "biolink:causes"}],
+                 "sources": [{"resource_id": "infores:spoke", "resource_role": "aggregator_knowledge_source"},
+                             {"resource_id": "infores:chembl", "resource_role": "primary_knowledge_source"}],
+                 "attributes": [{"attribute_type_id": "biolink:support_graphs", "value": ["sg1"]},
+                                {"attribute_type_id": None, "value": 0.01},
+                                {"attribute_type_id": "biolink:publications", "value": ["PMID:1"]}]}
+    node_dicts = {"MONDO:0005148": {"name": "type 2 diabetes", "categories": ["biolink:Disease"]},
+                  "CHEBI:1": {"name": "chemical 1", "categories": ["biolink:SmallMolecule"]}}
+    results = [{"node_bindings": {"n00": [{"id": "MONDO:0005148"}], "n01": [{"id": "CHEBI:1"}]},
+                "analyses": [{"edge_bindings": {"e00": [{"id": "kp_edge"}]}}]}]
+    query_graph = QueryGraph(nodes={"n00": QNode(ids=["MONDO:0005148"]), "n01": QNode(categories=["biolink:SmallMolecule"])},
+                             edges={"e00": QEdge(subject="n01", object="n00")})
+    kp_selector = SimpleNamespace(kp_urls={"infores:spoke": "http://localhost"}, kp_versions={"infores:spoke": "v1"})
+    querier = TRAPIQuerier(ARAXResponse(), "infores:spoke", True, None, kp_selector=kp_selector)
+    original_edge_dict = json.loads(json.dumps(edge_dict))
+    expected_edge_key = querier._get_arax_edge_key(Edge.from_dict({key: value for key, value in edge_dict.items()
+                                                                   if key != "attributes"}))
+
+    answer_kg = querier._build_answer_kg({node_key: LazyNode.from_dict(node_dict) for node_key, node_dict in node_dicts.items()},
+                                         {"kp_edge": LazyEdge.from_dict(edge_dict)}, results, query_graph)
+    # The edge was keyed and patched without hydrating any of its attributes, qualifiers, or sources
+    edge_key, edge = next(iter(answer_kg.edges_by_qg_id["e00"].items()))
+    assert edge_key == expected_edge_key
+    assert "infores:chembl" in edge_key and "biolink:causes--decreased--None" in edge_key
+    assert edge._unhydrated == {"attributes", "qualifiers", "sources"}
+    assert edge_dict == original_edge_dict
+    assert [attribute.attribute_type_id for attribute in edge.attributes] == \
+           ["not provided (this attribute came from infores:spoke)", "biolink:publications"]
+    assert [source.resource_id for source in edge.sources] == ["infores:spoke", "infores:chembl", "infores:arax"]
+    assert edge.to_dict()["qualifiers"] == edge_dict["qualifiers"]
+
+
 if __name__ == "__main__":
     pytest.main(['-v', 'test_ARAX_expand.py'])
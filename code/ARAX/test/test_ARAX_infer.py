@@ -12,6 +12,7 @@ import ast
 from typing import List, Union
 
 import numpy as np
+import pandas as pd
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../ARAXQuery")
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
@@ -413,3 +414,151 @@ def test_xcrg_infer_dsl():
         edge_key = creative_mode_edges[0]
         edge_result = message.knowledge_graph.edges[edge_key]
         assert edge_result.predicate == 'biolink:regulates'
+
+
+def test_xdtd_grouped_paths(tmp_path):
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Infer/scripts")
+    import sqlite3
+    from ExplianableDTD_db import ExplainableDTD
+    connection = sqlite3.connect(f"{tmp_path}/test_xdtd.db")
+    connection.execute("CREATE TABLE PATH_RESULT_TABLE(drug_id VARCHAR(255), drug_name VARCHAR(255), disease_id VARCHAR(255), disease_name VARCHAR(255), path VARCHAR(255), path_score FLOAT)")
+    connection.execute("CREATE INDEX idx_PATH_RESULT_TABLE_disease_id ON PATH_RESULT_TABLE(disease_id)")
+    rows = [("CHEBI:1", "MONDO:1", "CHEBI:1->treats->MONDO:1", 0.5), ("CHEBI:2", "MONDO:1", "CHEBI:2->treats->MONDO:1", 0.2),
+            ("CHEBI:1", "MONDO:2", "CHEBI:1->treats->MONDO:2", 0.1), ("CHEBI:1", "MONDO:1", "CHEBI:1->affects->MONDO:1", 0.9)]
+    connection.executemany("INSERT INTO PATH_RESULT_TABLE VALUES (?, '', ?, '', ?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+    xdtd = ExplainableDTD(database_name="test_xdtd.db", outdir=str(tmp_path))
+    top_paths = xdtd.get_top_paths_for_disease("MONDO:1")
+    assert top_paths == {("CHEBI:1", "MONDO:1"): [["CHEBI:1->treats->MONDO:1", 0.5], ["CHEBI:1->affects->MONDO:1", 0.9]],
+                         ("CHEBI:2", "MONDO:1"): [["CHEBI:2->treats->MONDO:1", 0.2]]}
+    top_paths_by_disease = xdtd.get_top_paths_for_diseases(["MONDO:1", "MONDO:2", "MONDO:3"], top_m=1)
+    assert top_paths_by_disease["MONDO:1"][("CHEBI:1", "MONDO:1")] == [["CHEBI:1->affects->MONDO:1", 0.9]]
+    assert top_paths_by_disease["MONDO:2"] == {("CHEBI:1", "MONDO:2"): [["CHEBI:1->treats->MONDO:2", 0.1]]}
+    assert top_paths_by_disease["MONDO:3"] == {}
+    # Hot diseases are served from the cache (and callers can't modify the cached paths)
+    top_paths[("CHEBI:2", "MONDO:1")].clear()
+    xdtd.disconnect()
+    assert xdtd.get_top_paths_for_disease(["MONDO:1"])[("CHEBI:2", "MONDO:1")] == [["CHEBI:2->treats->MONDO:1", 0.2]]
+
+
+class _StubCRGClassifier:
+    """Stands in for an xCRG model; its class-0 column is deliberately not 1 - tp_prob, so the columns can be told apart"""
+
+    def __init__(self, num_features: int):
+        self.weights = np.random.default_rng(0).normal(size=num_features)
+        self.num_calls = 0
+
+    def predict_proba(self, X):
+        self.num_calls += 1
+        tp_probas = 1 / (1 + np.exp(-X @ self.weights))
+        return np.stack([(1 - tp_probas) / 2, tp_probas], axis=1)
+
+
+def _get_stub_xcrg():
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Infer/scripts")
+    from creativeCRG import creativeCRG
+    rng = np.random.default_rng(1)
+    xcrg = creativeCRG.__new__(creativeCRG)  # Skips loading the real embeddings/models
+    xcrg.response = ARAXResponse()
+    xcrg.data_key = ("stub",)
+    xcrg.chemical_curies = [f"CHEBI:{i}" for i in range(300)]
+    xcrg.gene_curies = [f"NCBIGene:{i}" for i in range(200)]
+    xcrg.chemical_rows = {curie: row for row, curie in enumerate(xcrg.chemical_curies)}
+    xcrg.gene_rows = {curie: row for row, curie in enumerate(xcrg.gene_curies)}
+    xcrg.chemical_embs = rng.normal(size=(300, 6))
+    xcrg.gene_embs = rng.normal(size=(200, 4))
+    xcrg.num_chemicals, xcrg.num_genes = 300, 200
+    xcrg.increase_model = _StubCRGClassifier(10)
+    xcrg.decrease_model = _StubCRGClassifier(10)
+    creativeCRG._cached_probas.clear()
+    return xcrg
+
+
+def _rank_candidates_one_at_a_time(xcrg, query_curie: str, query_type: str, N: int, threshold: float, model):
+    # How predict_top_N_chemicals/genes ranked the candidates for a single query curie before predictions were batched
+    if query_type == 'gene':
+        X = np.hstack([xcrg.chemical_embs, np.tile(xcrg.gene_embs[xcrg.gene_curies.index(query_curie)].reshape(1, -1), (xcrg.num_chemicals, 1))])
+        res = pd.concat([pd.DataFrame(xcrg.chemical_curies), pd.DataFrame([query_curie] * xcrg.num_chemicals), pd.DataFrame(model.predict_proba(X))], axis=1)
+    else:
+        X = np.hstack([np.tile(xcrg.chemical_embs[xcrg.chemical_curies.index(query_curie)].reshape(1, -1), (xcrg.num_genes, 1)), xcrg.gene_embs])
+        res = pd.concat([pd.DataFrame([query_curie] * xcrg.num_genes), pd.DataFrame(xcrg.gene_curies), pd.DataFrame(model.predict_proba(X))], axis=1)
+    res.columns = ['chemical_id', 'gene_id', 'tn_prob', 'tp_prob']
+    res = res.sort_values(by=['tp_prob'], ascending=False).reset_index(drop=True)
+    res = res.loc[res['tp_prob'] >= threshold, :].reset_index(drop=True)
+    return res.iloc[:N, :]
+
+
+@pytest.mark.parametrize("N,threshold", [(10, 0.5), (1, 0.2), (50, 0.9), (400, 0.01)])
+def test_xcrg_batched_predictions_match_per_curie_ranking(N, threshold, monkeypatch):
+    xcrg = _get_stub_xcrg()
+    import creativeCRG as creativeCRG_module
+    monkeypatch.setattr(creativeCRG_module, "MAX_PREDICTION_ROWS", 500)  # So the query genes are split across batches
+    query_genes = ["NCBIGene:3", "NCBIGene:150", "NCBIGene:3", "NCBIGene:unknown"]
+    top_chemicals = xcrg.predict_top_N_chemicals_for_genes(query_genes, N=N, threshold=threshold, model_type='increase')
+    assert set(top_chemicals) == {"NCBIGene:3", "NCBIGene:150"}
+    for gene, res in top_chemicals.items():
+        expected = _rank_candidates_one_at_a_time(xcrg, gene, 'gene', N, threshold, xcrg.increase_model)
+        pd.testing.assert_frame_equal(res.reset_index(drop=True), expected, check_dtype=False)
+    top_genes = xcrg.predict_top_N_genes_for_chemicals(["CHEBI:7", "CHEBI:299"], N=N, threshold=threshold, model_type='decrease')
+    for chemical, res in top_genes.items():
+        expected = _rank_candidates_one_at_a_time(xcrg, chemical, 'chemical', N, threshold, xcrg.decrease_model)
+        pd.testing.assert_frame_equal(res.reset_index(drop=True), expected, check_dtype=False)
+    # The single-curie methods give the same frames
+    pd.testing.assert_frame_equal(xcrg.predict_top_N_chemicals("NCBIGene:150", N=N, threshold=threshold),
+                                  top_chemicals["NCBIGene:150"])
+
+
+def test_xcrg_cached_predictions(monkeypatch):
+    xcrg = _get_stub_xcrg()
+    import creativeCRG as creativeCRG_module
+    model = xcrg.increase_model
+    monkeypatch.setattr(creativeCRG_module, "MAX_CACHED_PREDICTIONS", 2)
+    xcrg.predict_top_N_chemicals_for_genes(["NCBIGene:1", "NCBIGene:2"])
+    assert model.num_calls == 1  # Both genes are predicted in one batch
+    xcrg.predict_top_N_chemicals_for_genes(["NCBIGene:1"])
+    assert model.num_calls == 1
+    # NCBIGene:1 was used more recently, so NCBIGene:2 is the one evicted to make room for NCBIGene:3
+    xcrg.predict_top_N_chemicals_for_genes(["NCBIGene:3"])
+    cached_genes = {cache_key[-1] for cache_key in type(xcrg)._cached_probas}
+    assert cached_genes == {"NCBIGene:1", "NCBIGene:3"}
+    xcrg.predict_top_N_chemicals_for_genes(["NCBIGene:1", "NCBIGene:3"])
+    assert model.num_calls == 2
+    xcrg.predict_top_N_chemicals_for_genes(["NCBIGene:2"])
+    assert model.num_calls == 3
+    # Predictions for the other model type are cached separately
+    xcrg.predict_top_N_chemicals_for_genes(["NCBIGene:2"], model_type='decrease')
+    assert xcrg.decrease_model.num_calls == 1
+
+
+def test_xdtd_embedding_matrix(tmp_path):
+    sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Infer/scripts")
+    import pickle
+    from embedding_matrix import load_embedding_matrix, EMBEDDING_PICKLE_NAME
+    rng = np.random.default_rng(7)
+    embeddings = {f"CHEBI:{i}": rng.normal(size=8).astype(np.float32) for i in range(20)}
+    embeddings["MONDO:1"] = rng.normal(size=8).astype(np.float32)
+    pickle_path = f"{tmp_path}/{EMBEDDING_PICKLE_NAME}"
+    with open(pickle_path, "wb") as pickle_file:
+        pickle.dump(embeddings, pickle_file)
+
+    # Drug/disease scores computed from the (memory-mapped) matrix match those computed from the pickle
+    matrix, rows = load_embedding_matrix(str(tmp_path))
+    assert isinstance(matrix, np.memmap)
+    drug_curies = [f"CHEBI:{i}" for i in range(20)]
+    disease_embedding = matrix[rows["MONDO:1"]]
+    scores = matrix[[rows[curie] for curie in drug_curies]] @ disease_embedding
+    expected_scores = np.array([embeddings[curie] @ embeddings["MONDO:1"] for curie in drug_curies])
+    assert np.allclose(scores, expected_scores)
+    assert not [file_name for file_name in os.listdir(tmp_path) if file_name.endswith(".tmp")]
+
+    # A newer pickle gets converted again
+    embeddings["CHEBI:0"] = np.zeros(8, dtype=np.float32)
+    with open(pickle_path, "wb") as pickle_file:
+        pickle.dump(embeddings, pickle_file)
+    pickle_stat = os.stat(pickle_path)
+    os.utime(pickle_path, ns=(pickle_stat.st_atime_ns, pickle_stat.st_mtime_ns + 1_000_000_000))
+    matrix, rows = load_embedding_matrix(str(tmp_path))
+    assert not matrix[rows["CHEBI:0"]].any()
+    assert np.array_equal(matrix[rows["CHEBI:1"]], embeddings["CHEBI:1"])
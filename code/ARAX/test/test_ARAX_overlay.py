@@ -29,6 +29,11 @@ from openapi_server.models.node_binding import NodeBinding
 from openapi_server.models.edge_binding import EdgeBinding
 from openapi_server.models.result import Result
 from openapi_server.models.message import Message
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Overlay/ngd")
+from pmid_index import PMIDIndex, build_pmid_index, get_marginal_and_joint_counts
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Overlay")
+from neighbor_count_index import NeighborCountIndex, build_neighbor_count_index, build_neighbor_count_index_from_sqlite
+from fisher_exact_pvalues import calculate_fisher_exact_pvalues
 
 
 def _do_arax_query(query: dict) -> List[Union[ARAXResponse, Message]]:
@@ -799,5 +804,116 @@ def test_ngd_sqlite_syntax_error():
     assert response.status == 'OK'
 
 
+def test_ngd_pmid_index(tmp_path):
+    import numpy as np
+    import random
+    import sqlite3
+    rng = random.Random(42)
+    curie_to_pmids = {f"CHEBI:{i}": rng.sample(range(1, 5000), rng.randint(0, 400)) for i in range(60)}
+    curie_to_pmids["UMLS:C0000001"] = [4, 2, 2, 9]  # Duplicate PMIDs are only counted once
+    sqlite_path = f"{tmp_path}/curie_to_pmids.sqlite"
+    connection = sqlite3.connect(sqlite_path)
+    connection.execute("CREATE TABLE curie_to_pmids (curie TEXT, pmids TEXT)")
+    connection.executemany("INSERT INTO curie_to_pmids (curie, pmids) VALUES (?, ?)",
+                           [(curie, json.dumps(pmids)) for curie, pmids in curie_to_pmids.items()])
+    connection.commit()
+    connection.close()
+
+    pmid_index = PMIDIndex(build_pmid_index(sqlite_path))
+    assert pmid_index.is_up_to_date_with(sqlite_path)
+    assert pmid_index.get_pmids("CHEBI:999") is None
+    assert pmid_index.get_pmids("UMLS:C0000001").tolist() == [2, 4, 9]
+    for curie, pmids in curie_to_pmids.items():
+        assert pmid_index.get_pmids(curie).tolist() == sorted(set(pmids))
+
+    # The batched kernel gives the same counts as intersecting the PMID sets pair by pair
+    curies = list(curie_to_pmids)
+    pmid_arrays = [pmid_index.get_pmids(curie) for curie in curies]
+    pairs = [(rng.randrange(len(curies)), rng.randrange(len(curies))) for _ in range(500)]
+    subject_counts, object_counts, joint_counts, shared_pmids = get_marginal_and_joint_counts(
+        pmid_arrays, [pair[0] for pair in pairs], [pair[1] for pair in pairs], max_shared_pmids=30)
+    for pair_index, (subject_index, object_index) in enumerate(pairs):
+        subject_pmids, object_pmids = set(curie_to_pmids[curies[subject_index]]), set(curie_to_pmids[curies[object_index]])
+        assert subject_counts[pair_index] == len(subject_pmids) and object_counts[pair_index] == len(object_pmids)
+        assert joint_counts[pair_index] == len(subject_pmids & object_pmids)
+        assert shared_pmids[pair_index].tolist() == sorted(subject_pmids & object_pmids)[:30]
+
+    # A sqlite that's been rebuilt is detected even if its size didn't change
+    sqlite_stat = os.stat(sqlite_path)
+    os.utime(sqlite_path, ns=(sqlite_stat.st_atime_ns, sqlite_stat.st_mtime_ns + 1_000_000_000))
+    assert not pmid_index.is_up_to_date_with(sqlite_path)
+    pmid_index.close()
+
+
+def test_neighbor_count_index(tmp_path):
+    neighbor_counts = {"CHEBI:1": {("biolink:Gene", None): 12, ("biolink:Gene", "biolink:interacts_with"): 7,
+                                   ("biolink:Gene", "biolink:physically_interacts_with"): 5,
+                                   ("biolink:Disease", None): 3, ("biolink:Disease", "biolink:treats"): 3},
+                       "MONDO:0005015": {("biolink:Gene", None): 40},
+                       "UniProtKB:P14136": dict()}
+    category_counts = {"biolink:Gene": 50000, "biolink:Disease": 20000, "biolink:Protein": 1000}
+    sqlite_path = f"{tmp_path}/kg2c.sqlite"
+    with open(sqlite_path, "wb") as sqlite_file:
+        sqlite_file.write(b"\0" * 4096)
+    index_path = build_neighbor_count_index(neighbor_counts, neighbor_counts.get, category_counts, sqlite_path)
+    assert index_path == f"{tmp_path}/kg2c.neighbor_counts"
+    neighbor_count_index = NeighborCountIndex(index_path)
+    assert neighbor_count_index.is_up_to_date_with(sqlite_path)
+    curies = ["CHEBI:1", "MONDO:0005015", "UniProtKB:P14136", "CHEBI:2"]
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Gene") == {"CHEBI:1": 12, "MONDO:0005015": 40}
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Gene", "biolink:interacts_with") == {"CHEBI:1": 7}
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Disease", "biolink:treats") == {"CHEBI:1": 3}
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Protein") == dict()
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Gene", "biolink:affects") == dict()
+    assert neighbor_count_index.get_category_count("biolink:Disease") == 20000
+    assert neighbor_count_index.get_category_count("biolink:Cell") is None
+    assert neighbor_count_index.has_counts_for_predicate("biolink:treats")
+    assert neighbor_count_index.has_counts_for_predicate(None)
+    assert not neighbor_count_index.has_counts_for_predicate("biolink:affects")
+    # A sqlite that's been rebuilt is detected even if its size didn't change
+    sqlite_stat = os.stat(sqlite_path)
+    os.utime(sqlite_path, ns=(sqlite_stat.st_atime_ns, sqlite_stat.st_mtime_ns + 1_000_000_000))
+    assert not neighbor_count_index.is_up_to_date_with(sqlite_path)
+    neighbor_count_index.close()
+
+
+def test_neighbor_count_index_without_predicates(tmp_path):
+    # Indexes built from the KG2c sqlite only have counts over all predicates, so FET can't use them for a predicate
+    import sqlite3
+    sqlite_path = f"{tmp_path}/kg2c.sqlite"
+    connection = sqlite3.connect(sqlite_path)
+    connection.execute("CREATE TABLE neighbors (id TEXT, neighbor_counts TEXT)")
+    connection.execute("CREATE TABLE category_counts (category TEXT, count INTEGER)")
+    connection.executemany("INSERT INTO neighbors VALUES (?, ?)",
+                           [("CHEBI:1", json.dumps({"biolink:Gene": 12, "biolink:Disease": 3})),
+                            ("MONDO:0005015", json.dumps({"biolink:Gene": 40}))])
+    connection.executemany("INSERT INTO category_counts VALUES (?, ?)", [("biolink:Gene", 50000), ("biolink:Disease", 20000)])
+    connection.commit()
+    connection.close()
+    neighbor_count_index = NeighborCountIndex(build_neighbor_count_index_from_sqlite(sqlite_path))
+    curies = ["CHEBI:1", "MONDO:0005015"]
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Gene") == {"CHEBI:1": 12, "MONDO:0005015": 40}
+    assert neighbor_count_index.has_counts_for_predicate(None)
+    assert not neighbor_count_index.has_counts_for_predicate("biolink:interacts_with")
+    assert neighbor_count_index.get_neighbor_counts(curies, "biolink:Gene", "biolink:interacts_with") == dict()
+    neighbor_count_index.close()
+
+
+def test_fisher_exact_pvalues():
+    import random
+    import scipy.stats as stats
+    rng = random.Random(7)
+    tables = [(0, 0, 0, 0), (0, 5, 0, 5), (3, 3, 3, 3), (1, 9, 11, 3), (7, 2, 2, 7)]
+    tables += [tuple(rng.randint(0, rng.choice([3, 10, 40])) for _ in range(4)) for _ in range(300)]
+    for _ in range(300):
+        object_size = rng.choice([1, 10, 200, 5000])
+        in_sample = rng.randint(0, min(object_size, 150))
+        tables.append((in_sample, object_size - in_sample, 150 - in_sample, 500000 - object_size - (150 - in_sample)))
+    pvalues = calculate_fisher_exact_pvalues(*zip(*tables))
+    for table, pvalue in zip(tables, pvalues):
+        a, b, c, d = table
+        assert pvalue == pytest.approx(stats.fisher_exact([[a, b], [c, d]])[1], rel=1e-6)
+
+
 if __name__ == "__main__":
     pytest.main(['-v'])
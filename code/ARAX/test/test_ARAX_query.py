@@ -28,4 +28,37 @@ def test_query_by_query_graph_2():
     assert response.envelope.schema_version == '1.5.0'
 
 
+def test_query_stream_sends_pid_and_authorization(monkeypatch):
+    import json
+    import time
+    from ARAX_query_tracker import get_cancel_token
+    from openapi_server.models.message import Message
+    from openapi_server.models.response import Response
+    def run_fake_query(self, query, mode='ARAX', origin='ARAXi'):
+        self.response.envelope = Response(message=Message(), status='OK')
+        self.response.info("Received the query")
+        time.sleep(0.2)  # The query is given its job_id after the first messages have been streamed
+        self.response.job_id = 42
+        time.sleep(0.2)
+        self.response.info("Done with the query")
+        return self.response
+
+    def run_fake_query_without_job_id(self, query, mode='ARAX', origin='ARAXi'):
+        self.response.envelope = Response(message=Message(), status='OK')
+        self.response.error("Query could not be run due to exceeded limits", error_code="OverLimit")
+        return self.response
+
+    monkeypatch.setattr(ARAXQuery, "track_query_finish", lambda self: None)
+    for fake_query, expected_job_id in [(run_fake_query, 42), (run_fake_query_without_job_id, None)]:
+        monkeypatch.setattr(ARAXQuery, "query", fake_query)
+        stream = ARAXQuery().query_return_stream({"message": {}})
+        pid_lines = []
+        for line in stream:
+            if line.startswith('{"pid"'):
+                pid_lines.append(json.loads(line))
+            elif "Done with the query" in line:
+                assert pid_lines  # The pid was sent as soon as the query had a job_id, not at the end
+        assert pid_lines == [{"pid": os.getpid(), "authorization": get_cancel_token(expected_job_id, os.getpid())}]
+
+
 if __name__ == "__main__": pytest.main(['-v'])
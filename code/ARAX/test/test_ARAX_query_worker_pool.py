@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Usage:
+    Run all tests: pytest -v test_ARAX_query_worker_pool.py
+    Run a single test: pytest -v test_ARAX_query_worker_pool.py -k test_worker_pool_runs_queries
+"""
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from ARAX_query_worker_pool import JOB_HEADER_FORMAT, QueryWorkerPool, READY, REPLY_FORMAT
+
+
+def _echo_query(query_dict: dict):
+    return (json.dumps({"pid": os.getpid(), "query": query_dict}), )
+
+
+def _failing_query(query_dict: dict):
+    raise ValueError("this query always fails")
+
+
+def _wait_for(condition, timeout: float = 10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def _get_pool(**kwargs) -> QueryWorkerPool:
+    return QueryWorkerPool({"echo": _echo_query, "fail": _failing_query}, warm_up=lambda: None, **kwargs).start()
+
+
+def test_worker_pool_runs_queries():
+    pool = _get_pool(num_workers=2)
+    try:
+        pids = set()
+        for index in range(6):
+            with pool.run_query({"index": index}, "echo", timeout=10) as read_fo:
+                answer = json.loads(read_fo.read())
+            assert answer["query"] == {"index": index}
+            assert answer["pid"] != os.getpid()
+            pids.add(answer["pid"])
+        # Workers are reused rather than forked per query
+        assert len(pids) <= 2
+        status = pool.get_status()
+        assert status["num_queries_dispatched"] == 6 and status["queue_depth"] == 0
+        assert status["last_warm_start_latency_sec"] is not None
+    finally:
+        pool.close()
+
+
+def test_worker_pool_warms_up_before_forking():
+    warm_up_pids = []
+
+    def report_warm_up_pids(query_dict: dict):
+        return (json.dumps({"pid": os.getpid(), "warm_up_pids": warm_up_pids}), )
+
+    pool = QueryWorkerPool({"report": report_warm_up_pids}, num_workers=2,
+                           warm_up=lambda: warm_up_pids.append(os.getpid())).start()
+    try:
+        # The parent warmed up once, and its workers were forked already warm
+        assert warm_up_pids == [os.getpid()]
+        with pool.run_query({}, "report", timeout=10) as read_fo:
+            answer = json.loads(read_fo.read())
+        assert answer["pid"] != os.getpid() and answer["warm_up_pids"] == [os.getpid()]
+    finally:
+        pool.close()
+
+
+def test_worker_pool_recycles_workers():
+    pool = _get_pool(num_workers=1, max_queries_per_worker=2)
+    try:
+        pids = []
+        for index in range(4):
+            with pool.run_query({"index": index}, "echo", timeout=10) as read_fo:
+                pids.append(json.loads(read_fo.read())["pid"])
+        assert pids[0] == pids[1] and pids[2] == pids[3] and pids[1] != pids[2]
+        _wait_for(lambda: pool.get_status()["num_workers_recycled"] == 2)
+    finally:
+        pool.close()
+
+
+def test_worker_pool_replaces_failed_workers():
+    pool = _get_pool(num_workers=1)
+    try:
+        with pool.run_query({}, "fail", timeout=10) as read_fo:
+            assert read_fo.read() == ""
+        _wait_for(lambda: pool.get_status()["num_workers_lost"] == 1)
+        with pool.run_query({"index": 1}, "echo", timeout=10) as read_fo:
+            assert json.loads(read_fo.read())["query"] == {"index": 1}
+    finally:
+        pool.close()
+
+
+def test_worker_exits_when_pool_closes_mid_header():
+    pool = QueryWorkerPool({"echo": _echo_query}, num_workers=1, warm_up=lambda: None)
+    pool_socket, worker_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    pid = os.fork()
+    if pid == 0:
+        pool_socket.close()
+        try:
+            pool._run_worker(worker_socket, time.time())
+        except BaseException:
+            os._exit(1)
+        os._exit(0)
+    worker_socket.close()
+    assert struct.unpack(REPLY_FORMAT, pool_socket.recv(struct.calcsize(REPLY_FORMAT)))[0] == READY
+    read_fd, write_fd = os.pipe()
+    socket.send_fds(pool_socket, [struct.pack(JOB_HEADER_FORMAT, 10, 4)[:3]], [write_fd])
+    os.close(write_fd)
+    pool_socket.close()
+    # The worker treats the partial header as the pool closing, rather than failing on it
+    assert os.waitpid(pid, 0)[1] == 0
+    assert os.read(read_fd, 1) == b""
+    os.close(read_fd)
@@ -0,0 +1,184 @@
+#!/bin/env python3
+"""
+Usage:
+    Run all tests: pytest -v test_ARAX_response_cache.py
+    Run a single test: pytest -v test_ARAX_response_cache.py -k test_local_response_storage
+"""
+import gzip
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache/")
+from response_storage import ResponseStorage, GZIP_SUFFIX, LEGACY_SUFFIX, get_results_page
+from trapi_validation_cache import TRAPIValidationCache, PENDING_STATUS
+
+
+def _get_example_envelope() -> dict:
+    nodes = {f"CHEBI:{i}": {"name": f"chemical {i}", "categories": ["biolink:ChemicalEntity"],
+                            "attributes": [{"attribute_type_id": "biolink:description", "value": "x" * 50}]}
+             for i in range(200)}
+    return {"status": "Success", "description": "test",
+            "message": {"knowledge_graph": {"nodes": nodes, "edges": {}}, "results": [], "query_graph": None}}
+
+
+class _FakeS3Error(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class _FakeS3Object:
+    def __init__(self, bucket, key: str):
+        self.bucket = bucket
+        self.key = key
+
+    def upload_fileobj(self, fileobj):
+        self.bucket.objects[self.key] = fileobj.read()
+
+    def get(self, Range: str = None):
+        if self.key not in self.bucket.objects:
+            raise _FakeS3Error("NoSuchKey")
+        content = self.bucket.objects[self.key]
+        if Range:
+            start, end = Range.replace("bytes=", "").split("-")
+            content = content[int(start):int(end) + 1]
+        return {"Body": io.BytesIO(content)}
+
+
+class _FakeS3Bucket:
+    """A local stand-in for a boto3 Bucket resource"""
+    def __init__(self):
+        self.objects = dict()
+
+    def Object(self, key: str):
+        return _FakeS3Object(self, key)
+
+
+def test_local_response_storage(tmp_path):
+    envelope = _get_example_envelope()
+    storage = ResponseStorage(local_dir=str(tmp_path))
+    stored_path = storage.store_envelope(7, envelope)
+    assert stored_path.endswith(ResponseStorage.get_preferred_suffix())
+    assert os.path.getsize(stored_path) < len(json.dumps(envelope, sort_keys=True, indent=2)) / 5
+    assert storage.fetch_envelope(7) == envelope
+    assert storage.fetch_envelope(8) is None
+
+    # Responses stored the old way (pretty-printed, uncompressed) are still readable
+    with open(f"{tmp_path}/9{LEGACY_SUFFIX}", "w") as legacy_file:
+        json.dump(envelope, legacy_file, sort_keys=True, indent=2)
+    assert storage.fetch_envelope(9) == envelope
+
+
+def test_s3_response_storage():
+    envelope = _get_example_envelope()
+    bucket = _FakeS3Bucket()
+    storage = ResponseStorage(s3_bucket=bucket)
+    stored_key = storage.store_envelope(12, envelope)
+    assert stored_key == f"/responses/12{ResponseStorage.get_preferred_suffix()}"
+    assert storage.fetch_envelope(12) == envelope
+    assert storage.fetch_envelope(13) is None
+
+    bucket.objects[f"/responses/14{GZIP_SUFFIX}"] = gzip.compress(json.dumps(envelope).encode())
+    bucket.objects[f"/responses/15{LEGACY_SUFFIX}"] = json.dumps(envelope, indent=2).encode()
+    assert storage.fetch_envelope(14) == envelope
+    assert storage.fetch_envelope(15) == envelope
+
+
+def _get_example_envelope_with_results(num_results: int) -> dict:
+    envelope = _get_example_envelope()
+    message = envelope["message"]
+    message["auxiliary_graphs"] = {"aux1": {"edges": ["support_edge"]}}
+    edges = message["knowledge_graph"]["edges"]
+    edges["support_edge"] = {"subject": "CHEBI:198", "object": "CHEBI:199", "predicate": "biolink:related_to"}
+    for i in range(num_results):
+        edges[f"e{i}"] = {"subject": f"CHEBI:{i}", "object": "CHEBI:0", "predicate": "biolink:related_to",
+                          "attributes": [{"attribute_type_id": "biolink:support_graphs", "value": ["aux1"]}] if i == 3 else []}
+        message["results"].append({"node_bindings": {"n0": [{"id": f"CHEBI:{i}"}], "n1": [{"id": "CHEBI:0"}]},
+                                   "analyses": [{"score": (i * 7919 % num_results) / num_results,
+                                                 "edge_bindings": {"e0": [{"id": f"e{i}"}]}}]})
+    return envelope
+
+
+@pytest.mark.parametrize("use_s3", [False, True])
+def test_paged_response_retrieval(tmp_path, use_s3):
+    envelope = _get_example_envelope_with_results(150)
+    storage = ResponseStorage(s3_bucket=_FakeS3Bucket()) if use_s3 else ResponseStorage(local_dir=str(tmp_path))
+    storage.results_page_size = 40
+    assert storage.fetch_results_page(21, offset=0, limit=10) is None
+    storage.store_result_index(21, envelope)
+
+    for offset, limit in [(0, 10), (35, 10), (30, 60), (140, 50), (200, 10), (0, 0)]:
+        page = storage.fetch_results_page(21, offset=offset, limit=limit)
+        assert page == get_results_page(envelope, offset=offset, limit=limit)
+        assert page["result_page"] == {"offset": offset, "limit": limit, "n_results": 150}
+        results = page["message"]["results"]
+        assert len(results) == max(0, min(limit, 150 - offset))
+        scores = [result["analyses"][0]["score"] for result in results]
+        assert scores == sorted(scores, reverse=True)
+        node_keys = {binding["id"] for result in results for bindings in result["node_bindings"].values()
+                     for binding in bindings}
+        edge_keys = {f"e{result['node_bindings']['n0'][0]['id'].split(':')[1]}" for result in results}
+        if any(result["analyses"][0]["edge_bindings"]["e0"][0]["id"] == "e3" for result in results):
+            assert page["message"]["auxiliary_graphs"] == {"aux1": {"edges": ["support_edge"]}}
+            edge_keys.add("support_edge")
+            node_keys.update({"CHEBI:198", "CHEBI:199"})
+        else:
+            assert page["message"]["auxiliary_graphs"] == {}
+        assert set(page["message"]["knowledge_graph"]["nodes"]) == node_keys
+        assert set(page["message"]["knowledge_graph"]["edges"]) == edge_keys
+        assert page["status"] == "Success"
+
+
+def test_trapi_validation_cache(tmp_path):
+    validation_cache = TRAPIValidationCache(db_path=f"{tmp_path}/validation_cache.sqlite")
+    envelope = _get_example_envelope()
+    cache_key = validation_cache.get_cache_key(envelope, "1.5.0", "4.2.1")
+    assert cache_key == validation_cache.get_cache_key({**envelope, "validation_result": {"status": "PASS"}}, "1.5.0", "4.2.1")
+    assert cache_key != validation_cache.get_cache_key(envelope, "1.5.0", "4.2.2")
+    assert cache_key != validation_cache.get_cache_key({**envelope, "description": "other"}, "1.5.0", "4.2.1")
+    assert validation_cache.get(cache_key) is None
+
+    # Only one fetch gets to start a background validation
+    assert validation_cache.mark_pending(cache_key, {"status": PENDING_STATUS})
+    assert not validation_cache.mark_pending(cache_key, {"status": PENDING_STATUS})
+    assert validation_cache.get(cache_key) == {"status": PENDING_STATUS}
+    validation_cache.put(cache_key, {"status": "PASS", "message": ""})
+    assert validation_cache.get(cache_key) == {"status": "PASS", "message": ""}
+
+    validation_cache.max_entries = 3
+    for i in range(5):
+        validation_cache.put(f"key{i}", {"status": "ERROR"})
+    assert validation_cache.get(cache_key) is None
+    assert validation_cache.get("key4") == {"status": "ERROR"}
+
+
+def test_background_validation_does_not_hold_response_pipe(tmp_path, monkeypatch):
+    import select
+    import time
+    import response_cache
+    validation_done_path = f"{tmp_path}/validation_done"
+    release_path = f"{tmp_path}/release_validation"
+
+    def slow_validation(envelope, schema_version, cache_key):
+        deadline = time.time() + 20
+        while not os.path.exists(release_path) and time.time() < deadline:
+            time.sleep(0.05)
+        open(validation_done_path, "w").close()
+
+    monkeypatch.setattr(response_cache, "run_trapi_validation_in_background", slow_validation)
+    # Like a forked query child streaming its response to the server through a pipe
+    read_fd, write_fd = os.pipe()
+    try:
+        response_cache.start_trapi_validation_in_background(_get_example_envelope(), "1.5.0", "some_key")
+        os.close(write_fd)
+        # The response pipe reaches EOF while the validation is still running
+        assert select.select([read_fd], [], [], 5)[0]
+        assert os.read(read_fd, 1) == b""
+        assert not os.path.exists(validation_done_path)
+    finally:
+        os.close(read_fd)
+        open(release_path, "w").close()
@@ -13,6 +13,7 @@ from typing import List, Union, Dict, Tuple, Set, Iterable
 
 import ARAX_resultify
 from ARAX_resultify import ARAXResultify
+from kg_index_by_qg import KGIndexByQG, get_kg_index_by_qg, update_kg_index_by_qg
 from ARAX_query import ARAXQuery
 
 # is there a better way to import openapi_server?  Following SO posting 16981921
@@ -1641,5 +1642,102 @@ def test_issue2166():
     assert response.status == 'OK'
 
 
+def _get_result_graph_signatures(results: List[Result]) -> Set[tuple]:
+    signatures = set()
+    for result in results:
+        node_bindings = tuple(sorted((qnode_key, tuple(sorted(binding.id for binding in bindings)))
+                                     for qnode_key, bindings in result.node_bindings.items()))
+        edge_bindings = tuple(sorted((qedge_key, tuple(sorted(binding.id for binding in bindings)))
+                                     for qedge_key, bindings in result.analyses[0].edge_bindings.items()))
+        signatures.add((node_bindings, edge_bindings, result.essence))
+    return signatures
+
+
+def _create_multi_hop_kg_and_qg(num_n1_nodes: int) -> Tuple[KnowledgeGraph, QueryGraph]:
+    # QG is DOID:12345 -- n01 -- n02 (is_set) plus an optional n02 -- n03
+    qg = QueryGraph(nodes={"DOID:12345": QNode(ids=["DOID:12345"]), "n01": QNode(), "n02": QNode(is_set=True),
+                           "n03": QNode(option_group_id="opt")},
+                    edges={"qe01": QEdge(subject="DOID:12345", object="n01"), "qe02": QEdge(subject="n01", object="n02"),
+                           "qe03": QEdge(subject="n02", object="n03", option_group_id="opt")})
+    kg_node_info = [{"node_key": "DOID:12345", "qnode_keys": ["DOID:12345"]}]
+    kg_node_info += [{"node_key": f"UniProtKB:{index}", "qnode_keys": ["n01"]} for index in range(num_n1_nodes)]
+    kg_node_info += [{"node_key": f"HP:{index}", "qnode_keys": ["n02"]} for index in range(7)]
+    kg_node_info += [{"node_key": f"CHEBI:{index}", "qnode_keys": ["n03"]} for index in range(3)]
+    kg_edge_info = [{"edge_key": f"ke01_{index}", "subject": "DOID:12345", "object": f"UniProtKB:{index}",
+                     "qedge_keys": ["qe01"]} for index in range(0, num_n1_nodes, 2)]
+    kg_edge_info += [{"edge_key": f"ke02_{index}", "subject": f"UniProtKB:{index % num_n1_nodes}",
+                      "object": f"HP:{index % 7}", "qedge_keys": ["qe02"]} for index in range(0, num_n1_nodes * 3, 5)]
+    kg_edge_info += [{"edge_key": f"ke03_{index}", "subject": f"HP:{index}", "object": f"CHEBI:{index % 3}",
+                      "qedge_keys": ["qe03"]} for index in range(0, 7, 2)]
+    return KnowledgeGraph(nodes=_create_nodes(kg_node_info), edges=_create_edges(kg_edge_info)), qg
+
+
+def test_kg_index_by_qg_updates():
+    kg, qg = _create_multi_hop_kg_and_qg(20)
+    message = Message(knowledge_graph=kg, query_graph=qg)
+    kg_index = get_kg_index_by_qg(message)
+    assert kg_index.equals(KGIndexByQG.build(kg))
+    assert get_kg_index_by_qg(message) is kg_index
+
+    # Mimic what Expand/Filter_KG/Overlay do to the KG in between resultify calls
+    kg.nodes.update(_create_nodes([{"node_key": "UniProtKB:new", "qnode_keys": ["n01"]}]))
+    kg.edges.update(_create_edges([{"edge_key": "ke01_new", "subject": "DOID:12345", "object": "UniProtKB:new",
+                                    "qedge_keys": ["qe01"]}]))
+    del kg.nodes["HP:6"]
+    for edge_key in [edge_key for edge_key, edge in kg.edges.items() if "HP:6" in {edge.subject, edge.object}]:
+        del kg.edges[edge_key]
+    kg.nodes["UniProtKB:1"].qnode_keys = ["n01", "n02"]
+    kg.edges["ke01_0"].subject = "UniProtKB:1"
+    kg.edges["ke01_0"].object = "DOID:12345"
+    kg.edges["ke02_0"].qedge_keys = ["qe02", "qe03"]
+    assert update_kg_index_by_qg(message) > 0
+    assert kg_index.equals(KGIndexByQG.build(kg))
+    assert "HP:6" not in kg_index.node_keys_by_qg_key["n02"]
+    assert kg_index.edge_keys_by_node_pair_undirected["qe01"][("UniProtKB:1", "DOID:12345")] == {"ke01_0"}
+    assert update_kg_index_by_qg(message) == 0
+    # Changes made to a node's/edge's qnode/qedge key list in place are picked up too
+    kg.nodes["UniProtKB:1"].qnode_keys.append("n03")
+    kg.edges["ke02_0"].qedge_keys.remove("qe03")
+    assert update_kg_index_by_qg(message) == 2
+    assert kg_index.equals(KGIndexByQG.build(kg))
+
+    # Nodes/edges known to have been removed can be dropped without a full sync
+    removed_edge_keys = {edge_key for edge_key, edge in kg.edges.items() if "HP:4" in {edge.subject, edge.object}}
+    del kg.nodes["HP:4"]
+    for edge_key in removed_edge_keys:
+        del kg.edges[edge_key]
+    kg_index.discard(node_keys=["HP:4"], edge_keys=removed_edge_keys)
+    assert kg_index.equals(KGIndexByQG.build(kg))
+
+    # A brand new KG (like the one Resultify leaves behind after cleaning up) is handled too
+    message.knowledge_graph = KnowledgeGraph(nodes={"DOID:12345": kg.nodes["DOID:12345"]}, edges=dict())
+    update_kg_index_by_qg(message)
+    assert kg_index.equals(KGIndexByQG.build(message.knowledge_graph))
+    assert kg_index.edge_keys_by_subject == dict()
+    assert update_kg_index_by_qg(Message(knowledge_graph=kg)) is None
+
+
+@pytest.mark.parametrize("ignore_edge_direction", [True, False])
+def test_parallel_result_enumeration(monkeypatch, ignore_edge_direction):
+    kg, qg = _create_multi_hop_kg_and_qg(60)
+    serial_response = ARAXResponse()
+    serial_results = ARAX_resultify._get_results_for_kg_by_qg(kg, qg, ignore_edge_direction=ignore_edge_direction,
+                                                              log=serial_response)
+    assert serial_response.status == 'OK'
+    assert len(serial_results) > 5
+    assert any("n03" in result.node_bindings for result in serial_results)
+
+    monkeypatch.setattr(ARAX_resultify, "MIN_ESSENCE_NODES_PER_PROCESS", 5)
+    parallel_response = ARAXResponse()
+    parallel_results = ARAX_resultify._get_results_for_kg_by_qg(kg, qg, ignore_edge_direction=ignore_edge_direction,
+                                                                log=parallel_response, kg_index=KGIndexByQG.build(kg),
+                                                                num_processes=3)
+    assert parallel_response.status == 'OK'
+    assert _get_result_graph_signatures(parallel_results) == _get_result_graph_signatures(serial_results)
+    parallel_messages = [message["message"] for message in parallel_response.messages]
+    assert any(message.startswith("Splitting result enumeration across 3 processes") for message in parallel_messages)
+    assert any("for the largest worker" in message for message in parallel_messages)
+
+
 if __name__ == '__main__':
     pytest.main(['-v', 'test_ARAX_resultify.py'])
@@ -7,13 +7,17 @@ Usage:
 import copy
 import json
 import os
+import sqlite3
+import signal
 import sys
+import threading
 import timeit
 
 import pytest
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer/")
-from node_synonymizer import NodeSynonymizer
+from node_synonymizer import NodeSynonymizer, _LRUCache
+from synonymizer_snapshot import SynonymizerSnapshot, build_snapshot
 
 ATRIAL_FIBRILLATION_CURIE = "MONDO:0004981"
 PARKINSONS_CURIE = "DOID:14330"
@@ -395,5 +399,137 @@ def test_cluster_graphs():
         assert node["attributes"]
 
 
+def test_lookup_caching():
+    NodeSynonymizer.clear_caches()
+    synonymizer = NodeSynonymizer()
+    curies = [PARKINSONS_CURIE, IBUPROFEN_CURIE, FAKE_CURIE]
+
+    uncached_canonical = synonymizer.get_canonical_curies(curies)
+    uncached_equivalent = synonymizer.get_equivalent_nodes(curies)
+    assert synonymizer.get_cache_stats()["canonical"] == {"hits": 0, "misses": 3, "size": 3}
+
+    # Make sure mutating the returned results doesn't corrupt the cache
+    uncached_canonical[PARKINSONS_CURIE]["preferred_name"] = "something else"
+    uncached_equivalent[PARKINSONS_CURIE].append("SOME:curie")
+
+    cached_canonical = synonymizer.get_canonical_curies(curies)
+    cached_equivalent = synonymizer.get_equivalent_nodes(curies)
+    assert cached_canonical[PARKINSONS_CURIE]["preferred_name"] != "something else"
+    assert "SOME:curie" not in cached_equivalent[PARKINSONS_CURIE]
+    assert cached_canonical[FAKE_CURIE] is None
+    assert cached_equivalent[FAKE_CURIE] is None
+    assert synonymizer.get_cache_stats()["canonical"]["hits"] == 3
+    assert synonymizer.get_cache_stats()["equivalent"]["hits"] == 3
+
+    # Caches are shared across instances (and threads)
+    assert NodeSynonymizer().get_cache_stats()["canonical"]["hits"] == 3
+
+
+def _build_mini_synonymizer(sqlite_path: str):
+    # A tiny synonymizer-like sqlite, with just the tables/columns that curie lookups use
+    db_connection = sqlite3.connect(sqlite_path)
+    db_connection.execute("CREATE TABLE nodes (id TEXT, id_simplified TEXT, cluster_id TEXT)")
+    db_connection.execute("CREATE TABLE clusters (cluster_id TEXT, name TEXT, category TEXT, member_ids TEXT)")
+    db_connection.executemany("INSERT INTO nodes VALUES (?, ?, ?)",
+                              [(PARKINSONS_CURIE_2, PARKINSONS_CURIE_2, PARKINSONS_CURIE_2),
+                               (PARKINSONS_CURIE, PARKINSONS_CURIE, PARKINSONS_CURIE_2),
+                               ("umls:C0030567", "UMLS:C0030567", PARKINSONS_CURIE_2),
+                               (IBUPROFEN_CURIE, IBUPROFEN_CURIE, IBUPROFEN_CURIE)])
+    db_connection.executemany("INSERT INTO clusters VALUES (?, ?, ?, ?)",
+                              [(PARKINSONS_CURIE_2, PARKINSONS_NAME, "Disease",
+                                str([PARKINSONS_CURIE, "umls:C0030567", PARKINSONS_CURIE_2])),
+                               (IBUPROFEN_CURIE, None, "SmallMolecule", str([IBUPROFEN_CURIE]))])
+    db_connection.commit()
+    db_connection.close()
+
+
+def _get_mini_synonymizer(tmp_path) -> NodeSynonymizer:
+    sqlite_path = str(tmp_path / "mini_synonymizer.sqlite")
+    _build_mini_synonymizer(sqlite_path)
+    # NodeSynonymizer looks for its sqlite relative to the NodeSynonymizer directory
+    synonymizer_dir = os.path.dirname(os.path.abspath(__file__)) + "/../NodeSynonymizer"
+    return NodeSynonymizer(os.path.relpath(sqlite_path, synonymizer_dir))
+
+
+def test_lookup_cache_is_bounded_by_size(tmp_path):
+    lru_cache = _LRUCache(max_cost=10)
+    lru_cache.put_many({"A:1": ("A:1", "B:1", "C:1", "D:1"), "A:2": None})
+    assert lru_cache.cost == 6
+    # Pushes the total cost past the limit, so the least recently used entry gets evicted
+    lru_cache.put_many({"A:3": ("A:3", "B:3", "C:3", "D:3")})
+    assert set(lru_cache.entries) == {"A:2", "A:3"}
+    assert lru_cache.cost == 6
+
+    # Members of the same cluster share one cached tuple
+    NodeSynonymizer.clear_caches()
+    synonymizer = _get_mini_synonymizer(tmp_path)
+    synonymizer.get_equivalent_nodes([PARKINSONS_CURIE, "UMLS:C0030567"])
+    equivalent_cache = synonymizer._get_lookup_cache("equivalent")
+    assert equivalent_cache.entries[PARKINSONS_CURIE] is equivalent_cache.entries["UMLS:C0030567"]
+    synonymizer.close()
+    NodeSynonymizer.clear_caches()
+
+
+def test_db_connections_of_finished_threads_are_closed(tmp_path):
+    synonymizer = _get_mini_synonymizer(tmp_path)
+    thread_connections = []
+    thread = threading.Thread(target=lambda: thread_connections.append(synonymizer._get_db_connection()))
+    thread.start()
+    thread.join()
+    assert thread in synonymizer._db_connections
+
+    # The next connection opened (by any thread) cleans up after the finished one
+    next_thread = threading.Thread(target=synonymizer._get_db_connection)
+    next_thread.start()
+    next_thread.join()
+    with pytest.raises(sqlite3.ProgrammingError):
+        thread_connections[0].execute("SELECT 1")
+    assert thread not in synonymizer._db_connections
+
+    main_connection = synonymizer._get_db_connection()
+    synonymizer.close()
+    assert not synonymizer._db_connections
+    with pytest.raises(sqlite3.ProgrammingError):
+        main_connection.execute("SELECT 1")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires os.fork")
+def test_synonymizer_usable_after_fork_while_locked(tmp_path):
+    NodeSynonymizer.clear_caches()
+    synonymizer = _get_mini_synonymizer(tmp_path)
+    # Another thread holds the synonymizer's connection lock at the moment of the fork
+    synonymizer._db_connections_lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        signal.alarm(10)  # Don't hang forever if the child deadlocks
+        canonical_info = synonymizer.get_canonical_curies(PARKINSONS_CURIE)[PARKINSONS_CURIE]
+        os._exit(0 if canonical_info["preferred_curie"] == PARKINSONS_CURIE_2 else 1)
+    synonymizer._db_connections_lock.release()
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    synonymizer.close()
+    NodeSynonymizer.clear_caches()
+
+
+def test_synonymizer_snapshot(tmp_path):
+    # Build a snapshot from a tiny synonymizer-like sqlite and make sure lookups match what's in the sqlite
+    sqlite_path = str(tmp_path / "mini_synonymizer.sqlite")
+    _build_mini_synonymizer(sqlite_path)
+
+    snapshot = SynonymizerSnapshot(build_snapshot(sqlite_path))
+    assert snapshot.is_up_to_date_with(sqlite_path)
+    assert snapshot.get_canonical_info(PARKINSONS_CURIE) == (PARKINSONS_CURIE_2, "Disease", PARKINSONS_NAME)
+    assert snapshot.get_canonical_info(IBUPROFEN_CURIE) == (IBUPROFEN_CURIE, "SmallMolecule", None)
+    # Member ids come back in the same order as in the sqlite's clusters table
+    assert snapshot.get_member_ids("UMLS:C0030567") == [PARKINSONS_CURIE, "umls:C0030567", PARKINSONS_CURIE_2]
+    assert snapshot.get_canonical_info(FAKE_CURIE) is None
+    assert snapshot.get_member_ids(FAKE_CURIE) is None
+    # A sqlite that's been rebuilt is detected even if its size didn't change
+    sqlite_stat = os.stat(sqlite_path)
+    os.utime(sqlite_path, ns=(sqlite_stat.st_atime_ns, sqlite_stat.st_mtime_ns + 1_000_000_000))
+    assert not snapshot.is_up_to_date_with(sqlite_path)
+    snapshot.close()
+
+
 if __name__ == "__main__":
     pytest.main(['-v', 'test_ARAX_synonymizer.py'])
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../ARAXQuery/Path_Finder")
+
+from BidirectionalPathFinder import BidirectionalPathFinder
+from model.Node import Node
+from repo.Repository import Repository
+
+
+class InMemoryRepo(Repository):
+
+    def __init__(self, edges):
+        self.neighbors = dict()
+        for node_1, node_2, weight in edges:
+            self.neighbors.setdefault(node_1, []).append((node_2, weight))
+            self.neighbors.setdefault(node_2, []).append((node_1, weight))
+        self.num_batches = 0
+
+    def get_neighbors(self, node, limit=-1):
+        return [Node(neighbor_id, weight) for neighbor_id, weight in self.neighbors.get(node.id, [])]
+
+    def get_neighbors_of_nodes(self, nodes, limit=-1):
+        self.num_batches += 1
+        return super().get_neighbors_of_nodes(nodes, limit)
+
+    def get_node_degree(self, node):
+        return len(self.neighbors.get(node.id, []))
+
+
+def _get_example_repo():
+    return InMemoryRepo([("A", "B", 0.1), ("B", "Z", 0.2), ("A", "C", 0.3), ("C", "Z", 0.4), ("B", "C", 0.05),
+                         ("A", "Z", 0.9), ("C", "D", 0.1), ("D", "Z", 0.1)])
+
+
+def test_find_all_paths():
+    repo = _get_example_repo()
+    paths = BidirectionalPathFinder(repo).find_all_paths("A", "Z", hops_numbers=3)
+    assert {str(path) for path in paths} == {"A_Z", "A_B_Z", "A_C_Z", "A_B_C_Z", "A_C_B_Z", "A_C_D_Z"}
+    assert [str(path) for path in paths][:2] == ["A_B_Z", "A_C_D_Z"]
+    assert [path.compute_weight() for path in paths] == pytest.approx([0.3, 0.5, 0.55, 0.55, 0.7, 0.9])
+    # Each level's frontier (on both sides) is fetched in one batch
+    assert repo.num_batches == 2
+
+
+def test_find_all_paths_with_limits():
+    path_finder = BidirectionalPathFinder(_get_example_repo())
+    paths = path_finder.find_all_paths("A", "Z", hops_numbers=4, max_paths=2)
+    assert [str(path) for path in paths] == ["A_B_Z", "A_B_C_D_Z"]
+    assert path_finder.is_truncated
+    assert BidirectionalPathFinder(_get_example_repo()).find_all_paths("A", "A", hops_numbers=2) == []
+
+
+def test_find_all_paths_stops_between_neighbor_batches(monkeypatch):
+    import time
+    import BidirectionalPathFinder as bidirectional_path_finder
+    monkeypatch.setattr(bidirectional_path_finder, "PLOVER_BATCH_SIZE", 2)
+    repo = InMemoryRepo([("A", f"N{index}", 0.1) for index in range(10)] +
+                        [(f"N{index}", "Z", 0.1) for index in range(10)])
+    requested_node_ids = []
+
+    def get_neighbors_of_nodes_slowly(nodes, limit=-1):
+        requested_node_ids.extend(node.id for node in nodes)
+        time.sleep(0.1)
+        return InMemoryRepo.get_neighbors_of_nodes(repo, nodes, limit)
+
+    monkeypatch.setattr(repo, "get_neighbors_of_nodes", get_neighbors_of_nodes_slowly)
+    path_finder = BidirectionalPathFinder(repo)
+    path_finder.find_all_paths("A", "Z", hops_numbers=4, time_limit=0.25)
+    # A and Z are fetched in one batch, then the deadline passes partway through the next level's five batches
+    assert path_finder.is_truncated
+    assert 2 < len(requested_node_ids) < 12
+
+
+def test_ngd_sorted_neighbors(tmp_path):
+    import json
+    import sqlite3
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../..")  # code directory, for RTXConfiguration
+    from repo.NGDSortedNeighborsRepo import NGDSortedNeighborsRepo
+    curie_to_pmids_path = str(tmp_path / "curie_to_pmids.sqlite")
+    with sqlite3.connect(curie_to_pmids_path) as conn:
+        conn.execute("CREATE TABLE curie_to_pmids (curie TEXT, pmids TEXT)")
+        conn.executemany("INSERT INTO curie_to_pmids VALUES (?, ?)",
+                         [("A", json.dumps(list(range(1, 11)))), ("B", json.dumps(list(range(1, 6)))),
+                          ("C", json.dumps(list(range(10, 21))))])
+    conn.close()
+    repo = InMemoryRepo([("A", "C", 1), ("A", "B", 1), ("A", "D", 1)])
+    ngd_repo = NGDSortedNeighborsRepo(repo, degree_repo=repo, curie_to_pmids_path=curie_to_pmids_path)
+    # B shares more of A's PMIDs than C does; D has no PMIDs at all
+    assert [neighbor.id for neighbor in ngd_repo.get_neighbors(Node("A"))] == ["B", "C"]
+    assert [neighbor.id for neighbor in ngd_repo.get_neighbors(Node("A"), limit=1)] == ["B"]
+    assert repo.num_batches == 1  # The sorted neighbors are cached
+    ngd_repo.close()
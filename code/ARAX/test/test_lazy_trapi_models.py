@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Usage:
+    Run all tests: pytest -v test_lazy_trapi_models.py
+"""
+import copy
+import os
+import pickle
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from lazy_trapi_models import LazyEdge, knowledge_graph_from_dict
+from openapi_server.models.attribute import Attribute
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+
+
+def _get_example_knowledge_graph_dict(num_edges: int = 10) -> dict:
+    nodes = {"MONDO:0005015": {"name": "diabetes mellitus", "categories": ["biolink:Disease"]}}
+    edges = dict()
+    for index in range(num_edges):
+        nodes[f"NCBIGene:{index}"] = {"name": f"gene {index}", "categories": ["biolink:Gene"],
+                                      "attributes": [{"attribute_type_id": "biolink:synonym", "value": [f"G{index}"]}]}
+        edges[f"e{index}"] = {"subject": f"NCBIGene:{index}", "object": "MONDO:0005015",
+                              "predicate": "biolink:gene_associated_with_condition",
+                              "attributes": [{"attribute_type_id": "biolink:p_value", "value": 0.01,
+                                              "attributes": [{"attribute_type_id": "biolink:publications",
+                                                              "value": ["PMID:1"]}]}],
+                              "sources": [{"resource_id": "infores:arax",
+                                           "resource_role": "primary_knowledge_source"}]}
+    return {"nodes": nodes, "edges": edges}
+
+
+def test_lazy_knowledge_graph_matches_from_dict():
+    knowledge_graph_dict = _get_example_knowledge_graph_dict()
+    original_dict = copy.deepcopy(knowledge_graph_dict)
+    knowledge_graph = knowledge_graph_from_dict(knowledge_graph_dict)
+    edge = knowledge_graph.edges["e0"]
+    # Plain fields are set right away; the rest are only hydrated once they're read
+    assert edge.predicate == "biolink:gene_associated_with_condition"
+    assert edge._unhydrated == {"attributes", "sources"}
+    assert isinstance(edge.attributes[0], Attribute) and isinstance(edge.attributes[0].attributes[0], Attribute)
+    assert edge._unhydrated == {"sources"}
+    assert knowledge_graph.to_dict() == KnowledgeGraph.from_dict(knowledge_graph_dict).to_dict()
+    assert knowledge_graph == KnowledgeGraph.from_dict(knowledge_graph_dict)
+    assert knowledge_graph_dict == original_dict
+
+
+def test_lazy_edges_are_copied_on_write():
+    knowledge_graph_dict = _get_example_knowledge_graph_dict(num_edges=2)
+    knowledge_graph = knowledge_graph_from_dict(knowledge_graph_dict)
+    edge = knowledge_graph.edges["e1"]
+    edge.attributes = []
+    edge.hydrate()
+    assert edge.attributes == [] and "_unhydrated" not in edge.__dict__
+    assert len(knowledge_graph_dict["edges"]["e1"]["attributes"]) == 1
+    copied_knowledge_graph = pickle.loads(pickle.dumps(knowledge_graph_from_dict(knowledge_graph_dict)))
+    assert copied_knowledge_graph == KnowledgeGraph.from_dict(knowledge_graph_dict)
+
+
+def test_lazy_edges_are_validated():
+    with pytest.raises(ValueError):
+        LazyEdge.from_dict({"subject": None, "object": "MONDO:0005015", "predicate": "biolink:related_to"})
+    with pytest.raises(ValueError):
+        LazyEdge.from_dict({"subject": "NCBIGene:1", "object": "MONDO:0005015", "predicate": "biolink:related_to",
+                            "sources": []})
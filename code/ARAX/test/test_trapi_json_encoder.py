@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Usage:
+    Run all tests: pytest -v test_trapi_json_encoder.py
+    Compare dumps_model() to to_dict() + json.dumps() on a large envelope: python3 test_trapi_json_encoder.py
+"""
+import json
+import os
+import sys
+import timeit
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from trapi_json_encoder import dumps_model, iter_model_json, model_to_dict
+from openapi_server.models.attribute import Attribute
+from openapi_server.models.auxiliary_graph import AuxiliaryGraph
+from openapi_server.models.edge import Edge
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.log_entry import LogEntry
+from openapi_server.models.message import Message
+from openapi_server.models.node import Node
+from openapi_server.models.node_binding import NodeBinding
+from openapi_server.models.response import Response
+from openapi_server.models.result import Result
+
+
+def _get_example_envelope(num_genes: int = 50) -> Response:
+    nodes = {"MONDO:0005015": Node(name="diabetes mellitus", categories=["biolink:Disease"])}
+    edges = dict()
+    results = []
+    for index in range(num_genes):
+        nodes[f"NCBIGene:{index}"] = Node(name=f"gene {index}", categories=["biolink:Gene"],
+                                          attributes=[Attribute(attribute_type_id="biolink:synonym", value=[f"G{index}"])])
+        edges[f"e{index}"] = Edge(subject=f"NCBIGene:{index}", object="MONDO:0005015",
+                                  predicate="biolink:gene_associated_with_condition")
+        results.append(Result(node_bindings={"n0": [NodeBinding(id="MONDO:0005015")],
+                                             "n1": [NodeBinding(id=f"NCBIGene:{index}")]}, analyses=[]))
+    message = Message(knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges), results=results,
+                      auxiliary_graphs={"a0": AuxiliaryGraph(edges=["e0", "e1"])})
+    return Response(message=message, status="Success", description="Normal completion",
+                    logs=[LogEntry(message="Query completed", level="INFO")])
+
+
+def test_iter_model_json_matches_json_dumps():
+    envelope = _get_example_envelope()
+    chunks = list(iter_model_json(envelope, chunk_size=1000, use_orjson=False))
+    assert len(chunks) > 1
+    assert "".join(chunks) == json.dumps(envelope.to_dict(), allow_nan=False, sort_keys=True)
+
+
+def test_iter_model_json_unsorted_matches_json_dumps():
+    envelope = _get_example_envelope()
+    assert dumps_model(envelope, sort_keys=False, use_orjson=False) == json.dumps(envelope.to_dict(), allow_nan=False)
+
+
+def test_iter_model_json_with_orjson_matches_orjson_dumps():
+    orjson = pytest.importorskip("orjson")
+    envelope = _get_example_envelope()
+    assert dumps_model(envelope, use_orjson=True) == \
+        orjson.dumps(envelope.to_dict(), option=orjson.OPT_SORT_KEYS).decode("utf-8")
+
+
+def test_model_to_dict_matches_to_dict():
+    envelope = _get_example_envelope()
+    envelope.message.knowledge_graph.edges["e0"].attributes = [Attribute(attribute_type_id="biolink:p_value",
+                                                                         value=0.01)]
+    envelope_dict = model_to_dict(envelope)
+    assert envelope_dict == envelope.to_dict()
+    assert list(envelope_dict) == list(envelope.to_dict())
+
+
+def test_iter_model_json_writes_non_finite_floats_as_null():
+    envelope = _get_example_envelope(num_genes=2)
+    envelope.message.knowledge_graph.nodes["NCBIGene:1"].attributes[0].value = float("nan")
+    envelope_dict = json.loads("".join(iter_model_json(envelope)))
+    assert envelope_dict["message"]["knowledge_graph"]["nodes"]["NCBIGene:1"]["attributes"][0]["value"] is None
+    assert envelope_dict["message"]["knowledge_graph"]["nodes"]["NCBIGene:0"]["attributes"][0]["value"] == ["G0"]
+
+
+def benchmark_dumps_model():
+    envelope = _get_example_envelope(num_genes=500)
+    to_dict_sec = min(timeit.repeat(lambda: json.dumps(envelope.to_dict(), allow_nan=False, sort_keys=True),
+                                    number=1, repeat=3))
+    dumps_model_sec = min(timeit.repeat(lambda: dumps_model(envelope), number=1, repeat=3))
+    print(f"to_dict() + json.dumps(): {to_dict_sec:.3f} sec; dumps_model(): {dumps_model_sec:.3f} sec")
+
+
+def main():
+    benchmark_dumps_model()
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,7 @@ def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
 
 
 FLASK_DEFAULT_TCP_PORT = 5008
+QUERY_WORKER_POOL_DEFAULT_SIZE = 2
 global child_pid
 child_pid = None
 global parent_pid
@@ -158,6 +159,15 @@ def main():
         signal.signal(signal.SIGPIPE, receive_sigpipe)
         signal.signal(signal.SIGTERM, receive_sigterm)
 
+        # Pre-fork warm workers to run queries in (set query_worker_pool_size
+        # to 0 in the config file to fork a child per query instead)
+        query_worker_pool_size = local_config.get(
+            'query_worker_pool_size', QUERY_WORKER_POOL_DEFAULT_SIZE)
+        if query_worker_pool_size > 0:
+            from openapi_server.controllers import query_controller
+            eprint(f"Starting {query_worker_pool_size} query workers")
+            query_controller.start_query_worker_pool(query_worker_pool_size)
+
         eprint("Starting flask application in the parent process")
         setproctitle.setproctitle(setproctitle.getproctitle() +
                                   f" [port={tcp_port}]")
@@ -14,14 +14,24 @@ def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
 
 
 rlimit_child_process_bytes = 34359738368  # 32 GiB
+max_queries_per_query_worker = 50
+max_query_worker_rss_bytes = 8589934592  # 8 GiB; workers that grow past this are replaced after their current query
+query_worker_wait_sec = 5  # if no pooled worker is idle by then, fork a child for the query as before
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../../../../ARAX/ARAXQuery")
 import ARAX_query
+from ARAX_query_worker_pool import QueryWorkerPool
+from trapi_json_encoder import model_to_dict
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../../../../ARAX/BiolinkHelper")
+from biolink_helper import BiolinkHelper
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../models")
 import response
 
 
+query_worker_pool = None
+
+
 def child_receive_sigpipe(signal_number, frame):
     if signal_number == signal.SIGPIPE:
         eprint("[query_controller]: child process detected a "
@@ -71,9 +81,39 @@ def run_query_dict_in_child_process(query_dict: dict,
     return read_fo
 
 
+def start_query_worker_pool(num_workers: int):
+    global query_worker_pool
+    try:
+        BiolinkHelper()  # Load the shared Biolink lookups before forking, so all the workers share them
+    except Exception:
+        eprint(f"[query_controller]: could not preload the Biolink lookups: {traceback.format_exc()}")
+    query_worker_pool = QueryWorkerPool({"stream": _run_query_and_return_json_generator_stream,
+                                         "nonstream": _run_query_and_return_json_generator_nonstream},
+                                        num_workers,
+                                        rlimit_bytes=rlimit_child_process_bytes,
+                                        max_queries_per_worker=max_queries_per_query_worker,
+                                        max_rss_bytes=max_query_worker_rss_bytes).start()
+
+
+def get_query_worker_pool_status() -> dict:
+    if query_worker_pool is None:
+        return {"num_workers": 0}
+    return query_worker_pool.get_status()
+
+
+def run_query_dict_in_worker(query_dict: dict, runner_name: str) -> Iterable[str]:
+    if query_worker_pool is not None:
+        read_fo = query_worker_pool.run_query(query_dict, runner_name, timeout=query_worker_wait_sec)
+        if read_fo is not None:
+            return read_fo
+    query_runner = {"stream": _run_query_and_return_json_generator_stream,
+                    "nonstream": _run_query_and_return_json_generator_nonstream}[runner_name]
+    return run_query_dict_in_child_process(query_dict, query_runner)
+
+
 def _run_query_and_return_json_generator_nonstream(query_dict: dict) -> Iterable[str]:
     envelope = ARAX_query.ARAXQuery().query_return_message(query_dict, mode='RTXKG2')
-    envelope_dict = envelope.to_dict()
+    envelope_dict = model_to_dict(envelope)
     if hasattr(envelope, 'http_status'):
         envelope_dict['http_status'] = envelope.http_status
     else:
@@ -117,16 +157,14 @@ def query(request_body):  # noqa: E501
         if not fork_mode:
             json_generator = _run_query_and_return_json_generator_stream(query)
         else:
-            json_generator = run_query_dict_in_child_process(query,
-                                                             _run_query_and_return_json_generator_stream)
+            json_generator = run_query_dict_in_worker(query, "stream")
 
         resp_obj = flask.Response(json_generator, mimetype=mime_type)
     # Else perform the query and return the result
         http_status = None
 
     else:
-        json_generator = run_query_dict_in_child_process(query,
-                                                         _run_query_and_return_json_generator_nonstream)
+        json_generator = run_query_dict_in_worker(query, "nonstream")
         the_dict = json.loads(next(json_generator))
         http_status = the_dict.get('http_status', 200)
         resp_obj = response.Response.from_dict(the_dict)
@@ -29,12 +29,20 @@ def child_receive_sigpipe(signal_number, frame):
         os._exit(0)
 
 
-def _get_response(response_id: str) -> Union[dict, tuple]:
+def _get_response(response_id: str, offset: int = None, limit: int = None,
+                  async_validation: bool = None) -> Union[dict, tuple]:
     response_cache = ResponseCache()
-    return response_cache.get_response(response_id)
+    if limit is not None:
+        return response_cache.get_response_page(
+            response_id, offset=offset, limit=limit,
+            async_validation=async_validation)
+    return response_cache.get_response(response_id,
+                                       async_validation=async_validation)
 
 
-def get_response_in_child_process(response_id: str) -> TextIO:
+def get_response_in_child_process(response_id: str, offset: int = None,
+                                  limit: int = None,
+                                  async_validation: bool = None) -> TextIO:
     eprint("[response_controller]: Creating pipe and "
            "forking a child to get the response")
     read_fd, write_fd = os.pipe()
@@ -59,7 +67,8 @@ def get_response_in_child_process(response_id: str) -> TextIO:
             # child process needs to get a stream object for the file
             # descriptor `write_fd`
             with os.fdopen(write_fd, 'w') as write_fo:
-                envelope = _get_response(response_id)
+                envelope = _get_response(response_id, offset, limit,
+                                         async_validation)
                 write_fo.write(json.dumps(envelope))
                 write_fo.flush()
         except BaseException as e:
@@ -80,24 +89,33 @@ def get_response_in_child_process(response_id: str) -> TextIO:
     return read_fo
 
 
-def get_response(response_id: str) -> Any:  # noqa: E501
+def get_response(response_id: str, offset: int = None, limit: int = None,
+                 async_validation: bool = None) -> Any:  # noqa: E501
     """Request a previously stored response from the server
 
      # noqa: E501
 
     :param response_id: Identifier of the response to return
     :type response_id: str
+    :param offset: Index of the first result (by descending score) to return; only used with limit
+    :type offset: int
+    :param limit: If provided, return only this many results and the part of the knowledge graph they reference
+    :type limit: int
+    :param async_validation: If true, return without waiting for TRAPI validation; a later request gets the result
+    :type async_validation: bool
 
     :rtype: Response
     """
 
     if do_fork:
-        read_fo = get_response_in_child_process(response_id)
+        read_fo = get_response_in_child_process(response_id, offset, limit,
+                                                async_validation)
         resp_obj = json.load(read_fo)
         if type(resp_obj) == list and len(resp_obj) == 2:
             resp_obj = tuple(resp_obj)
     else:
-        resp_obj = _get_response(response_id)
+        resp_obj = _get_response(response_id, offset, limit,
+                                 async_validation)
     return resp_obj
 
 
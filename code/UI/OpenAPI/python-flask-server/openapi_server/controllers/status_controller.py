@@ -21,7 +21,7 @@ def get_status(last_n_hours=None, id_=None, terminate_pid=None, authorization=No
     :type terminate_pid: int
     :param authorization: Authorization string required for certain calls to status
     :type authorization: str
-    :param mode: Switch to control the type of returned status information Possible values are: activity: Show query activity on server [default] smartapi: Summarize Translator endpoints at SmartAPI
+    :param mode: Switch to control the type of returned status information Possible values are: activity: Show query activity on server [default] smartapi: Summarize Translator endpoints at SmartAPI query_workers: Show the state of the query worker pool
     :type mode: str
 
     :rtype: object
@@ -31,6 +31,10 @@ def get_status(last_n_hours=None, id_=None, terminate_pid=None, authorization=No
         manager = RecentUUIDManager()
         return manager.get_recent_uuids( ars_host=authorization, top_n_pks=last_n_hours )
 
+    if mode is not None and mode == 'query_workers':
+        from openapi_server.controllers import query_controller
+        return query_controller.get_query_worker_pool_status()
+
     if authorization is not None and authorization == 'smartapi':
         smartapi = SmartAPI()
         return smartapi.get_trapi_endpoints()
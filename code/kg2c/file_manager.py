@@ -229,6 +229,7 @@ def upload_kg2c_files_to_arax_databases_server(kg2pre_version: str, sub_version:
     # First upload required files
     test_suffix = "_TEST" if is_test else ""
     os.system(f"scp kg2c.sqlite{test_suffix} rtxconfig@{rtx_config.db_host}:{remote_dbs_dir}/kg2c_{sub_version}_KG{kg2pre_version}.sqlite{test_suffix}")
+    os.system(f"scp kg2c.neighbor_counts{test_suffix} rtxconfig@{rtx_config.db_host}:{remote_dbs_dir}/kg2c_{sub_version}_KG{kg2pre_version}.neighbor_counts{test_suffix}")
     os.system(f"scp meta_kg.json{test_suffix} rtxconfig@{rtx_config.db_host}:{remote_dbs_dir}/meta_kg_{sub_version}_KG{kg2pre_version}c.json{test_suffix}")
     os.system(f"scp fda_approved_drugs.pickle{test_suffix} rtxconfig@{rtx_config.db_host}:{remote_dbs_dir}/fda_approved_drugs_{sub_version}_KG{kg2pre_version}c.pickle{test_suffix}")
 
@@ -1,6 +1,7 @@
 """
 This script creates a 'meta knowledge graph' (per TRAPI) and records node neighbor counts by category (in the
-kg2c.sqlite file generated by create_kg2c_files.py). It uses the 'lite' KG2c JSON file to derive this meta info.
+kg2c.sqlite file generated by create_kg2c_files.py, as well as in a memory-mapped neighbor count index next to it that
+also has counts by predicate). It uses the 'lite' KG2c JSON file to derive this meta info.
 Usage: python record_kg2c_meta_info.py [--test]
 """
 import argparse
@@ -13,10 +14,12 @@ import sqlite3
 import sys
 import time
 from collections import defaultdict
-from typing import Dict, Set
+from typing import Dict, Set, Tuple, Optional
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAX/BiolinkHelper/")
 from biolink_helper import BiolinkHelper
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAX/ARAXQuery/Overlay/")
+from neighbor_count_index import build_neighbor_count_index
 
 
 KG2C_DIR = f"{os.path.dirname(os.path.abspath(__file__))}"
@@ -103,29 +106,30 @@ def build_meta_kg(nodes_by_id: Dict[str, Dict[str, any]], edges_by_id: Dict[str,
         json.dump(meta_kg, meta_kg_file, default=serialize_with_sets, indent=2)
 
 
-def add_neighbor_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], edges_by_id: Dict[str, Dict[str, any]],
-                                  sqlite_file_name: str, label_property_name: str):
-    logging.info("Counting up node neighbors by category..")
-    # First gather neighbors of each node by label/category
-    neighbors_by_label = defaultdict(lambda: defaultdict(lambda: set()))
-    neighbors = defaultdict(set)
+def get_neighbor_predicates(edges_by_id: Dict[str, Dict[str, any]]) -> Dict[str, Dict[str, Set[str]]]:
+    # Gather the neighbors of each node, along with the predicates of the edges connecting them (in either direction)
+    neighbor_predicates = defaultdict(lambda: defaultdict(set))
     for edge in edges_by_id.values():
         subject_node_id = edge["subject"]
         object_node_id = edge["object"]
-        neighbors[subject_node_id].add(object_node_id)  # Used for overall neighbor counts later
-        neighbors[object_node_id].add(subject_node_id)  # Used for overall neighbor counts later
-        subject_node = nodes_by_id[subject_node_id]
-        object_node = nodes_by_id[object_node_id]
-        for label in object_node[label_property_name]:
-            neighbors_by_label[subject_node_id][label].add(object_node_id)
-        for label in subject_node[label_property_name]:
-            neighbors_by_label[object_node_id][label].add(subject_node_id)
-
-    # Then record only the counts of neighbors per label/category
-    neighbor_counts = defaultdict(dict)
-    for node_id, neighbors_dict in neighbors_by_label.items():
-        for label, neighbor_ids in neighbors_dict.items():
-            neighbor_counts[node_id][label] = len(neighbor_ids)
+        neighbor_predicates[subject_node_id][object_node_id].add(edge["predicate"])
+        neighbor_predicates[object_node_id][subject_node_id].add(edge["predicate"])
+    return neighbor_predicates
+
+
+def add_neighbor_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]],
+                                  neighbor_predicates: Dict[str, Dict[str, Set[str]]],
+                                  sqlite_file_name: str, label_property_name: str):
+    logging.info("Counting up node neighbors by category..")
+    # Record only the counts of neighbors per label/category
+    neighbor_counts = dict()
+    for node_id, predicates_by_neighbor in neighbor_predicates.items():
+        label_counts = defaultdict(int)
+        for neighbor_id in predicates_by_neighbor:
+            for label in nodes_by_id[neighbor_id][label_property_name]:
+                label_counts[label] += 1
+        if label_counts:
+            neighbor_counts[node_id] = dict(label_counts)
 
     # Then write these counts to the sqlite file
     logging.info(f" Saving neighbor counts (for {len(neighbor_counts)} nodes) to sqlite..")
@@ -147,7 +151,7 @@ def add_neighbor_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], edges_
     with open(f"{KG2C_DIR}/{neighbors_tsv_name}", "w+") as neighbors_file:
         writer = csv.writer(neighbors_file, delimiter="\t")
         writer.writerow(["id", "num_neighbors", "name", label_property_name])
-        for node_id, neighbor_ids in sorted(neighbors.items(), key=lambda item: len(item[1]), reverse=True)[:1000000]:
+        for node_id, neighbor_ids in sorted(neighbor_predicates.items(), key=lambda item: len(item[1]), reverse=True)[:1000000]:
             node = nodes_by_id.get(node_id, dict())
             writer.writerow([node_id, len(neighbor_ids), node.get("name"), node.get(label_property_name)])
 
@@ -175,6 +179,32 @@ def add_category_counts_to_sqlite(nodes_by_id: Dict[str, Dict[str, any]], sqlite
                  f"{cursor.fetchone()[0]} rows")
     cursor.close()
     connection.close()
+    return dict(rows)
+
+
+def build_neighbor_count_index_file(nodes_by_id: Dict[str, Dict[str, any]],
+                                    neighbor_predicates: Dict[str, Dict[str, Set[str]]], category_counts: Dict[str, int],
+                                    sqlite_file_name: str, label_property_name: str, biolink_helper: BiolinkHelper):
+    # The Fisher's exact test overlay looks up neighbor counts (overall and per predicate) in this memory-mapped index
+    logging.info("Building neighbor count index..")
+    expanded_predicates_map = dict()
+
+    def get_neighbor_counts(node_id: str) -> Dict[Tuple[str, Optional[str]], int]:
+        counts = defaultdict(int)
+        for neighbor_id, predicates in neighbor_predicates[node_id].items():
+            predicates_key = frozenset(predicates)
+            if predicates_key not in expanded_predicates_map:
+                # Counts for a predicate include neighbors connected via its descendants, like Expand's answers do
+                expanded_predicates_map[predicates_key] = [None] + biolink_helper.get_ancestors(list(predicates),
+                                                                                                include_mixins=True)
+            for label in nodes_by_id[neighbor_id][label_property_name]:
+                for predicate in expanded_predicates_map[predicates_key]:
+                    counts[(label, predicate)] += 1
+        return counts
+
+    # The index is stamped with the (finished) sqlite's size and modification time, so it only gets used alongside this
+    # exact copy of the sqlite
+    build_neighbor_count_index(neighbor_predicates, get_neighbor_counts, category_counts, f"{KG2C_DIR}/{sqlite_file_name}")
 
 
 def generate_fda_approved_drugs_pickle(edges_by_id: Dict[str, Dict[str, any]], fda_approved_file_name: str):
@@ -213,8 +243,11 @@ def record_meta_kg_info(biolink_version: str, is_test: bool):
     sqlite_file_name = f"kg2c.sqlite{'_TEST' if is_test else ''}"
     fda_approved_file_name = f"fda_approved_drugs.pickle{'_TEST' if is_test else ''}"
     build_meta_kg(nodes_by_id, edges_by_id, meta_kg_file_name, bh, is_test)
-    add_neighbor_counts_to_sqlite(nodes_by_id, edges_by_id, sqlite_file_name, expanded_labels_property_name)
-    add_category_counts_to_sqlite(nodes_by_id, sqlite_file_name, expanded_labels_property_name)
+    neighbor_predicates = get_neighbor_predicates(edges_by_id)
+    add_neighbor_counts_to_sqlite(nodes_by_id, neighbor_predicates, sqlite_file_name, expanded_labels_property_name)
+    category_counts = add_category_counts_to_sqlite(nodes_by_id, sqlite_file_name, expanded_labels_property_name)
+    build_neighbor_count_index_file(nodes_by_id, neighbor_predicates, category_counts, sqlite_file_name,
+                                    expanded_labels_property_name, bh)
     generate_fda_approved_drugs_pickle(edges_by_id, fda_approved_file_name)
     
     logging.info(f"Recording meta KG info took {round((time.time() - start) / 60, 1)} minutes.")
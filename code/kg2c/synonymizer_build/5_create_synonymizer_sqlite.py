@@ -8,6 +8,8 @@ import subprocess
 import numpy as np
 import pandas as pd
 
+from pack_cluster_members import add_packed_cluster_members, INT_ID_COLUMN
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 KG2C_DIR = f"{SCRIPT_DIR}/../"
 SYNONYMIZER_BUILD_DIR = f"{KG2C_DIR}/synonymizer_build"
@@ -59,6 +61,15 @@ def capitalize_curie_prefix(curie: str) -> str:
     return ":".join(curie_chunks)
 
 
+def save_table_with_int_ids(df: pd.DataFrame, table_name: str, db_connection: sqlite3.Connection):
+    # Give the table an explicit integer primary key (unlike rowids, sqlite won't renumber these on VACUUM), since the
+    # packed member/edge arrays in the clusters table refer to nodes/edges by it
+    create_table_sql = pd.io.sql.get_schema(df, table_name, con=db_connection)
+    create_table_sql = create_table_sql.replace("(", f"(\n\"{INT_ID_COLUMN}\" INTEGER PRIMARY KEY,", 1)
+    db_connection.execute(create_table_sql)
+    df.to_sql(table_name, con=db_connection, index=False, if_exists="append")
+
+
 def create_synonymizer_sqlite(nodes_df: pd.DataFrame, edges_df: pd.DataFrame) -> pd.DataFrame:
     # Get sqlite set up
     sqlite_db_path = f"{SYNONYMIZER_BUILD_DIR}/node_synonymizer.sqlite"
@@ -79,7 +90,7 @@ def create_synonymizer_sqlite(nodes_df: pd.DataFrame, edges_df: pd.DataFrame) ->
 
     # Save nodes table
     logging.info(f"Dumping nodes table to sqlite...")
-    nodes_df.to_sql("nodes", con=db_connection, index=False)
+    save_table_with_int_ids(nodes_df, "nodes", db_connection)
     logging.info(f"Creating index on node ID...")
     db_connection.execute("CREATE UNIQUE INDEX node_id_index on nodes (id)")
     logging.info(f"Creating index on simplified node ID...")
@@ -94,7 +105,7 @@ def create_synonymizer_sqlite(nodes_df: pd.DataFrame, edges_df: pd.DataFrame) ->
 
     # Save edges table
     logging.info(f"Dumping edges table to sqlite...")
-    edges_df.to_sql("edges", con=db_connection, index=False)
+    save_table_with_int_ids(edges_df, "edges", db_connection)
     logging.info(f"Creating index on edge ID...")
     db_connection.execute("CREATE UNIQUE INDEX edge_id_index on edges (id)")
     db_connection.commit()
@@ -172,6 +183,9 @@ def create_synonymizer_sqlite(nodes_df: pd.DataFrame, edges_df: pd.DataFrame) ->
 
     db_connection.close()
 
+    # Add compact (binary) versions of the member/edge ID lists, which are much faster for the synonymizer to decode
+    add_packed_cluster_members(sqlite_db_path)
+
     return clusters_df
 
 
@@ -0,0 +1,169 @@
+"""
+Adds a compact, binary encoding of each cluster's member nodes and intra-cluster edges to a synonymizer sqlite.
+
+The clusters table has always stored member_ids/intra_cluster_edge_ids as Python-literal strings, which the
+NodeSynonymizer then had to parse (with ast.literal_eval) on every lookup. This script adds two BLOB columns to the
+clusters table, member_int_ids and intra_cluster_edge_int_ids, each holding a packed array of little-endian uint32s
+that are the integer ids of the member nodes/edges in the nodes/edges tables (which thus act as the string dictionary).
+These are each table's explicit 'int_id INTEGER PRIMARY KEY' column, rather than its implicit rowids, which sqlite is
+free to renumber (e.g., on VACUUM). The NodeSynonymizer uses these columns whenever they're present. This is run as
+part of step 5 of the synonymizer build, but can also be run on an existing synonymizer to upgrade it in place (in
+which case int_id columns are added to its nodes/edges tables, if they don't have them already).
+
+Usage:
+    python pack_cluster_members.py <path to synonymizer sqlite>
+    python pack_cluster_members.py <path to synonymizer sqlite> --benchmark
+"""
+import argparse
+import ast
+import logging
+import sqlite3
+import sys
+import time
+from array import array
+from typing import Iterable, List
+
+BATCH_SIZE = 100000
+INT_ID_COLUMN = "int_id"
+
+
+def encode_int_ids(int_ids: Iterable[int]) -> bytes:
+    packed_int_ids = array("I", int_ids)
+    assert packed_int_ids.itemsize == 4
+    if sys.byteorder == "big":
+        packed_int_ids.byteswap()
+    return packed_int_ids.tobytes()
+
+
+def decode_int_ids(blob: bytes) -> array:
+    int_ids = array("I")
+    int_ids.frombytes(blob)
+    if sys.byteorder == "big":
+        int_ids.byteswap()
+    return int_ids
+
+
+def add_int_id_column(db_connection: sqlite3.Connection, table_name: str):
+    """
+    Rebuilds the given table with an explicit 'int_id INTEGER PRIMARY KEY' column (numbered in the table's current
+    rowid order), unless it already has one. Its indexes are recreated.
+    """
+    column_infos = db_connection.execute(f"PRAGMA table_info({table_name})").fetchall()
+    if any(column_info[1] == INT_ID_COLUMN for column_info in column_infos):
+        return
+    logging.info(f"Adding an {INT_ID_COLUMN} column to the {table_name} table..")
+    index_sqls = [row[0] for row in db_connection.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND "
+                                                          "tbl_name = ? AND sql IS NOT NULL", (table_name,))]
+    column_names = [f'"{column_info[1]}"' for column_info in column_infos]
+    column_defs = [f'"{column_info[1]}" {column_info[2]}' for column_info in column_infos]
+    db_connection.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_without_int_ids")
+    db_connection.execute(f"CREATE TABLE {table_name} ({INT_ID_COLUMN} INTEGER PRIMARY KEY, {', '.join(column_defs)})")
+    db_connection.execute(f"INSERT INTO {table_name} ({INT_ID_COLUMN}, {', '.join(column_names)}) "
+                          f"SELECT rowid, {', '.join(column_names)} FROM {table_name}_without_int_ids ORDER BY rowid")
+    db_connection.execute(f"DROP TABLE {table_name}_without_int_ids")
+    for index_sql in index_sqls:
+        db_connection.execute(index_sql)
+    db_connection.commit()
+
+
+def parse_id_list_str(id_list_str: str) -> List[str]:
+    # Empty lists were stored as 'nan' (from pandas) rather than '[]'
+    return [] if not id_list_str or id_list_str == "nan" else ast.literal_eval(id_list_str)
+
+
+def add_packed_cluster_members(sqlite_db_path: str):
+    logging.info(f"Adding packed cluster member/edge columns to {sqlite_db_path}..")
+    db_connection = sqlite3.connect(sqlite_db_path)
+
+    add_int_id_column(db_connection, "nodes")
+    add_int_id_column(db_connection, "edges")
+    cluster_columns = {row[1] for row in db_connection.execute("PRAGMA table_info(clusters)")}
+    for column_name in ["member_int_ids", "intra_cluster_edge_int_ids"]:
+        if column_name not in cluster_columns:
+            db_connection.execute(f"ALTER TABLE clusters ADD COLUMN {column_name} BLOB")
+
+    logging.info(f"Loading node and edge int ids..")
+    node_int_ids = {node_id: int_id for int_id, node_id in db_connection.execute(f"SELECT {INT_ID_COLUMN}, id FROM nodes")}
+    edge_int_ids = {edge_id: int_id for int_id, edge_id in db_connection.execute(f"SELECT {INT_ID_COLUMN}, id FROM edges")}
+
+    logging.info(f"Packing member/edge ids for each cluster..")
+    read_cursor = db_connection.cursor()
+    read_cursor.execute("SELECT rowid, member_ids, intra_cluster_edge_ids FROM clusters")
+    num_clusters_packed = 0
+    while True:
+        cluster_rows = read_cursor.fetchmany(BATCH_SIZE)
+        if not cluster_rows:
+            break
+        updates = [(encode_int_ids(node_int_ids[member_id] for member_id in parse_id_list_str(member_ids_str)),
+                    encode_int_ids(edge_int_ids[edge_id] for edge_id in parse_id_list_str(edge_ids_str)),
+                    cluster_rowid)
+                   for cluster_rowid, member_ids_str, edge_ids_str in cluster_rows]
+        db_connection.executemany("UPDATE clusters SET member_int_ids = ?, intra_cluster_edge_int_ids = ? "
+                                  "WHERE rowid = ?", updates)
+        num_clusters_packed += len(updates)
+        logging.info(f"  Packed {num_clusters_packed} clusters so far..")
+    read_cursor.close()
+    db_connection.commit()
+    db_connection.close()
+    logging.info(f"Done packing cluster members for {num_clusters_packed} clusters")
+
+
+def run_benchmark(sqlite_db_path: str, num_clusters: int = 100):
+    """
+    Compares how long it takes to decode member/edge lists for the largest clusters using the old string columns
+    vs. the packed columns (including looking up the member curies for the decoded int ids).
+    """
+    db_connection = sqlite3.connect(sqlite_db_path)
+    cluster_rows = db_connection.execute("SELECT member_ids, intra_cluster_edge_ids, member_int_ids, "
+                                         "intra_cluster_edge_int_ids FROM clusters "
+                                         "ORDER BY cluster_size DESC LIMIT ?", (num_clusters,)).fetchall()
+    num_members = sum(len(decode_int_ids(row[2])) for row in cluster_rows)
+    print(f"Benchmarking decoding for the {len(cluster_rows)} largest clusters ({num_members} member nodes total)")
+
+    start = time.time()
+    for member_ids_str, edge_ids_str, _, _ in cluster_rows:
+        parse_id_list_str(member_ids_str)
+        parse_id_list_str(edge_ids_str)
+    literal_eval_time = time.time() - start
+
+    start = time.time()
+    for _, _, member_int_ids_blob, edge_int_ids_blob in cluster_rows:
+        decode_int_ids(member_int_ids_blob)
+        decode_int_ids(edge_int_ids_blob)
+    unpack_time = time.time() - start
+
+    start = time.time()
+    for _, _, member_int_ids_blob, _ in cluster_rows:
+        member_int_ids = decode_int_ids(member_int_ids_blob).tolist()
+        for start_index in range(0, len(member_int_ids), 30000):  # Stay under sqlite's max number of bound parameters
+            int_ids_chunk = member_int_ids[start_index:start_index + 30000]
+            placeholders = ",".join("?" for _ in int_ids_chunk)
+            db_connection.execute(f"SELECT id FROM nodes WHERE {INT_ID_COLUMN} IN ({placeholders})",
+                                  int_ids_chunk).fetchall()
+    unpack_and_resolve_time = time.time() - start
+    db_connection.close()
+
+    print(f"  ast.literal_eval of string columns:     {round(literal_eval_time * 1000, 2)} ms")
+    print(f"  unpacking of int id columns:            {round(unpack_time * 1000, 2)} ms")
+    print(f"  unpacking + resolving member curies:    {round(unpack_and_resolve_time * 1000, 2)} ms")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s: %(message)s",
+                        handlers=[logging.StreamHandler()])
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("sqlite_db_path")
+    arg_parser.add_argument("-b", "--benchmark", dest="benchmark", action="store_true",
+                            help="Benchmark decoding of the largest clusters instead of (re)packing them.")
+    arg_parser.add_argument("-n", "--numclusters", dest="num_clusters", type=int, default=100,
+                            help="Number of (largest) clusters to use in the benchmark.")
+    args = arg_parser.parse_args()
+    if args.benchmark:
+        run_benchmark(args.sqlite_db_path, args.num_clusters)
+    else:
+        add_packed_cluster_members(args.sqlite_db_path)
+
+
+if __name__ == "__main__":
+    main()